@@ -0,0 +1,136 @@
+# catalog_index_benchmark.py
+"""
+Catalog Color Index Benchmark
+Build time, memory footprint, match latency and update cost of the
+in-memory catalog index (catalog_index.CatalogColorIndex) on a synthetic
+catalog, with a Python scan of the same photos as the baseline.
+
+    python benchmarks/catalog_index_benchmark.py --photos 1000000
+    python benchmarks/catalog_index_benchmark.py --photos 100000 --scan-photos 100000 --output small.json
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from typing import Any, Dict, Iterator, List
+
+import numpy as np
+from bson.objectid import ObjectId
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from catalog_index import CatalogColorIndex
+from clothing_matcher import iter_matching_photo_ids
+from pipeline_benchmark import _git_commit, measure
+
+
+GENDERS = ("female", "male", "unisex")
+
+
+def read_rss_mb() -> float:
+    """Resident set size of this process (Linux /proc), 0 elsewhere"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024.0
+    except OSError:
+        pass
+    return 0.0
+
+
+def synthetic_photos(count: int, vocabulary: List[str], seed: int) -> Iterator[Dict[str, Any]]:
+    """Photo documents with increasing ObjectIds, as the index projection returns them"""
+    rng = np.random.default_rng(seed)
+    colors = rng.integers(0, len(vocabulary), size=(count, 2))
+    genders = rng.integers(0, len(GENDERS), size=count)
+    base = int(time.time()) - count
+    for i in range(count):
+        oid = ObjectId((base + i).to_bytes(4, "big") + (i % (1 << 64)).to_bytes(8, "big"))
+        top2 = [vocabulary[colors[i, 0]], vocabulary[colors[i, 1]]]
+        yield {"_id": oid, "gender": GENDERS[genders[i]], "top2_colors": top2 if i % 2 else [{"hex": h} for h in top2]}
+
+
+def request_colors(vocabulary: List[str], rng: random.Random, requested: int, similar_per_color: int) -> List[str]:
+    """The expanded color set of one /get-matching-clothes request"""
+    return sorted(set(rng.sample(vocabulary, requested * similar_per_color)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the in-memory catalog color index")
+    parser.add_argument("--photos", type=int, default=1_000_000)
+    parser.add_argument("--vocabulary", type=int, default=50_000, help="Distinct garment colors")
+    parser.add_argument("--requested", type=int, default=6, help="Colors per request")
+    parser.add_argument("--similar", type=int, default=20, help="Similar colors per requested color")
+    parser.add_argument("--changes", type=int, default=20_000, help="Incremental updates to time")
+    parser.add_argument("--scan-photos", type=int, default=100_000, help="Photos in the scan baseline (0 = skip)")
+    parser.add_argument("--runs", type=int, default=7)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="catalog_index_benchmark.json")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    vocabulary = ["#%06x" % rng.randrange(1 << 24) for _ in range(args.vocabulary)]
+    results: Dict[str, Any] = {}
+
+    # Build
+    rss_before = read_rss_mb()
+    index = CatalogColorIndex(compact_threshold=args.changes + 1)
+    start = time.perf_counter()
+    index.build(synthetic_photos(args.photos, vocabulary, args.seed))
+    results["build_s"] = round(time.perf_counter() - start, 2)
+    results["index_memory_mb"] = round(index.memory_bytes() / (1024 * 1024), 1)
+    results["rss_growth_mb"] = round(read_rss_mb() - rss_before, 1)
+    results["bytes_per_photo"] = round(index.memory_bytes() / max(1, args.photos), 1)
+    print(f"Built {len(index)} photos in {results['build_s']}s: index {results['index_memory_mb']} MB "
+          f"({results['bytes_per_photo']} B/photo), RSS +{results['rss_growth_mb']} MB")
+
+    # Match
+    queries = [request_colors(vocabulary, rng, args.requested, args.similar) for _ in range(50)]
+    for gender in (None, "female"):
+        cycle = iter(queries * 1000)
+        timing = measure(lambda: index.match(next(cycle), gender), args.runs)
+        matched = sum(len(index.match(q, gender)) for q in queries) / len(queries)
+        results[f"match_{gender or 'any'}"] = {**timing, "mean_matches": round(matched, 1)}
+        print(f"match (gender={gender}): median {timing['median_ms']:.3f} ms, p90 {timing['p90_ms']:.3f} ms, "
+              f"{matched:.0f} matches on average")
+
+    # Incremental changes: new photos, then updates of existing ones, then one compaction
+    changes = list(synthetic_photos(args.changes, vocabulary, args.seed + 1))
+    for doc in changes:
+        doc["_id"] = ObjectId()
+    start = time.perf_counter()
+    for doc in changes:
+        index.apply(doc)
+    results["apply_us"] = round((time.perf_counter() - start) * 1e6 / len(changes), 2)
+    cycle = iter(queries * 1000)
+    results["match_any_with_delta"] = measure(lambda: index.match(next(cycle)), args.runs)
+    start = time.perf_counter()
+    with index._lock:
+        index._compact()
+    results["compaction_s"] = round(time.perf_counter() - start, 2)
+    print(f"apply: {results['apply_us']} us/change; match with a {args.changes}-photo delta: "
+          f"median {results['match_any_with_delta']['median_ms']:.3f} ms; compaction {results['compaction_s']}s")
+
+    # Baseline: the scan the database query replaced, over scan_photos in-memory documents
+    if args.scan_photos:
+        photos = list(synthetic_photos(args.scan_photos, vocabulary, args.seed))
+        similar = set(queries[0])
+        results["scan"] = {
+            "photos": args.scan_photos,
+            **measure(lambda: list(iter_matching_photo_ids(photos, similar)), max(1, args.runs // 2)),
+        }
+        print(f"python scan of {args.scan_photos} photos: median {results['scan']['median_ms']:.1f} ms")
+
+    report = {"commit": _git_commit(), "photos": args.photos, "vocabulary": args.vocabulary, "results": results}
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nReport written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,245 @@
+# face_masking_benchmark.py
+"""
+Face Masking Benchmark
+Latency and peak memory of FaceMaskingPreprocessor.process_image, full-frame
+path vs. multi-resolution path (downscaled detection + face-window parsing).
+
+Each (mode, image size) runs in a fresh subprocess so the peak-RSS numbers
+are not polluted by the previous run.
+
+With the real facer models (needs facer and its downloaded weights):
+    python benchmarks/face_masking_benchmark.py --sizes 4032x3024,2016x1512
+
+Without them, --stub-models uses stand-ins that reproduce facer's
+resolution-dependent work (uint8 -> float copy, warp to 448, un-warp of
+the logits to the input size) around a constant-cost network, so the
+difference between the modes is representative but absolute numbers are not:
+    python benchmarks/face_masking_benchmark.py --stub-models
+"""
+
+import argparse
+import io
+import json
+import math
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List
+
+import numpy as np
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from face_masking_preprocessor import FaceMaskingPreprocessor
+from image_pipeline import decode_image
+
+
+# name -> (detect_max_side, parse_max_side)
+MODES = {
+    "full": (0, 0),
+    "multires": (640, 896),
+}
+CELEBM_CLASSES = 19
+
+
+class StubDetector(nn.Module):
+    """
+    Stand-in for retinaface/mobilenet: a strided conv backbone whose cost grows
+    with the input size, returning one face at a fixed relative position.
+    """
+
+    def __init__(self):
+        super().__init__()
+        channels = [3, 8, 16, 32, 64, 64]
+        layers = []
+        for c_in, c_out in zip(channels, channels[1:]):
+            layers += [nn.Conv2d(c_in, c_out, 3, stride=2, padding=1), nn.ReLU()]
+        self.body = nn.Sequential(*layers).eval()
+
+    def forward(self, images: torch.Tensor) -> Dict[str, torch.Tensor]:
+        _, _, h, w = images.shape
+        self.body(images.float() / 255.0)
+
+        size = 0.3 * min(w, h)
+        cx, cy = 0.5 * w, 0.4 * h
+        rect = torch.tensor([[cx - size / 2, cy - size / 2, cx + size / 2, cy + size / 2]])
+        points = torch.tensor([[
+            [cx - 0.18 * size, cy - 0.1 * size],   # eyes
+            [cx + 0.18 * size, cy - 0.1 * size],
+            [cx, cy + 0.05 * size],                # nose
+            [cx - 0.14 * size, cy + 0.22 * size],  # mouth corners
+            [cx + 0.14 * size, cy + 0.22 * size],
+        ]])
+        return {"rects": rect, "points": points, "scores": torch.tensor([0.99]), "image_ids": torch.tensor([0])}
+
+
+class StubParser(nn.Module):
+    """
+    Stand-in for farl/celebm/448 with the same data flow: the whole input is
+    converted to float, the face square is warped to 448x448, a constant-cost
+    network predicts logits there and the logits are un-warped to the input size.
+    """
+
+    def __init__(self, num_classes: int = CELEBM_CLASSES):
+        super().__init__()
+        torch.manual_seed(0)
+        self.net = nn.Sequential(
+            nn.Conv2d(3, 32, 3, stride=2, padding=1), nn.ReLU(),
+            nn.Conv2d(32, 64, 3, stride=2, padding=1), nn.ReLU(),
+            nn.Conv2d(64, num_classes, 1),
+        ).eval()
+
+        # Skin ellipse with hair above it, so the mask looks like a face crop
+        yy, xx = torch.meshgrid(torch.linspace(-1, 1, 448), torch.linspace(-1, 1, 448), indexing="ij")
+        template = torch.zeros(num_classes, 448, 448)
+        template[0] = 5.0
+        template[2][(xx / 0.45) ** 2 + (yy / 0.6) ** 2 < 1] = 10.0
+        template[14][((xx / 0.6) ** 2 + ((yy + 0.3) / 0.55) ** 2 < 1) & (template[2] == 0)] = 10.0
+        self.register_buffer("template", template.unsqueeze(0))
+
+    def forward(self, images: torch.Tensor, data: Dict[str, torch.Tensor]) -> Dict:
+        images = images.float() / 255.0
+        _, _, h, w = images.shape
+
+        # Same square facer's celebm alignment uses (no rotation here)
+        lm = data["points"][0]
+        eye_avg = (lm[0] + lm[1]) / 2
+        eye_to_mouth = (lm[3] + lm[4]) / 2 - eye_avg
+        half = max(2.0 * torch.linalg.norm(lm[1] - lm[0]).item(), 1.8 * torch.linalg.norm(eye_to_mouth).item())
+        center = eye_avg + 0.1 * eye_to_mouth
+
+        # theta maps normalized 448-grid coords to normalized input coords
+        sx, sy = half / (w / 2), half / (h / 2)
+        tx, ty = center[0].item() / (w / 2) - 1, center[1].item() / (h / 2) - 1
+        theta = torch.tensor([[[sx, 0.0, tx], [0.0, sy, ty]]])
+        grid = F.affine_grid(theta, (1, 3, 448, 448), align_corners=False)
+        warped = F.grid_sample(images, grid, mode="bilinear", align_corners=False)
+
+        logits = F.interpolate(self.net(warped), size=(448, 448), mode="bilinear", align_corners=False)
+        logits = logits * 0.01 + self.template
+
+        inverse = torch.tensor([[[1 / sx, 0.0, -tx / sx], [0.0, 1 / sy, -ty / sy]]])
+        inv_grid = F.affine_grid(inverse, (1, logits.shape[1], h, w), align_corners=False)
+        data["seg"] = {"logits": F.grid_sample(logits, inv_grid, mode="bilinear", align_corners=False)}
+        return data
+
+
+def build_preprocessor(mode: str, stub_models: bool) -> FaceMaskingPreprocessor:
+    detect_max_side, parse_max_side = MODES[mode]
+    if not stub_models:
+        return FaceMaskingPreprocessor(device="cpu", detect_max_side=detect_max_side, parse_max_side=parse_max_side)
+
+    preprocessor = FaceMaskingPreprocessor.__new__(FaceMaskingPreprocessor)
+    preprocessor.device = torch.device("cpu")
+    preprocessor.detect_max_side = detect_max_side
+    preprocessor.parse_max_side = parse_max_side
+    preprocessor.mask_regions = "skin_hair"
+    preprocessor.face_detector = StubDetector()
+    preprocessor.face_parser = StubParser()
+    return preprocessor
+
+
+def synthetic_photo(width: int, height: int) -> bytes:
+    """Smooth gradient + blocks, JPEG-encoded like a phone upload"""
+    # Built small and upscaled so generating it does not set the peak-RSS baseline
+    y, x = np.mgrid[0:48, 0:64].astype(np.float32)
+    pixels = np.stack([x / 64 * 200 + 30, y / 48 * 180 + 40, (x + y) / 112 * 160 + 50], axis=-1)
+    image = Image.fromarray(pixels.astype(np.uint8)).resize((width, height), Image.Resampling.BILINEAR)
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=90)
+    return buffer.getvalue()
+
+
+def _peak_rss_mb() -> float:
+    # ru_maxrss is in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def run_worker(mode: str, width: int, height: int, runs: int, stub_models: bool, draft_min_side: int) -> Dict:
+    """One configuration, in this (fresh) process"""
+    torch.set_num_threads(1)
+    preprocessor = build_preprocessor(mode, stub_models)
+    image_bytes = synthetic_photo(width, height)
+    decoded = decode_image(image_bytes, draft_min_side=draft_min_side)
+    decoded.array  # materialize outside the measured region
+
+    rss_before = _peak_rss_mb()
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        preprocessor.process_image(decoded, output_size=(224, 224))
+        timings.append((time.perf_counter() - start) * 1000.0)
+    timings.sort()
+
+    return {
+        "mode": mode,
+        "image_size": f"{width}x{height}",
+        "decoded_size": f"{decoded.size[0]}x{decoded.size[1]}",
+        "median_ms": round(statistics.median(timings), 1),
+        "p90_ms": round(timings[max(0, math.ceil(0.9 * len(timings)) - 1)], 1),
+        "peak_rss_increase_mb": round(_peak_rss_mb() - rss_before, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark face masking: full-frame vs multi-resolution")
+    parser.add_argument("--sizes", default="4032x3024,2016x1512,1280x960", help="Comma-separated WxH image sizes")
+    parser.add_argument("--modes", default=",".join(MODES), help="Comma-separated modes to compare")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--stub-models", action="store_true", help="Use stand-in models instead of facer")
+    parser.add_argument("--draft-min-side", type=int, default=0,
+                        help="JPEG draft decoding like the API (0 = decode at full resolution)")
+    parser.add_argument("--output", default="face_masking_benchmark.json")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    modes = [m.strip() for m in args.modes.split(",") if m.strip()]
+    sizes = [tuple(int(v) for v in s.lower().split("x")) for s in args.sizes.split(",") if s.strip()]
+
+    if args.worker:
+        # Silence the per-stage prints of the preprocessor; only the JSON line goes to stdout
+        real_stdout = sys.stdout
+        sys.stdout = open(os.devnull, "w")
+        result = run_worker(modes[0], sizes[0][0], sizes[0][1], args.runs, args.stub_models, args.draft_min_side)
+        sys.stdout = real_stdout
+        print(json.dumps(result))
+        return
+
+    results: List[Dict] = []
+    for width, height in sizes:
+        for mode in modes:
+            cmd = [
+                sys.executable, os.path.abspath(__file__), "--worker",
+                "--modes", mode, "--sizes", f"{width}x{height}",
+                "--runs", str(args.runs), "--draft-min-side", str(args.draft_min_side),
+            ]
+            if args.stub_models:
+                cmd.append("--stub-models")
+            proc = subprocess.run(cmd, capture_output=True, text=True)
+            if proc.returncode != 0:
+                raise RuntimeError(f"{mode} {width}x{height} failed:\n{proc.stderr}")
+            result = json.loads(proc.stdout.strip().splitlines()[-1])
+            results.append(result)
+            print(json.dumps(result))
+
+    report = {
+        "torch_version": torch.__version__,
+        "stub_models": args.stub_models,
+        "draft_min_side": args.draft_min_side,
+        "modes": {name: {"detect_max_side": d, "parse_max_side": p} for name, (d, p) in MODES.items()},
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nReport written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
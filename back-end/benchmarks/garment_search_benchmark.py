@@ -0,0 +1,107 @@
+# garment_search_benchmark.py
+"""
+Garment Search Benchmark
+Build time, memory footprint and search latency of the perceptual garment
+search index (garment_search.GarmentColorIndex) on a synthetic catalog, with
+an exhaustive CIEDE2000 scan of the same garments as the baseline.
+
+    python benchmarks/garment_search_benchmark.py --photos 1000000
+    python benchmarks/garment_search_benchmark.py --photos 100000 --output small.json
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from typing import Any, Dict, Iterator, List
+
+import numpy as np
+from bson.objectid import ObjectId
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from catalog_index_benchmark import GENDERS, read_rss_mb
+from color_space import delta_e_2000, hexes_to_rgb, rgb_to_lab
+from garment_search import GarmentColorIndex
+from pipeline_benchmark import _git_commit, measure
+
+
+def synthetic_photos(count: int, vocabulary: List[str], colors_per_photo: int, seed: int) -> Iterator[Dict[str, Any]]:
+    """Photo documents with increasing ObjectIds and `colors_sorted` as uploads store them"""
+    rng = np.random.default_rng(seed)
+    colors = rng.integers(0, len(vocabulary), size=(count, colors_per_photo))
+    percentages = np.sort(rng.integers(1, 60, size=(count, colors_per_photo)), axis=1)[:, ::-1]
+    genders = rng.integers(0, len(GENDERS), size=count)
+    base = int(time.time()) - count
+    for i in range(count):
+        yield {
+            "_id": ObjectId((base + i).to_bytes(4, "big") + i.to_bytes(8, "big")),
+            "gender": GENDERS[genders[i]],
+            "colors_sorted": {
+                str(rank + 1): {"color": vocabulary[colors[i, rank]], "percentage": int(percentages[i, rank])}
+                for rank in range(colors_per_photo)
+            },
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the perceptual garment search index")
+    parser.add_argument("--photos", type=int, default=1_000_000)
+    parser.add_argument("--vocabulary", type=int, default=50_000, help="Distinct garment colors")
+    parser.add_argument("--colors-per-photo", type=int, default=5)
+    parser.add_argument("--requested", type=int, default=6, help="Palette colors per request")
+    parser.add_argument("--max-delta-e", type=float, default=10.0)
+    parser.add_argument("--runs", type=int, default=7)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="garment_search_benchmark.json")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    vocabulary = ["#%06x" % rng.randrange(1 << 24) for _ in range(args.vocabulary)]
+    results: Dict[str, Any] = {}
+
+    # Build
+    rss_before = read_rss_mb()
+    index = GarmentColorIndex(max_delta_e=args.max_delta_e)
+    start = time.perf_counter()
+    index.build(synthetic_photos(args.photos, vocabulary, args.colors_per_photo, args.seed))
+    results["build_s"] = round(time.perf_counter() - start, 2)
+    results["index_memory_mb"] = round(index.memory_bytes() / (1024 * 1024), 1)
+    results["rss_growth_mb"] = round(read_rss_mb() - rss_before, 1)
+    results["bytes_per_photo"] = round(index.memory_bytes() / max(1, args.photos), 1)
+    print(f"Built {len(index)} photos in {results['build_s']}s: index {results['index_memory_mb']} MB "
+          f"({results['bytes_per_photo']} B/photo), RSS +{results['rss_growth_mb']} MB")
+
+    # Search: first page, a deeper page, and every match
+    queries = [["#%06x" % rng.randrange(1 << 24) for _ in range(args.requested)] for _ in range(50)]
+    for name, gender, limit, offset in (
+        ("top20", None, 20, 0), ("top20_female", "female", 20, 0), ("page5", None, 20, 80), ("all", None, None, 0)
+    ):
+        cycle = iter(queries * 1000)
+        timing = measure(lambda: index.search(next(cycle), gender, limit=limit, offset=offset), args.runs)
+        matched = sum(index.search(q, gender, limit=1)[0] for q in queries) / len(queries)
+        results[f"search_{name}"] = {**timing, "mean_matches": round(matched, 1)}
+        print(f"search {name}: median {timing['median_ms']:.2f} ms, p90 {timing['p90_ms']:.2f} ms, "
+              f"{matched:.0f} matches on average")
+
+    # Baseline: CIEDE2000 from every requested color to every distinct catalog color
+    vocabulary_labs = rgb_to_lab(hexes_to_rgb(vocabulary))
+    query_labs = [rgb_to_lab(hexes_to_rgb(q)) for q in queries]
+    cycle = iter(query_labs * 1000)
+    results["scan_vocabulary"] = measure(
+        lambda: delta_e_2000(next(cycle)[:, None], vocabulary_labs[None]), max(1, args.runs // 2)
+    )
+    print(f"dE2000 against all {args.vocabulary} catalog colors (before any scoring): "
+          f"median {results['scan_vocabulary']['median_ms']:.1f} ms")
+
+    report = {"commit": _git_commit(), "photos": args.photos, "vocabulary": args.vocabulary, "results": results}
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nReport written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
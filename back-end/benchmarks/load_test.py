@@ -0,0 +1,423 @@
+# load_test.py
+"""
+End-to-End Load Test
+Throughput, latency percentiles and server RSS of the full FastAPI app
+under a configurable request mix at a fixed concurrency.
+
+The app (color_analysis_api:app under uvicorn, as in the Dockerfile) runs
+in a child process with:
+  - an in-process Mongo stand-in (memory_mongo) seeded with a synthetic
+    photos / color_similarity / GridFS catalog,
+  - a random-weight ResNeXt serving checkpoint (real loading path),
+  - the facer stand-ins of face_masking_benchmark,
+  - ingestion without rembg background removal (its model is a download;
+    --real-ingestion uses rembg if its weights are cached).
+Everything else (execution pools, micro-batchers, caches, middleware) is
+the production code with its usual environment configuration.
+
+The load generator runs in this process as a closed loop: each of
+--concurrency workers sends its next request as soon as the previous one
+finished, so throughput is what the server sustains at that concurrency.
+
+    python benchmarks/load_test.py --concurrency 8 --duration 60
+    python benchmarks/load_test.py --mix analyze-color=1 --concurrency 4 --env RESULT_CACHE_ENABLED=false
+"""
+
+import argparse
+import asyncio
+import io
+import json
+import math
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from types import SimpleNamespace
+from typing import Dict, List, Optional
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCHMARKS_DIR)
+sys.path.insert(0, BACKEND_DIR)
+
+# endpoint -> relative weight
+DEFAULT_MIX = "analyze-color=4,get-matching-clothes=3,get-image-by-docid=10,upload-image-process-store=1"
+ENDPOINTS = ("analyze-color", "get-matching-clothes", "get-image-by-docid", "upload-image-process-store", "search-clothes")
+
+# Distinct synthetic payloads; the result caches see repeats once the pool is exhausted
+PHOTO_SIZES = ((1280, 960), (2016, 1512), (960, 1280))
+GARMENT_POOL = 16
+
+
+def photo_object_id(index: int):
+    from bson.objectid import ObjectId
+    return ObjectId(f"{index:024x}")
+
+
+def primary_colors(num_similarity_docs: int, seed: int) -> List[str]:
+    """Primary colors of the seeded color_similarity documents (same in server and driver)"""
+    rng = random.Random(seed)
+    return ["#%06x" % rng.randrange(1 << 24) for _ in range(num_similarity_docs)]
+
+
+def seed_catalog(num_photos: int, num_similarity_docs: int, seed: int):
+    """MemoryCatalog with photos (dominant and top-2 colors, GridFS image), similarity documents and images"""
+    import numpy as np
+    from catalog_migrations import backfill_match_colors, ensure_photo_indexes
+    from memory_mongo import MemoryCatalog
+    from pipeline_benchmark import synthetic_garment
+
+    rng = random.Random(seed + 1)
+    np_rng = np.random.default_rng(seed)
+    catalog = MemoryCatalog()
+    vocabulary = ["#%06x" % rng.randrange(1 << 24) for _ in range(2000)]
+
+    catalog.color_similarity.insert_many([
+        {"primary_color": primary, "similar_colors": [{"hex": h} for h in rng.sample(vocabulary, 20)]}
+        for primary in primary_colors(num_similarity_docs, seed)
+    ])
+    image_ids = [catalog.fs.put(synthetic_garment(256, np_rng)) for _ in range(GARMENT_POOL)]
+    photos = []
+    for i in range(num_photos):
+        colors = rng.sample(vocabulary, 5)
+        percentages = sorted((rng.randint(1, 50) for _ in colors), reverse=True)
+        photos.append({
+            "_id": photo_object_id(i),
+            "photo_url": f"seed://{i}",
+            "gender": "female" if i % 3 else "male",
+            "is_available": True,
+            "colors_sorted": {
+                str(rank): {"color": color, "percentage": pct}
+                for rank, (color, pct) in enumerate(zip(colors, percentages), start=1)
+            },
+            "top2_colors": colors[:2],
+            "image_gridfs": image_ids[i % len(image_ids)],
+        })
+    catalog.photos.insert_many(photos)
+    # As on a migrated production catalog
+    backfill_match_colors(catalog.photos)
+    ensure_photo_indexes(catalog.photos)
+    return catalog
+
+
+def _ingest_without_background_removal(image_bytes: bytes, color_count: int = 5):
+    from ingestion import extract_colors_with_percentage
+    return extract_colors_with_percentage(image_bytes, color_count=color_count)
+
+
+def serve(args):
+    """Child process: the API with stand-ins, on 127.0.0.1:args.port"""
+    import uvicorn
+    import color_analysis_api as api
+    from face_masking_benchmark import build_preprocessor
+    from mongo_store import CatalogStore
+
+    catalog = seed_catalog(args.photos, args.similarity_docs, args.seed)
+    api.SUBSYSTEMS["mongo_catalog"].loader = lambda: CatalogStore(catalog, io_workers=api.MONGO_IO_WORKERS)
+
+    def stub_face_preprocessor(device="cpu", detect_max_side=640, parse_max_side=896, mask_regions="skin_hair"):
+        preprocessor = build_preprocessor("multires", stub_models=True)
+        preprocessor.detect_max_side = detect_max_side
+        preprocessor.parse_max_side = parse_max_side
+        preprocessor.mask_regions = mask_regions
+        return preprocessor
+
+    api.get_face_masking_preprocessor = stub_face_preprocessor
+    if not args.real_ingestion:
+        api.SUBSYSTEMS["ingestion"].loader = lambda: SimpleNamespace(
+            process_garment_image=_ingest_without_background_removal
+        )
+
+    print(f"[load-test] catalog seeded: {args.photos} photos, {args.similarity_docs} similarity docs", flush=True)
+    uvicorn.run(api.app, host="127.0.0.1", port=args.port, log_level="warning")
+
+
+def write_random_checkpoint(path: str):
+    import torch
+    from season_classifier import ColorAnalysisModel, SERVING_CHECKPOINT_FORMAT
+
+    torch.manual_seed(0)
+    model = ColorAnalysisModel(num_classes=4, pretrained=False)
+    torch.save({"format": SERVING_CHECKPOINT_FORMAT, "num_classes": 4, "state_dict": model.state_dict()}, path)
+
+
+def read_rss_mb(pid: int) -> Optional[float]:
+    """Resident set size of a process (Linux /proc), None elsewhere"""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024.0
+    except OSError:
+        pass
+    return None
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _percentile(sorted_values: List[float], q: float) -> float:
+    return sorted_values[max(0, math.ceil(q * len(sorted_values)) - 1)]
+
+
+def summarize(samples: List[tuple], duration_s: float) -> Dict:
+    """samples: (latency_ms, status) of one endpoint (or all)"""
+    latencies = sorted(latency for latency, _ in samples)
+    statuses: Dict[str, int] = defaultdict(int)
+    for _, status in samples:
+        statuses[str(status)] += 1
+    summary = {
+        "requests": len(samples),
+        "errors": sum(1 for _, status in samples if not (isinstance(status, int) and status < 400)),
+        "throughput_rps": round(len(samples) / duration_s, 2),
+        "status": dict(statuses),
+    }
+    if latencies:
+        summary.update({
+            "mean_ms": round(statistics.fmean(latencies), 1),
+            "p50_ms": round(_percentile(latencies, 0.50), 1),
+            "p90_ms": round(_percentile(latencies, 0.90), 1),
+            "p99_ms": round(_percentile(latencies, 0.99), 1),
+            "max_ms": round(latencies[-1], 1),
+        })
+    return summary
+
+
+def distinct_photo(width: int, height: int, np_rng) -> bytes:
+    """Gradient photo with a random coarse block pattern, so no two have near-identical dHashes"""
+    import numpy as np
+    from PIL import Image
+
+    y, x = np.mgrid[0:48, 0:64].astype(np.float32)
+    gradient = np.stack([x / 64 * 200 + 30, y / 48 * 180 + 40, (x + y) / 112 * 160 + 50], axis=-1)
+    blocks = np.kron(np_rng.uniform(-60, 60, size=(6, 8, 3)), np.ones((8, 8, 1)))
+    pixels = np.clip(gradient + blocks, 0, 255).astype(np.uint8)
+    image = Image.fromarray(pixels).resize((width, height), Image.Resampling.BILINEAR)
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=90)
+    return buffer.getvalue()
+
+
+def build_payloads(args) -> Dict[str, list]:
+    import numpy as np
+    from pipeline_benchmark import synthetic_garment
+
+    np_rng = np.random.default_rng(args.seed + 2)
+    photos = [distinct_photo(*PHOTO_SIZES[i % len(PHOTO_SIZES)], np_rng) for i in range(args.image_pool)]
+    return {
+        "photos": photos,
+        "garments": [synthetic_garment(512, np_rng) for _ in range(GARMENT_POOL)],
+        "primary_colors": primary_colors(args.similarity_docs, args.seed),
+    }
+
+
+async def send_request(client, endpoint: str, payloads: Dict[str, list], rng: random.Random, args):
+    if endpoint == "analyze-color":
+        image = rng.choice(payloads["photos"])
+        return await client.post("/analyze-color", files={"image": ("photo.jpg", image, "image/jpeg")})
+    if endpoint == "get-matching-clothes":
+        colors = rng.sample(payloads["primary_colors"], rng.randint(1, 3))
+        params = {"gender": rng.choice(("female", "male"))} if rng.random() < 0.5 else None
+        return await client.post("/get-matching-clothes", json=colors, params=params)
+    if endpoint == "search-clothes":
+        colors = rng.sample(payloads["primary_colors"], rng.randint(1, 6))
+        params = {"offset": rng.choice((0, 0, 0, 20, 40))}
+        if rng.random() < 0.5:
+            params["gender"] = rng.choice(("female", "male"))
+        return await client.post("/search-clothes", json=colors, params=params)
+    if endpoint == "get-image-by-docid":
+        doc_id = str(photo_object_id(rng.randrange(args.photos)))
+        return await client.get("/get-image-by-docid", params={"doc_id": doc_id})
+    garment = rng.choice(payloads["garments"])
+    return await client.post(
+        "/upload-image-process-store",
+        params={"gender": rng.choice(("female", "male"))},
+        files={"image": ("garment.jpg", garment, "image/jpeg")},
+    )
+
+
+async def drive(base_url: str, server_pid: int, mix: Dict[str, float], payloads, args) -> Dict:
+    import httpx
+
+    samples: Dict[str, List[tuple]] = defaultdict(list)
+    rss: List[Dict[str, float]] = []
+    start = time.perf_counter()
+    measure_from = start + args.warmup
+    end = measure_from + args.duration
+    endpoints, weights = zip(*mix.items())
+
+    async def worker(worker_id: int):
+        rng = random.Random(args.seed * 1000 + worker_id)
+        while time.perf_counter() < end:
+            endpoint = rng.choices(endpoints, weights)[0]
+            sent = time.perf_counter()
+            try:
+                status = (await send_request(client, endpoint, payloads, rng, args)).status_code
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            if sent >= measure_from:
+                samples[endpoint].append(((time.perf_counter() - sent) * 1000.0, status))
+
+    async def sample_rss():
+        while time.perf_counter() < end:
+            rss.append({"t_s": round(time.perf_counter() - start, 1), "rss_mb": read_rss_mb(server_pid)})
+            await asyncio.sleep(args.rss_interval)
+
+    limits = httpx.Limits(max_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout, limits=limits) as client:
+        await asyncio.gather(sample_rss(), *(worker(i) for i in range(args.concurrency)))
+        health = (await client.get("/health")).json()
+
+    all_samples = [sample for endpoint_samples in samples.values() for sample in endpoint_samples]
+    rss_values = [point["rss_mb"] for point in rss if point["rss_mb"] is not None]
+    return {
+        "total": summarize(all_samples, args.duration),
+        "endpoints": {endpoint: summarize(samples[endpoint], args.duration) for endpoint in endpoints},
+        "rss": {
+            "peak_mb": round(max(rss_values), 1) if rss_values else None,
+            "final_mb": round(rss_values[-1], 1) if rss_values else None,
+            "timeline": [{"t_s": p["t_s"], "rss_mb": p["rss_mb"] and round(p["rss_mb"], 1)} for p in rss],
+        },
+        "server_health": {
+            key: health.get(key)
+            for key in ("inference_batching", "face_batching", "result_cache", "near_duplicate_cache",
+                        "execution_pools", "catalog_index", "color_similarity", "garment_search", "mongo_catalog",
+                        "subsystems")
+        },
+    }
+
+
+def wait_until_ready(base_url: str, server: subprocess.Popen, timeout_s: float):
+    """Block until the eager subsystems finished loading; fail if one did not load"""
+    import httpx
+
+    deadline = time.monotonic() + timeout_s
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"server exited with code {server.returncode}")
+        try:
+            subsystems = httpx.get(f"{base_url}/health", timeout=5).json()["subsystems"]
+            states = {name: status["state"] for name, status in subsystems.items() if not status["lazy"]}
+            if all(state in ("ready", "failed", "disabled") for state in states.values()):
+                failed = [name for name, state in states.items() if state == "failed"]
+                if failed:
+                    raise RuntimeError(f"subsystems failed to load: {', '.join(failed)}")
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    raise TimeoutError(f"server not ready after {timeout_s:.0f}s")
+
+
+def parse_mix(spec: str) -> Dict[str, float]:
+    mix = {}
+    for part in spec.split(","):
+        if not part.strip():
+            continue
+        endpoint, _, weight = part.partition("=")
+        endpoint = endpoint.strip().lstrip("/")
+        if endpoint not in ENDPOINTS:
+            raise SystemExit(f"unknown endpoint '{endpoint}' (one of {', '.join(ENDPOINTS)})")
+        mix[endpoint] = float(weight or 1)
+    return {endpoint: weight for endpoint, weight in mix.items() if weight > 0}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the full API with a Mongo stand-in and stub models")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="Comma-separated endpoint=weight")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=60.0, help="Measured seconds (after warm-up)")
+    parser.add_argument("--warmup", type=float, default=10.0, help="Seconds of load before measuring")
+    parser.add_argument("--photos", type=int, default=5000, help="Seeded catalog photos")
+    parser.add_argument("--similarity-docs", type=int, default=500, help="Seeded color_similarity documents")
+    parser.add_argument("--image-pool", type=int, default=64, help="Distinct photos sent to /analyze-color")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--timeout", type=float, default=120.0, help="Per-request timeout in seconds")
+    parser.add_argument("--rss-interval", type=float, default=1.0, help="Seconds between server RSS samples")
+    parser.add_argument("--ready-timeout", type=float, default=300.0)
+    parser.add_argument("--real-ingestion", action="store_true", help="Use rembg background removal")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE",
+                        help="Extra server environment (repeatable), e.g. ENABLE_FACE_BATCHING=false")
+    parser.add_argument("--server-log", default="load_test_server.log")
+    parser.add_argument("--output", default="load_test.json")
+    parser.add_argument("--port", type=int, default=0, help=argparse.SUPPRESS)
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args)
+        return
+
+    mix = parse_mix(args.mix)
+    port = _free_port()
+    base_url = f"http://127.0.0.1:{port}"
+
+    with tempfile.TemporaryDirectory() as tmp:
+        checkpoint = os.path.join(tmp, "random_resnext50.pth")
+        write_random_checkpoint(checkpoint)
+        env = dict(
+            os.environ,
+            MODEL_PATH=checkpoint,
+            INFERENCE_BACKEND="torch",
+            INGEST_POOL_KIND="thread",  # the stand-in ingestion lives in this module
+            INDEXED_CLOTHES_MATCHING="true",  # the seeded catalog is backfilled
+            PYTHONPATH=os.pathsep.join([BACKEND_DIR, BENCHMARKS_DIR]),
+        )
+        env.update(item.split("=", 1) for item in args.env)
+
+        cmd = [
+            sys.executable, os.path.abspath(__file__), "--serve", "--port", str(port),
+            "--photos", str(args.photos), "--similarity-docs", str(args.similarity_docs), "--seed", str(args.seed),
+        ]
+        if args.real_ingestion:
+            cmd.append("--real-ingestion")
+
+        print("Building payloads...")
+        payloads = build_payloads(args)
+        with open(args.server_log, "w") as log:
+            server = subprocess.Popen(cmd, cwd=BACKEND_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+            try:
+                print(f"Starting server on {base_url} (log: {args.server_log})...")
+                wait_until_ready(base_url, server, args.ready_timeout)
+                print(f"Driving {args.concurrency} concurrent clients for {args.warmup:.0f}s warm-up "
+                      f"+ {args.duration:.0f}s, mix {mix}")
+                results = asyncio.run(drive(base_url, server.pid, mix, payloads, args))
+            finally:
+                server.terminate()
+                server.wait(timeout=30)
+
+    report = {
+        "config": {
+            "mix": mix,
+            "concurrency": args.concurrency,
+            "duration_s": args.duration,
+            "warmup_s": args.warmup,
+            "photos": args.photos,
+            "similarity_docs": args.similarity_docs,
+            "image_pool": args.image_pool,
+            "real_ingestion": args.real_ingestion,
+            "server_env": dict(item.split("=", 1) for item in args.env),
+            "cpu_count": os.cpu_count(),
+        },
+        **results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    print(f"\n{'endpoint':<28} {'req':>6} {'err':>5} {'rps':>8} {'p50':>9} {'p90':>9} {'p99':>9}")
+    for name, summary in list(results["endpoints"].items()) + [("total", results["total"])]:
+        print(f"{name:<28} {summary['requests']:>6} {summary['errors']:>5} {summary['throughput_rps']:>8.2f} "
+              f"{summary.get('p50_ms', 0):>7.1f}ms {summary.get('p90_ms', 0):>7.1f}ms {summary.get('p99_ms', 0):>7.1f}ms")
+    print(f"server RSS: peak {results['rss']['peak_mb']} MB, final {results['rss']['final_mb']} MB")
+    print(f"\nReport written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
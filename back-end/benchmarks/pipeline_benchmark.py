@@ -0,0 +1,243 @@
+# pipeline_benchmark.py
+"""
+Pipeline Stage Benchmark
+Per-stage latency of the analysis and catalog paths on synthetic inputs,
+written to JSON so runs on different commits can be compared.
+
+Runs offline: the facer models are the stand-ins of face_masking_benchmark
+(same resolution-dependent work, constant-cost network) and the ResNeXt
+classifier has random weights, so absolute numbers only say something
+relative to another run of this script on the same machine.
+
+    python benchmarks/pipeline_benchmark.py --output before.json
+    python benchmarks/pipeline_benchmark.py --output after.json --compare before.json --fail-over 10
+
+Stages:
+    process_image_for_model   decode + face masking + resize (the API helper)
+    create_region_mask        label map -> region mask
+    crop_and_resize           mask bbox crop, resize, mask application
+    preprocess                PIL -> normalized model tensor
+    classifier_forward        ResNeXt-50 forward pass
+    weighted_palette          ColorRecommendationEngineV2.get_weighted_palette_for_probabilities
+    extract_colors            ingestion.extract_colors_with_percentage
+    matching_loop             /get-matching-clothes similar-color expansion + catalog scan
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import math
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+import torch
+from PIL import Image
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from face_masking_benchmark import CELEBM_CLASSES, build_preprocessor, synthetic_photo
+
+
+# Minimum measured time per run; fast stages are called repeatedly within a run
+MIN_RUN_SECONDS = 0.02
+
+
+def measure(fn: Callable[[], object], runs: int) -> Dict[str, float]:
+    """Per-call latency of fn over `runs` runs, after one warm-up call"""
+    start = time.perf_counter()
+    fn()
+    warmup_s = time.perf_counter() - start
+    calls = max(1, int(MIN_RUN_SECONDS / max(warmup_s, 1e-9)))
+
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        for _ in range(calls):
+            fn()
+        timings.append((time.perf_counter() - start) * 1000.0 / calls)
+    timings.sort()
+    return {
+        "median_ms": round(statistics.median(timings), 4),
+        "p90_ms": round(timings[max(0, math.ceil(0.9 * len(timings)) - 1)], 4),
+        "min_ms": round(timings[0], 4),
+        "calls_per_run": calls,
+    }
+
+
+def synthetic_garment(size: int, rng: np.random.Generator) -> bytes:
+    """A few flat color blocks with noise, JPEG-encoded like a catalog upload"""
+    blocks = rng.integers(0, 256, size=(4, 4, 3), dtype=np.uint8)
+    image = Image.fromarray(blocks).resize((size, size), Image.Resampling.NEAREST)
+    pixels = np.asarray(image).astype(np.int16) + rng.integers(-8, 9, size=(size, size, 3))
+    buffer = io.BytesIO()
+    Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8)).save(buffer, format="JPEG", quality=90)
+    return buffer.getvalue()
+
+
+def synthetic_catalog(num_photos: int, num_similarity_docs: int, rng: np.random.Generator):
+    """color_similarity documents and photo documents in the shapes the catalog stores"""
+    def random_hex(n):
+        return ["#%06x" % v for v in rng.integers(0, 1 << 24, size=n)]
+
+    # Photos draw from a limited color vocabulary so requests actually match
+    vocabulary = random_hex(2000)
+    similarity_docs = [
+        {"primary_color": primary, "similar_colors": [{"hex": h.upper()} for h in rng.choice(vocabulary, 20)]}
+        for primary in random_hex(num_similarity_docs)
+    ]
+    photos = []
+    for i, pair in enumerate(rng.choice(vocabulary, size=(num_photos, 2))):
+        # Both stored shapes: plain strings and {"hex": ...} entries
+        top2 = list(pair) if i % 2 else [{"hex": h.lstrip("#")} for h in pair]
+        photos.append({"_id": f"{i:024x}", "gender": "women" if i % 3 else "men", "top2_colors": top2})
+    return similarity_docs, photos
+
+
+def run_benchmarks(sizes: List[tuple], runs: int, stages: Optional[set]) -> List[Dict]:
+    # Imported late: the API module reads its configuration at import time
+    with contextlib.redirect_stdout(io.StringIO()):
+        import color_analysis_api as api
+    from clothing_matcher import collect_similar_colors, iter_matching_photo_ids
+    from color_recommendation_engine import ColorRecommendationEngineV2
+    from ingestion import extract_colors_with_percentage
+    from season_classifier import ColorAnalysisModel, SEASON_LABELS
+
+    rng = np.random.default_rng(0)
+    torch.manual_seed(0)
+    results = []
+
+    def bench(stage: str, case: str, fn: Callable[[], object]):
+        if stages and stage not in stages:
+            return
+        result = dict(stage=stage, case=case, **measure(fn, runs))
+        results.append(result)
+        print(json.dumps(result))
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        preprocessor = build_preprocessor("multires", stub_models=True)
+        engine = ColorRecommendationEngineV2(os.path.join(BACKEND_DIR, "color_palette_v2.json"))
+    api.SUBSYSTEMS["face_preprocessor"].reset(preprocessor)
+    api.FACE_BATCHER = None
+
+    for width, height in sizes:
+        photo = synthetic_photo(width, height)
+        bench("process_image_for_model", f"{width}x{height} masked",
+              lambda: api._process_image_for_model(photo, apply_face_masking=True))
+        bench("process_image_for_model", f"{width}x{height} unmasked",
+              lambda: api._process_image_for_model(photo, apply_face_masking=False))
+
+    for side in (448, 896):
+        label_map = rng.integers(0, CELEBM_CLASSES, size=(side, side), dtype=np.int64)
+        bench("create_region_mask", f"{side}x{side}", lambda: preprocessor._create_region_mask(label_map))
+
+    for width, height in sizes:
+        image_rgb = np.asarray(Image.open(io.BytesIO(synthetic_photo(width, height))).convert("RGB"))
+        yy, xx = np.mgrid[0:height, 0:width]
+        face = ((xx - 0.5 * width) / (0.15 * width)) ** 2 + ((yy - 0.4 * height) / (0.2 * height)) ** 2 < 1
+        mask = face.astype(np.uint8) * 255
+        bench("crop_and_resize", f"{width}x{height}",
+              lambda: preprocessor._crop_and_resize(image_rgb, mask, height, width, height, api.IMG_SIZE))
+
+    for side in (224, 512):
+        pil = Image.fromarray(rng.integers(0, 256, size=(side, side, 3), dtype=np.uint8))
+        bench("preprocess", f"{side}x{side}", lambda: api.preprocess(pil))
+
+    if not stages or "classifier_forward" in stages:
+        model = ColorAnalysisModel(num_classes=len(SEASON_LABELS), pretrained=False).eval()
+        for batch_size in (1, 8):
+            batch = torch.randn(batch_size, 3, *api.IMG_SIZE)
+
+            def forward():
+                with torch.no_grad():
+                    model(batch)
+
+            bench("classifier_forward", f"batch {batch_size}", forward)
+
+    probabilities = [dict(zip(SEASON_LABELS, p)) for p in rng.dirichlet(np.ones(len(SEASON_LABELS)), size=64)]
+    counter = iter(range(1 << 62))
+    bench("weighted_palette", "4 seasons",
+          lambda: engine.get_weighted_palette_for_probabilities(probabilities[next(counter) % len(probabilities)]))
+
+    for side in (256, 1024):
+        garment = synthetic_garment(side, rng)
+        bench("extract_colors", f"{side}x{side}", lambda: extract_colors_with_percentage(garment))
+
+    similarity_docs, photos = synthetic_catalog(100_000, 500, rng)
+    for num_colors in (1, 5):
+        requested = similarity_docs[:num_colors]
+        for num_photos in (10_000, 100_000):
+            bench("matching_loop", f"{num_colors} colors x {num_photos} photos",
+                  lambda: list(iter_matching_photo_ids(photos[:num_photos], collect_similar_colors(requested))))
+
+    return results
+
+
+def compare(results: List[Dict], baseline_path: str, fail_over: Optional[float]) -> bool:
+    """Print the median change per case against a previous report; False if a case regressed past fail_over %"""
+    with open(baseline_path) as f:
+        baseline = {(r["stage"], r["case"]): r for r in json.load(f)["results"]}
+
+    ok = True
+    print(f"\nCompared with {baseline_path}:")
+    for result in results:
+        before = baseline.get((result["stage"], result["case"]))
+        if before is None:
+            continue
+        change = (result["median_ms"] / before["median_ms"] - 1.0) * 100.0 if before["median_ms"] else 0.0
+        flag = ""
+        if fail_over is not None and change > fail_over:
+            flag, ok = "  REGRESSION", False
+        print(f"  {result['stage']:<25} {result['case']:<28} "
+              f"{before['median_ms']:>10.3f} -> {result['median_ms']:>10.3f} ms ({change:+.1f}%){flag}")
+    return ok
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline stages on synthetic inputs")
+    parser.add_argument("--sizes", default="4032x3024,1280x960", help="Comma-separated WxH photo sizes")
+    parser.add_argument("--stages", default="", help="Comma-separated stages to run (default: all)")
+    parser.add_argument("--runs", type=int, default=7)
+    parser.add_argument("--threads", type=int, default=1, help="torch intra-op threads")
+    parser.add_argument("--output", default="pipeline_benchmark.json")
+    parser.add_argument("--compare", help="Previous report to compare medians against")
+    parser.add_argument("--fail-over", type=float, help="With --compare: exit 1 if a median grew by more than this %%")
+    args = parser.parse_args()
+
+    torch.set_num_threads(args.threads)
+    sizes = [tuple(int(v) for v in s.lower().split("x")) for s in args.sizes.split(",") if s.strip()]
+    stages = {s.strip() for s in args.stages.split(",") if s.strip()}
+
+    results = run_benchmarks(sizes, args.runs, stages)
+    report = {
+        "commit": _git_commit(),
+        "torch_version": torch.__version__,
+        "threads": args.threads,
+        "runs": args.runs,
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nReport written to {args.output}")
+
+    if args.compare and not compare(results, args.compare, args.fail_over):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
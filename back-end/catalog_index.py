@@ -0,0 +1,466 @@
+# catalog_index.py
+"""
+In-Memory Catalog Color Index
+An inverted index from (gender, normalized top-2 color) to photo _ids, so
+/get-matching-clothes can match without a database round trip.
+
+The index is a compressed posting-list (CSR) segment built from numpy
+arrays, plus a small delta for changes since the last build:
+
+- ids: the ObjectIds of the indexed photos as 12-byte strings, sorted, so
+  a photo's position ("slot") orders results by _id
+- keys: sorted uint64 keys, gender code << 32 | color code, where the
+  color code of a '#rrggbb' color is its 24-bit value (other strings get
+  codes from a small vocabulary above 2**24)
+- offsets / slots: the posting list of keys[i] is slots[offsets[i]:offsets[i + 1]]
+- alive: False for slots whose photo changed or was deleted since the build
+
+Changes (apply / remove) tombstone the photo's base slot and keep the new
+version in per-key Python sets until the delta reaches compact_threshold
+photos, when everything is merged into a new base segment. Matching is a
+union of posting lists: a searchsorted over the requested keys, a
+concatenate, np.unique, and the delta sets.
+
+CatalogIndexRefresher keeps an index in sync with a photos collection,
+through a change stream when the server supports one (replica sets,
+Atlas), otherwise by polling for new _ids (and `updated_at`, for writers
+that set it) with a periodic full rebuild that also drops deleted photos.
+"""
+
+import logging
+import sys
+from array import array
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+from bson.objectid import ObjectId
+
+from clothing_matcher import photo_top_colors
+
+logger = logging.getLogger(__name__)
+
+
+# Fields of a photo document the index reads
+INDEX_PROJECTION = {"_id": 1, "gender": 1, "top2_colors": 1}
+
+# Serves the updated_at polling query (created by catalog_migrations.py)
+PHOTO_REFRESH_INDEX = [("updated_at", 1)]
+
+_ODD_COLOR_BASE = 1 << 24
+
+
+def _id_bytes(doc_id: Any) -> bytes:
+    if not isinstance(doc_id, ObjectId):
+        raise TypeError(f"catalog index only supports ObjectId _ids, got {doc_id!r}")
+    return doc_id.binary
+
+
+class CatalogColorIndex:
+    """(gender, color) -> photo _id posting lists; thread-safe"""
+
+    projection = INDEX_PROJECTION
+
+    def __init__(self, compact_threshold: int = 20000):
+        """
+        Args:
+            compact_threshold: Changed photos kept in the delta before it is merged into the base
+        """
+        self.compact_threshold = compact_threshold
+        self._lock = threading.Lock()
+        self._genders: Dict[Any, int] = {}
+        self._odd_colors: Dict[str, int] = {}
+
+        # Base segment
+        self._ids = np.empty(0, dtype="S12")
+        self._alive = np.empty(0, dtype=bool)
+        self._keys = np.empty(0, dtype=np.uint64)
+        self._offsets = np.zeros(1, dtype=np.int64)
+        self._slots = np.empty(0, dtype=np.int32)
+
+        # Delta: keys of every changed photo (empty for photos without colors or
+        # deleted), and the photos per key
+        self._delta_docs: Dict[bytes, Tuple[int, ...]] = {}
+        self._delta_postings: Dict[int, Set[bytes]] = {}
+
+        self._builds = 0
+        self._compactions = 0
+        self._changes_applied = 0
+        self.last_build_ms: Optional[float] = None
+
+    # --- Keys ---
+
+    def _gender_code(self, gender: Any) -> int:
+        code = self._genders.get(gender)
+        if code is None:
+            code = self._genders[gender] = len(self._genders)
+        return code
+
+    def _color_code(self, color: str, create: bool = True) -> Optional[int]:
+        if len(color) == 7 and color[0] == "#":
+            try:
+                return int(color[1:], 16)
+            except ValueError:
+                pass
+        code = self._odd_colors.get(color)
+        if code is None and create:
+            code = self._odd_colors[color] = _ODD_COLOR_BASE + len(self._odd_colors)
+        return code
+
+    def _doc_keys(self, doc: Dict[str, Any]) -> Tuple[int, ...]:
+        colors = photo_top_colors(doc)
+        if not colors:
+            return ()
+        gender = self._gender_code(doc.get("gender")) << 32
+        return tuple(sorted({gender | self._color_code(color) for color in colors}))
+
+    # --- Building ---
+
+    def build(self, docs: Iterable[Dict[str, Any]]) -> int:
+        """
+        Replace the whole index with the given photo documents.
+
+        Returns:
+            Number of photos indexed (photos without top-2 colors are skipped)
+        """
+        start = time.perf_counter()
+        # Typed buffers rather than lists of Python ints keep the build's peak memory low
+        ids = bytearray()
+        entry_docs = array("q")
+        entry_keys = array("Q")
+        count = 0
+        with self._lock:
+            for doc in docs:
+                keys = self._doc_keys(doc)
+                if keys:
+                    entry_docs.extend([count] * len(keys))
+                    entry_keys.extend(keys)
+                    ids += _id_bytes(doc["_id"])
+                    count += 1
+            self._set_base(
+                np.frombuffer(ids, dtype="S12"),
+                np.frombuffer(entry_docs, dtype=np.int64),
+                np.frombuffer(entry_keys, dtype=np.uint64)
+            )
+            self._delta_docs.clear()
+            self._delta_postings.clear()
+            self._builds += 1
+        self.last_build_ms = round((time.perf_counter() - start) * 1000.0, 1)
+        return count
+
+    def _set_base(self, ids: np.ndarray, entry_docs: np.ndarray, entry_keys: np.ndarray):
+        """New base segment from (document position, key) entries"""
+        order = np.argsort(ids, kind="stable")
+        slot_of_doc = np.empty(len(ids), dtype=np.int64)
+        slot_of_doc[order] = np.arange(len(ids))
+        entry_slots = slot_of_doc[entry_docs]
+
+        by_key = np.lexsort((entry_slots, entry_keys))
+        sorted_keys = entry_keys[by_key]
+        keys, starts = np.unique(sorted_keys, return_index=True)
+
+        self._ids = ids[order]
+        self._alive = np.ones(len(ids), dtype=bool)
+        self._keys = keys
+        self._offsets = np.append(starts, len(sorted_keys)).astype(np.int64)
+        self._slots = entry_slots[by_key].astype(np.int32)
+
+    def _compact(self):
+        """Merge the live base entries and the delta into a new base (lock held)"""
+        entry_counts = np.diff(self._offsets)
+        entry_slots = self._slots.astype(np.int64)
+        entry_keys = np.repeat(self._keys, entry_counts)
+        live = self._alive[entry_slots]
+        live_slots = np.flatnonzero(self._alive)
+
+        # Renumber the live base slots 0..n-1, then append the delta photos
+        renumber = np.full(len(self._ids), -1, dtype=np.int64)
+        renumber[live_slots] = np.arange(len(live_slots))
+        delta = [(oid, keys) for oid, keys in self._delta_docs.items() if keys]
+        ids = np.concatenate([self._ids[live_slots], np.array([oid for oid, _ in delta], dtype="S12")])
+        delta_docs = [len(live_slots) + i for i, (_, keys) in enumerate(delta) for _ in keys]
+        delta_keys = [key for _, keys in delta for key in keys]
+
+        self._set_base(
+            ids,
+            np.concatenate([renumber[entry_slots[live]], np.array(delta_docs, dtype=np.int64)]),
+            np.concatenate([entry_keys[live], np.array(delta_keys, dtype=np.uint64)])
+        )
+        self._delta_docs.clear()
+        self._delta_postings.clear()
+        self._compactions += 1
+
+    # --- Incremental changes ---
+
+    def _base_slot(self, oid: bytes) -> Optional[int]:
+        slot = int(np.searchsorted(self._ids, oid))
+        # numpy drops trailing NUL bytes of S12 values
+        if slot < len(self._ids) and self._ids[slot].ljust(12, b"\0") == oid:
+            return slot
+        return None
+
+    def _replace(self, oid: bytes, keys: Tuple[int, ...]):
+        slot = self._base_slot(oid)
+        if not keys and slot is None and oid not in self._delta_docs:
+            # Never indexed (e.g. an upload without top-2 colors)
+            return
+        if slot is not None:
+            self._alive[slot] = False
+        for key in self._delta_docs.get(oid, ()):
+            postings = self._delta_postings[key]
+            postings.discard(oid)
+            if not postings:
+                del self._delta_postings[key]
+        self._delta_docs[oid] = keys
+        for key in keys:
+            self._delta_postings.setdefault(key, set()).add(oid)
+        self._changes_applied += 1
+        if len(self._delta_docs) >= self.compact_threshold:
+            self._compact()
+
+    def apply(self, doc: Dict[str, Any]):
+        """Insert or update one photo document (needs _id, gender, top2_colors)"""
+        oid = _id_bytes(doc["_id"])
+        with self._lock:
+            self._replace(oid, self._doc_keys(doc))
+
+    def remove(self, doc_id: ObjectId):
+        with self._lock:
+            self._replace(_id_bytes(doc_id), ())
+
+    # --- Matching ---
+
+    def match(
+        self,
+        colors: Iterable[str],
+        gender: Optional[str] = None,
+        after: Optional[str] = None,
+        limit: Optional[int] = None
+    ) -> List[str]:
+        """
+        _ids (as hex strings) of the photos with a top-2 color in `colors`, in
+        _id order - the same photos as clothing_matcher.matching_photos_query.
+
+        Args:
+            colors: Normalized '#rrggbb' colors
+            gender: Optional gender filter (lowercased, as the query does)
+            after: Only _ids greater than this one (hex), to continue a previous page
+            limit: At most this many _ids (None = all)
+        """
+        after_id = bytes.fromhex(after) if after else None
+        with self._lock:
+            if gender:
+                code = self._genders.get(gender.lower())
+                genders = [code] if code is not None else []
+            else:
+                genders = list(self._genders.values())
+            color_codes = {code for code in (self._color_code(c, create=False) for c in colors) if code is not None}
+            query_keys = np.array(
+                sorted((g << 32) | c for g in genders for c in color_codes), dtype=np.uint64
+            )
+
+            positions = np.searchsorted(self._keys, query_keys)
+            in_range = positions < len(self._keys)
+            found = positions[in_range][self._keys[positions[in_range]] == query_keys[in_range]]
+            if len(found):
+                slots = np.unique(np.concatenate([
+                    self._slots[self._offsets[p]:self._offsets[p + 1]] for p in found.tolist()
+                ]))
+                keep = self._alive[slots]
+                if after_id is not None:
+                    keep &= slots >= np.searchsorted(self._ids, after_id, side="right")
+                ids = self._ids[slots[keep]]
+            else:
+                ids = self._ids[:0]
+
+            delta_ids: Set[bytes] = set()
+            if self._delta_postings:
+                for key in query_keys.tolist():
+                    delta_ids.update(self._delta_postings.get(key, ()))
+            if after_id is not None:
+                delta_ids = {oid for oid in delta_ids if oid > after_id}
+
+        if delta_ids:
+            ids = np.sort(np.concatenate([ids, np.array(list(delta_ids), dtype="S12")]))
+        if limit is not None:
+            ids = ids[:limit]
+        # One hex string for all ids (the buffer keeps all 12 bytes of each), then sliced
+        hex_ids = ids.tobytes().hex()
+        return [hex_ids[i:i + 24] for i in range(0, len(hex_ids), 24)]
+
+    # --- Stats ---
+
+    def memory_bytes(self) -> int:
+        """Approximate memory held by the index (arrays plus the Python delta)"""
+        arrays = sum(a.nbytes for a in (self._ids, self._alive, self._keys, self._offsets, self._slots))
+        delta = sys.getsizeof(self._delta_docs) + sys.getsizeof(self._delta_postings)
+        delta += sum(sys.getsizeof(oid) + sys.getsizeof(keys) for oid, keys in self._delta_docs.items())
+        delta += sum(sys.getsizeof(postings) for postings in self._delta_postings.values())
+        return int(arrays + delta)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return int(self._alive.sum()) + sum(1 for keys in self._delta_docs.values() if keys)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "photos": len(self),
+            "base_photos": len(self._ids),
+            "delta_photos": len(self._delta_docs),
+            "posting_keys": len(self._keys),
+            "genders": len(self._genders),
+            "memory_mb": round(self.memory_bytes() / (1024 * 1024), 2),
+            "builds": self._builds,
+            "compactions": self._compactions,
+            "changes_applied": self._changes_applied,
+            "last_build_ms": self.last_build_ms,
+        }
+
+
+class CatalogIndexRefresher:
+    """Builds a CatalogColorIndex from a photos collection and keeps it up to date"""
+
+    def __init__(
+        self,
+        index: Any,
+        photos: Any,
+        poll_interval_s: float = 5.0,
+        rebuild_interval_s: float = 3600.0,
+        use_change_stream: bool = True,
+        name: str = "Catalog index"
+    ):
+        """
+        Args:
+            index: Index to maintain: a CatalogColorIndex, or any index with the same
+                build / apply / remove methods and `projection` (garment_search.GarmentColorIndex)
+            photos: photos collection (pymongo or memory_mongo)
+            poll_interval_s: Polling period when change streams are unavailable
+            rebuild_interval_s: Full rebuild period when polling (0 = never)
+            use_change_stream: Try a change stream before falling back to polling
+            name: Used in log messages
+        """
+        self.index = index
+        self.photos = photos
+        self.poll_interval_s = poll_interval_s
+        self.rebuild_interval_s = rebuild_interval_s
+        self.use_change_stream = use_change_stream
+        self.name = name
+        self.mode: Optional[str] = None
+
+        self._stream = None
+        self._last_id: Optional[ObjectId] = None
+        self._last_update: Optional[datetime] = None
+        self._last_rebuild = 0.0
+        self._errors = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        """Open the change stream (or record the polling position), build the index, start the worker"""
+        if self.use_change_stream:
+            try:
+                # Opened before the build, so no change between the two is lost;
+                # changes already in the build are re-applied idempotently
+                self._stream = self.photos.watch(full_document="updateLookup")
+                self.mode = "change_stream"
+            except Exception as e:
+                print(f"{self.name}: change streams unavailable ({e}), polling every {self.poll_interval_s}s")
+        if self._stream is None:
+            self.mode = "polling"
+
+        self.rebuild()
+        self._thread = threading.Thread(target=self._run, name="catalog-index-refresh", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = 5.0):
+        self._stop.set()
+        if self._stream is not None:
+            try:
+                self._stream.close()
+            except Exception:
+                pass
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def rebuild(self):
+        # Polling resumes from slightly before the build, in case of clock skew
+        self._last_update = datetime.now(timezone.utc) - timedelta(seconds=self.poll_interval_s)
+        last_id = self._last_id
+
+        def tracked(docs):
+            # The highest _id seen, including photos without colors, is where polling resumes
+            nonlocal last_id
+            for doc in docs:
+                if last_id is None or doc["_id"] > last_id:
+                    last_id = doc["_id"]
+                yield doc
+
+        count = self.index.build(tracked(self.photos.find({}, self.index.projection)))
+        self._last_id = last_id
+        self._last_rebuild = time.monotonic()
+        print(f"{self.name} built: {count} photos in {self.index.last_build_ms}ms")
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                if self._stream is not None:
+                    self._consume_stream()
+                else:
+                    self.poll_once()
+                    self._stop.wait(self.poll_interval_s)
+            except Exception as e:
+                self._errors += 1
+                logger.warning(f"{self.name} refresh failed: {e}")
+                if self._stream is not None:
+                    # Resume by polling; the rebuild covers what the stream missed
+                    try:
+                        self._stream.close()
+                    except Exception:
+                        pass
+                    self._stream = None
+                    self.mode = "polling"
+                    self._last_rebuild = 0.0
+                self._stop.wait(self.poll_interval_s)
+
+    def _consume_stream(self):
+        change = self._stream.try_next()
+        if change is None:
+            self._stop.wait(0.05)
+            return
+        operation = change.get("operationType")
+        if operation in ("insert", "update", "replace"):
+            doc = change.get("fullDocument")
+            if doc is None:
+                # Deleted again before the lookup
+                self.index.remove(change["documentKey"]["_id"])
+            else:
+                self.index.apply(doc)
+        elif operation == "delete":
+            self.index.remove(change["documentKey"]["_id"])
+        elif operation in ("drop", "rename", "invalidate"):
+            raise RuntimeError(f"photos change stream ended ({operation})")
+
+    def poll_once(self):
+        """New photos by _id, and edits by updated_at; a full rebuild when one is due"""
+        if self.rebuild_interval_s > 0 and time.monotonic() - self._last_rebuild >= self.rebuild_interval_s:
+            self.rebuild()
+            return
+
+        new_docs = self.photos.find(
+            {"_id": {"$gt": self._last_id}} if self._last_id is not None else {},
+            self.index.projection,
+            sort=[("_id", 1)]
+        )
+        for doc in new_docs:
+            self.index.apply(doc)
+            self._last_id = doc["_id"]
+
+        poll_start = datetime.now(timezone.utc)
+        for doc in self.photos.find({"updated_at": {"$gt": self._last_update}}, self.index.projection):
+            self.index.apply(doc)
+        self._last_update = poll_start - timedelta(seconds=1)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {"mode": self.mode, "errors": self._errors, **self.index.get_stats()}
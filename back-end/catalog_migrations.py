@@ -0,0 +1,100 @@
+# catalog_migrations.py
+"""
+Catalog Migrations
+Backfills the normalized match colors (clothing_matcher.MATCH_COLORS_FIELD)
+of existing photo documents and creates the indexes /get-matching-clothes
+queries with, plus the updated_at index the in-memory catalog index polls
+and the color_similarity primary_color index.
+Safe to re-run: only documents without the field are touched, unless
+--all is given (e.g. after top2_colors were edited outside the API).
+
+Usage (from back-end/, MONGO_URI from the environment or .env):
+    python catalog_migrations.py [--dry-run] [--all] [--batch-size 1000]
+"""
+
+import argparse
+import os
+import time
+from typing import Any, List
+
+from catalog_index import PHOTO_REFRESH_INDEX
+from clothing_matcher import MATCH_COLORS_FIELD, PHOTO_MATCH_INDEXES, photo_top_colors
+from similarity_lookup import SIMILARITY_INDEX
+
+
+def ensure_photo_indexes(photos: Any) -> List[str]:
+    """Creates the matching indexes (a no-op for indexes that already exist)"""
+    names = [photos.create_index(keys) for keys in PHOTO_MATCH_INDEXES]
+    names.append(photos.create_index(PHOTO_REFRESH_INDEX, sparse=True))
+    return names
+
+
+def ensure_similarity_index(color_similarity: Any) -> str:
+    return color_similarity.create_index(SIMILARITY_INDEX)
+
+
+def backfill_match_colors(photos: Any, batch_size: int = 1000, recompute_all: bool = False, dry_run: bool = False) -> int:
+    """
+    Stores the normalized top-2 colors of every photo that lacks them.
+
+    Args:
+        photos: photos collection (pymongo or memory_mongo)
+        batch_size: updates per bulk_write round trip
+        recompute_all: rewrite the field on every document
+        dry_run: count the documents that would change, without writing
+
+    Returns:
+        Number of documents updated (or that would be)
+    """
+    from pymongo import UpdateOne
+
+    query = {} if recompute_all else {MATCH_COLORS_FIELD: {"$exists": False}}
+    # The snapshot of ids is taken up front so updated documents are not revisited
+    pending = [doc["_id"] for doc in photos.find(query, {"_id": 1})]
+    if dry_run:
+        return len(pending)
+
+    updated = 0
+    for start in range(0, len(pending), batch_size):
+        batch_ids = pending[start:start + batch_size]
+        requests = [
+            UpdateOne({"_id": doc["_id"]}, {"$set": {MATCH_COLORS_FIELD: photo_top_colors(doc)}})
+            for doc in photos.find({"_id": {"$in": batch_ids}}, {"top2_colors": 1})
+        ]
+        if requests:
+            updated += photos.bulk_write(requests, ordered=False).matched_count
+    return updated
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backfill and index the photo match colors")
+    parser.add_argument("--uri", default=None, help="MongoDB URI (default: MONGO_URI)")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--all", action="store_true", help="recompute the field on every document")
+    parser.add_argument("--dry-run", action="store_true", help="only count the documents to update")
+    parser.add_argument("--skip-indexes", action="store_true")
+    args = parser.parse_args()
+
+    from dotenv import load_dotenv
+    from pymongo import MongoClient
+
+    load_dotenv()
+    uri = args.uri or os.getenv("MONGO_URI")
+    if not uri:
+        parser.error("no MongoDB URI: pass --uri or set MONGO_URI")
+    db = MongoClient(uri)["color_analysis"]
+    photos = db["photos"]
+
+    start = time.perf_counter()
+    updated = backfill_match_colors(photos, args.batch_size, recompute_all=args.all, dry_run=args.dry_run)
+    verb = "would update" if args.dry_run else "updated"
+    print(f"{MATCH_COLORS_FIELD}: {verb} {updated} documents in {time.perf_counter() - start:.1f}s")
+
+    if not (args.dry_run or args.skip_indexes):
+        for name in ensure_photo_indexes(photos):
+            print(f"index ready: {name}")
+        print(f"index ready: color_similarity.{ensure_similarity_index(db['color_similarity'])}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+# clothing_matcher.py
+"""
+Clothing Color Matching
+Pure helpers behind /get-matching-clothes: hex normalization, expansion of
+the requested colors through their color_similarity documents, and
+matching catalog photos by their top-2 colors - either server side, on the
+normalized copy stored in MATCH_COLORS_FIELD, or by scanning documents.
+
+Also the opaque continuation tokens of paginated matches: the position
+of the last match returned (its _id, and its score for ranked matches).
+
+Kept free of FastAPI/Mongo imports so the matching can be benchmarked and
+tested on synthetic documents.
+"""
+
+import base64
+import binascii
+import json
+from typing import Any, Container, Dict, Iterable, Iterator, List, Mapping, Optional
+
+
+# Normalized top-2 colors, written next to `top2_colors` so matching is an indexed $in
+MATCH_COLORS_FIELD = "top2_colors_norm"
+
+# Multikey indexes for matching_photos_query, with and without the gender filter;
+# the trailing _id lets the server return matches in _id order without a blocking sort
+PHOTO_MATCH_INDEXES = [
+    [("gender", 1), (MATCH_COLORS_FIELD, 1), ("_id", 1)],
+    [(MATCH_COLORS_FIELD, 1), ("_id", 1)],
+]
+
+
+def normalize_hex(value: Any) -> str:
+    """
+    Normalize hex strings to a consistent format: '#rrggbb' lowercase.
+    Handles:
+      - None
+      - strings with/without '#'
+      - strings with spaces
+    """
+    if value is None:
+        return ""
+    s = str(value).strip()
+    if not s:
+        return ""
+    if s.startswith("#"):
+        s = s[1:]
+    # some safety: keep only first 6 chars
+    s = s[:6]
+    return f"#{s.lower()}"
+
+
+def collect_similar_colors(similarity_docs: Iterable[Optional[Mapping[str, Any]]]) -> List[str]:
+    """
+    Sorted, normalized union of the `similar_colors` of color_similarity
+    documents (None for a color without a document).
+    """
+    similar_set = set()
+    for doc in similarity_docs:
+        if doc and "similar_colors" in doc:
+            for similar in doc["similar_colors"]:
+                raw_hex = similar.get("hex") if isinstance(similar, dict) else similar
+                similar_set.add(normalize_hex(raw_hex))
+    return sorted(similar_set)
+
+
+def photo_top_colors(photo: Mapping[str, Any]) -> List[str]:
+    """Normalized `top2_colors` of a photo document (plain hex strings or {"hex": ...} entries)"""
+    return [
+        normalize_hex(x) if isinstance(x, str)
+        else normalize_hex(x.get("hex"))
+        for x in photo.get("top2_colors") or ()
+    ]
+
+
+def iter_matching_photo_ids(photos: Iterable[Mapping[str, Any]], similar_colors: Container[str]) -> Iterator[Any]:
+    """`_id` of every photo with at least one top-2 color in similar_colors, in scan order"""
+    for photo in photos:
+        if any(c in similar_colors for c in photo_top_colors(photo)):
+            yield photo["_id"]
+
+
+def matching_photos_query(similar_colors: List[str], gender: Optional[str] = None) -> Dict[str, Any]:
+    """Photos filter for an indexed match on MATCH_COLORS_FIELD (gender lowercased, as before)"""
+    query: Dict[str, Any] = {}
+    if gender:
+        query["gender"] = gender.lower()
+    query[MATCH_COLORS_FIELD] = {"$in": list(similar_colors)}
+    return query
+
+
+def encode_cursor(position: Mapping[str, Any]) -> str:
+    """Opaque, URL-safe continuation token for a match position"""
+    raw = json.dumps(position, separators=(",", ":"), sort_keys=True).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(token: str) -> Dict[str, Any]:
+    """
+    Match position of a token from encode_cursor.
+
+    Raises:
+        ValueError: if the token is malformed
+    """
+    try:
+        position = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+    except (binascii.Error, UnicodeDecodeError, json.JSONDecodeError) as e:
+        raise ValueError(f"invalid cursor: {e}") from e
+    if not isinstance(position, dict) or not isinstance(position.get("id"), str):
+        raise ValueError("invalid cursor")
+    try:
+        bytes.fromhex(position["id"])
+    except ValueError as e:
+        raise ValueError("invalid cursor: bad _id") from e
+    if len(position["id"]) != 24 or not isinstance(position.get("score", 0.0), (int, float)):
+        raise ValueError("invalid cursor")
+    return position
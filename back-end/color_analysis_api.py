@@ -1,52 +1,160 @@
+import time
+_IMPORT_START = time.perf_counter()
+
 import io
 import os
-from typing import Dict, List, Any, Optional, Tuple
+import asyncio
+import contextlib
+import dataclasses
+import itertools
+import json
+import zipfile
+import zlib
+from typing import AsyncIterator, Dict, Iterator, List, Any, Optional, Tuple
 import logging
-from collections import OrderedDict
+
+from constants import LOG_LEVEL
 
 # Ensure logging is configured early
-logging.basicConfig(level=logging.DEBUG)
+logging.basicConfig(level=LOG_LEVEL)
 
 # PyTorch and ML/Image Imports
 import torch
-import torch.nn as nn
 import numpy as np
 from PIL import Image
 
 
 
 
-from fastapi import FastAPI, UploadFile, File, HTTPException, Query
+from fastapi import FastAPI, UploadFile, File, HTTPException, Query, Header
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
 from pydantic import BaseModel, Field
-from torchvision import transforms
-from torchvision.models import resnext50_32x4d, ResNeXt50_32X4D_Weights
-from constants import MODEL_PATH, COLOR_PALETTE_PATH
-from pymongo import MongoClient
+from constants import (
+    MODEL_PATH,
+    INFERENCE_MODE,
+    CALIBRATION_IMAGES_DIR,
+    COLOR_PALETTE_PATH,
+    ENABLE_INFERENCE_BATCHING,
+    BATCH_MAX_SIZE,
+    BATCH_MAX_WAIT_MS,
+    CPU_POOL_WORKERS,
+    INGEST_POOL_WORKERS,
+    INGEST_POOL_KIND,
+    TORCH_NUM_THREADS,
+    BATCH_MAX_IMAGES,
+    BATCH_MAX_ARCHIVE_MB,
+    MODEL_VERSION_OVERRIDE,
+    RESULT_CACHE_ENABLED,
+    RESULT_CACHE_MAX_ENTRIES,
+    RESULT_CACHE_MAX_MB,
+    RESULT_CACHE_TTL_SECONDS,
+    PHASH_CACHE_ENABLED,
+    PHASH_MAX_DISTANCE,
+    PHASH_CACHE_MAX_ENTRIES,
+    PHASH_MAX_COLOR_DELTA_E,
+    INFERENCE_BACKEND,
+    ONNX_MODEL_PATH,
+    ONNX_INTRA_OP_THREADS,
+    ONNX_PARITY_CHECK,
+    ONNX_PARITY_ATOL,
+    STARTUP_MODE,
+    LAZY_SUBSYSTEMS,
+    JPEG_DRAFT_MIN_SIDE,
+    FACE_DETECT_MAX_SIDE,
+    FACE_PARSE_MAX_SIDE,
+    FACE_MASK_REGIONS,
+    ENABLE_FACE_BATCHING,
+    FACE_BATCH_MAX_SIZE,
+    FACE_BATCH_MAX_WAIT_MS,
+    LATENCY_BUDGET_MS,
+    FACE_DEGRADED_DETECT_MAX_SIDE,
+    PHASH_RELAXED_DISTANCE,
+    SERVER_TIMING_ENABLED,
+    PROFILING_ENABLED,
+    PROFILE_SAMPLE_RATE,
+    PROFILE_INTERVAL_MS,
+    PROFILE_DIR,
+    PROFILE_MAX_COUNT,
+    PROFILE_ADMIN_TOKEN,
+    PROFILE_TORCH,
+    INDEXED_CLOTHES_MATCHING,
+    CATALOG_INDEX_ENABLED,
+    CATALOG_INDEX_CHANGE_STREAMS,
+    CATALOG_INDEX_POLL_SECONDS,
+    CATALOG_INDEX_REBUILD_SECONDS,
+    SIMILARITY_PRELOAD_MAX_DOCS,
+    SIMILARITY_CACHE_MAX_ENTRIES,
+    SIMILARITY_REFRESH_SECONDS,
+    SIMILARITY_RELOAD_SECONDS,
+    SIMILARITY_CHANGE_STREAMS,
+    GARMENT_SEARCH_ENABLED,
+    GARMENT_SEARCH_MAX_DELTA_E,
+    GARMENT_SEARCH_MIN_COVERAGE,
+    CLOTHES_MATCHING_ENGINE,
+    MATCHING_MAX_PAGE_SIZE,
+    MONGO_MAX_POOL_SIZE,
+    MONGO_MIN_POOL_SIZE,
+    MONGO_CONNECT_TIMEOUT_MS,
+    MONGO_SERVER_SELECTION_TIMEOUT_MS,
+    MONGO_SOCKET_TIMEOUT_MS,
+    MONGO_MAX_IDLE_TIME_MS,
+    MONGO_IO_WORKERS,
+)
 from bson.objectid import ObjectId
-from rembg import remove
-from colorthief import ColorThief
 from dotenv import load_dotenv
-import os
-import gridfs
 import base64
+import hmac
 
 
 
 # Import our custom modules
 from color_recommendation_engine import ColorRecommendationEngineV2
 from face_masking_preprocessor import get_face_masking_preprocessor
+from season_classifier import SEASON_LABELS, load_color_analysis_model
+from onnx_backend import OnnxSeasonClassifier, check_parity
+from inference_modes import prepare_model_for_mode
+from micro_batcher import FaceMaskingBatcher, InferenceBatcher
+from result_cache import ResultCache, CachedAnalysis
+from perceptual_cache import PerceptualCache, compute_image_key
+from execution_pool import PipelineExecutor, configure_torch_threads
+from subsystems import SubsystemRegistry, SubsystemUnavailable
+from image_pipeline import decode_image, to_model_tensor
+from clothing_matcher import (
+    MATCH_COLORS_FIELD,
+    collect_similar_colors,
+    decode_cursor,
+    encode_cursor,
+    iter_matching_photo_ids,
+    matching_photos_query,
+    photo_top_colors,
+)
+from metrics import (
+    CACHE_LOOKUPS,
+    CONTENT_TYPE as METRICS_CONTENT_TYPE,
+    DEGRADATIONS,
+    MASKING_FALLBACKS,
+    REGISTRY as METRICS_REGISTRY,
+    ServerTimingMiddleware,
+    timed,
+)
+from latency_budget import (
+    DEGRADE_NEAR_DUPLICATE,
+    DEGRADE_REDUCED_DETECTION,
+    DEGRADE_SKIP_MASKING,
+    DEGRADE_SKIP_PARSING,
+    Deadline,
+    StageCostModel,
+)
+from catalog_index import CatalogColorIndex, CatalogIndexRefresher
+from similarity_lookup import ColorSimilarityLookup, fetch_similarity_docs
+from garment_search import GarmentColorIndex
+from mongo_store import CatalogStore, MongoCatalog
+from profiling import ProfileStore, ProfilingMiddleware, profile_torch_forward, torch_trace_requested
 
 load_dotenv()   # loads everything from .env - MUST be called before reading env vars
 API_BASE_URL = os.getenv("API_BASE_URL", "http://localhost:8000")
 MONGO_URI = os.getenv("MONGO_URI")
-client = MongoClient(MONGO_URI)
-db = client["color_analysis"]
-photos_collection = db["photos"]
-
-# DB references
-color_similarity_collection = db["color_similarity"]
 
 
 
@@ -67,29 +175,79 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+if SERVER_TIMING_ENABLED:
+    app.add_middleware(ServerTimingMiddleware)
+
+
+def _admin_token_ok(token: Optional[str]) -> bool:
+    """X-Admin-Token check for the profiling hooks (closed when no token is configured)"""
+    return bool(PROFILE_ADMIN_TOKEN) and token is not None and hmac.compare_digest(token, PROFILE_ADMIN_TOKEN)
+
+
+# Not installed at all when profiling is off
+PROFILE_STORE: Optional[ProfileStore] = None
+if PROFILING_ENABLED:
+    PROFILE_STORE = ProfileStore(PROFILE_DIR, max_profiles=PROFILE_MAX_COUNT)
+    app.add_middleware(
+        ProfilingMiddleware,
+        store=PROFILE_STORE,
+        sample_rate=PROFILE_SAMPLE_RATE,
+        interval_ms=PROFILE_INTERVAL_MS,
+        torch_traces=PROFILE_TORCH,
+        authorize=_admin_token_ok,
+    )
+    print(f"🔬 Request profiling enabled (sample rate {PROFILE_SAMPLE_RATE}, profiles in {PROFILE_DIR})")
+    if not PROFILE_ADMIN_TOKEN:
+        print("⚠️ PROFILE_ADMIN_TOKEN is not set: profiles can only be sampled, explicit triggers and /admin/profiles are refused")
 
 
 # --- GLOBAL CONFIGURATION ---
 ML_MODEL = None 
 COLOR_ENGINE = None
 FACE_PREPROCESSOR = None 
+FACE_BATCHER = None
+INFERENCE_BATCHER = None
+CATALOG_INDEX_REFRESHER: Optional[CatalogIndexRefresher] = None
+SIMILARITY_LOOKUP: Optional[ColorSimilarityLookup] = None
+GARMENT_SEARCH_REFRESHER: Optional[CatalogIndexRefresher] = None
+ACTIVE_INFERENCE_BACKEND = None
+MODEL_VERSION = "unloaded"
+STARTUP_TIMINGS: Dict[str, float] = {}
+RESULT_CACHE = ResultCache(
+    max_entries=RESULT_CACHE_MAX_ENTRIES,
+    max_bytes=int(RESULT_CACHE_MAX_MB * 1024 * 1024),
+    ttl_seconds=RESULT_CACHE_TTL_SECONDS
+) if RESULT_CACHE_ENABLED else None
+PERCEPTUAL_CACHE = PerceptualCache(
+    max_distance=PHASH_MAX_DISTANCE,
+    max_entries=PHASH_CACHE_MAX_ENTRIES,
+    ttl_seconds=RESULT_CACHE_TTL_SECONDS,
+    relaxed_distance=PHASH_RELAXED_DISTANCE,
+    max_color_delta_e=PHASH_MAX_COLOR_DELTA_E
+) if PHASH_CACHE_ENABLED else None
+STAGE_COSTS = StageCostModel()
+# Face masking options, most expensive first: stage name -> (preprocessor options, degradations)
+FACE_MASKING_LADDER = {
+    "face_masking": ({}, ()),
+    "face_box_crop": ({"parse": False}, (DEGRADE_SKIP_PARSING,)),
+    "face_box_crop_reduced": (
+        {"parse": False, "detect_max_side": FACE_DEGRADED_DETECT_MAX_SIDE},
+        (DEGRADE_SKIP_PARSING, DEGRADE_REDUCED_DETECTION)
+    ),
+}
 IMG_SIZE = (224, 224) 
 DEVICE = torch.device("cpu")
+MAX_UPLOAD_BYTES = 10 * 1024 * 1024  # 10MB per image
+BATCH_IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.bmp')
 USE_FACE_MASKING = True  
+EXECUTOR = PipelineExecutor(
+    cpu_workers=CPU_POOL_WORKERS,
+    ingest_workers=INGEST_POOL_WORKERS,
+    ingest_kind=INGEST_POOL_KIND
+)
+SUBSYSTEMS = SubsystemRegistry()
 # ----------------------------
 
-# --- PYTORCH MODEL ARCHITECTURE ---
-class ColorAnalysisModel(nn.Module):
-    def __init__(self, num_classes=4):
-        super().__init__()
-        self.base_model = resnext50_32x4d(weights=ResNeXt50_32X4D_Weights.IMAGENET1K_V1)
-        num_ftrs = self.base_model.fc.in_features
-        self.base_model.fc = nn.Linear(num_ftrs, num_classes)
-
-    def forward(self, x):
-        return self.base_model(x)
-
-
 # --- ENHANCED DATA MODELS (Pydantic) ---
 class Color(BaseModel):
     name: str
@@ -137,6 +295,23 @@ class AnalysisResult(BaseModel):
     all_probabilities: Dict[str, float] = Field(..., description="All season probabilities")
     description: Optional[SeasonDescription] = None
     face_masking_applied: bool = Field(False, description="Whether face masking was applied")
+    degradations: List[str] = Field(
+        default_factory=list,
+        description="Cheaper pipeline options taken to meet the latency budget"
+    )
+
+
+class BatchItemResult(BaseModel):
+    index: int = Field(..., description="Position of the image in the request")
+    filename: Optional[str] = None
+    result: Optional[AnalysisResult] = None
+    error: Optional[str] = Field(None, description="Why this image could not be analyzed")
+
+
+class BatchAnalysisResult(BaseModel):
+    count: int
+    succeeded: int
+    results: List[BatchItemResult]
 
 
 class DetailedAnalysisResult(BaseModel):
@@ -149,195 +324,566 @@ class DetailedAnalysisResult(BaseModel):
     face_masking_applied: bool = False
 
 
-def fix_state_dict_keys(state_dict, model_has_base_model=True):
-    """Fix state_dict keys to match the model architecture"""
-    new_state_dict = OrderedDict()
+def _load_classifier(timings: Optional[Dict[str, float]] = None):
+    """
+    Load the season classifier for the configured backend.
     
-    for key, value in state_dict.items():
-        new_key = key
-        
-        if new_key.startswith('module.'):
-            new_key = new_key.replace('module.', '')
-        
-        if model_has_base_model:
-            if not new_key.startswith('base_model.'):
-                new_key = 'base_model.' + new_key
-        else:
-            if new_key.startswith('base_model.'):
-                new_key = new_key.replace('base_model.', '')
-        
-        new_state_dict[new_key] = value
+    With INFERENCE_BACKEND=onnx the ONNX Runtime session is verified against the
+    PyTorch checkpoint (unless ONNX_PARITY_CHECK is off) and PyTorch is used
+    as the fallback if the session cannot be created or parity fails.
+    The PyTorch path applies INFERENCE_MODE (channels_last / bf16 / int8).
+    
+    Returns:
+        Tuple of (model, backend_name)
+    """
+    if INFERENCE_BACKEND == "onnx":
+        try:
+            onnx_model = OnnxSeasonClassifier(ONNX_MODEL_PATH, intra_op_threads=ONNX_INTRA_OP_THREADS)
+            if not ONNX_PARITY_CHECK:
+                return onnx_model, "onnx"
+            
+            torch_model = load_color_analysis_model(MODEL_PATH, DEVICE, num_classes=4, timings=timings)
+            report = check_parity(torch_model, onnx_model, atol=ONNX_PARITY_ATOL, img_size=IMG_SIZE)
+            print(f"ONNX parity: max diff {report['max_abs_diff']:.2e}, top-1 agreement {report['top1_agreement']:.0%}")
+            if report["passed"]:
+                return onnx_model, "onnx"
+            
+            print("WARNING: ONNX parity check failed, falling back to PyTorch")
+        except Exception as e:
+            print(f"WARNING: ONNX backend unavailable ({e}), falling back to PyTorch")
+    
+    model = load_color_analysis_model(MODEL_PATH, DEVICE, num_classes=4, timings=timings)
+    mode = "fp32"
+    if INFERENCE_MODE != "fp32":
+        try:
+            model, mode = prepare_model_for_mode(model, INFERENCE_MODE, CALIBRATION_IMAGES_DIR)
+        except Exception as e:
+            print(f"WARNING: inference mode '{INFERENCE_MODE}' failed ({e}), using fp32")
     
-    return new_state_dict
+    # The mode actually running, which is part of MODEL_VERSION (and so of the cache keys)
+    return model, f"torch/{mode}"
 
 
-@app.on_event("startup")
-async def load_resources_on_startup():
-    """Load all models on startup"""
-    global ML_MODEL, COLOR_ENGINE, FACE_PREPROCESSOR
+def _compute_model_version() -> str:
+    """Identifies the loaded weights + backend so cached results never outlive a model swap"""
+    if MODEL_VERSION_OVERRIDE:
+        return MODEL_VERSION_OVERRIDE
     
-    # Load ML Model
+    weights_path = ONNX_MODEL_PATH if ACTIVE_INFERENCE_BACKEND == "onnx" else MODEL_PATH
     try:
-        if not os.path.exists(MODEL_PATH):
-            print(f"Model file not found at {MODEL_PATH}")
-            return
-        
-        print(f"Loading ML model from {MODEL_PATH}...")
-        
-        model = ColorAnalysisModel(num_classes=4)
-        checkpoint = torch.load(MODEL_PATH, map_location=DEVICE, weights_only=False)
-        
-        if isinstance(checkpoint, dict):
-            if 'state_dict' in checkpoint:
-                state_dict = checkpoint['state_dict']
-            elif 'model_state_dict' in checkpoint:
-                state_dict = checkpoint['model_state_dict']
-            else:
-                state_dict = checkpoint
-        else:
-            state_dict = checkpoint
-        
-        state_dict = fix_state_dict_keys(state_dict, model_has_base_model=True)
-        model.load_state_dict(state_dict, strict=True)
-        model.eval()
-        model = model.to(DEVICE)
-        
-        ML_MODEL = model
-        print(f"PyTorch Model loaded successfully!")
-        
-    except Exception as e:
-        print(f"ERROR loading PyTorch model: {e}")
-        import traceback
-        traceback.print_exc()
+        stat = os.stat(weights_path)
+        fingerprint = f"{os.path.basename(weights_path)}:{stat.st_size}:{int(stat.st_mtime)}"
+    except OSError:
+        fingerprint = os.path.basename(weights_path)
+    return f"{ACTIVE_INFERENCE_BACKEND}:{fingerprint}"
+
+
+def _load_classifier_subsystem():
+    """Loads the classifier and, when enabled, starts the micro-batcher in front of it"""
+    global ML_MODEL, INFERENCE_BATCHER, ACTIVE_INFERENCE_BACKEND, MODEL_VERSION
     
-    # Load Color Recommendation Engine
-    try:
-        if not os.path.exists(COLOR_PALETTE_PATH):
-            print(f"Color palette file not found at {COLOR_PALETTE_PATH}")
-            return
-        
-        print(f"Loading Color Recommendation Engine...")
-        COLOR_ENGINE = ColorRecommendationEngineV2(COLOR_PALETTE_PATH)
-        
-    except Exception as e:
-        print(f"ERROR loading Color Recommendation Engine: {e}")
-        import traceback
-        traceback.print_exc()
+    if not os.path.exists(MODEL_PATH):
+        raise FileNotFoundError(f"Model file not found at {MODEL_PATH}")
+    
+    print(f"Loading ML model from {MODEL_PATH}...")
+    classifier_timings: Dict[str, float] = {}
+    model, ACTIVE_INFERENCE_BACKEND = _load_classifier(classifier_timings)
+    for phase, elapsed in classifier_timings.items():
+        STARTUP_TIMINGS[f"classifier.{phase}"] = elapsed
+        print(f"[startup] classifier.{phase}: {elapsed:.1f}ms")
+    
+    ML_MODEL = model
+    MODEL_VERSION = _compute_model_version()
+    print(f"Model loaded successfully! (backend: {ACTIVE_INFERENCE_BACKEND}, version: {MODEL_VERSION})")
+    
+    if ENABLE_INFERENCE_BATCHING:
+        INFERENCE_BATCHER = InferenceBatcher(
+            ML_MODEL,
+            DEVICE,
+            max_batch_size=BATCH_MAX_SIZE,
+            max_wait_ms=BATCH_MAX_WAIT_MS
+        )
+        print(f"Inference batching enabled (max batch {BATCH_MAX_SIZE}, window {BATCH_MAX_WAIT_MS}ms)")
+    
+    return ML_MODEL
+
+
+def _load_color_engine_subsystem():
+    global COLOR_ENGINE
+    
+    if not os.path.exists(COLOR_PALETTE_PATH):
+        raise FileNotFoundError(f"Color palette file not found at {COLOR_PALETTE_PATH}")
+    
+    COLOR_ENGINE = ColorRecommendationEngineV2(COLOR_PALETTE_PATH)
+    return COLOR_ENGINE
+
+
+def _load_face_preprocessor_subsystem():
+    global FACE_PREPROCESSOR, FACE_BATCHER
+    
+    # Note: This will fail if facer dependencies are not installed;
+    # requests then fall back to the unmasked, resized image.
+    FACE_PREPROCESSOR = get_face_masking_preprocessor(
+        device=str(DEVICE),
+        detect_max_side=FACE_DETECT_MAX_SIDE,
+        parse_max_side=FACE_PARSE_MAX_SIDE,
+        mask_regions=FACE_MASK_REGIONS
+    )
+    
+    if ENABLE_FACE_BATCHING:
+        FACE_BATCHER = FaceMaskingBatcher(
+            FACE_PREPROCESSOR,
+            max_batch_size=FACE_BATCH_MAX_SIZE,
+            max_wait_ms=FACE_BATCH_MAX_WAIT_MS
+        )
+        print(f"Face masking batching enabled (max batch {FACE_BATCH_MAX_SIZE}, window {FACE_BATCH_MAX_WAIT_MS}ms)")
+    return FACE_PREPROCESSOR
+
+
+def _load_ingestion_subsystem():
+    # rembg (and the onnxruntime session behind it) + ColorThief
+    import ingestion
+    
+    if INGEST_POOL_KIND == "thread":
+        # Process-pool workers build their own session on first use
+        ingestion.get_rembg_session()
+    return ingestion
+
+
+def _load_mongo_catalog_subsystem():
+    # No connection is opened here: the client connects on the first catalog call
+    catalog = MongoCatalog(
+        MONGO_URI,
+        max_pool_size=MONGO_MAX_POOL_SIZE,
+        min_pool_size=MONGO_MIN_POOL_SIZE,
+        connect_timeout_ms=MONGO_CONNECT_TIMEOUT_MS,
+        server_selection_timeout_ms=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        socket_timeout_ms=MONGO_SOCKET_TIMEOUT_MS,
+        max_idle_time_ms=MONGO_MAX_IDLE_TIME_MS
+    )
+    return CatalogStore(catalog, io_workers=MONGO_IO_WORKERS)
+
+
+def _load_catalog_index_subsystem():
+    global CATALOG_INDEX_REFRESHER
+    
+    catalog = SUBSYSTEMS["mongo_catalog"].ensure()
+    refresher = CatalogIndexRefresher(
+        CatalogColorIndex(),
+        catalog.photos,
+        poll_interval_s=CATALOG_INDEX_POLL_SECONDS,
+        rebuild_interval_s=CATALOG_INDEX_REBUILD_SECONDS,
+        use_change_stream=CATALOG_INDEX_CHANGE_STREAMS
+    )
+    refresher.start()
+    CATALOG_INDEX_REFRESHER = refresher
+    return refresher.index
+
+
+def _load_color_similarity_subsystem():
+    global SIMILARITY_LOOKUP
+    
+    catalog = SUBSYSTEMS["mongo_catalog"].ensure()
+    lookup = ColorSimilarityLookup(
+        catalog.color_similarity,
+        preload_max_docs=SIMILARITY_PRELOAD_MAX_DOCS,
+        cache_max_entries=SIMILARITY_CACHE_MAX_ENTRIES,
+        refresh_interval_s=SIMILARITY_REFRESH_SECONDS,
+        reload_interval_s=SIMILARITY_RELOAD_SECONDS,
+        use_change_stream=SIMILARITY_CHANGE_STREAMS
+    )
+    lookup.start()
+    SIMILARITY_LOOKUP = lookup
+    return lookup
+
+
+def _load_garment_search_subsystem():
+    global GARMENT_SEARCH_REFRESHER
     
-    # Load Face Masking Preprocessor
-    if USE_FACE_MASKING:
+    catalog = SUBSYSTEMS["mongo_catalog"].ensure()
+    refresher = CatalogIndexRefresher(
+        GarmentColorIndex(max_delta_e=GARMENT_SEARCH_MAX_DELTA_E, min_coverage=GARMENT_SEARCH_MIN_COVERAGE),
+        catalog.photos,
+        poll_interval_s=CATALOG_INDEX_POLL_SECONDS,
+        rebuild_interval_s=CATALOG_INDEX_REBUILD_SECONDS,
+        use_change_stream=CATALOG_INDEX_CHANGE_STREAMS,
+        name="Garment search"
+    )
+    refresher.start()
+    GARMENT_SEARCH_REFRESHER = refresher
+    return refresher.index
+
+
+SUBSYSTEMS.register("classifier", _load_classifier_subsystem, lazy="classifier" in LAZY_SUBSYSTEMS)
+SUBSYSTEMS.register("color_engine", _load_color_engine_subsystem, lazy="color_engine" in LAZY_SUBSYSTEMS)
+SUBSYSTEMS.register(
+    "face_preprocessor",
+    _load_face_preprocessor_subsystem,
+    enabled=USE_FACE_MASKING,
+    lazy="face_preprocessor" in LAZY_SUBSYSTEMS
+)
+SUBSYSTEMS.register("ingestion", _load_ingestion_subsystem, lazy="ingestion" in LAZY_SUBSYSTEMS)
+SUBSYSTEMS.register(
+    "mongo_catalog",
+    _load_mongo_catalog_subsystem,
+    lazy="mongo_catalog" in LAZY_SUBSYSTEMS,
+    retry_on_failure=True
+)
+SUBSYSTEMS.register(
+    "color_similarity",
+    _load_color_similarity_subsystem,
+    lazy="color_similarity" in LAZY_SUBSYSTEMS,
+    retry_on_failure=True
+)
+SUBSYSTEMS.register(
+    "catalog_index",
+    _load_catalog_index_subsystem,
+    enabled=CATALOG_INDEX_ENABLED
+)  # always eager: matching falls back to Mongo until it is ready instead of waiting for it
+SUBSYSTEMS.register("garment_search", _load_garment_search_subsystem, enabled=GARMENT_SEARCH_ENABLED)
+
+
+async def _require(*names: str) -> List[Any]:
+    """Waits for (or triggers) the given subsystems; 503 if one is unavailable"""
+    values = []
+    for name in names:
         try:
-            print(f"Loading Face Masking Preprocessor...")
-            # Note: This will fail if facer dependencies are not installed, 
-            # and FACE_PREPROCESSOR will remain None.
-            FACE_PREPROCESSOR = get_face_masking_preprocessor(device=str(DEVICE))
-            
-        except Exception as e:
-            print(f"WARNING: Face masking preprocessor failed to load: {e}")
-            print("   Continuing without face masking...")
-            import traceback
-            traceback.print_exc()
+            values.append(await SUBSYSTEMS[name].ensure_async())
+        except SubsystemUnavailable as e:
+            raise HTTPException(status_code=503, detail=str(e))
+    return values
+
+
+async def _catalog() -> CatalogStore:
+    (catalog,) = await _require("mongo_catalog")
+    return catalog
+
+
+@app.on_event("startup")
+async def load_resources_on_startup():
+    """Start loading the eager subsystems in parallel; lazy ones load on first use"""
+    startup_begin = time.perf_counter()
+    
+    intra_op, inter_op = configure_torch_threads(CPU_POOL_WORKERS, TORCH_NUM_THREADS)
+    print(f"Torch threads: intra-op={intra_op}, inter-op={inter_op} (cpu pool: {CPU_POOL_WORKERS} workers)")
+    
+    started = SUBSYSTEMS.start_eager()
+    print(f"[startup] loading in parallel: {', '.join(started) or 'nothing'} (lazy: {', '.join(LAZY_SUBSYSTEMS) or 'nothing'})")
+    
+    if STARTUP_MODE == "blocking":
+        await asyncio.get_running_loop().run_in_executor(None, SUBSYSTEMS.wait, started)
+        STARTUP_TIMINGS["total"] = round((time.perf_counter() - startup_begin) * 1000.0, 1)
+        print(f"[startup] total: {STARTUP_TIMINGS['total']:.1f}ms")
+
+
+@app.on_event("shutdown")
+async def release_resources_on_shutdown():
+    """Stop background workers"""
+    if INFERENCE_BATCHER is not None:
+        INFERENCE_BATCHER.stop()
+    if FACE_BATCHER is not None:
+        FACE_BATCHER.stop()
+    if CATALOG_INDEX_REFRESHER is not None:
+        CATALOG_INDEX_REFRESHER.stop()
+    if SIMILARITY_LOOKUP is not None:
+        SIMILARITY_LOOKUP.stop()
+    if GARMENT_SEARCH_REFRESHER is not None:
+        GARMENT_SEARCH_REFRESHER.stop()
+    catalog = SUBSYSTEMS["mongo_catalog"].get(wait=False)
+    if catalog is not None:
+        catalog.close()
+    EXECUTOR.shutdown(wait=False)
 
 
 # --- Preprocessing Pipeline ---
-preprocess = transforms.Compose([
-    transforms.Resize(IMG_SIZE),
-    transforms.ToTensor(),
-    transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225]), 
-])
+def preprocess(pil_image: Image.Image) -> torch.Tensor:
+    """Resize (only if needed) + ToTensor + ImageNet normalization in one pass"""
+    return to_model_tensor(pil_image, IMG_SIZE)
 
 
 # --- NEW: Refactored Image Processing Helper (Masking logic removed) ---
-def _process_image_for_model(image_data: bytes, apply_face_masking: bool = True) -> Tuple[Image.Image, bool]:
+def _process_image_for_model(
+    image_data: bytes,
+    apply_face_masking: bool = True,
+    deadline: Optional[Deadline] = None
+) -> Tuple[Image.Image, bool]:
     """
     Handles all image loading, face masking, and resizing.
     
+    Args:
+        deadline: Latency budget of the request; when it cannot cover full face
+                  masking plus classification, the first affordable option of
+                  FACE_MASKING_LADDER is used and recorded as a degradation
+    
     Returns:
         Tuple of (processed_pil_image, masking_applied)
     """
     masking_applied = False
+    deadline = deadline or Deadline(None, STAGE_COSTS)
     
     try:
-        pil_image = Image.open(io.BytesIO(image_data))
-        if pil_image.mode != 'RGB':
-            logging.info(f"Converting image from {pil_image.mode} to RGB")
-            pil_image = pil_image.convert('RGB')
-        logging.info(f"Image loaded successfully: {pil_image.size}")
+        # Decoded once (EXIF orientation, RGB, draft-mode JPEG) and shared with the face preprocessor
+        with deadline.stage("decode"), timed("decode"):
+            decoded = decode_image(image_data, draft_min_side=JPEG_DRAFT_MIN_SIDE)
+        logging.debug(f"Image loaded successfully: {decoded.size} (source {decoded.source_size})")
     except Exception as e:
         logging.error(f"Failed to load image: {str(e)}")
         raise HTTPException(status_code=400, detail=f"Invalid image file: {str(e)}")
 
-    # Apply face masking if enabled and preprocessor is available
-    if apply_face_masking and FACE_PREPROCESSOR is not None:
+    # Apply face masking if enabled and preprocessor is available (waits if it is still loading)
+    face_preprocessor = SUBSYSTEMS["face_preprocessor"].get() if apply_face_masking else None
+    face_stage = deadline.choose(list(FACE_MASKING_LADDER), then=("classify",)) if face_preprocessor else None
+    if apply_face_masking and face_preprocessor is None:
+        MASKING_FALLBACKS.inc("unavailable")
+    if face_preprocessor is not None and face_stage is None:
+        MASKING_FALLBACKS.inc("budget")
+        logging.warning(f"Latency budget exhausted ({deadline.remaining_ms():.0f}ms left), skipping face masking")
+        deadline.degrade(DEGRADE_SKIP_MASKING)
+    elif face_preprocessor is not None:
+        options, degradations = FACE_MASKING_LADDER[face_stage]
         try:
-            logging.info("Applying face masking preprocessing...")
-            # FACE_PREPROCESSOR.process_image returns the masked/cropped PIL image at IMG_SIZE
-            processed_pil_image, _ = FACE_PREPROCESSOR.process_image(image_data, output_size=IMG_SIZE)
+            logging.debug(f"Applying face masking preprocessing ({face_stage})...")
+            # Returns the masked/cropped PIL image at IMG_SIZE; through the batcher,
+            # concurrent requests share one detector and one parser call
+            with deadline.stage(face_stage), timed(face_stage):
+                if FACE_BATCHER is not None:
+                    processed_pil_image, _ = FACE_BATCHER.process((decoded, IMG_SIZE, options))
+                else:
+                    processed_pil_image, _ = face_preprocessor.process_image(decoded, output_size=IMG_SIZE, **options)
             masking_applied = True
-            logging.info("Face masking applied successfully")
+            for name in degradations:
+                deadline.degrade(name)
+            logging.debug("Face masking applied successfully")
             return processed_pil_image, masking_applied
         except Exception as e:
             # Fall back to resized original image on failure
+            MASKING_FALLBACKS.inc("error")
             logging.warning(f"Face masking failed: {str(e)}, using resized original image")
             # Fall through to standard resizing
     
     # Standard resize if masking is disabled, preprocessor failed to load, or masking failed
-    logging.info("Resizing original image to model input size.")
-    processed_pil_image = pil_image.resize(IMG_SIZE, Image.Resampling.LANCZOS)
+    logging.debug("Resizing original image to model input size.")
+    processed_pil_image = decoded.pil.resize(IMG_SIZE, Image.Resampling.LANCZOS)
     
     return processed_pil_image, masking_applied
 
 
-def analyze_image_tone(image_data: bytes, apply_face_masking: bool = True) -> tuple[str, float, Dict[str, float], np.ndarray, bool, Image.Image]:
+def _classify_tensor(input_tensor: torch.Tensor) -> torch.Tensor:
+    """
+    Runs the classifier on a single preprocessed (3, H, W) tensor.
+    
+    Goes through the micro-batcher when enabled so concurrent requests share
+    one forward pass.
+    
+    Returns:
+        1-D tensor of softmax probabilities
+    """
+    # A torch-profiled request runs its own forward pass so the trace (recorded
+    # on the calling thread) covers it
+    torch_trace = PROFILE_TORCH and torch_trace_requested()
+    if INFERENCE_BATCHER is not None and not torch_trace:
+        return INFERENCE_BATCHER.process(input_tensor)
+    
+    input_batch = input_tensor.unsqueeze(0).to(DEVICE)
+    if torch_trace:
+        with torch.no_grad(), profile_torch_forward(PROFILE_DIR):
+            output = ML_MODEL(input_batch)
+    else:
+        with torch.no_grad():
+            output = ML_MODEL(input_batch)
+    return torch.nn.functional.softmax(output, dim=1)[0].cpu()
+
+
+def _classify_batch(input_tensors: List[torch.Tensor]) -> torch.Tensor:
+    """
+    Runs the classifier on many preprocessed tensors in true batches
+    of up to BATCH_MAX_SIZE images.
+    
+    With the micro-batcher enabled the tensors are queued on it, so its worker
+    stays the only thread running forward passes.
+    
+    Returns:
+        (N, num_classes) tensor of softmax probabilities
+    """
+    if INFERENCE_BATCHER is not None:
+        with timed("classify"):
+            futures = [INFERENCE_BATCHER.submit(tensor) for tensor in input_tensors]
+            return torch.stack([future.result() for future in futures])
+    
+    outputs = []
+    for start in range(0, len(input_tensors), BATCH_MAX_SIZE):
+        input_batch = torch.stack(input_tensors[start:start + BATCH_MAX_SIZE]).to(DEVICE)
+        with torch.no_grad(), timed("classify"):
+            output = ML_MODEL(input_batch)
+        outputs.append(torch.nn.functional.softmax(output, dim=1).cpu())
+    return torch.cat(outputs)
+
+
+def _probabilities_to_prediction(probabilities: torch.Tensor) -> Tuple[str, float, Dict[str, float]]:
+    """
+    Maps a 1-D softmax row to seasons: [Autumn, Summer, Winter, Spring]
+    
+    Returns:
+        Tuple of (season_name, confidence, all_probabilities)
+    """
+    predicted_index = torch.argmax(probabilities).item()
+    season_name = SEASON_LABELS[predicted_index]
+    confidence = probabilities[predicted_index].item()
+    
+    all_probs = {
+        season: probabilities[idx].item() 
+        for idx, season in enumerate(SEASON_LABELS)
+    }
+    return season_name, confidence, all_probs
+
+
+def _prepare_input_tensor(image_data: bytes, apply_face_masking: bool = True) -> Tuple[torch.Tensor, bool]:
+    """
+    Decode, mask and normalize one image for the classifier.
+    
+    Returns:
+        Tuple of (input_tensor, masking_applied)
+    """
+    processed_pil_image, masking_applied = _process_image_for_model(image_data, apply_face_masking)
+    return preprocess(processed_pil_image), masking_applied
+
+
+def analyze_image_tone(
+    image_data: bytes,
+    apply_face_masking: bool = True,
+    deadline: Optional[Deadline] = None
+) -> tuple[str, float, Dict[str, float], np.ndarray, bool, Image.Image]:
     """
     Analyzes the image using the loaded PyTorch model
     
+    Args:
+        deadline: Latency budget of the request (see _process_image_for_model)
+    
     Returns:
         Tuple of (season_name, confidence, all_probabilities, raw_predictions, masking_applied, processed_pil_image)
     """
-    if ML_MODEL is None:
-        raise HTTPException(status_code=503, detail="ML Model not initialized.")
+    try:
+        SUBSYSTEMS["classifier"].ensure()
+    except SubsystemUnavailable as e:
+        raise HTTPException(status_code=503, detail=f"ML Model not initialized. ({e})")
 
     try:
-        processed_pil_image, masking_applied = _process_image_for_model(image_data, apply_face_masking)
-        
-        # Preprocess for PyTorch
-        input_tensor = preprocess(processed_pil_image)
-        input_batch = input_tensor.unsqueeze(0).to(DEVICE)
-        
-        # Run inference
-        with torch.no_grad():
-            output = ML_MODEL(input_batch)
-        
-        probabilities = torch.nn.functional.softmax(output, dim=1)
-        predicted_index = torch.argmax(probabilities, dim=1).item()
-        
-        # Map to seasons: [Autumn, Summer, Winter, Spring]
-        SEASON_LABELS = ['Autumn', 'Summer', 'Winter', 'Spring']
-        season_name = SEASON_LABELS[predicted_index]
-        confidence = probabilities[0, predicted_index].item()
+        deadline = deadline or Deadline(None, STAGE_COSTS)
+        processed_pil_image, masking_applied = _process_image_for_model(image_data, apply_face_masking, deadline)
         
-        all_probs = {
-            season: probabilities[0, idx].item() 
-            for idx, season in enumerate(SEASON_LABELS)
-        }
+        with deadline.stage("classify"), timed("classify"):
+            # Preprocess for PyTorch
+            input_tensor = preprocess(processed_pil_image)
+            
+            # Run inference
+            probabilities = _classify_tensor(input_tensor)
+        season_name, confidence, all_probs = _probabilities_to_prediction(probabilities)
         
-        raw_predictions = probabilities[0].cpu().numpy()
+        raw_predictions = probabilities.numpy()
         
-        print(f"Prediction: {season_name} (Confidence: {confidence:.2%})")
+        logging.debug(f"Prediction: {season_name} (Confidence: {confidence:.2%})")
         
         return season_name, confidence, all_probs, raw_predictions, masking_applied, processed_pil_image
         
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Image analysis error: {e}")
-        import traceback
-        traceback.print_exc()
+        logging.error(f"Image analysis error: {e}", exc_info=True)
         # Raise generic 400 error if it wasn't already an HTTPException
         raise HTTPException(status_code=400, detail=f"Image analysis failed: {str(e)}")
 
 
+def _build_analysis_result(
+    season: str,
+    confidence: float,
+    all_probs: Dict[str, float],
+    masking_applied: bool,
+    include_description: bool = False,
+    degradations: Tuple[str, ...] = ()
+) -> AnalysisResult:
+    """Builds the API response (weighted palette + optional description) for one prediction"""
+    # Get palette from color engine using weighted method for personalization
+    if COLOR_ENGINE:
+        with timed("palette"):
+            palette_data = COLOR_ENGINE.get_weighted_palette_for_probabilities(all_probs)
+    else:
+        logging.error("Color Engine not initialized")
+        raise HTTPException(status_code=503, detail="Color Engine not initialized")
+    
+    result = AnalysisResult(
+        season=season,
+        confidence=round(confidence, 4),
+        palettes=Palette(**palette_data),
+        all_probabilities=all_probs,
+        face_masking_applied=masking_applied,
+        degradations=list(degradations)
+    )
+    
+    if include_description and COLOR_ENGINE:
+        # Assuming get_season_description returns a dict compatible with SeasonDescription
+        result.description = SeasonDescription(**COLOR_ENGINE.get_season_description(season))
+    
+    return result
+
+
+def _analyze_with_near_duplicate_cache(
+    image_data: bytes,
+    apply_face_masking: bool = True,
+    deadline: Optional[Deadline] = None
+) -> CachedAnalysis:
+    """
+    Runs on the cpu pool: checks the perceptual-hash tier before the expensive
+    face masking + classification, and stores the result there on a miss.
+    
+    When the deadline cannot cover the full pipeline, a match within
+    PHASH_RELAXED_DISTANCE is served instead (as a degradation). Degraded
+    results are never stored.
+    """
+    deadline = deadline or Deadline(None, STAGE_COSTS)
+    
+    def analyze() -> CachedAnalysis:
+        _, _, all_probs, _, masking_applied, _ = analyze_image_tone(image_data, apply_face_masking, deadline)
+        return CachedAnalysis(
+            probabilities=all_probs,
+            masking_applied=masking_applied,
+            degradations=tuple(deadline.degradations)
+        )
+    
+    if PERCEPTUAL_CACHE is None:
+        return analyze()
+    
+    namespace = PerceptualCache.namespace(apply_face_masking, MODEL_VERSION)
+    try:
+        image_hash, image_color = compute_image_key(image_data)
+    except Exception:
+        # Undecodable upload - let the full pipeline report the error
+        image_hash, image_color = None, None
+    
+    if image_hash is not None:
+        relaxed = (
+            PERCEPTUAL_CACHE.relaxed_distance > PERCEPTUAL_CACHE.max_distance
+            and not deadline.affords("decode", "face_masking", "classify")
+        )
+        match = PERCEPTUAL_CACHE.get(
+            image_hash,
+            namespace,
+            max_distance=PERCEPTUAL_CACHE.relaxed_distance if relaxed else None,
+            color=image_color
+        )
+        CACHE_LOOKUPS.inc("near_duplicate", "miss" if match is None else "hit")
+        if match is not None:
+            analysis, distance = match
+            logging.debug(f"Near-duplicate cache hit (distance {distance})")
+            if distance > PERCEPTUAL_CACHE.max_distance:
+                return dataclasses.replace(analysis, degradations=(DEGRADE_NEAR_DUPLICATE,))
+            return analysis
+    
+    analysis = analyze()
+    if image_hash is not None and not analysis.degradations:
+        PERCEPTUAL_CACHE.put(image_hash, namespace, analysis, color=image_color)
+    return analysis
+
+
 # --- API ENDPOINTS ---
 
 @app.post(
@@ -349,17 +895,23 @@ def analyze_image_tone(image_data: bytes, apply_face_masking: bool = True) -> tu
 async def analyze_color_endpoint(
     image: UploadFile = File(..., description="The image to analyze."),
     include_description: bool = Query(False, description="Include detailed season description"),
-    apply_face_masking: bool = Query(True, description="Apply face masking preprocessing")
+    apply_face_masking: bool = Query(True, description="Apply face masking preprocessing"),
+    latency_budget_ms: Optional[float] = Query(
+        None, ge=0, description="Latency budget in ms (0 = unlimited, default: server LATENCY_BUDGET_MS)"
+    )
 ) -> AnalysisResult:
     """Basic color analysis endpoint with optional face masking"""
+    # The budget starts when the request reaches the handler, so upload and queueing time count
+    deadline = Deadline(LATENCY_BUDGET_MS if latency_budget_ms is None else latency_budget_ms, STAGE_COSTS)
     try:
-        logging.info(f"Received image for analysis: {image.filename}, content_type: {image.content_type}")
+        logging.debug(f"Received image for analysis: {image.filename}, content_type: {image.content_type}")
         
         if image.content_type and not image.content_type.startswith('image/'):
             logging.error(f"Invalid content type: {image.content_type}")
             raise HTTPException(status_code=400, detail="File must be an image")
         
-        image_bytes = await image.read()
+        with timed("upload_read"):
+            image_bytes = await image.read()
         
         max_size = 10 * 1024 * 1024  # 10MB
         if len(image_bytes) > max_size:
@@ -371,41 +923,198 @@ async def analyze_color_endpoint(
             logging.error("Empty file uploaded")
             raise HTTPException(status_code=400, detail="Empty file uploaded")
         
-        logging.info(f"Image size: {len(image_bytes)} bytes, starting analysis...")
+        logging.debug(f"Image size: {len(image_bytes)} bytes, starting analysis...")
         
-        # Analyze the image (image is discarded here)
-        season, confidence, all_probs, _, masking_applied, _ = analyze_image_tone(image_bytes, apply_face_masking)
+        # Cache keys include MODEL_VERSION, so wait for a classifier that is still loading
+        await _require("classifier", "color_engine")
         
-        logging.info(f"Analysis complete: {season} ({confidence:.2%})")
+        async def compute() -> CachedAnalysis:
+            # Analyze the image off the event loop (image is discarded here)
+            return await EXECUTOR.run_cpu(_analyze_with_near_duplicate_cache, image_bytes, apply_face_masking, deadline)
         
-        # Get palette from color engine using weighted method for personalization
-        if COLOR_ENGINE:
-            palette_data = COLOR_ENGINE.get_weighted_palette_for_probabilities(all_probs)
+        if RESULT_CACHE is not None:
+            cache_key = ResultCache.make_key(image_bytes, apply_face_masking, MODEL_VERSION)
+            analysis, cache_hit = await RESULT_CACHE.get_or_compute(cache_key, compute)
+            CACHE_LOOKUPS.inc("result", "hit" if cache_hit else "miss")
         else:
-            logging.error("Color Engine not initialized")
-            raise HTTPException(status_code=503, detail="Color Engine not initialized")
+            analysis, cache_hit = await compute(), False
+        
+        season, confidence = analysis.top_season()
+        logging.info(f"Analysis complete: {season} ({confidence:.2%}){' [cached]' if cache_hit else ''}")
+        for name in analysis.degradations:
+            DEGRADATIONS.inc(name)
+        if analysis.degradations:
+            logging.info(f"Degradations: {', '.join(analysis.degradations)} (stages: {deadline.stage_ms})")
         
-        result = AnalysisResult(
-            season=season,
-            confidence=round(confidence, 4),
-            palettes=Palette(**palette_data),
-            all_probabilities=all_probs,
-            face_masking_applied=masking_applied
+        return _build_analysis_result(
+            season, confidence, analysis.probabilities, analysis.masking_applied, include_description,
+            analysis.degradations
         )
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error(f"Error in analyze_color_endpoint: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Internal error: {str(e)}")
+
+
+def _read_batch_archive(archive_bytes: bytes) -> List[Tuple[str, bytes]]:
+    """Extracts image files from a zip archive, in archive order (runs on the cpu pool)"""
+    try:
+        zf = zipfile.ZipFile(io.BytesIO(archive_bytes))
+    except zipfile.BadZipFile:
+        raise HTTPException(status_code=400, detail="Archive must be a valid zip file")
+    
+    items = []
+    with zf:
+        for info in zf.infolist():
+            if info.is_dir() or not info.filename.lower().endswith(BATCH_IMAGE_EXTENSIONS):
+                continue
+            if os.path.basename(info.filename).startswith('.'):
+                continue  # macOS resource forks etc.
+            if len(items) >= BATCH_MAX_IMAGES:
+                raise HTTPException(status_code=413, detail=f"Too many images (max {BATCH_MAX_IMAGES} per request)")
+            if info.file_size > MAX_UPLOAD_BYTES:
+                # Keep the slot so indexes still line up with the archive
+                items.append((info.filename, b""))
+                continue
+            try:
+                items.append((info.filename, zf.read(info)))
+            except (zipfile.BadZipFile, zlib.error, EOFError, RuntimeError, NotImplementedError) as e:
+                # CRC mismatch, truncated or corrupt data, encryption, unsupported compression
+                raise HTTPException(status_code=400, detail=f"Cannot read {info.filename} from the archive: {e}")
+    return items
+
+
+async def _analyze_batch_items(
+    items: List[Tuple[str, bytes]],
+    apply_face_masking: bool,
+    include_description: bool
+) -> BatchAnalysisResult:
+    """Decode + mask in parallel, classify in true batches, build one result per item"""
+    errors: Dict[int, str] = {}
+    
+    for index, (_, data) in enumerate(items):
+        if len(data) == 0:
+            errors[index] = "Empty file or file larger than 10MB"
+        elif len(data) > MAX_UPLOAD_BYTES:
+            errors[index] = f"File too large ({len(data) / (1024 * 1024):.2f}MB). Maximum size is 10MB."
+    
+    results: Dict[int, AnalysisResult] = {}
+    cache_keys: Dict[int, str] = {}
+    if RESULT_CACHE is not None:
+        for index, (_, data) in enumerate(items):
+            if index in errors:
+                continue
+            cache_keys[index] = ResultCache.make_key(data, apply_face_masking, MODEL_VERSION)
+            cached = RESULT_CACHE.get(cache_keys[index])
+            CACHE_LOOKUPS.inc("result", "miss" if cached is None else "hit")
+            if cached is not None:
+                season, confidence = cached.top_season()
+                results[index] = _build_analysis_result(
+                    season, confidence, cached.probabilities, cached.masking_applied, include_description
+                )
+    
+    pending = [index for index in range(len(items)) if index not in errors and index not in results]
+    prepared = await asyncio.gather(
+        *(EXECUTOR.run_cpu(_prepare_input_tensor, items[index][1], apply_face_masking) for index in pending),
+        return_exceptions=True
+    )
+    
+    tensors, ready, masking_flags = [], [], []
+    for index, outcome in zip(pending, prepared):
+        if isinstance(outcome, BaseException):
+            errors[index] = outcome.detail if isinstance(outcome, HTTPException) else f"Image analysis failed: {outcome}"
+            continue
+        tensor, masking_applied = outcome
+        tensors.append(tensor)
+        ready.append(index)
+        masking_flags.append(masking_applied)
+    
+    if tensors:
+        probabilities = await EXECUTOR.run_cpu(_classify_batch, tensors)
+        for row, (index, masking_applied) in enumerate(zip(ready, masking_flags)):
+            season, confidence, all_probs = _probabilities_to_prediction(probabilities[row])
+            if RESULT_CACHE is not None:
+                RESULT_CACHE.put(cache_keys[index], CachedAnalysis(probabilities=all_probs, masking_applied=masking_applied))
+            results[index] = _build_analysis_result(
+                season, confidence, all_probs, masking_applied, include_description
+            )
+    
+    return BatchAnalysisResult(
+        count=len(items),
+        succeeded=len(results),
+        results=[
+            BatchItemResult(
+                index=index,
+                filename=filename,
+                result=results.get(index),
+                error=errors.get(index)
+            )
+            for index, (filename, _) in enumerate(items)
+        ]
+    )
+
+
+@app.post(
+    "/analyze-color/batch",
+    response_model=BatchAnalysisResult,
+    summary="Analyze many images in one request",
+    description="Accepts multiple image files and/or a zip archive of images. Returns one result per image, in order, with per-item errors."
+)
+async def analyze_color_batch_endpoint(
+    images: Optional[List[UploadFile]] = File(None, description="Images to analyze."),
+    archive: Optional[UploadFile] = File(None, description="Zip archive of images."),
+    include_description: bool = Query(False, description="Include detailed season description"),
+    apply_face_masking: bool = Query(True, description="Apply face masking preprocessing")
+) -> BatchAnalysisResult:
+    """Batch color analysis endpoint for bulk re-analysis jobs"""
+    try:
+        await _require("classifier", "color_engine")
+        
+        items: List[Tuple[str, bytes]] = []
+        for upload in images or []:
+            if len(items) >= BATCH_MAX_IMAGES:
+                raise HTTPException(status_code=413, detail=f"Too many images (max {BATCH_MAX_IMAGES} per request)")
+            with timed("upload_read"):
+                items.append((upload.filename, await upload.read()))
+        
+        if archive is not None:
+            max_archive_bytes = int(BATCH_MAX_ARCHIVE_MB * 1024 * 1024)
+            with timed("upload_read"):
+                archive_bytes = await archive.read(max_archive_bytes + 1)
+            if len(archive_bytes) > max_archive_bytes:
+                raise HTTPException(status_code=413, detail=f"Archive too large. Maximum size is {BATCH_MAX_ARCHIVE_MB:g}MB.")
+            # Decompressing up to BATCH_MAX_IMAGES members is CPU work
+            archive_items = await EXECUTOR.run_cpu(_read_batch_archive, archive_bytes)
+            if len(items) + len(archive_items) > BATCH_MAX_IMAGES:
+                raise HTTPException(status_code=413, detail=f"Too many images (max {BATCH_MAX_IMAGES} per request)")
+            items.extend(archive_items)
         
-        if include_description and COLOR_ENGINE:
-            # Assuming get_season_description returns a dict compatible with SeasonDescription
-            result.description = SeasonDescription(**COLOR_ENGINE.get_season_description(season))
+        if not items:
+            raise HTTPException(status_code=400, detail="No images provided")
         
-        return result
+        logging.info(f"Batch analysis of {len(items)} images")
+        return await _analyze_batch_items(items, apply_face_masking, include_description)
     
     except HTTPException:
         raise
     except Exception as e:
-        logging.error(f"Error in analyze_color_endpoint: {str(e)}", exc_info=True)
+        logging.error(f"Error in analyze_color_batch_endpoint: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Internal error: {str(e)}")
 
 
+def _render_debug_image(image_bytes: bytes, apply_face_masking: bool) -> Tuple[io.BytesIO, bool]:
+    """Runs the preprocessing pipeline and encodes the model input as JPEG"""
+    pil_image, masking_applied = _process_image_for_model(image_bytes, apply_face_masking)
+
+    # Convert PIL image to bytes
+    img_byte_arr = io.BytesIO()
+    pil_image.save(img_byte_arr, format='JPEG', quality=95) # Use high quality for debugging
+    img_byte_arr.seek(0)
+    return img_byte_arr, masking_applied
+
+
 # --- NEW DEBUG ENDPOINT ---
 @app.post(
     "/analyze-debug-masked-image",
@@ -421,7 +1130,8 @@ async def analyze_debug_masked_image_endpoint(
         if image.content_type and not image.content_type.startswith('image/'):
             raise HTTPException(status_code=400, detail="File must be an image")
         
-        image_bytes = await image.read()
+        with timed("upload_read"):
+            image_bytes = await image.read()
         
         max_size = 10 * 1024 * 1024  # 10MB
         if len(image_bytes) > max_size:
@@ -431,15 +1141,12 @@ async def analyze_debug_masked_image_endpoint(
         if len(image_bytes) == 0:
             raise HTTPException(status_code=400, detail="Empty file uploaded")
         
-        # --- Use the robust processing helper function ---
-        pil_image, masking_applied = _process_image_for_model(image_bytes, apply_face_masking)
-
-        # Convert PIL image to bytes
-        img_byte_arr = io.BytesIO()
-        pil_image.save(img_byte_arr, format='JPEG', quality=95) # Use high quality for debugging
-        img_byte_arr.seek(0)
+        # --- Use the robust processing helper function (off the event loop) ---
+        img_byte_arr, masking_applied = await EXECUTOR.run_cpu(
+            _render_debug_image, image_bytes, apply_face_masking
+        )
 
-        print(f"Debug image returned: Masking applied={masking_applied}")
+        logging.debug(f"Debug image returned: Masking applied={masking_applied}")
 
         # Stream the image back, including the debug header
         return StreamingResponse(img_byte_arr, media_type="image/jpeg", 
@@ -448,23 +1155,75 @@ async def analyze_debug_masked_image_endpoint(
     except HTTPException:
         raise
     except Exception as e:
-        import traceback
-        print(f"Error in analyze_debug_masked_image_endpoint: {e}")
-        traceback.print_exc()
+        logging.error(f"Error in analyze_debug_masked_image_endpoint: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Internal error: {str(e)}")
 
 
+@app.get("/metrics")
+async def metrics_endpoint():
+    """Prometheus metrics: stage latency histograms, masking fallbacks, cache lookups"""
+    return Response(content=METRICS_REGISTRY.render(), media_type=METRICS_CONTENT_TYPE)
+
+
+def _require_profiling_admin(token: Optional[str]):
+    if PROFILE_STORE is None:
+        raise HTTPException(status_code=404, detail="Profiling is disabled (PROFILING_ENABLED=false)")
+    if not PROFILE_ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="PROFILE_ADMIN_TOKEN is not configured")
+    if not _admin_token_ok(token):
+        raise HTTPException(status_code=403, detail="Invalid or missing X-Admin-Token")
+
+
+@app.get("/admin/profiles")
+async def list_profiles(x_admin_token: Optional[str] = Header(None)):
+    """Captured request profiles, newest first"""
+    _require_profiling_admin(x_admin_token)
+    return {"profiles": PROFILE_STORE.list(), "max_profiles": PROFILE_STORE.max_profiles}
+
+
+@app.get("/admin/profiles/{profile_id}")
+async def download_profile(
+    profile_id: str,
+    kind: str = Query("folded", description="folded (stack samples) | torch (Chrome trace) | meta"),
+    x_admin_token: Optional[str] = Header(None)
+):
+    """Download one artifact of a captured profile"""
+    _require_profiling_admin(x_admin_token)
+    path = PROFILE_STORE.path(profile_id, kind)
+    if path is None:
+        raise HTTPException(status_code=404, detail=f"No {kind} artifact for profile {profile_id}")
+    media_type = "text/plain" if kind == "folded" else "application/json"
+    return FileResponse(path, media_type=media_type, filename=os.path.basename(path))
+
+
 @app.get("/health")
 async def health_check():
     """Check if the API and model are ready"""
+    core_ready = SUBSYSTEMS["classifier"].ready and SUBSYSTEMS["color_engine"].ready
+    catalog = SUBSYSTEMS["mongo_catalog"].get(wait=False)
     return {
-        "status": "healthy" if (ML_MODEL is not None and COLOR_ENGINE is not None) else "partially_loaded",
+        "status": "healthy" if core_ready else "partially_loaded",
         "model_loaded": ML_MODEL is not None,
         "color_engine_loaded": COLOR_ENGINE is not None,
         "face_preprocessor_loaded": FACE_PREPROCESSOR is not None,
         "face_masking_enabled": USE_FACE_MASKING,
         "device": str(DEVICE),
-        "num_classes": 4
+        "inference_backend": ACTIVE_INFERENCE_BACKEND,
+        "num_classes": 4,
+        "inference_batching": INFERENCE_BATCHER.get_stats() if INFERENCE_BATCHER is not None else None,
+        "face_batching": FACE_BATCHER.get_stats() if FACE_BATCHER is not None else None,
+        "latency_budget_ms": LATENCY_BUDGET_MS,
+        "stage_costs_ms": STAGE_COSTS.get_stats(),
+        "execution_pools": EXECUTOR.get_stats(),
+        "model_version": MODEL_VERSION,
+        "startup_timings_ms": STARTUP_TIMINGS,
+        "result_cache": RESULT_CACHE.get_stats() if RESULT_CACHE is not None else None,
+        "near_duplicate_cache": PERCEPTUAL_CACHE.get_stats() if PERCEPTUAL_CACHE is not None else None,
+        "catalog_index": CATALOG_INDEX_REFRESHER.get_stats() if CATALOG_INDEX_REFRESHER is not None else None,
+        "color_similarity": SIMILARITY_LOOKUP.get_stats() if SIMILARITY_LOOKUP is not None else None,
+        "garment_search": GARMENT_SEARCH_REFRESHER.get_stats() if GARMENT_SEARCH_REFRESHER is not None else None,
+        "mongo_catalog": catalog.get_stats() if catalog is not None else None,
+        "subsystems": SUBSYSTEMS.readiness()
     }
 
 
@@ -476,7 +1235,9 @@ async def root():
         "version": "2.1.1",
         "endpoints": {
             "health": "/health",
+            "metrics": "/metrics",
             "analyze_basic": "/analyze-color",
+            "analyze_batch": "/analyze-color/batch",
             "analyze_debug_image": "/analyze-debug-masked-image", # Added debug endpoint
             "docs": "/docs"
         },
@@ -488,61 +1249,23 @@ async def root():
     }
 
 
-def extract_colors_with_percentage(image_bytes: bytes, color_count: int = 5) -> Dict[str, Dict[str, Any]]:
-    """
-    Extracts dominant colors and estimates percentage for each one.
-    Returns:
-        {
-            "1": {"color": "#rrggbb", "percentage": int},
-            "2": {"color": "#rrggbb", "percentage": int},
-            ...
-        }
-    """
-
-    # Load image
-    img = Image.open(io.BytesIO(image_bytes)).convert("RGB")
-    img_small = img.resize((150, 150))   # shrink for faster pixel stats
-    pixels = np.array(img_small).reshape(-1, 3)
-
-    # Use ColorThief for palette
-    ct = ColorThief(io.BytesIO(image_bytes))
-    palette = ct.get_palette(color_count=color_count)
-
-    # For each palette color → percentage of closest pixels
-    percentages = []
-    for color in palette:
-        diff = np.linalg.norm(pixels - np.array(color), axis=1)
-        closest = diff <= np.min(diff) + 25   # tolerance so clusters aren't too tiny
-        pct = int((np.sum(closest) / len(pixels)) * 100)
-        percentages.append(pct)
-
-    # Normalize to sum=100 (rounding safety)
-    total = sum(percentages)
-    if total > 0:
-        percentages = [int((p / total) * 100) for p in percentages]
-
-    # Build required JSON structure
-    result = {}
-    for i, (rgb, pct) in enumerate(zip(palette, percentages), start=1):
-        hex_color = "#{:02x}{:02x}{:02x}".format(*rgb)
-        result[str(i)] = {
-            "color": hex_color,
-            "percentage": pct
-        }
-
-    return result
-
-
-
-def save_photo_data(photo_url: str, colors_sorted: list, is_available: bool, gender: str):
+async def save_photo_data(catalog: CatalogStore, photo_url: str, colors_sorted: list, is_available: bool, gender: str):
     doc = {
         "photo_url": photo_url,
         "colors_sorted": colors_sorted,
         "is_available": is_available,
         "gender": gender
     }
-    result = photos_collection.insert_one(doc)
-    return str(result.inserted_id)
+    # Uploads carry no top2_colors; storing the (empty) normalized field marks them as migrated
+    doc[MATCH_COLORS_FIELD] = photo_top_colors(doc)
+    with timed("mongo_query"):
+        inserted_id = await catalog.insert_photo(doc)
+    # Visible to matching right away, not only after the next index refresh
+    for name in ("catalog_index", "garment_search"):
+        index = SUBSYSTEMS[name].get(wait=False)
+        if index is not None:
+            index.apply(doc)
+    return str(inserted_id)
 
 @app.post("/upload-image-process-store")
 async def upload_image_process_store(
@@ -551,18 +1274,19 @@ async def upload_image_process_store(
     is_available: bool = True
 ):
     try:
-        img_bytes = await image.read()
+        with timed("upload_read"):
+            img_bytes = await image.read()
         if len(img_bytes) == 0:
             raise HTTPException(status_code=400, detail="Empty image file")
 
-        # Remove background
-        bg_removed_bytes = remove(img_bytes)
+        ingestion, catalog = await _require("ingestion", "mongo_catalog")
 
-        # Extract colors WITH percentage
-        color_json = extract_colors_with_percentage(bg_removed_bytes)
+        # Remove background and extract colors WITH percentage (ingestion pool)
+        color_json = await EXECUTOR.run_ingest(ingestion.process_garment_image, img_bytes)
 
         # Save to DB
-        doc_id = save_photo_data(
+        doc_id = await save_photo_data(
+            catalog,
             photo_url="uploaded_via_api",
             colors_sorted=color_json,
             is_available=is_available,
@@ -575,12 +1299,12 @@ async def upload_image_process_store(
             "colors": color_json
         }
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
-
-fs = gridfs.GridFS(db)
 @app.get("/get-image-by-docid")
 async def get_image_by_docid(doc_id: str = Query(..., description="MongoDB document _id")):
     """
@@ -595,14 +1319,16 @@ async def get_image_by_docid(doc_id: str = Query(..., description="MongoDB docum
             raise HTTPException(status_code=400, detail="Invalid document _id format")
 
         # Fetch the document
-        doc = photos_collection.find_one({"_id": object_id})
+        catalog = await _catalog()
+        with timed("mongo_query"):
+            doc = await catalog.find_photo(object_id, {"image_gridfs": 1})
         if not doc or "image_gridfs" not in doc:
             raise HTTPException(status_code=404, detail="Document not found or no image in GridFS")
 
         # Fetch the image from GridFS
         file_id = doc["image_gridfs"]
-        grid_out = fs.get(file_id)
-        image_bytes = grid_out.read()
+        with timed("gridfs_read"):
+            image_bytes = await catalog.read_file(file_id)
 
         # Stream the image
         return StreamingResponse(io.BytesIO(image_bytes), media_type="image/jpeg")
@@ -627,7 +1353,9 @@ async def get_image_from_base64(doc_id: str = Query(..., description="MongoDB do
             raise HTTPException(status_code=400, detail="Invalid document _id format")
 
         # Fetch the document
-        doc = photos_collection.find_one({"_id": object_id})
+        catalog = await _catalog()
+        with timed("mongo_query"):
+            doc = await catalog.find_photo(object_id, {"image_base64": 1})
         if not doc or "image_base64" not in doc:
             raise HTTPException(status_code=404, detail="Document not found or no Base64 image")
 
@@ -650,25 +1378,6 @@ from fastapi import APIRouter
 router = APIRouter()
 
 
-def _normalize_hex(value: Any) -> str:
-    """
-    Normalize hex strings to a consistent format: '#rrggbb' lowercase.
-    Handles:
-      - None
-      - strings with/without '#'
-      - strings with spaces
-    """
-    if value is None:
-        return ""
-    s = str(value).strip()
-    if not s:
-        return ""
-    if s.startswith("#"):
-        s = s[1:]
-    # some safety: keep only first 6 chars
-    s = s[:6]
-    return f"#{s.lower()}"
-
 def serialize_mongo_doc(doc):
     doc = dict(doc)  # make a copy
     for k, v in doc.items():
@@ -676,10 +1385,96 @@ def serialize_mongo_doc(doc):
             doc[k] = str(v)
     return doc
 
+def _iter_photo_id_matches(
+    catalog: CatalogStore,
+    similar_colors: List[str],
+    gender: Optional[str],
+    after: Optional[str],
+    limit: Optional[int]
+) -> Iterator[Tuple[str, None]]:
+    """
+    Photos with a top-2 color in similar_colors, in _id order, after the
+    given _id: from the catalog index when it is loaded, otherwise from Mongo.
+    Mongo results are yielded as the cursor fetches them.
+    """
+    catalog_index = SUBSYSTEMS["catalog_index"].get(wait=False)
+    if catalog_index is not None:
+        with timed("catalog_index"):
+            photo_ids = catalog_index.match(similar_colors, gender, after=after, limit=limit)
+        for photo_id in photo_ids:
+            yield photo_id, None
+        return
+
+    after_filter = {"_id": {"$gt": ObjectId(after)}} if after else {}
+    # Cursor batches are fetched while iterating, so the query is timed as a whole
+    with timed("mongo_query"):
+        if INDEXED_CLOTHES_MATCHING:
+            photos = catalog.photos.find(
+                {**matching_photos_query(similar_colors, gender), **after_filter},
+                {"_id": 1},
+                sort=[("_id", 1)],
+                limit=limit or 0
+            )
+            photo_ids = (photo["_id"] for photo in photos)
+        else:
+            query = {"gender": gender.lower()} if gender else {}
+            photos = catalog.photos.find({**query, **after_filter}, sort=[("_id", 1)])
+            photo_ids = iter_matching_photo_ids(photos, set(similar_colors))
+        for photo_id in itertools.islice(photo_ids, limit):
+            yield str(photo_id), None
+
+
+def _match_entry(doc_id: str, score: Optional[float]) -> Dict[str, Any]:
+    entry: Dict[str, Any] = {"doc_id": doc_id, "image_url": f"{API_BASE_URL}/get-image-by-docid?doc_id={doc_id}"}
+    if score is not None:
+        entry["score"] = score
+    return entry
+
+
+def _next_cursor(engine: str, doc_id: str, score: Optional[float]) -> str:
+    position: Dict[str, Any] = {"engine": engine, "id": doc_id}
+    if score is not None:
+        position["score"] = score
+    return encode_cursor(position)
+
+
+async def _in_memory(items: Iterator[Any]) -> AsyncIterator[Any]:
+    for item in items:
+        yield item
+
+
+async def _ndjson_matches(
+    matches: AsyncIterator[Tuple[str, Optional[float]]],
+    engine: str,
+    limit: Optional[int]
+) -> AsyncIterator[str]:
+    """One line per match, then a summary line with the page's count and continuation token"""
+    count, last, next_cursor = 0, None, None
+    try:
+        # Closed on break, so a catalog cursor stops fetching batches
+        async with contextlib.aclosing(matches):
+            async for doc_id, score in matches:
+                if limit is not None and count == limit:
+                    next_cursor = _next_cursor(engine, *last)
+                    break
+                yield json.dumps(_match_entry(doc_id, score)) + "\n"
+                count, last = count + 1, (doc_id, score)
+    except Exception as e:
+        # The status line is already sent: report the failure in-band
+        logging.warning(f"Streaming matches failed after {count}: {e}")
+        yield json.dumps({"error": str(e), "matched_count": count}) + "\n"
+        return
+    yield json.dumps({"matched_count": count, "next_cursor": next_cursor}) + "\n"
+
+
 @app.post("/get-matching-clothes")
 async def get_matching_clothes(
     primary_colors: List[str],
-    gender: Optional[str] = Query(None)
+    gender: Optional[str] = Query(None),
+    limit: Optional[int] = Query(None, ge=1, le=MATCHING_MAX_PAGE_SIZE, description="Page size (default: every match)"),
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page"),
+    stream: bool = Query(False, description="Stream matches as NDJSON"),
+    accept: Optional[str] = Header(None)
 ):
     """
     Accepts RAW LIST input:
@@ -694,55 +1489,143 @@ async def get_matching_clothes(
                 ...
             ]
         }
+
+    With `limit`, one page of matches and a `next_cursor` (null on the last
+    page) to pass as `cursor` for the next one. With `stream=true` (or
+    `Accept: application/x-ndjson`), one JSON line per match
+    ({"doc_id", "image_url"}) as the matches are found, then
+    {"matched_count", "next_cursor"}.
     """
 
     try:
-        similar_set = set()
+        position = None
+        if cursor:
+            try:
+                position = decode_cursor(cursor)
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+        # One more than the page, to know whether there is a next one
+        fetch = limit + 1 if limit is not None else None
+
+        # Perceptual matching, ranked by score, once the garment search is loaded. A page
+        # continues with the engine of the previous one
+        if position is not None:
+            engine = position.get("engine")
+        elif CLOTHES_MATCHING_ENGINE == "lab" and SUBSYSTEMS["garment_search"].ready:
+            engine = "lab"
+        else:
+            engine = "id"
+        if engine == "lab":
+            if position is not None and "score" not in position:
+                raise HTTPException(status_code=400, detail="invalid cursor: no score")
+            (garment_search,) = await _require("garment_search")
+            after = (position["score"], position["id"]) if position is not None else None
+            with timed("garment_search"):
+                # Scoring holds the index lock for tens of ms on large catalogs
+                _, ranked = await EXECUTOR.run_cpu(
+                    garment_search.search, primary_colors, gender, limit=fetch, after=after
+                )
+            matches = iter(ranked)
+        elif engine == "id":
+            catalog = await _catalog()
+
+            # --- STEP 1: Load similar colors ---
+            # From memory when the lookup is loaded, otherwise one $in query for all colors
+            try:
+                similarity = await SUBSYSTEMS["color_similarity"].ensure_async()
+            except SubsystemUnavailable:
+                similarity = None
+            if similarity is not None and similarity.preloaded:
+                similarity_docs = similarity.lookup(primary_colors)
+            elif similarity is not None:
+                # LRU misses are queried from Mongo
+                similarity_docs = await catalog.run(similarity.lookup, primary_colors)
+            else:
+                with timed("mongo_query"):
+                    similarity_docs = await catalog.run(
+                        fetch_similarity_docs, catalog.color_similarity, primary_colors
+                    )
 
-        # --- STEP 1: Load similar colors ---
-        for color in primary_colors:
-            norm_color = _normalize_hex(color)
+            all_similar_colors = collect_similar_colors(similarity_docs)
 
-            doc = (
-                color_similarity_collection.find_one({"primary_color": color})
-                or color_similarity_collection.find_one({"primary_color": norm_color})
-                or color_similarity_collection.find_one({"primary_color": color.lower()})
+            # --- STEP 2: Find matching clothes ---
+            matches = _iter_photo_id_matches(
+                catalog, all_similar_colors, gender, position["id"] if position is not None else None, fetch
             )
+        else:
+            raise HTTPException(status_code=400, detail="invalid cursor: unknown engine")
+
+        if stream or (accept and "application/x-ndjson" in accept):
+            # Mongo cursors are read on the catalog I/O pool, in growing batches
+            rows = catalog.iterate(matches) if engine == "id" else _in_memory(matches)
+            return StreamingResponse(_ndjson_matches(rows, engine, limit), media_type="application/x-ndjson")
+
+        page = await catalog.run(list, matches) if engine == "id" else list(matches)
+        next_cursor = None
+        if limit is not None and len(page) > limit:
+            page = page[:limit]
+            next_cursor = _next_cursor(engine, *page[-1])
+
+        response: Dict[str, Any] = {
+            "matched_count": len(page),
+            "images": [f"{API_BASE_URL}/get-image-by-docid?doc_id={doc_id}" for doc_id, _ in page]
+        }
+        if engine == "lab":
+            response["scores"] = [score for _, score in page]
+        if limit is not None or cursor:
+            response["next_cursor"] = next_cursor
+        return response
 
-            if doc and "similar_colors" in doc:
-                for similar in doc["similar_colors"]:
-                    raw_hex = similar.get("hex") if isinstance(similar, dict) else similar
-                    similar_set.add(_normalize_hex(raw_hex))
-
-        all_similar_colors = sorted(similar_set)
-
-        # --- STEP 2: Find matching clothes ---
-        image_urls = []
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
-        query = {}
-        if gender:
-            query["gender"] = gender.lower()
 
-        for cloth in photos_collection.find(query):
-            raw_top2 = cloth.get("top2_colors")
-            if not raw_top2:
-                continue
+@app.post("/search-clothes")
+async def search_clothes(
+    colors: List[str],
+    gender: Optional[str] = Query(None),
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+    max_delta_e: Optional[float] = Query(None, gt=0, le=100, description="CIEDE2000 matching distance")
+):
+    """
+    Accepts RAW LIST input (e.g. a season palette):
+        ["#808000", "#123456"]
 
-            normalized = [
-                _normalize_hex(x) if isinstance(x, str)
-                else _normalize_hex(x.get("hex"))
-                for x in raw_top2
+    Returns garments ranked by how much of each is covered by colors close
+    (CIEDE2000) to the requested ones, best first:
+        {
+            "total": 42,
+            "offset": 0,
+            "limit": 20,
+            "results": [
+                {"doc_id": "6931c6f7cd874aa7be0f026a", "score": 87.5,
+                 "image_url": "http://localhost:8000/get-image-by-docid?doc_id=6931c6f7cd874aa7be0f026a"},
+                ...
             ]
-
-            if any(c in all_similar_colors for c in normalized):
-                # Build image URL
-                image_url = f"{API_BASE_URL}/get-image-by-docid?doc_id={cloth['_id']}"
-                image_urls.append(image_url)
-
-        return {
-            "matched_count": len(image_urls),
-            "images": image_urls
         }
+    """
+    (garment_search,) = await _require("garment_search")
+    with timed("garment_search"):
+        total, ranked = await EXECUTOR.run_cpu(
+            garment_search.search, colors, gender, limit=limit, offset=offset, max_delta_e=max_delta_e
+        )
+    return {
+        "total": total,
+        "offset": offset,
+        "limit": limit,
+        "results": [
+            {
+                "doc_id": doc_id,
+                "score": score,
+                "image_url": f"{API_BASE_URL}/get-image-by-docid?doc_id={doc_id}"
+            }
+            for doc_id, score in ranked
+        ]
+    }
 
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+
+STARTUP_TIMINGS["import"] = round((time.perf_counter() - _IMPORT_START) * 1000.0, 1)
+print(f"[startup] import: {STARTUP_TIMINGS['import']:.1f}ms")
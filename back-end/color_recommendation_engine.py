@@ -2,11 +2,25 @@
 """
 Color Recommendation Engine V2
 Loads color palettes from color_palette_v2.json and provides personalized recommendations
+
+The JSON is compiled once at load time into arrays: a table of unique
+colors (hex, RGB, Lab), one row per season color entry ("occurrence") with
+its confidence multiplier and use-case bitmask, and a season x color
+membership matrix of multipliers. Palette requests are then a few
+vectorized operations plus a partial sort, instead of walking the JSON.
+Results are identical to walking the JSON entry by entry: weights are
+accumulated in the same season order (so float sums match bit for bit)
+and ties keep the order in which colors were first seen.
 """
 
 import json
+import logging
 import numpy as np
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Tuple
+
+from color_space import hexes_to_rgb, rgb_to_lab
+
+logger = logging.getLogger(__name__)
 
 
 class ColorRecommendationEngineV2:
@@ -32,9 +46,80 @@ class ColorRecommendationEngineV2:
             'Winter': 'winter',
             'Spring': 'spring'
         }
+        self._compile()
         
         print(f"✅ Color Recommendation Engine initialized with {len(self.data)} seasons")
     
+    def _compile(self):
+        """Build the array representation of self.data (see module docstring)"""
+        color_index: Dict[str, int] = {}
+        occurrences = []  # (season index, color index, color entry)
+        
+        for s, season_name in enumerate(self.seasons):
+            season_data = self.data.get(self.season_map[season_name], {})
+            for color in season_data.get('primary_colors', []):
+                c = color_index.setdefault(color['hex'], len(color_index))
+                occurrences.append((s, c, color))
+        
+        use_cases = sorted({use for *_, color in occurrences for use in color.get('use_for', [])})
+        if len(use_cases) > 64:
+            raise ValueError(f"Too many use_for values for a 64-bit mask: {len(use_cases)}")
+        self.use_case_bits = {use: np.uint64(1) << np.uint64(i) for i, use in enumerate(use_cases)}
+        
+        # Unique colors
+        self.color_hex: List[str] = list(color_index)
+        first_entry: Dict[int, Dict[str, Any]] = {}
+        for _, c, color in occurrences:
+            first_entry.setdefault(c, color)
+        self.color_rgb = hexes_to_rgb(self.color_hex)
+        for c, color in first_entry.items():
+            if len(color.get('rgb', [])) == 3:
+                self.color_rgb[c] = color['rgb']
+        self.color_lab = rgb_to_lab(self.color_rgb)
+        
+        # Occurrences, in self.seasons order then JSON order
+        self.occ_season = np.array([s for s, *_ in occurrences], dtype=np.int64)
+        self.occ_color = np.array([c for _, c, *_ in occurrences], dtype=np.int64)
+        self.occ_multiplier = np.array(
+            [color.get('confidence_multiplier', 1.0) for *_, color in occurrences], dtype=np.float64
+        )
+        self.occ_use_mask = np.array([
+            sum((int(self.use_case_bits[use]) for use in set(color.get('use_for', []))), 0)
+            for *_, color in occurrences
+        ], dtype=np.uint64)
+        self._occ_entries = [color for *_, color in occurrences]
+        
+        # Membership: one row of multipliers per season and repeat of a color within
+        # the season (rows beyond the first only exist for repeated hexes), plus the
+        # first occurrence of each color per season (-1 if absent)
+        num_seasons, num_colors = len(self.seasons), len(self.color_hex)
+        self.season_first_occurrence = np.full((num_seasons, num_colors), -1, dtype=np.int64)
+        self._season_rows: List[List[int]] = [[] for _ in range(num_seasons)]
+        rows: List[np.ndarray] = []
+        repeats: Dict[Tuple[int, int], int] = {}
+        for occ, (s, c, _) in enumerate(occurrences):
+            repeat = repeats.get((s, c), 0)
+            repeats[(s, c)] = repeat + 1
+            if repeat == 0:
+                self.season_first_occurrence[s, c] = occ
+            if repeat == len(self._season_rows[s]):
+                self._season_rows[s].append(len(rows))
+                rows.append(np.zeros(num_colors, dtype=np.float64))
+            rows[self._season_rows[s][repeat]][c] = self.occ_multiplier[occ]
+        self.membership = np.array(rows, dtype=np.float64).reshape(-1, num_colors)
+        
+        # get_palette_for_season only slices the JSON, so its answers are fixed
+        self._season_palettes: Dict[str, Tuple[List[Tuple[str, str]], List[Tuple[str, str]]]] = {}
+        for season_name, season_key in self.season_map.items():
+            season_data = self.data.get(season_key, {})
+            primary_colors = season_data.get('primary_colors', [])
+            neutral_colors = season_data.get('neutral_colors', [])
+            secondary_entries = (primary_colors[6:9] if len(primary_colors) > 6 else []) + neutral_colors[:3]
+            self._season_palettes[season_name] = (
+                [(color['name'], color['hex']) for color in primary_colors[:6]],
+                [(color['name'], color['hex']) for color in secondary_entries],
+            )
+    
     def get_season_data(self, season_name: str) -> Dict[str, Any]:
         """
         Get complete season data from JSON
@@ -66,40 +151,12 @@ class ColorRecommendationEngineV2:
         Returns:
             Dictionary with primary and secondary colors
         """
-        season_data = self.get_season_data(season_name)
-        
-        primary_colors = season_data.get('primary_colors', [])
-        neutral_colors = season_data.get('neutral_colors', [])
-        
-        # Format primary colors (top 6)
-        primary = [
-            {
-                "name": color['name'],
-                "hex": color['hex']
-            }
-            for color in primary_colors[:6]
-        ]
-        
-        # Format secondary colors (next 6 from primary + neutrals)
-        secondary_from_primary = primary_colors[6:9] if len(primary_colors) > 6 else []
-        secondary = [
-            {
-                "name": color['name'],
-                "hex": color['hex']
-            }
-            for color in secondary_from_primary
-        ]
-        
-        # Add neutrals to secondary
-        for neutral in neutral_colors[:3]:
-            secondary.append({
-                "name": neutral['name'],
-                "hex": neutral['hex']
-            })
+        self.get_season_data(season_name)  # ValueError for unknown seasons
+        primary, secondary = self._season_palettes[season_name]
         
         return {
-            "primary": primary,
-            "secondary": secondary
+            "primary": [{"name": name, "hex": hex_code} for name, hex_code in primary],
+            "secondary": [{"name": name, "hex": hex_code} for name, hex_code in secondary]
         }
     
     def get_weighted_palette_for_probabilities(
@@ -131,94 +188,71 @@ class ColorRecommendationEngineV2:
         Returns:
             Dictionary with primary and secondary color lists
         """
-        print(f"\nWeighted Palette Generation")
-        print(f"  Probabilities: {all_probabilities}")
-        print(f"  Min threshold: {min_probability_threshold * 100}%")
+        debug = logger.isEnabledFor(logging.DEBUG)
+        if debug:
+            logger.debug(f"Weighted Palette Generation")
+            logger.debug(f"  Probabilities: {all_probabilities}")
+            logger.debug(f"  Min threshold: {min_probability_threshold * 100}%")
         
         # Identify primary and secondary seasons
         sorted_probs = sorted(all_probabilities.items(), key=lambda x: x[1], reverse=True)
-        primary_season = sorted_probs[0][0] if sorted_probs else None
         secondary_season = sorted_probs[1][0] if len(sorted_probs) > 1 else None
         
-        # Step 1: Collect colors from seasons above threshold
-        weighted_colors = []
+        # Step 1: Seasons above threshold, in all_probabilities order
         seasons_included = []
-        
+        season_rows, row_probabilities, row_boosts = [], [], []
         for season_name, probability in all_probabilities.items():
             if probability < min_probability_threshold:
-                print(f"  Skipping {season_name} ({probability:.1%}) - below threshold")
                 continue
-            
-            seasons_included.append(season_name)
-            print(f"  Including {season_name} ({probability:.1%})")
-            
-            season_data = self.get_season_data(season_name)
-            primary_colors = season_data.get('primary_colors', [])
-            
-            for color in primary_colors:
-                multiplier = color.get('confidence_multiplier', 1.0)
-                
-                # Boost secondary season colors to create more variation
-                if season_name == secondary_season and probability > 0.20:
-                    # Apply boost factor to secondary season when it has significant probability
-                    weight = probability * multiplier * secondary_boost_factor
-                    print(f"  Boosting {season_name} color '{color['name']}' (secondary season, {secondary_boost_factor}x)")
-                else:
-                    weight = probability * multiplier
-                
-                weighted_colors.append({
-                    'name': color['name'],
-                    'hex': color['hex'],
-                    'rgb': color.get('rgb', []),
-                    'weight': weight,
-                    'primary_season': season_name,
-                    'use_for': color.get('use_for', []),
-                    'confidence_multiplier': multiplier
-                })
-        
-        print(f"  Total colors collected: {len(weighted_colors)}")
-        
-        # Step 2: Aggregate duplicate colors (sum weights for same hex)
-        color_map = {}
-        for item in weighted_colors:
-            hex_code = item['hex']
-            if hex_code in color_map:
-                old_weight = color_map[hex_code]['weight']
-                color_map[hex_code]['weight'] += item['weight']
-                
-                if 'seasons' not in color_map[hex_code]:
-                    color_map[hex_code]['seasons'] = [color_map[hex_code]['primary_season']]
-                color_map[hex_code]['seasons'].append(item['primary_season'])
-                
-                print(f"  Boosted '{item['name']}' ({hex_code}): {old_weight:.3f} -> {color_map[hex_code]['weight']:.3f}")
-            else:
-                color_map[hex_code] = item
-                color_map[hex_code]['seasons'] = [item['primary_season']]
-        
-        print(f"  Unique colors after aggregation: {len(color_map)}")
-        
-        # Step 3: Sort by weight (descending)
-        sorted_colors = sorted(
-            color_map.values(),
-            key=lambda x: x['weight'],
-            reverse=True
-        )
-        
-        # Step 4: Format output
-        primary = [
-            {'name': c['name'], 'hex': c['hex']}
-            for c in sorted_colors[:primary_count]
+            self.get_season_data(season_name)  # ValueError for unknown seasons
+            seasons_included.append(self.seasons.index(season_name))
+            # Boost secondary season colors when it has significant probability
+            boost = season_name == secondary_season and probability > 0.20
+            for row in self._season_rows[seasons_included[-1]]:
+                season_rows.append(row)
+                row_probabilities.append(probability)
+                row_boosts.append(boost)
+        
+        if not season_rows:
+            return {"primary": [], "secondary": []}
+        
+        # Step 2: Weight of every color: the membership matrix-vector product, with
+        # rows summed in the order above (the same float sums as adding entry by entry;
+        # rows of seasons without a color add exactly 0)
+        contributions = np.asarray(row_probabilities)[:, None] * self.membership[season_rows]
+        if any(row_boosts):
+            contributions[row_boosts] *= secondary_boost_factor
+        weights = np.add.reduce(contributions, axis=0)
+        
+        # First-seen order of the colors of the included seasons; entries are numbered
+        # season by season in JSON order, so the first occurrence orders a season's colors
+        first_occurrence = self.season_first_occurrence[seasons_included]
+        ranks = np.arange(len(seasons_included))[:, None] * len(self._occ_entries)
+        never = np.iinfo(np.int64).max
+        first_seen = np.where(first_occurrence >= 0, ranks + first_occurrence, never).min(axis=0)
+        
+        # Step 3: Order by weight (descending), ties in first-seen order
+        candidates = np.flatnonzero(first_seen != never)
+        wanted = len(candidates) if min(primary_count, secondary_count) < 0 else primary_count + secondary_count
+        ordered = candidates[_top_order(weights[candidates], first_seen[candidates], wanted)]
+        
+        # Step 4: Format output, naming each color after its first included entry
+        ordered_occurrences = first_occurrence[:, ordered]
+        name_occurrences = ordered_occurrences[np.argmax(ordered_occurrences >= 0, axis=0), np.arange(len(ordered))]
+        sorted_colors = [
+            {'name': self._occ_entries[occ]['name'], 'hex': self.color_hex[c]}
+            for c, occ in zip(ordered.tolist(), name_occurrences.tolist())
         ]
         
-        secondary = [
-            {'name': c['name'], 'hex': c['hex']}
-            for c in sorted_colors[primary_count:primary_count + secondary_count]
-        ]
+        primary = sorted_colors[:primary_count]
+        secondary = sorted_colors[primary_count:primary_count + secondary_count]
         
-        print(f"\n  Result:")
-        print(f"    Primary palette: {len(primary)} colors")
-        print(f"    Secondary palette: {len(secondary)} colors")
-        print(f"    Seasons included: {', '.join(seasons_included)}")
+        if debug:
+            logger.debug(f"  Unique colors after aggregation: {len(candidates)}")
+            logger.debug(f"  Result:")
+            logger.debug(f"    Primary palette: {len(primary)} colors")
+            logger.debug(f"    Secondary palette: {len(secondary)} colors")
+            logger.debug(f"    Seasons included: {', '.join(self.seasons[s] for s in seasons_included)}")
         
         return {
             "primary": primary,
@@ -256,57 +290,45 @@ class ColorRecommendationEngineV2:
         primary_season, primary_score = sorted_scores[0]
         secondary_season, secondary_score = sorted_scores[1]
         
-        print(f"\n📊 SEASONAL ANALYSIS:")
-        print(f"   Primary: {primary_season} ({primary_score:.1f}%)")
-        print(f"   Secondary: {secondary_season} ({secondary_score:.1f}%)")
-        
-        # Collect all colors with fit scores
-        all_colors = []
+        logger.debug(f"📊 SEASONAL ANALYSIS:")
+        logger.debug(f"   Primary: {primary_season} ({primary_score:.1f}%)")
+        logger.debug(f"   Secondary: {secondary_season} ({secondary_score:.1f}%)")
+        
+        # Fit score of every season color entry
+        base_scores = np.array([
+            primary_score if season_name == primary_season
+            else secondary_score * 0.7 if season_name == secondary_season
+            else min(primary_score, secondary_score) * 0.2
+            for season_name in self.seasons
+        ], dtype=np.float64)
+        fit_scores = np.minimum(base_scores[self.occ_season] * self.occ_multiplier, 100.0)
+        
+        # Filter by use case
+        candidates = np.arange(len(self.occ_season))
+        if use_case and use_case != 'all':
+            allowed = self.use_case_bits.get(use_case, np.uint64(0)) | self.use_case_bits.get('all', np.uint64(0))
+            candidates = np.flatnonzero(self.occ_use_mask & allowed)
+        
+        # Sort by fit score (ties in JSON order) and get top N
+        ordered = candidates[_top_order(fit_scores[candidates], candidates, top_n)][:top_n]
+        top_colors = []
+        for occ, season_index, fit_score in zip(
+            ordered.tolist(), self.occ_season[ordered].tolist(), fit_scores[ordered].tolist()
+        ):
+            color = self._occ_entries[occ]
+            top_colors.append({
+                'name': color['name'],
+                'hex': color['hex'],
+                'rgb': color.get('rgb', []),
+                'season': self.seasons[season_index],
+                'fit_score': fit_score,
+                'use_for': color.get('use_for', []),
+                'confidence_multiplier': color.get('confidence_multiplier', 1.0)
+            })
         
-        for season_name in self.seasons:
-            season_key = self.season_map[season_name]
-            season_data = self.data.get(season_key, {})
-            
-            primary_colors = season_data.get('primary_colors', [])
-            
-            for color in primary_colors:
-                # Calculate fit score
-                if season_name == primary_season:
-                    base_score = primary_score
-                elif season_name == secondary_season:
-                    base_score = secondary_score * 0.7
-                else:
-                    base_score = min(primary_score, secondary_score) * 0.2
-                
-                # Apply confidence multiplier
-                multiplier = color.get('confidence_multiplier', 1.0)
-                fit_score = base_score * multiplier
-                
-                # Filter by use case
-                if use_case and use_case != 'all':
-                    use_for_list = color.get('use_for', [])
-                    if use_case not in use_for_list and 'all' not in use_for_list:
-                        continue
-                
-                all_colors.append({
-                    'name': color['name'],
-                    'hex': color['hex'],
-                    'rgb': color.get('rgb', []),
-                    'season': season_name,
-                    'fit_score': min(fit_score, 100.0),
-                    'use_for': color.get('use_for', []),
-                    'confidence_multiplier': multiplier
-                })
-        
-        # Sort by fit score
-        all_colors.sort(key=lambda x: x['fit_score'], reverse=True)
-        
-        # Get top N
-        top_colors = all_colors[:top_n]
-        
-        print(f"\n🎨 COLOR RECOMMENDATIONS:")
-        print(f"   Total colors analyzed: {len(all_colors)}")
-        print(f"   Returning top {len(top_colors)} colors")
+        logger.debug(f"🎨 COLOR RECOMMENDATIONS:")
+        logger.debug(f"   Total colors analyzed: {len(candidates)}")
+        logger.debug(f"   Returning top {len(top_colors)} colors")
         
         return {
             'seasonal_analysis': {
@@ -350,3 +372,18 @@ class ColorRecommendationEngineV2:
             season: self.get_season_description(season)
             for season in self.seasons
         }
+
+
+def _top_order(scores: np.ndarray, tiebreak: np.ndarray, k: int) -> np.ndarray:
+    """
+    Positions of the (at least) k highest scores, highest first, equal scores
+    ordered by ascending tiebreak - the order of a stable descending sort.
+    
+    Only the candidates that can reach the top k (argpartition, keeping every
+    score tied with the k-th) are sorted.
+    """
+    positions = np.arange(len(scores))
+    if 0 < k < len(scores):
+        kth = scores[np.argpartition(-scores, k - 1)[k - 1]]
+        positions = np.flatnonzero(scores >= kth)
+    return positions[np.lexsort((tiebreak[positions], -scores[positions]))]
@@ -0,0 +1,125 @@
+# color_space.py
+"""
+Color Space Conversions
+Vectorized hex / sRGB / CIE Lab (D65) conversions for palette and garment
+colors, the CIEDE2000 color difference, and DIN99o coordinates, in which
+Euclidean distance approximates CIEDE2000 (used to index garment colors).
+"""
+
+from typing import Iterable
+
+import numpy as np
+
+
+# D65 reference white (CIE 1931 2 degree observer), Y = 1
+D65_WHITE = np.array([0.95047, 1.0, 1.08883])
+
+_SRGB_TO_XYZ = np.array([
+    [0.4124564, 0.3575761, 0.1804375],
+    [0.2126729, 0.7151522, 0.0721750],
+    [0.0193339, 0.1191920, 0.9503041],
+])
+
+
+def hex_to_rgb(hex_color: str) -> np.ndarray:
+    """'#rrggbb' (or 'rrggbb') -> uint8 array [r, g, b]"""
+    value = hex_color.strip().lstrip("#")
+    if len(value) != 6:
+        raise ValueError(f"Not a #rrggbb color: {hex_color!r}")
+    return np.array([int(value[i:i + 2], 16) for i in (0, 2, 4)], dtype=np.uint8)
+
+
+def hexes_to_rgb(hex_colors: Iterable[str]) -> np.ndarray:
+    """(N,) hex strings -> (N, 3) uint8"""
+    return np.array([hex_to_rgb(h) for h in hex_colors], dtype=np.uint8).reshape(-1, 3)
+
+
+def rgb_to_lab(rgb: np.ndarray) -> np.ndarray:
+    """
+    sRGB (uint8 or 0-255 floats, shape (..., 3)) -> CIE L*a*b* under D65.
+
+    Returns:
+        float64 array of the same leading shape
+    """
+    srgb = np.asarray(rgb, dtype=np.float64) / 255.0
+    linear = np.where(srgb <= 0.04045, srgb / 12.92, ((srgb + 0.055) / 1.055) ** 2.4)
+    xyz = linear @ _SRGB_TO_XYZ.T / D65_WHITE
+
+    epsilon, kappa = 216.0 / 24389.0, 24389.0 / 27.0
+    f = np.where(xyz > epsilon, np.cbrt(xyz), (kappa * xyz + 16.0) / 116.0)
+    lightness = 116.0 * f[..., 1] - 16.0
+    a = 500.0 * (f[..., 0] - f[..., 1])
+    b = 200.0 * (f[..., 1] - f[..., 2])
+    return np.stack([lightness, a, b], axis=-1)
+
+
+def delta_e_2000(lab1: np.ndarray, lab2: np.ndarray) -> np.ndarray:
+    """
+    CIEDE2000 color difference between Lab colors (shapes broadcast over the
+    leading axes, last axis L*, a*, b*), with kL = kC = kH = 1.
+
+    Returns:
+        float64 array of the broadcast leading shape
+    """
+    lab1 = np.asarray(lab1, dtype=np.float64)
+    lab2 = np.asarray(lab2, dtype=np.float64)
+    L1, a1, b1 = lab1[..., 0], lab1[..., 1], lab1[..., 2]
+    L2, a2, b2 = lab2[..., 0], lab2[..., 1], lab2[..., 2]
+
+    # a* is stretched for near-neutral colors so their hue is better behaved
+    c_mean7 = ((np.hypot(a1, b1) + np.hypot(a2, b2)) / 2.0) ** 7
+    g = 0.5 * (1.0 - np.sqrt(c_mean7 / (c_mean7 + 25.0 ** 7)))
+    a1p, a2p = a1 * (1.0 + g), a2 * (1.0 + g)
+    c1p, c2p = np.hypot(a1p, b1), np.hypot(a2p, b2)
+    h1p = np.degrees(np.arctan2(b1, a1p)) % 360.0
+    h2p = np.degrees(np.arctan2(b2, a2p)) % 360.0
+
+    delta_l = L2 - L1
+    delta_c = c2p - c1p
+    chroma_product = c1p * c2p
+    dh = h2p - h1p
+    dh = np.where(dh > 180.0, dh - 360.0, np.where(dh < -180.0, dh + 360.0, dh))
+    dh = np.where(chroma_product == 0, 0.0, dh)
+    delta_h = 2.0 * np.sqrt(chroma_product) * np.sin(np.radians(dh) / 2.0)
+
+    l_mean = (L1 + L2) / 2.0
+    c_mean = (c1p + c2p) / 2.0
+    h_sum = h1p + h2p
+    h_mean = np.where(
+        np.abs(h1p - h2p) <= 180.0, h_sum / 2.0,
+        np.where(h_sum < 360.0, (h_sum + 360.0) / 2.0, (h_sum - 360.0) / 2.0)
+    )
+    h_mean = np.where(chroma_product == 0, h_sum, h_mean)
+
+    t = (1.0
+         - 0.17 * np.cos(np.radians(h_mean - 30.0))
+         + 0.24 * np.cos(np.radians(2.0 * h_mean))
+         + 0.32 * np.cos(np.radians(3.0 * h_mean + 6.0))
+         - 0.20 * np.cos(np.radians(4.0 * h_mean - 63.0)))
+    l_offset = (l_mean - 50.0) ** 2
+    s_l = 1.0 + 0.015 * l_offset / np.sqrt(20.0 + l_offset)
+    s_c = 1.0 + 0.045 * c_mean
+    s_h = 1.0 + 0.015 * c_mean * t
+    c_mean7 = c_mean ** 7
+    r_t = (-2.0 * np.sqrt(c_mean7 / (c_mean7 + 25.0 ** 7))
+           * np.sin(np.radians(60.0 * np.exp(-(((h_mean - 275.0) / 25.0) ** 2)))))
+
+    dl, dc, dhh = delta_l / s_l, delta_c / s_c, delta_h / s_h
+    return np.sqrt(dl ** 2 + dc ** 2 + dhh ** 2 + r_t * dc * dhh)
+
+
+def lab_to_din99o(lab: np.ndarray) -> np.ndarray:
+    """
+    CIE L*a*b* (shape (..., 3)) -> DIN99o (DIN 6176) L99o, a99o, b99o.
+
+    Returns:
+        float64 array of the same shape
+    """
+    lab = np.asarray(lab, dtype=np.float64)
+    rotation = np.radians(26.0)
+    e = lab[..., 1] * np.cos(rotation) + lab[..., 2] * np.sin(rotation)
+    f = 0.83 * (lab[..., 2] * np.cos(rotation) - lab[..., 1] * np.sin(rotation))
+    chroma = np.log1p(0.075 * np.hypot(e, f)) / 0.0435
+    hue = np.arctan2(f, e) + rotation
+    lightness = 303.67 * np.log1p(0.0039 * lab[..., 0])
+    return np.stack([lightness, chroma * np.cos(hue), chroma * np.sin(hue)], axis=-1)
@@ -1,5 +1,150 @@
 import os
 
+# Python log level of the API (DEBUG adds per-stage pipeline details to every request)
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+# Add a Server-Timing header with the pipeline stage durations to every response
+SERVER_TIMING_ENABLED = os.environ.get("SERVER_TIMING_ENABLED", "true").lower() == "true"
+
 # Support both local development and production (Docker) paths
 MODEL_PATH = os.environ.get("MODEL_PATH", "../models/ResNext50/best_model_resnext50_rgbm.pth")
+# Classifier CPU inference mode: fp32 | channels_last | bf16 | int8_dynamic | int8_static
+INFERENCE_MODE = os.environ.get("INFERENCE_MODE", "fp32").lower()
+# Images used to calibrate int8_static (face-masked test photos work best)
+CALIBRATION_IMAGES_DIR = os.environ.get("CALIBRATION_IMAGES_DIR", "../models/ResNext50/test_images")
 COLOR_PALETTE_PATH = os.environ.get("COLOR_PALETTE_PATH", "color_palette_v2.json")
+
+# Dynamic micro-batching for the season classifier
+ENABLE_INFERENCE_BATCHING = os.environ.get("ENABLE_INFERENCE_BATCHING", "true").lower() == "true"
+BATCH_MAX_SIZE = int(os.environ.get("BATCH_MAX_SIZE", "8"))
+BATCH_MAX_WAIT_MS = float(os.environ.get("BATCH_MAX_WAIT_MS", "5"))
+
+# Execution pools for CPU-bound work (0 = derive torch threads from core count)
+CPU_POOL_WORKERS = int(os.environ.get("CPU_POOL_WORKERS", "2"))
+INGEST_POOL_WORKERS = int(os.environ.get("INGEST_POOL_WORKERS", "1"))
+INGEST_POOL_KIND = os.environ.get("INGEST_POOL_KIND", "thread")
+TORCH_NUM_THREADS = int(os.environ.get("TORCH_NUM_THREADS", "0"))
+
+# Classifier inference backend: "torch" (eager PyTorch) or "onnx" (ONNX Runtime CPU session)
+INFERENCE_BACKEND = os.environ.get("INFERENCE_BACKEND", "torch").lower()
+ONNX_MODEL_PATH = os.environ.get("ONNX_MODEL_PATH", "../models/ResNext50/season_classifier.opt.onnx")
+ONNX_INTRA_OP_THREADS = int(os.environ.get("ONNX_INTRA_OP_THREADS", "0"))
+ONNX_PARITY_CHECK = os.environ.get("ONNX_PARITY_CHECK", "true").lower() == "true"
+ONNX_PARITY_ATOL = float(os.environ.get("ONNX_PARITY_ATOL", "1e-4"))
+
+# Maximum number of images (and zip archive size) accepted by /analyze-color/batch
+BATCH_MAX_IMAGES = int(os.environ.get("BATCH_MAX_IMAGES", "64"))
+BATCH_MAX_ARCHIVE_MB = float(os.environ.get("BATCH_MAX_ARCHIVE_MB", "100"))
+
+# Content-addressed result cache for /analyze-color
+# MODEL_VERSION overrides the automatic weights fingerprint used in cache keys
+MODEL_VERSION_OVERRIDE = os.environ.get("MODEL_VERSION", "")
+RESULT_CACHE_ENABLED = os.environ.get("RESULT_CACHE_ENABLED", "true").lower() == "true"
+RESULT_CACHE_MAX_ENTRIES = int(os.environ.get("RESULT_CACHE_MAX_ENTRIES", "10000"))
+RESULT_CACHE_MAX_MB = float(os.environ.get("RESULT_CACHE_MAX_MB", "32"))
+RESULT_CACHE_TTL_SECONDS = float(os.environ.get("RESULT_CACHE_TTL_SECONDS", "3600"))
+
+# Perceptual-hash (near-duplicate) cache tier - max Hamming distance out of 64 bits
+PHASH_CACHE_ENABLED = os.environ.get("PHASH_CACHE_ENABLED", "true").lower() == "true"
+PHASH_MAX_DISTANCE = int(os.environ.get("PHASH_MAX_DISTANCE", "4"))
+PHASH_CACHE_MAX_ENTRIES = int(os.environ.get("PHASH_CACHE_MAX_ENTRIES", "200000"))
+# CIEDE2000 tolerance between the mean colors of a near-duplicate and the query,
+# so a re-toned photo (warm vs cool) does not get the other photo's season
+PHASH_MAX_COLOR_DELTA_E = float(os.environ.get("PHASH_MAX_COLOR_DELTA_E", "2.0"))
+
+# Subsystem initialization
+# STARTUP_MODE: "background" (eager subsystems load in parallel threads, the server accepts
+# requests immediately) or "blocking" (parallel, but startup waits until they are loaded)
+STARTUP_MODE = os.environ.get("STARTUP_MODE", "background").lower()
+# Subsystems loaded on first use instead of at startup
+LAZY_SUBSYSTEMS = [
+    name.strip() for name in os.environ.get("LAZY_SUBSYSTEMS", "ingestion,mongo_catalog,color_similarity").split(",")
+    if name.strip()
+]
+
+# Large JPEG uploads are decoded at a reduced DCT scale (1/2, 1/4, 1/8) whose long side
+# stays >= this many pixels; 0 always decodes at full resolution
+JPEG_DRAFT_MIN_SIDE = int(os.environ.get("JPEG_DRAFT_MIN_SIDE", "1024"))
+
+# Face masking working resolution: detection runs on a copy downscaled to FACE_DETECT_MAX_SIDE,
+# parsing on the face window downscaled to FACE_PARSE_MAX_SIDE (0 = full resolution / full frame)
+FACE_DETECT_MAX_SIDE = int(os.environ.get("FACE_DETECT_MAX_SIDE", "640"))
+FACE_PARSE_MAX_SIDE = int(os.environ.get("FACE_PARSE_MAX_SIDE", "896"))
+
+# Face regions kept by the mask: skin | skin_hair | skin_eyes
+FACE_MASK_REGIONS = os.environ.get("FACE_MASK_REGIONS", "skin_hair")
+
+# Micro-batching for face masking: concurrent images share one detector and one parser call
+ENABLE_FACE_BATCHING = os.environ.get("ENABLE_FACE_BATCHING", "true").lower() == "true"
+FACE_BATCH_MAX_SIZE = int(os.environ.get("FACE_BATCH_MAX_SIZE", "4"))
+FACE_BATCH_MAX_WAIT_MS = float(os.environ.get("FACE_BATCH_MAX_WAIT_MS", "10"))
+
+# Per-request latency budget for /analyze-color (ms, 0 = unlimited, the default); the latency_budget_ms
+# query parameter overrides it. Requests short on budget skip face parsing (detector box crop),
+# detect at FACE_DEGRADED_DETECT_MAX_SIDE, or skip face masking.
+LATENCY_BUDGET_MS = float(os.environ.get("LATENCY_BUDGET_MS", "0"))
+FACE_DEGRADED_DETECT_MAX_SIDE = int(os.environ.get("FACE_DEGRADED_DETECT_MAX_SIDE", "320"))
+# Near-duplicate distance accepted when the budget cannot cover the pipeline (0 = off,
+# must exceed PHASH_MAX_DISTANCE to have an effect)
+PHASH_RELAXED_DISTANCE = int(os.environ.get("PHASH_RELAXED_DISTANCE", "0"))
+
+# On-demand request profiling (off = no profiling middleware installed). Requests are profiled
+# when they send `X-Profile: 1` (or `torch`) / `?profile=1`, or at PROFILE_SAMPLE_RATE.
+# Profiles go to a ring buffer of PROFILE_MAX_COUNT entries in PROFILE_DIR and are served
+# on /admin/profiles; PROFILE_ADMIN_TOKEN (X-Admin-Token) guards both triggering and download
+# (both are refused while it is unset; sampling still works).
+PROFILING_ENABLED = os.environ.get("PROFILING_ENABLED", "false").lower() == "true"
+PROFILE_SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_INTERVAL_MS = float(os.environ.get("PROFILE_INTERVAL_MS", "5"))
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "/tmp/color-analysis-profiles")
+PROFILE_MAX_COUNT = int(os.environ.get("PROFILE_MAX_COUNT", "50"))
+PROFILE_ADMIN_TOKEN = os.environ.get("PROFILE_ADMIN_TOKEN", "")
+# Attach a torch profiler trace of the classifier forward pass to `torch` profiles
+PROFILE_TORCH = os.environ.get("PROFILE_TORCH", "false").lower() == "true"
+
+# true: /get-matching-clothes matches on the indexed, normalized top-2 colors; run
+# `python catalog_migrations.py` on existing catalogs before enabling it, unmigrated photos
+# never match. false (default) scans every photo
+INDEXED_CLOTHES_MATCHING = os.environ.get("INDEXED_CLOTHES_MATCHING", "false").lower() == "true"
+
+# In-process (gender, color) -> photo index for /get-matching-clothes, built at startup and
+# refreshed from a change stream, or by polling every CATALOG_INDEX_POLL_SECONDS with a full
+# rebuild every CATALOG_INDEX_REBUILD_SECONDS (0 = never) when change streams are unavailable
+CATALOG_INDEX_ENABLED = os.environ.get("CATALOG_INDEX_ENABLED", "false").lower() == "true"
+CATALOG_INDEX_CHANGE_STREAMS = os.environ.get("CATALOG_INDEX_CHANGE_STREAMS", "true").lower() == "true"
+CATALOG_INDEX_POLL_SECONDS = float(os.environ.get("CATALOG_INDEX_POLL_SECONDS", "5"))
+CATALOG_INDEX_REBUILD_SECONDS = float(os.environ.get("CATALOG_INDEX_REBUILD_SECONDS", "3600"))
+
+# color_similarity lookups for /get-matching-clothes: the whole table is kept in memory when it
+# has at most SIMILARITY_PRELOAD_MAX_DOCS documents (0 = never), otherwise an LRU of
+# SIMILARITY_CACHE_MAX_ENTRIES spellings; reloaded on change (change stream, or polled every
+# SIMILARITY_REFRESH_SECONDS, with a full reload every SIMILARITY_RELOAD_SECONDS (0 = never)
+# for in-place edits the poll cannot see)
+SIMILARITY_PRELOAD_MAX_DOCS = int(os.environ.get("SIMILARITY_PRELOAD_MAX_DOCS", "200000"))
+SIMILARITY_CACHE_MAX_ENTRIES = int(os.environ.get("SIMILARITY_CACHE_MAX_ENTRIES", "10000"))
+SIMILARITY_REFRESH_SECONDS = float(os.environ.get("SIMILARITY_REFRESH_SECONDS", "60"))
+SIMILARITY_RELOAD_SECONDS = float(os.environ.get("SIMILARITY_RELOAD_SECONDS", "3600"))
+SIMILARITY_CHANGE_STREAMS = os.environ.get("SIMILARITY_CHANGE_STREAMS", "true").lower() == "true"
+
+# Perceptual garment search (/search-clothes): garment colors indexed in memory and ranked by
+# CIEDE2000 closeness weighted by color coverage; colors stop matching at GARMENT_SEARCH_MAX_DELTA_E
+# and colors covering less than GARMENT_SEARCH_MIN_COVERAGE of a garment are not indexed.
+# Refreshed like the catalog index (CATALOG_INDEX_CHANGE_STREAMS / _POLL_SECONDS / _REBUILD_SECONDS)
+GARMENT_SEARCH_ENABLED = os.environ.get("GARMENT_SEARCH_ENABLED", "false").lower() == "true"
+GARMENT_SEARCH_MAX_DELTA_E = float(os.environ.get("GARMENT_SEARCH_MAX_DELTA_E", "10"))
+GARMENT_SEARCH_MIN_COVERAGE = float(os.environ.get("GARMENT_SEARCH_MIN_COVERAGE", "0.05"))
+# "lab" serves /get-matching-clothes from the garment search (requested colors matched
+# perceptually, ranked by score) instead of the color_similarity table, once it is loaded
+CLOTHES_MATCHING_ENGINE = os.environ.get("CLOTHES_MATCHING_ENGINE", "similarity").lower()
+# Largest `limit` (page size) accepted by /get-matching-clothes; without one it returns every match
+MATCHING_MAX_PAGE_SIZE = int(os.environ.get("MATCHING_MAX_PAGE_SIZE", "500"))
+
+# Mongo catalog client: connects on first use; request handlers run their catalog calls on
+# MONGO_IO_WORKERS threads (keep it at most MONGO_MAX_POOL_SIZE, which the background index
+# and similarity workers share). MONGO_SOCKET_TIMEOUT_MS / MONGO_MAX_IDLE_TIME_MS: 0 = none
+MONGO_MAX_POOL_SIZE = int(os.environ.get("MONGO_MAX_POOL_SIZE", "32"))
+MONGO_MIN_POOL_SIZE = int(os.environ.get("MONGO_MIN_POOL_SIZE", "0"))
+MONGO_CONNECT_TIMEOUT_MS = int(os.environ.get("MONGO_CONNECT_TIMEOUT_MS", "5000"))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.environ.get("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000"))
+MONGO_SOCKET_TIMEOUT_MS = int(os.environ.get("MONGO_SOCKET_TIMEOUT_MS", "30000"))
+MONGO_MAX_IDLE_TIME_MS = int(os.environ.get("MONGO_MAX_IDLE_TIME_MS", "60000"))
+MONGO_IO_WORKERS = int(os.environ.get("MONGO_IO_WORKERS", "16"))
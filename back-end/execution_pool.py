@@ -0,0 +1,122 @@
+# execution_pool.py
+"""
+Execution Layer for CPU-bound Work
+Runs decode -> mask -> classify and garment ingestion off the asyncio event loop.
+
+Two bounded pools are used:
+- cpu pool: thread pool for the analysis pipeline (models live in this process)
+- ingest pool: thread or process pool for rembg + ColorThief ingestion
+
+Torch intra-op threads are sized from the cpu pool so that
+`cpu_workers * torch_threads` does not exceed the number of cores.
+"""
+
+import asyncio
+import contextvars
+import functools
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Tuple
+
+import torch
+
+
+def configure_torch_threads(cpu_workers: int, torch_threads: int = 0) -> Tuple[int, int]:
+    """
+    Coordinate torch intra-op threads with the cpu pool size.
+
+    Args:
+        cpu_workers: Number of threads in the cpu pool
+        torch_threads: Explicit intra-op thread count (0 = derive from core count)
+
+    Returns:
+        Tuple of (intra_op_threads, inter_op_threads)
+    """
+    cores = os.cpu_count() or 1
+    intra_op = torch_threads if torch_threads > 0 else max(1, cores // max(1, cpu_workers))
+    torch.set_num_threads(intra_op)
+
+    # Inter-op parallelism can only be set once, before any parallel work runs
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        pass
+
+    return torch.get_num_threads(), torch.get_num_interop_threads()
+
+
+class PipelineExecutor:
+    """
+    Bounded pools for CPU-bound request work.
+
+    Handlers `await` `run_cpu(...)` / `run_ingest(...)`; the event loop stays
+    free to serve /health and other requests while the work runs.
+    """
+
+    def __init__(self, cpu_workers: int = 2, ingest_workers: int = 1, ingest_kind: str = "thread"):
+        """
+        Args:
+            cpu_workers: Max threads for the analysis pipeline
+            ingest_workers: Max workers for garment ingestion
+            ingest_kind: 'thread' or 'process' for the ingestion pool
+        """
+        if ingest_kind not in ("thread", "process"):
+            raise ValueError(f"Unknown ingest pool kind: {ingest_kind}")
+
+        self.cpu_workers = max(1, cpu_workers)
+        self.ingest_workers = max(1, ingest_workers)
+        self.ingest_kind = ingest_kind
+
+        self._cpu_pool = ThreadPoolExecutor(max_workers=self.cpu_workers, thread_name_prefix="cpu-pool")
+        self._ingest_pool: Executor
+        if ingest_kind == "process":
+            # spawn avoids forking a process that already holds torch/OpenMP threads
+            self._ingest_pool = ProcessPoolExecutor(
+                max_workers=self.ingest_workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        else:
+            self._ingest_pool = ThreadPoolExecutor(max_workers=self.ingest_workers, thread_name_prefix="ingest-pool")
+
+        self._lock = threading.Lock()
+        self._in_flight = {"cpu": 0, "ingest": 0}
+        self._completed = {"cpu": 0, "ingest": 0}
+
+    async def run_cpu(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """Run fn on the cpu pool, preserving the caller's context variables"""
+        ctx = contextvars.copy_context()
+        call = functools.partial(ctx.run, fn, *args, **kwargs)
+        return await self._submit("cpu", self._cpu_pool, call)
+
+    async def run_ingest(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """Run fn on the ingestion pool (fn and args must be picklable in process mode)"""
+        call = functools.partial(fn, *args, **kwargs)
+        return await self._submit("ingest", self._ingest_pool, call)
+
+    async def _submit(self, pool_name: str, pool: Executor, call: Callable[[], Any]) -> Any:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            self._in_flight[pool_name] += 1
+        try:
+            return await loop.run_in_executor(pool, call)
+        finally:
+            with self._lock:
+                self._in_flight[pool_name] -= 1
+                self._completed[pool_name] += 1
+
+    def shutdown(self, wait: bool = True):
+        self._cpu_pool.shutdown(wait=wait)
+        self._ingest_pool.shutdown(wait=wait)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "cpu_workers": self.cpu_workers,
+                "ingest_workers": self.ingest_workers,
+                "ingest_kind": self.ingest_kind,
+                "in_flight": dict(self._in_flight),
+                "completed": dict(self._completed),
+                "torch_threads": torch.get_num_threads(),
+            }
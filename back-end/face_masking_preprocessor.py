@@ -5,11 +5,18 @@ Crops face + hair region, excluding neck, shoulders, and body
 NO OpenCV dependency - uses Pillow + NumPy only
 """
 
+import logging
+
 import numpy as np
 from PIL import Image, ImageOps
 import torch
-from typing import Tuple, Optional
-import io
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+from image_pipeline import DecodedImage, decode_image
+from mask_engine import DEFAULT_REGION_SET, apply_mask_inplace, build_class_lut, mask_bbox, region_mask
+from metrics import MASKING_FALLBACKS, timed
+
+logger = logging.getLogger(__name__)
 
 
 class FaceMaskingPreprocessor:
@@ -17,21 +24,37 @@ class FaceMaskingPreprocessor:
     Precise face + hair cropping using Facer toolbox.
     Cuts at chin level - NO neck, NO body, NO shoulders, NO outfit.
     
-    Class indices:
+    Default region set 'skin_hair' (celebm class indices):
     - Class 2: Face skin
     - Classes 4-13: Facial parts (eyebrows, eyes, nose, lips, mouth, ears)
     - Class 14: Hair
     - EXCLUDED: Class 3 (shoulders/body), Classes 15+ (outfit/neck/body)
+    Other sets: 'skin' (face skin only), 'skin_eyes' (skin + eyes).
     """
     
-    def __init__(self, device: str = 'cpu'):
+    def __init__(
+        self,
+        device: str = 'cpu',
+        detect_max_side: int = 640,
+        parse_max_side: int = 896,
+        mask_regions: str = DEFAULT_REGION_SET
+    ):
         """
         Initialize the face masking preprocessor
         
         Args:
             device: 'cpu' or 'cuda'
+            detect_max_side: Longest side the detector sees; larger images are
+                             downscaled for detection (0 = full resolution)
+            parse_max_side: Longest side of the face window given to the parser
+                            (0 = parse the full frame)
+            mask_regions: Named region set kept by the mask (see mask_engine.REGION_SETS)
         """
+        build_class_lut(mask_regions)  # fail fast on an unknown region set
         self.device = torch.device(device)
+        self.detect_max_side = detect_max_side
+        self.parse_max_side = parse_max_side
+        self.mask_regions = mask_regions
         self.face_detector = None
         self.face_parser = None
         self._load_models()
@@ -75,120 +98,287 @@ class FaceMaskingPreprocessor:
     
     def process_image(
         self, 
-        image_input: bytes, 
-        output_size: Tuple[int, int] = (224, 224)
+        image_input: Union[bytes, DecodedImage], 
+        output_size: Tuple[int, int] = (224, 224),
+        parse: bool = True,
+        detect_max_side: Optional[int] = None
     ) -> Tuple[Image.Image, Optional[np.ndarray]]:
         """
         Process image to extract face + hair region
         
         Args:
-            image_input: Image bytes
+            image_input: Image bytes, or an image the API already decoded
             output_size: Output image size (width, height)
+            parse: False skips face parsing and crops the detector box (see process_batch)
+            detect_max_side: Overrides the detector working size for this call
             
         Returns:
             Tuple of (masked_face_pil, mask_array)
         """
-        # Convert bytes to PIL Image (replaces cv2.imdecode)
-        pil_image = Image.open(io.BytesIO(image_input))
-        
-        # Convert to RGB if needed
-        if pil_image.mode != 'RGB':
-            pil_image = pil_image.convert('RGB')
+        decoded = image_input if isinstance(image_input, DecodedImage) else decode_image(image_input)
+        return self.process_batch([decoded], output_size, parse=parse, detect_max_side=detect_max_side)[0]
+    
+    def process_batch(
+        self,
+        images: Sequence[DecodedImage],
+        output_size: Tuple[int, int] = (224, 224),
+        return_exceptions: bool = False,
+        parse: bool = True,
+        detect_max_side: Optional[int] = None
+    ) -> List[Union[Tuple[Image.Image, Optional[np.ndarray]], Exception]]:
+        """
+        Extract the face + hair region of several images with one detector
+        call and one parser call.
         
-        # Convert PIL to numpy array (RGB format)
-        image_rgb = np.array(pil_image)
-        image_height, image_width, _ = image_rgb.shape
+        Images (and face windows) of different sizes are padded to a shared
+        size, anchored top-left so their coordinates do not change. Images
+        without a detected face fall back individually to (original_pil, None),
+        exactly like process_image.
         
-        print(f"Processing image: {image_width}x{image_height}")
+        Args:
+            images: Decoded images
+            output_size: Output image size (width, height)
+            return_exceptions: Return an image's cropping error in place of its
+                               result instead of raising it (errors of the shared
+                               detector / parser calls are always raised)
+            parse: False skips the parser: the detector box, widened for the
+                   hair, is cropped without a mask (mask_array is None). The
+                   cheap option for requests short on latency budget.
+            detect_max_side: Overrides self.detect_max_side for this call
+            
+        Returns:
+            One (masked_face_pil, mask_array) tuple per image, in input order
+        """
+        logger.debug(f"Processing {len(images)} image(s): {[decoded.size for decoded in images]}")
+        results: List = [(decoded.pil, None) for decoded in images]
         
-        # Prepare image for Facer (must be uint8)
-        image_tensor = torch.tensor(
-            image_rgb, 
-            dtype=torch.uint8
-        ).permute(2, 0, 1).unsqueeze(0).to(self.device)
+        # Face Detection (on downscaled copies when detect_max_side is set)
+        with timed("face_detect"):
+            detections = self._detect_faces(
+                images, self.detect_max_side if detect_max_side is None else detect_max_side
+            )
         
-        # Face Detection
-        print("Detecting faces...")
-        with torch.inference_mode():
-            batch_dicts = self.face_detector(image_tensor)
+        with_face = [index for index, faces in enumerate(detections) if faces is not None]
+        if len(with_face) < len(images):
+            MASKING_FALLBACKS.inc("no_face", amount=len(images) - len(with_face))
+            logger.debug(f"No faces detected in {len(images) - len(with_face)} image(s), returning original image")
+        if not with_face:
+            return results
         
-        if not batch_dicts or len(batch_dicts) == 0:
-            print("No faces detected! Returning original image")
-            return pil_image, None
+        if not parse:
+            logger.debug("Skipping face parsing, cropping the detection box")
+            for index in with_face:
+                try:
+                    with timed("face_crop"):
+                        results[index] = self._crop_detection_box(images[index].array, detections[index], output_size)
+                except Exception as e:
+                    if not return_exceptions:
+                        raise
+                    results[index] = e
+            return results
+        
+        # Face Parsing (Segmentation) - only the face ROI when parse_max_side is set
+        with timed("face_parse"):
+            parser_inputs = [self._prepare_parser_input(images[index].array, detections[index]) for index in with_face]
+            parse_tensor = pad_to_batch([pixels for pixels, _, _ in parser_inputs]).to(self.device)
+            faces = {
+                key: torch.cat([roi_faces[key] for _, roi_faces, _ in parser_inputs])
+                for key in parser_inputs[0][1]
+            }
+            # Face k was found in parser input k
+            faces['image_ids'] = torch.arange(len(parser_inputs)).to(faces['image_ids'])
+            with torch.inference_mode():
+                batch_dicts = self.face_parser(parse_tensor, faces)
+            
+            batch_dict = batch_dicts[0] if isinstance(batch_dicts, list) else batch_dicts
+            
+            if not isinstance(batch_dict, dict) or 'seg' not in batch_dict:
+                MASKING_FALLBACKS.inc("no_segmentation", amount=len(with_face))
+                logger.warning("No segmentation output, returning original image")
+                return results
+            
+            # Extract segmentation masks
+            seg_logits = batch_dict['seg']['logits']  # (n_faces, num_classes, h, w)
+            # argmax over logits == argmax over softmax, without the full-map softmax
+            seg_pred = seg_logits.argmax(dim=1)  # (n_faces, h, w)
+            
+            n_classes = seg_logits.shape[1]
+            if n_classes <= 256:
+                # uint8 label map: 8x smaller than int64 and the cheapest LUT index
+                seg_pred = seg_pred.to(torch.uint8)
+            seg_pred_np = seg_pred.cpu().numpy()
+        
+        logger.debug(f"Segmentation classes: {n_classes}")
+        
+        label_names = batch_dict['seg'].get('label_names')
+        for k, index in enumerate(with_face):
+            parse_pixels, _, roi = parser_inputs[k]
+            image_rgb = images[index].array
+            image_height, image_width, _ = image_rgb.shape
+            try:
+                with timed("face_crop"):
+                    # Label map of this face, without the padding of the shared batch size
+                    label_map = seg_pred_np[k, :parse_pixels.shape[0], :parse_pixels.shape[1]]
+                    
+                    # Create the region mask (in parser coordinates)
+                    merged_mask = self._create_region_mask(label_map, label_names)
+                    
+                    # Get chin position from landmarks
+                    face_dict = {
+                        key: value[k:k + 1] for key, value in batch_dict.items() if isinstance(value, torch.Tensor)
+                    }
+                    chin_y = self._get_chin_position(face_dict, merged_mask.shape[0])
+                    
+                    # Determine crop boundaries; the crop itself is taken from the decoded image
+                    results[index] = self._crop_and_resize(
+                        image_rgb, 
+                        merged_mask, 
+                        chin_y, 
+                        image_width, 
+                        image_height, 
+                        output_size,
+                        roi
+                    )
+            except Exception as e:
+                if not return_exceptions:
+                    raise
+                results[index] = e
         
-        batch_dict = batch_dicts[0] if isinstance(batch_dicts, list) else batch_dicts
-        print("Face(s) detected")
+        return results
+    
+    def _detect_faces(
+        self,
+        images: Sequence[DecodedImage],
+        detect_max_side: int
+    ) -> List[Optional[Dict[str, torch.Tensor]]]:
+        """
+        Run the detector once over all images, each on a copy downscaled to
+        detect_max_side if it is larger (0 = full resolution).
         
-        # Face Parsing (Segmentation)
-        print("Parsing face (segmentation)...")
+        Returns:
+            Per image, the facer detection dict of its first face in
+            decoded-image coordinates, or None if no face was found
+        """
+        pixel_arrays = []
+        axis_scales = []
+        for decoded in images:
+            width, height = decoded.size
+            scale = 1.0
+            if detect_max_side > 0 and max(width, height) > detect_max_side:
+                scale = detect_max_side / max(width, height)
+            
+            if scale < 1.0:
+                small = decoded.pil.resize(
+                    (max(1, round(width * scale)), max(1, round(height * scale))),
+                    Image.Resampling.BILINEAR
+                )
+                pixels = np.array(small)
+                # Per axis, the sizes were rounded
+                axis_scales.append(torch.tensor([pixels.shape[1] / width, pixels.shape[0] / height]))
+            else:
+                pixels = decoded.array
+                axis_scales.append(None)
+            pixel_arrays.append(pixels)
+        
+        # Facer expects uint8 (N, 3, H, W)
+        image_tensor = pad_to_batch(pixel_arrays).to(self.device)
         with torch.inference_mode():
-            batch_dicts = self.face_parser(image_tensor, batch_dicts)
-        
-        batch_dict = batch_dicts[0] if isinstance(batch_dicts, list) else batch_dicts
-        
-        if not isinstance(batch_dict, dict) or 'seg' not in batch_dict:
-            print("No segmentation output! Returning original image")
-            return pil_image, None
+            faces = self.face_detector(image_tensor)
         
-        # Extract segmentation masks
-        seg_logits = batch_dict['seg']['logits']  # (1, num_classes, H, W)
-        seg_probs = seg_logits.softmax(dim=1)
-        seg_pred = seg_probs.argmax(dim=1)  # (1, H, W)
+        detections: List[Optional[Dict[str, torch.Tensor]]] = [None] * len(images)
+        if not faces or len(faces.get('scores', ())) == 0:
+            return detections
         
-        n_classes = seg_probs.shape[1]
-        seg_pred_np = seg_pred[0].cpu().numpy()
-        
-        print(f"Segmentation classes: {n_classes}")
+        for face_index, image_id in enumerate(faces['image_ids'].tolist()):
+            # The mask is built from the first face only, so only that one is parsed
+            if detections[image_id] is not None:
+                continue
+            face = {key: value[face_index:face_index + 1] for key, value in faces.items()}
+            
+            axis_scale = axis_scales[image_id]
+            if axis_scale is not None:
+                # Map boxes and landmarks back to decoded-image pixels
+                face['rects'] = face['rects'] / axis_scale.repeat(2).to(face['rects'])
+                face['points'] = face['points'] / axis_scale.to(face['points'])
+            detections[image_id] = face
+        
+        return detections
+    
+    def _prepare_parser_input(
+        self,
+        image_rgb: np.ndarray,
+        faces: Dict[str, torch.Tensor]
+    ) -> Tuple[np.ndarray, Dict[str, torch.Tensor], Optional[Tuple[int, int, float, float]]]:
+        """
+        Build the parser input: the full frame, or (with parse_max_side) only the
+        window the parser aligns to, downscaled to at most parse_max_side.
         
-        # Create face + hair mask
-        merged_mask = self._create_face_hair_mask(seg_pred_np, n_classes)
+        The parser warps that window to 448x448 and un-warps its logits back to
+        the input size, so parsing a 12MP frame costs a full-resolution float copy
+        plus num_classes full-resolution logit maps.
         
-        # Get chin position from landmarks
-        chin_y = self._get_chin_position(batch_dict, image_height)
+        Returns:
+            Tuple of (uint8 (h, w, 3) pixels, faces in those pixels' coordinates,
+            roi) where roi = (x_offset, y_offset, x_scale, y_scale) maps parser
+            coordinates back to the image, or None for the full frame
+        """
+        if self.parse_max_side <= 0:
+            return image_rgb, faces, None
+        
+        image_height, image_width = image_rgb.shape[:2]
+        x1, y1, x2, y2 = parser_window(faces['points'][0], faces['rects'][0], image_width, image_height)
+        
+        roi_image = Image.fromarray(image_rgb[y1:y2, x1:x2])
+        scale = min(1.0, self.parse_max_side / max(x2 - x1, y2 - y1))
+        if scale < 1.0:
+            roi_image = roi_image.resize(
+                (max(1, round((x2 - x1) * scale)), max(1, round((y2 - y1) * scale))),
+                Image.Resampling.BILINEAR
+            )
+        roi_pixels = np.array(roi_image)
+        x_scale = roi_pixels.shape[1] / (x2 - x1)
+        y_scale = roi_pixels.shape[0] / (y2 - y1)
         
-        # Determine crop boundaries
-        cropped_face, mask_resized = self._crop_and_resize(
-            image_rgb, 
-            merged_mask, 
-            chin_y, 
-            image_width, 
-            image_height, 
-            output_size
-        )
+        offset = torch.tensor([x1, y1], dtype=torch.float32)
+        axis_scale = torch.tensor([x_scale, y_scale], dtype=torch.float32)
+        roi_faces = dict(faces)
+        roi_faces['points'] = (faces['points'] - offset.to(faces['points'])) * axis_scale.to(faces['points'])
+        roi_faces['rects'] = (faces['rects'] - offset.repeat(2).to(faces['rects'])) * axis_scale.repeat(2).to(faces['rects'])
         
-        return cropped_face, mask_resized
+        return roi_pixels, roi_faces, (x1, y1, x_scale, y_scale)
     
-    def _create_face_hair_mask(self, seg_pred_np: np.ndarray, n_classes: int) -> np.ndarray:
+    def _crop_detection_box(
+        self,
+        image_rgb: np.ndarray,
+        faces: Dict[str, torch.Tensor],
+        output_size: Tuple[int, int]
+    ) -> Tuple[Image.Image, None]:
         """
-        Create mask including face skin, facial parts, and hair
-        Excludes shoulders, body, and outfit
+        Crop the detection box, widened by the same 10% side margins as the
+        mask crop and raised by 30% of its height to keep the hair, without
+        parsing or masking anything.
         """
-        merged_mask = np.zeros_like(seg_pred_np, dtype=np.uint8)
-        
-        # Include face skin (class 2)
-        merged_mask[seg_pred_np == 2] = 255
-        print("Included: Class 2 (face skin)")
-        
-        # Include facial parts (classes 4-13) - SKIP class 3!
-        for cls in range(4, 14):
-            merged_mask[seg_pred_np == cls] = 255
-        print("Included: Classes 4-13 (facial features)")
-        
-        # Include hair (class 14)
-        merged_mask[seg_pred_np == 14] = 255
-        print("Included: Class 14 (hair)")
-        
-        # Explicitly exclude class 3 (shoulders/body)
-        merged_mask[seg_pred_np == 3] = 0
-        print("Excluded: Class 3 (shoulders/body)")
-        
-        # Explicitly exclude outfit classes (15+)
-        for cls in range(15, n_classes):
-            merged_mask[seg_pred_np == cls] = 0
-        print(f"Excluded: Classes 15-{n_classes-1} (outfit/neck/body)")
-        
-        print(f"Final mask pixels: {np.sum(merged_mask > 0)}")
-        
+        image_height, image_width = image_rgb.shape[:2]
+        x1, y1, x2, y2 = faces['rects'][0].tolist()
+        margin_x = (x2 - x1) * 0.1
+        crop_x1 = int(np.clip(x1 - margin_x, 0, image_width - 1))
+        crop_x2 = int(np.clip(np.ceil(x2 + margin_x), crop_x1 + 1, image_width))
+        crop_y1 = int(np.clip(y1 - (y2 - y1) * 0.3, 0, image_height - 1))
+        crop_y2 = int(np.clip(np.ceil(y2), crop_y1 + 1, image_height))
+        
+        logger.debug(f"Box crop bounds: x[{crop_x1}:{crop_x2}], y[{crop_y1}:{crop_y2}]")
+        
+        pil_crop = Image.fromarray(image_rgb[crop_y1:crop_y2, crop_x1:crop_x2])
+        return pil_crop.resize(output_size, Image.Resampling.LANCZOS), None
+    
+    def _create_region_mask(self, seg_pred_np: np.ndarray, label_names=None) -> np.ndarray:
+        """
+        Create mask of the configured region set (default: face skin, facial
+        parts and hair - excludes neck, shoulders, body and outfit)
+        """
+        merged_mask = region_mask(seg_pred_np, self.mask_regions, label_names)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Region set '{self.mask_regions}': {np.count_nonzero(merged_mask)} mask pixels")
         return merged_mask
     
     def _get_chin_position(self, batch_dict: dict, image_height: int) -> int:
@@ -202,9 +392,9 @@ class FaceMaskingPreprocessor:
                 if len(landmarks_np) > 0:
                     face_landmarks = landmarks_np[0]
                     chin_y = int(np.max(face_landmarks[:, 1]))
-                    print(f"Chin Y position: {chin_y}")
+                    logger.debug(f"Chin Y position: {chin_y}")
             except Exception as e:
-                print(f"Could not extract chin position: {e}")
+                logger.warning(f"Could not extract chin position: {e}")
         
         return chin_y
     
@@ -215,21 +405,27 @@ class FaceMaskingPreprocessor:
         chin_y: int,
         image_width: int,
         image_height: int,
-        output_size: Tuple[int, int]
+        output_size: Tuple[int, int],
+        roi: Optional[Tuple[int, int, float, float]] = None
     ) -> Tuple[Image.Image, np.ndarray]:
-        """Crop face region and resize to output size"""
-        coords = np.where(merged_mask > 0)
+        """
+        Crop face region and resize to output size
         
-        if len(coords[0]) == 0:
-            print("No mask pixels found! Returning original image")
+        The crop box is found in mask coordinates; `roi` (x_offset, y_offset,
+        x_scale, y_scale) maps it onto the image when the mask only covers
+        the parsed face window.
+        """
+        mask_height, mask_width = merged_mask.shape
+        bbox = mask_bbox(merged_mask)
+        
+        if bbox is None:
+            MASKING_FALLBACKS.inc("empty_mask")
+            logger.debug("No mask pixels found, returning original image")
             pil_image = Image.fromarray(image_rgb)
             pil_image = pil_image.resize(output_size, Image.Resampling.LANCZOS)
             return pil_image, np.ones(output_size, dtype=np.uint8) * 255
         
-        y_min = np.min(coords[0])
-        y_max = np.max(coords[0])
-        x_min = np.min(coords[1])
-        x_max = np.max(coords[1])
+        y_min, y_max, x_min, x_max = bbox
         
         # Limit y_max to chin level
         y_max = min(y_max, chin_y)
@@ -237,15 +433,22 @@ class FaceMaskingPreprocessor:
         # Add side margins (10%)
         margin_x = int((x_max - x_min) * 0.1)
         crop_x1 = max(0, x_min - margin_x)
-        crop_x2 = min(image_width, x_max + margin_x)
+        crop_x2 = min(mask_width, x_max + margin_x)
         crop_y1 = max(0, y_min)
-        crop_y2 = min(image_height, y_max)
+        crop_y2 = min(mask_height, y_max)
+        
+        # Crop the mask in its own coordinates, the image in image coordinates
+        merged_mask_crop = merged_mask[crop_y1:crop_y2, crop_x1:crop_x2]
+        if roi is not None:
+            x_offset, y_offset, x_scale, y_scale = roi
+            crop_x1 = max(0, x_offset + int(crop_x1 / x_scale))
+            crop_x2 = min(image_width, x_offset + int(round(crop_x2 / x_scale)))
+            crop_y1 = max(0, y_offset + int(crop_y1 / y_scale))
+            crop_y2 = min(image_height, y_offset + int(round(crop_y2 / y_scale)))
         
-        print(f"Crop bounds: x[{crop_x1}:{crop_x2}], y[{crop_y1}:{crop_y2}]")
+        logger.debug(f"Crop bounds: x[{crop_x1}:{crop_x2}], y[{crop_y1}:{crop_y2}]")
         
-        # Crop image and mask using numpy slicing
         face_crop_rgb = image_rgb[crop_y1:crop_y2, crop_x1:crop_x2]
-        merged_mask_crop = merged_mask[crop_y1:crop_y2, crop_x1:crop_x2]
         
         # Resize using PIL (replaces cv2.resize)
         pil_crop = Image.fromarray(face_crop_rgb)
@@ -257,35 +460,99 @@ class FaceMaskingPreprocessor:
         pil_mask_resized = pil_mask.resize(output_size, Image.Resampling.NEAREST)
         mask_resized = np.array(pil_mask_resized)
         
-        # Apply mask
-        print("Applying mask...")
-        black_background = np.zeros((output_size[1], output_size[0], 3), dtype=np.uint8)
-        mask_3ch = np.stack((mask_resized,) * 3, axis=-1)
-        
-        masked_face = np.where(
-            mask_3ch > 127,
-            face_crop_resized,
-            black_background
-        ).astype(np.uint8)
+        # Apply mask (in place on the resized uint8 crop)
+        apply_mask_inplace(face_crop_resized, mask_resized)
         
         # Convert to PIL
-        cropped_pil = Image.fromarray(masked_face)
-        
-        print("Face masking complete!")
+        cropped_pil = Image.fromarray(face_crop_resized)
         
         return cropped_pil, mask_resized
 
 
+def pad_to_batch(pixel_arrays: Sequence[np.ndarray]) -> torch.Tensor:
+    """
+    Stack (h, w, 3) uint8 arrays into one uint8 (N, 3, H, W) tensor.
+    
+    Smaller arrays are anchored top-left on a black canvas of the largest
+    height and width, so pixel coordinates are the same in the batch as in
+    each array and nothing has to be shifted back afterwards.
+    """
+    if len(pixel_arrays) == 1:
+        # from_numpy wraps the array without copying
+        return torch.from_numpy(pixel_arrays[0]).permute(2, 0, 1).unsqueeze(0)
+    
+    height = max(pixels.shape[0] for pixels in pixel_arrays)
+    width = max(pixels.shape[1] for pixels in pixel_arrays)
+    canvas = np.zeros((len(pixel_arrays), height, width, 3), dtype=np.uint8)
+    for index, pixels in enumerate(pixel_arrays):
+        canvas[index, :pixels.shape[0], :pixels.shape[1]] = pixels
+    return torch.from_numpy(canvas).permute(0, 3, 1, 2)
+
+
+def parser_window(
+    points: torch.Tensor,
+    rect: torch.Tensor,
+    image_width: int,
+    image_height: int,
+    margin: float = 0.1
+) -> Tuple[int, int, int, int]:
+    """
+    Pixel box (x1, y1, x2, y2) containing everything the face parser looks at.
+    
+    Mirrors facer's celebm alignment: an oriented square centred just below
+    the eyes, half-size max(2 * eye distance, 1.8 * eye-to-mouth distance).
+    Its half-diagonal is used so any head roll fits, the detection box is
+    included, and `margin` is added for the bilinear warp. Logits outside the
+    aligned square are background, so parsing only this box gives the same mask.
+    
+    Args:
+        points: (5, 2) landmarks - eyes, nose, mouth corners
+        rect: (4,) detection box x1, y1, x2, y2
+    """
+    lm = points.detach().cpu().double().numpy()
+    eye_avg = (lm[0] + lm[1]) * 0.5
+    mouth_avg = (lm[3] + lm[4]) * 0.5
+    eye_to_eye = lm[1] - lm[0]
+    eye_to_mouth = mouth_avg - eye_avg
+    half_size = max(np.hypot(*eye_to_eye) * 2.0, np.hypot(*eye_to_mouth) * 1.8)
+    radius = half_size * np.sqrt(2.0)
+    center = eye_avg + eye_to_mouth * 0.1
+    
+    box = rect.detach().cpu().double().numpy()
+    x1 = min(center[0] - radius, box[0])
+    y1 = min(center[1] - radius, box[1])
+    x2 = max(center[0] + radius, box[2])
+    y2 = max(center[1] + radius, box[3])
+    pad_x = (x2 - x1) * margin
+    pad_y = (y2 - y1) * margin
+    
+    x1 = int(np.clip(np.floor(x1 - pad_x), 0, image_width - 1))
+    y1 = int(np.clip(np.floor(y1 - pad_y), 0, image_height - 1))
+    x2 = int(np.clip(np.ceil(x2 + pad_x), x1 + 1, image_width))
+    y2 = int(np.clip(np.ceil(y2 + pad_y), y1 + 1, image_height))
+    return x1, y1, x2, y2
+
+
 # Singleton instance for reuse
 _preprocessor_instance: Optional[FaceMaskingPreprocessor] = None
 
 
-def get_face_masking_preprocessor(device: str = 'cpu') -> FaceMaskingPreprocessor:
+def get_face_masking_preprocessor(
+    device: str = 'cpu',
+    detect_max_side: int = 640,
+    parse_max_side: int = 896,
+    mask_regions: str = DEFAULT_REGION_SET
+) -> FaceMaskingPreprocessor:
     """Get or create singleton instance of FaceMaskingPreprocessor"""
     global _preprocessor_instance
     
     if _preprocessor_instance is None:
-        _preprocessor_instance = FaceMaskingPreprocessor(device=device)
+        _preprocessor_instance = FaceMaskingPreprocessor(
+            device=device,
+            detect_max_side=detect_max_side,
+            parse_max_side=parse_max_side,
+            mask_regions=mask_regions
+        )
     
     return _preprocessor_instance
 
@@ -0,0 +1,501 @@
+# garment_search.py
+"""
+Perceptual Garment Search
+Ranks catalog garments by how much of each garment is covered by colors
+perceptually close (CIEDE2000) to the requested palette colors.
+
+A garment's colors are its `colors_sorted` (dominant colors and their
+percentages, extracted at upload), or, for documents without them, its
+`top2_colors` weighted equally. Each garment color is compared with its
+closest requested color, with similarity 1 - dE2000 / max_delta_e (0 from
+max_delta_e on), and a garment scores the coverage-weighted sum, as a
+percentage:
+
+    score = 100 * sum(coverage(color) * similarity(color))
+
+GarmentColorIndex keeps the catalog in memory as numpy arrays:
+
+- colors: the distinct garment colors (24-bit RGB codes) with their Lab
+  and DIN99o values, ordered by a grid cell of their DIN99o coordinates,
+  where Euclidean distance approximates CIEDE2000. A query finds the
+  colors within SEARCH_RADIUS_FACTOR * max_delta_e of a requested color in
+  DIN99o through the grid, and only computes dE2000 for those
+- postings: the (garment slot, coverage) pairs of every color, CSR-style
+- ids / genders / alive: per garment slot, the _id (12 bytes, sorted), a
+  gender code, and False once the garment changed or was deleted
+
+As in catalog_index.CatalogColorIndex, changes go to a small delta that is
+merged into a new base at compact_threshold garments, and the index is
+kept in sync by catalog_index.CatalogIndexRefresher. Results are ordered
+by score, then _id, so pages are stable; a page is picked with a heap.
+"""
+
+import heapq
+import threading
+import time
+from array import array
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Tuple
+
+import numpy as np
+from bson.objectid import ObjectId
+
+from catalog_index import _id_bytes
+from clothing_matcher import normalize_hex
+from color_space import delta_e_2000, lab_to_din99o, rgb_to_lab
+
+
+# Fields of a photo document the index reads
+GARMENT_PROJECTION = {"_id": 1, "gender": 1, "colors_sorted": 1, "top2_colors": 1}
+
+# Candidate colors lie within this many max_delta_e of a requested color in DIN99o; on
+# random sRGB colors it keeps over 99.9% of the pairs within max_delta_e in CIEDE2000
+SEARCH_RADIUS_FACTOR = 2.0
+
+# DIN99o lightness is 0-100 and a99o / b99o stay within about +-60 for sRGB colors
+_GRID_ORIGIN = np.array([0.0, -64.0, -64.0])
+_GRID_SPAN = 128.0
+
+
+def _rgb_code(color: Any) -> Optional[int]:
+    value = normalize_hex(color)
+    if len(value) != 7:
+        return None
+    try:
+        return int(value[1:], 16)
+    except ValueError:
+        return None
+
+
+def _codes_to_lab(codes: np.ndarray) -> np.ndarray:
+    codes = np.asarray(codes, dtype=np.int64)
+    return rgb_to_lab(np.stack([(codes >> 16) & 255, (codes >> 8) & 255, codes & 255], axis=-1))
+
+
+def _ranges(starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    """Concatenation of arange(start, end) over the given bounds"""
+    lengths = ends - starts
+    total = int(lengths.sum())
+    if total == 0:
+        return np.empty(0, dtype=np.int64)
+    shifts = np.repeat(starts - np.concatenate([[0], np.cumsum(lengths)[:-1]]), lengths)
+    return np.arange(total, dtype=np.int64) + shifts
+
+
+def garment_colors(doc: Mapping[str, Any], min_coverage: float = 0.0) -> Dict[int, float]:
+    """
+    Coverage (0-1) of each color of a photo document, by 24-bit RGB code.
+
+    `colors_sorted` entries ({"color": "#rrggbb", "percentage": n}, in a
+    list or in a dict keyed by rank) are weighted by their percentages, or
+    equally when these are missing; documents without `colors_sorted` weight
+    their `top2_colors` equally. Colors covering less than min_coverage of
+    the garment are dropped.
+    """
+    entries = doc.get("colors_sorted")
+    if isinstance(entries, Mapping):
+        entries = list(entries.values())
+    pairs = []
+    for entry in entries or ():
+        if isinstance(entry, Mapping):
+            pairs.append((entry.get("color", entry.get("hex")), entry.get("percentage")))
+        else:
+            pairs.append((entry, None))
+    if not pairs:
+        pairs = [(c.get("hex") if isinstance(c, Mapping) else c, None) for c in doc.get("top2_colors") or ()]
+    if not pairs:
+        return {}
+
+    percentages = [p for _, p in pairs]
+    if all(isinstance(p, (int, float)) and p >= 0 for p in percentages) and sum(percentages) > 0:
+        total = float(sum(percentages))
+        weights = [p / total for p in percentages]
+    else:
+        weights = [1.0 / len(pairs)] * len(pairs)
+
+    coverage: Dict[int, float] = {}
+    for (color, _), weight in zip(pairs, weights):
+        code = _rgb_code(color)
+        if code is not None:
+            coverage[code] = coverage.get(code, 0.0) + weight
+    return {code: weight for code, weight in coverage.items() if weight > 0 and weight >= min_coverage}
+
+
+class GarmentColorIndex:
+    """DIN99o-gridded garment colors with coverage postings; thread-safe"""
+
+    projection = GARMENT_PROJECTION
+
+    def __init__(
+        self,
+        max_delta_e: float = 10.0,
+        min_coverage: float = 0.05,
+        cell_size: float = 8.0,
+        compact_threshold: int = 20000
+    ):
+        """
+        Args:
+            max_delta_e: Default CIEDE2000 distance at which a color stops matching
+            min_coverage: Garment colors covering less than this fraction are not indexed
+            cell_size: Grid cell side in DIN99o units
+            compact_threshold: Changed garments kept in the delta before it is merged into the base
+        """
+        self.max_delta_e = max_delta_e
+        self.min_coverage = min_coverage
+        self.cell_size = cell_size
+        self.compact_threshold = compact_threshold
+        self._side = int(np.ceil(_GRID_SPAN / cell_size))
+        self._lock = threading.Lock()
+        self._genders: Dict[Any, int] = {}
+
+        # Base segment: garments
+        self._ids = np.empty(0, dtype="S12")
+        self._gender_codes = np.empty(0, dtype=np.int16)
+        self._alive = np.empty(0, dtype=bool)
+        # Base segment: colors in grid order, their cells, and their postings
+        self._codes = np.empty(0, dtype=np.uint32)
+        self._labs = np.empty((0, 3), dtype=np.float32)
+        self._dins = np.empty((0, 3), dtype=np.float32)
+        self._cell_keys = np.empty(0, dtype=np.int64)
+        self._cell_offsets = np.zeros(1, dtype=np.int64)
+        self._post_offsets = np.zeros(1, dtype=np.int64)
+        self._post_slots = np.empty(0, dtype=np.int32)
+        self._post_weights = np.empty(0, dtype=np.float32)
+
+        # Delta: (gender code, color codes, coverages) of every changed garment
+        # (no colors for deleted ones), and the same as arrays for searching
+        self._delta_docs: Dict[bytes, Tuple[int, Tuple[int, ...], Tuple[float, ...]]] = {}
+        self._delta_arrays: Optional[Tuple[Any, ...]] = None
+
+        self._builds = 0
+        self._compactions = 0
+        self._changes_applied = 0
+        self.last_build_ms: Optional[float] = None
+
+    # --- Keys ---
+
+    def _gender_code(self, gender: Any) -> int:
+        code = self._genders.get(gender)
+        if code is None:
+            code = self._genders[gender] = len(self._genders)
+        return code
+
+    def _cells(self, din: np.ndarray) -> np.ndarray:
+        cell = np.clip(((din - _GRID_ORIGIN) // self.cell_size).astype(np.int64), 0, self._side - 1)
+        return (cell[..., 0] * self._side + cell[..., 1]) * self._side + cell[..., 2]
+
+    # --- Building ---
+
+    def build(self, docs: Iterable[Dict[str, Any]]) -> int:
+        """
+        Replace the whole index with the given photo documents.
+
+        Returns:
+            Number of garments indexed (photos without colors are skipped)
+        """
+        start = time.perf_counter()
+        ids = bytearray()
+        genders = array("h")
+        entry_docs = array("q")
+        entry_codes = array("I")
+        entry_weights = array("f")
+        count = 0
+        with self._lock:
+            for doc in docs:
+                coverage = garment_colors(doc, self.min_coverage)
+                if coverage:
+                    entry_docs.extend([count] * len(coverage))
+                    entry_codes.extend(coverage.keys())
+                    entry_weights.extend(coverage.values())
+                    genders.append(self._gender_code(doc.get("gender")))
+                    ids += _id_bytes(doc["_id"])
+                    count += 1
+            self._set_base(
+                np.frombuffer(ids, dtype="S12"),
+                np.frombuffer(genders, dtype=np.int16),
+                np.frombuffer(entry_docs, dtype=np.int64),
+                np.frombuffer(entry_codes, dtype=np.uint32),
+                np.frombuffer(entry_weights, dtype=np.float32)
+            )
+            self._delta_docs.clear()
+            self._delta_arrays = None
+            self._builds += 1
+        self.last_build_ms = round((time.perf_counter() - start) * 1000.0, 1)
+        return count
+
+    def _set_base(
+        self,
+        ids: np.ndarray,
+        genders: np.ndarray,
+        entry_docs: np.ndarray,
+        entry_codes: np.ndarray,
+        entry_weights: np.ndarray
+    ):
+        """New base segment from (document position, color code, coverage) entries"""
+        order = np.argsort(ids, kind="stable")
+        slot_of_doc = np.empty(len(ids), dtype=np.int64)
+        slot_of_doc[order] = np.arange(len(ids))
+        entry_slots = slot_of_doc[entry_docs]
+
+        # Distinct colors, ordered by grid cell
+        codes, entry_colors = np.unique(entry_codes, return_inverse=True)
+        labs = _codes_to_lab(codes)
+        dins = lab_to_din99o(labs)
+        cells = self._cells(dins)
+        color_order = np.argsort(cells, kind="stable")
+        rank = np.empty(len(codes), dtype=np.int64)
+        rank[color_order] = np.arange(len(codes))
+        entry_colors = rank[entry_colors.reshape(-1)]
+        cell_keys, cell_starts = np.unique(cells[color_order], return_index=True)
+
+        by_color = np.lexsort((entry_slots, entry_colors))
+        postings = np.bincount(entry_colors, minlength=len(codes))
+
+        self._ids = ids[order]
+        self._gender_codes = genders[order].astype(np.int16)
+        self._alive = np.ones(len(ids), dtype=bool)
+        self._codes = codes[color_order].astype(np.uint32)
+        self._labs = labs[color_order].astype(np.float32)
+        self._dins = dins[color_order].astype(np.float32)
+        self._cell_keys = cell_keys
+        self._cell_offsets = np.append(cell_starts, len(codes)).astype(np.int64)
+        self._post_offsets = np.concatenate([[0], np.cumsum(postings)]).astype(np.int64)
+        self._post_slots = entry_slots[by_color].astype(np.int32)
+        self._post_weights = entry_weights[by_color].astype(np.float32)
+
+    def _compact(self):
+        """Merge the live base garments and the delta into a new base (lock held)"""
+        entry_colors = np.repeat(np.arange(len(self._codes)), np.diff(self._post_offsets))
+        entry_slots = self._post_slots.astype(np.int64)
+        live = self._alive[entry_slots]
+        live_slots = np.flatnonzero(self._alive)
+
+        # Renumber the live base slots 0..n-1, then append the delta garments
+        renumber = np.full(len(self._ids), -1, dtype=np.int64)
+        renumber[live_slots] = np.arange(len(live_slots))
+        delta = [(oid, entry) for oid, entry in self._delta_docs.items() if entry[1]]
+        ids = np.concatenate([self._ids[live_slots], np.array([oid for oid, _ in delta], dtype="S12")])
+        genders = np.concatenate([
+            self._gender_codes[live_slots],
+            np.array([gender for _, (gender, _, _) in delta], dtype=np.int16)
+        ])
+        delta_docs = [len(live_slots) + i for i, (_, (_, codes, _)) in enumerate(delta) for _ in codes]
+        delta_codes = [code for _, (_, codes, _) in delta for code in codes]
+        delta_weights = [weight for _, (_, _, weights) in delta for weight in weights]
+
+        self._set_base(
+            ids,
+            genders,
+            np.concatenate([renumber[entry_slots[live]], np.array(delta_docs, dtype=np.int64)]),
+            np.concatenate([self._codes[entry_colors[live]], np.array(delta_codes, dtype=np.uint32)]),
+            np.concatenate([self._post_weights[live], np.array(delta_weights, dtype=np.float32)])
+        )
+        self._delta_docs.clear()
+        self._delta_arrays = None
+        self._compactions += 1
+
+    # --- Incremental changes ---
+
+    def _base_slot(self, oid: bytes) -> Optional[int]:
+        slot = int(np.searchsorted(self._ids, oid))
+        # numpy drops trailing NUL bytes of S12 values
+        if slot < len(self._ids) and self._ids[slot].ljust(12, b"\0") == oid:
+            return slot
+        return None
+
+    def _replace(self, oid: bytes, gender: int, coverage: Dict[int, float]):
+        slot = self._base_slot(oid)
+        if not coverage and slot is None and oid not in self._delta_docs:
+            # Never indexed (e.g. a photo without colors)
+            return
+        if slot is not None:
+            self._alive[slot] = False
+        self._delta_docs[oid] = (gender, tuple(coverage.keys()), tuple(coverage.values()))
+        self._delta_arrays = None
+        self._changes_applied += 1
+        if len(self._delta_docs) >= self.compact_threshold:
+            self._compact()
+
+    def apply(self, doc: Dict[str, Any]):
+        """Insert or update one photo document (needs _id, gender and colors_sorted or top2_colors)"""
+        oid = _id_bytes(doc["_id"])
+        coverage = garment_colors(doc, self.min_coverage)
+        with self._lock:
+            self._replace(oid, self._gender_code(doc.get("gender")), coverage)
+
+    def remove(self, doc_id: ObjectId):
+        with self._lock:
+            self._replace(_id_bytes(doc_id), -1, {})
+
+    # --- Searching ---
+
+    def _base_colors(self, query_labs: np.ndarray, max_delta_e: float) -> Tuple[np.ndarray, np.ndarray]:
+        """Base colors within max_delta_e of a requested color, and their best similarity"""
+        radius = SEARCH_RADIUS_FACTOR * max_delta_e
+        best = np.zeros(len(self._codes))
+        for lab, din in zip(query_labs, lab_to_din99o(query_labs)):
+            low = np.clip(((din - radius - _GRID_ORIGIN) // self.cell_size).astype(np.int64), 0, self._side - 1)
+            high = np.clip(((din + radius - _GRID_ORIGIN) // self.cell_size).astype(np.int64), 0, self._side - 1)
+            cells = np.stack(np.meshgrid(
+                *(np.arange(lo, hi + 1) for lo, hi in zip(low, high)), indexing="ij"
+            ), axis=-1).reshape(-1, 3)
+            keys = (cells[:, 0] * self._side + cells[:, 1]) * self._side + cells[:, 2]
+            positions = np.searchsorted(self._cell_keys, keys)
+            in_range = positions < len(self._cell_keys)
+            positions = positions[in_range][self._cell_keys[positions[in_range]] == keys[in_range]]
+            candidates = _ranges(self._cell_offsets[positions], self._cell_offsets[positions + 1])
+            # The cells cover a box around the DIN99o ball; dE2000 only for the colors inside the ball
+            offsets = self._dins[candidates] - din.astype(np.float32)
+            candidates = candidates[np.einsum("ij,ij->i", offsets, offsets) <= radius * radius]
+            if not len(candidates):
+                continue
+            similarity = 1.0 - delta_e_2000(lab, self._labs[candidates]) / max_delta_e
+            best[candidates] = np.maximum(best[candidates], similarity)
+
+        # Best similarity per color over the requested colors
+        colors = np.flatnonzero(best > 0)
+        return colors, best[colors]
+
+    def _base_scores(
+        self,
+        query_labs: np.ndarray,
+        max_delta_e: float,
+        gender: Optional[int]
+    ) -> Tuple[bytes, np.ndarray]:
+        colors, similarity = self._base_colors(query_labs, max_delta_e)
+        starts, ends = self._post_offsets[colors], self._post_offsets[colors + 1]
+        postings = _ranges(starts, ends)
+        slots = self._post_slots[postings]
+        contributions = self._post_weights[postings] * np.repeat(similarity, ends - starts)
+        # Dense over the slots: cheaper than sorting the postings to group them
+        scores = np.bincount(slots, weights=contributions, minlength=len(self._ids))
+        keep = (scores > 0) & self._alive
+        if gender is not None:
+            keep &= self._gender_codes == gender
+        slots = np.flatnonzero(keep)
+        return self._ids[slots].tobytes(), scores[slots] * 100.0
+
+    def _delta_scores(
+        self,
+        query_labs: np.ndarray,
+        max_delta_e: float,
+        gender: Optional[int]
+    ) -> Tuple[bytes, np.ndarray]:
+        if self._delta_arrays is None:
+            delta = [(oid, entry) for oid, entry in self._delta_docs.items() if entry[1]]
+            self._delta_arrays = (
+                b"".join(oid for oid, _ in delta),
+                np.array([gender for _, (gender, _, _) in delta], dtype=np.int64),
+                np.array([i for i, (_, (_, codes, _)) in enumerate(delta) for _ in codes], dtype=np.int64),
+                _codes_to_lab([code for _, (_, codes, _) in delta for code in codes]).reshape(-1, 3),
+                np.array([weight for _, (_, _, weights) in delta for weight in weights], dtype=np.float64),
+            )
+        ids, genders, entry_docs, entry_labs, entry_weights = self._delta_arrays
+        if not len(genders):
+            return b"", np.empty(0)
+
+        distances = delta_e_2000(query_labs[:, None, :], entry_labs[None, :, :])
+        similarity = np.clip(1.0 - distances / max_delta_e, 0.0, None).max(axis=0)
+        scores = np.bincount(entry_docs, weights=entry_weights * similarity, minlength=len(genders)) * 100.0
+        keep = scores > 0
+        if gender is not None:
+            keep &= genders == gender
+        kept = np.flatnonzero(keep)
+        return b"".join(ids[12 * i:12 * i + 12] for i in kept), scores[kept]
+
+    def search(
+        self,
+        colors: Iterable[str],
+        gender: Optional[str] = None,
+        limit: Optional[int] = 20,
+        offset: int = 0,
+        max_delta_e: Optional[float] = None,
+        after: Optional[Tuple[float, str]] = None
+    ) -> Tuple[int, List[Tuple[str, float]]]:
+        """
+        Garments ranked by their coverage-weighted similarity to the given colors.
+
+        Args:
+            colors: Requested '#rrggbb' colors (other strings are ignored)
+            gender: Optional gender filter (lowercased, as /get-matching-clothes does)
+            limit: Page size (None = every match)
+            offset: Matches to skip
+            max_delta_e: CIEDE2000 distance at which a color stops matching (default: the index's)
+            after: (score, _id) of the last garment of a previous page; only garments ranked
+                after it are returned (offset then counts from there)
+
+        Returns:
+            (number of matching garments, [(_id as a hex string, score 0-100)] of the page),
+            by score descending, then _id
+        """
+        max_delta_e = max_delta_e or self.max_delta_e
+        codes = sorted({code for code in (_rgb_code(c) for c in colors) if code is not None})
+        if not codes:
+            return 0, []
+        query_labs = _codes_to_lab(codes)
+
+        with self._lock:
+            gender_code = None
+            if gender:
+                gender_code = self._genders.get(gender.lower())
+                if gender_code is None:
+                    return 0, []
+            base_ids, base_scores = self._base_scores(query_labs, max_delta_e, gender_code)
+            delta_ids, delta_scores = self._delta_scores(query_labs, max_delta_e, gender_code)
+
+        # A base garment that changed since the build is tombstoned, so each _id appears once.
+        # Ranking uses the reported (rounded) scores, so equal scores are ordered by _id
+        ids = base_ids + delta_ids
+        scores = np.round(np.concatenate([base_scores, delta_scores]), 2)
+        total = len(scores)
+        if after is not None:
+            after_score, after_id = after
+            id_array = np.frombuffer(ids, dtype="S12")
+            kept = np.flatnonzero(
+                (scores < after_score) | ((scores == after_score) & (id_array > bytes.fromhex(after_id)))
+            )
+            ids = id_array[kept].tobytes()
+            scores = scores[kept]
+        remaining = len(scores)
+        wanted = remaining if limit is None else min(remaining, offset + limit)
+        if offset >= wanted:
+            return total, []
+
+        if limit is None:
+            # Every match: one vectorized sort
+            top = np.lexsort((np.frombuffer(ids, dtype="S12"), -scores))[offset:].tolist()
+        else:
+            # Every garment scoring at least the wanted-th best score goes on the heap, so ties are kept
+            candidates = np.arange(remaining)
+            if wanted < remaining:
+                threshold = np.partition(scores, remaining - wanted)[remaining - wanted]
+                candidates = np.flatnonzero(scores >= threshold)
+            top = heapq.nsmallest(
+                wanted, candidates.tolist(), key=lambda i: (-scores[i], ids[12 * i:12 * i + 12])
+            )[offset:]
+        return total, [(ids[12 * i:12 * i + 12].hex(), float(scores[i])) for i in top]
+
+    def memory_bytes(self) -> int:
+        return sum(a.nbytes for a in (
+            self._ids, self._gender_codes, self._alive, self._codes, self._labs, self._dins, self._cell_keys,
+            self._cell_offsets, self._post_offsets, self._post_slots, self._post_weights
+        ))
+
+    def __len__(self) -> int:
+        with self._lock:
+            return int(self._alive.sum()) + sum(1 for _, codes, _ in self._delta_docs.values() if codes)
+
+    def get_stats(self) -> Dict[str, Any]:
+        garments = len(self)
+        with self._lock:
+            return {
+                "photos": garments,
+                "colors": len(self._codes),
+                "postings": len(self._post_slots),
+                "delta_photos": len(self._delta_docs),
+                "max_delta_e": self.max_delta_e,
+                "memory_mb": round(self.memory_bytes() / (1024 * 1024), 2),
+                "builds": self._builds,
+                "compactions": self._compactions,
+                "changes_applied": self._changes_applied,
+                "last_build_ms": self.last_build_ms,
+            }
@@ -0,0 +1,124 @@
+# image_pipeline.py
+"""
+Image Pipeline
+Decode an upload once and share it between the API and the face preprocessor.
+
+`decode_image` opens the bytes a single time, applies the EXIF orientation
+and converts to RGB. Large JPEGs are decoded at a reduced DCT scale (draft
+mode), so a 12MP phone photo never gets fully decoded. The resulting
+`DecodedImage` carries the PIL image plus a single shared NumPy copy of the pixels.
+
+`to_model_tensor` turns a uint8 image into the normalized float tensor in one
+pass. It resizes only when the image is not already the model input size
+(masked crops already are).
+"""
+
+import io
+from typing import Optional, Tuple
+
+import numpy as np
+import torch
+from PIL import Image, ImageOps
+
+
+IMAGENET_MEAN = (0.485, 0.456, 0.406)
+IMAGENET_STD = (0.229, 0.224, 0.225)
+
+
+class DecodedImage:
+    """An upload decoded once: RGB, EXIF orientation applied"""
+
+    def __init__(self, pil: Image.Image, source_size: Tuple[int, int], draft_scale: int = 1):
+        """
+        Args:
+            pil: RGB image
+            source_size: (width, height) of the encoded image before draft reduction
+            draft_scale: DCT reduction libjpeg applied while decoding (1, 2, 4 or 8)
+        """
+        self.pil = pil
+        self.source_size = source_size
+        self.draft_scale = draft_scale
+        self._array: Optional[np.ndarray] = None
+
+    @property
+    def size(self) -> Tuple[int, int]:
+        return self.pil.size
+
+    @property
+    def array(self) -> np.ndarray:
+        """
+        (H, W, 3) uint8 pixels, copied out of PIL once on first access and
+        shared by every consumer (writable, so torch.from_numpy can wrap it)
+        """
+        if self._array is None:
+            self._array = np.array(self.pil)
+        return self._array
+
+
+def decode_image(image_bytes: bytes, draft_min_side: int = 1024) -> DecodedImage:
+    """
+    Decode an upload once.
+
+    Args:
+        image_bytes: Encoded image
+        draft_min_side: JPEGs are decoded at the smallest DCT scale (1/2, 1/4, 1/8)
+                        whose long side is still >= this. 0 disables draft mode.
+
+    Returns:
+        DecodedImage
+
+    Raises:
+        PIL.UnidentifiedImageError / OSError for undecodable input
+    """
+    img = Image.open(io.BytesIO(image_bytes))
+    source_size = img.size
+
+    if draft_min_side > 0 and img.format == "JPEG" and max(source_size) > draft_min_side:
+        # draft() keeps the result >= the requested box, so ask for the
+        # source aspect ratio scaled to the minimum long side
+        ratio = draft_min_side / max(source_size)
+        requested = (max(1, int(source_size[0] * ratio)), max(1, int(source_size[1] * ratio)))
+        img.draft("RGB", requested)
+
+    draft_scale = max(1, source_size[0] // img.size[0])
+
+    # Orientation is applied after the draft so the rotation runs on the small image
+    img = ImageOps.exif_transpose(img)
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+    else:
+        img.load()
+
+    return DecodedImage(img, source_size=source_size, draft_scale=draft_scale)
+
+
+def to_model_tensor(
+    image: Image.Image,
+    size: Tuple[int, int] = (224, 224),
+    mean: Tuple[float, float, float] = IMAGENET_MEAN,
+    std: Tuple[float, float, float] = IMAGENET_STD
+) -> torch.Tensor:
+    """
+    Fused Resize + ToTensor + Normalize.
+
+    Equivalent to the torchvision Compose (bilinear resize, /255, then
+    (x - mean) / std) but does a single multiply-add per element and skips
+    the resize when the image already has the target size.
+
+    Args:
+        image: RGB PIL image
+        size: (width, height) model input size
+
+    Returns:
+        (3, H, W) float32 tensor
+    """
+    if image.size != tuple(size):
+        image = image.resize(tuple(size), Image.Resampling.BILINEAR)
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+
+    pixels = torch.from_numpy(np.asarray(image).copy()).permute(2, 0, 1)
+    scale = torch.tensor([1.0 / (255.0 * s) for s in std]).view(3, 1, 1)
+    shift = torch.tensor([m / s for m, s in zip(mean, std)]).view(3, 1, 1)
+    # x / 255 * (1 / std) - mean / std, computed as one fused multiply-add
+    return torch.addcmul(-shift, pixels.to(torch.float32), scale).contiguous()
@@ -0,0 +1,294 @@
+# inference_modes.py
+"""
+Reduced-Precision CPU Inference Modes for the Season Classifier
+
+Modes (select with INFERENCE_MODE):
+- fp32:          eager PyTorch, unchanged
+- channels_last: NHWC memory format (faster oneDNN convolutions)
+- bf16:          bfloat16 autocast, only where the CPU supports it natively
+- int8_dynamic:  dynamic int8 quantization of the Linear layers
+- int8_static:   FX graph-mode static int8 quantization with a calibration pass
+
+Report (latency, memory, top-1 agreement with fp32):
+    python inference_modes.py --checkpoint ../models/ResNext50/best_model_resnext50_rgbm.pth \\
+                              --images ../models/ResNext50/test_images --output inference_modes_report.json
+"""
+
+import argparse
+import copy
+import io
+import json
+import math
+import os
+import statistics
+import time
+from typing import Dict, Iterable, List, Optional
+
+import torch
+import torch.nn as nn
+from PIL import Image
+
+from image_pipeline import to_model_tensor
+
+
+INFERENCE_MODES = ("fp32", "channels_last", "bf16", "int8_dynamic", "int8_static")
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+
+
+class InferenceModeModel(nn.Module):
+    """
+    Wraps a prepared model so callers keep passing NCHW float32 tensors
+    and keep receiving float32 logits, whatever the mode does internally.
+    """
+
+    def __init__(self, model: nn.Module, mode: str, channels_last: bool = False, autocast_dtype=None):
+        super().__init__()
+        self.model = model
+        self.mode = mode
+        self.channels_last = channels_last
+        self.autocast_dtype = autocast_dtype
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        if self.channels_last:
+            x = x.contiguous(memory_format=torch.channels_last)
+
+        if self.autocast_dtype is not None:
+            with torch.autocast(device_type="cpu", dtype=self.autocast_dtype):
+                return self.model(x).float()
+
+        return self.model(x)
+
+
+def bf16_supported() -> bool:
+    """True when oneDNN has native bfloat16 kernels for this CPU (AVX512-BF16 / AMX)"""
+    try:
+        return bool(torch.ops.mkldnn._is_mkldnn_bf16_supported())
+    except Exception:
+        return False
+
+
+def _quantized_engine() -> str:
+    engines = torch.backends.quantized.supported_engines
+    for engine in ("x86", "fbgemm", "onednn", "qnnpack"):
+        if engine in engines:
+            return engine
+    raise RuntimeError(f"No quantized engine available (supported: {engines})")
+
+
+def load_calibration_batches(
+    image_dir: Optional[str],
+    max_images: int = 64,
+    batch_size: int = 8,
+    seed: int = 0
+) -> List[torch.Tensor]:
+    """
+    Load preprocessed calibration batches from a directory of images.
+
+    Falls back to random tensors when no images are found, which is enough to
+    exercise the pipeline but gives poor activation ranges - always calibrate
+    on real (face-masked) photos before deploying int8_static.
+    """
+    tensors = []
+    if image_dir and os.path.isdir(image_dir):
+        for root, _, files in os.walk(image_dir):
+            for name in sorted(files):
+                if not name.lower().endswith(IMAGE_EXTENSIONS):
+                    continue
+                with Image.open(os.path.join(root, name)) as img:
+                    # Same preprocessing the API applies to the model input
+                    tensors.append(to_model_tensor(img.convert("RGB"), (224, 224)))
+                if len(tensors) >= max_images:
+                    break
+            if len(tensors) >= max_images:
+                break
+
+    if not tensors:
+        print(f"WARNING: no calibration images found in {image_dir!r}, using random inputs")
+        generator = torch.Generator().manual_seed(seed)
+        tensors = list(torch.randn(min(max_images, 16), 3, 224, 224, generator=generator))
+    else:
+        print(f"Loaded {len(tensors)} calibration images from {image_dir}")
+
+    return [torch.stack(tensors[i:i + batch_size]) for i in range(0, len(tensors), batch_size)]
+
+
+def _quantize_static(model: nn.Module, calibration_batches: Iterable[torch.Tensor]) -> nn.Module:
+    from torch.ao.quantization import get_default_qconfig_mapping
+    from torch.ao.quantization.quantize_fx import convert_fx, prepare_fx
+
+    engine = _quantized_engine()
+    torch.backends.quantized.engine = engine
+
+    calibration_batches = list(calibration_batches)
+    example_inputs = (calibration_batches[0][:1],)
+    prepared = prepare_fx(model.eval(), get_default_qconfig_mapping(engine), example_inputs)
+
+    with torch.no_grad():
+        for batch in calibration_batches:
+            prepared(batch)
+
+    print(f"Static int8 calibration done on {sum(len(b) for b in calibration_batches)} images ({engine})")
+    return convert_fx(prepared)
+
+
+def prepare_model_for_mode(
+    model: nn.Module,
+    mode: str,
+    calibration_dir: Optional[str] = None
+) -> nn.Module:
+    """
+    Convert an fp32 eval-mode classifier to the requested inference mode
+
+    Args:
+        model: fp32 ColorAnalysisModel in eval mode (CPU)
+        mode: One of INFERENCE_MODES
+        calibration_dir: Image directory for int8_static calibration
+
+    Returns:
+        Tuple of (model taking NCHW float32 input and returning float32 logits,
+        mode actually applied: "fp32" when the requested one is unavailable)
+    """
+    if mode not in INFERENCE_MODES:
+        raise ValueError(f"Unknown inference mode: {mode} (expected one of {', '.join(INFERENCE_MODES)})")
+
+    model = model.eval()
+
+    if mode == "fp32":
+        return model, mode
+
+    if mode == "channels_last":
+        return InferenceModeModel(model.to(memory_format=torch.channels_last), mode, channels_last=True), mode
+
+    if mode == "bf16":
+        if not bf16_supported():
+            print("WARNING: CPU has no native bfloat16 support, staying on fp32")
+            return model, "fp32"
+        return InferenceModeModel(
+            model.to(memory_format=torch.channels_last), mode,
+            channels_last=True, autocast_dtype=torch.bfloat16
+        ), mode
+
+    if mode == "int8_dynamic":
+        torch.backends.quantized.engine = _quantized_engine()
+        quantized = torch.ao.quantization.quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8, inplace=True)
+        return InferenceModeModel(quantized, mode), mode
+
+    # int8_static
+    quantized = _quantize_static(model, load_calibration_batches(calibration_dir))
+    return InferenceModeModel(quantized, mode), mode
+
+
+def _serialized_size_mb(model: nn.Module) -> float:
+    buffer = io.BytesIO()
+    torch.save(model.state_dict(), buffer)
+    return buffer.tell() / (1024 * 1024)
+
+
+def _rss_mb() -> float:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError):
+        return 0.0
+
+
+def _time_forward(model: nn.Module, batch: torch.Tensor, warmup: int, runs: int) -> Dict[str, float]:
+    timings = []
+    with torch.no_grad():
+        for _ in range(warmup):
+            model(batch)
+        for _ in range(runs):
+            start = time.perf_counter()
+            model(batch)
+            timings.append((time.perf_counter() - start) * 1000.0)
+    timings.sort()
+    return {
+        "median_ms": round(statistics.median(timings), 2),
+        "p90_ms": round(timings[max(0, math.ceil(0.9 * len(timings)) - 1)], 2),
+        "per_image_ms": round(statistics.median(timings) / len(batch), 2),
+    }
+
+
+def build_report(
+    fp32_model: nn.Module,
+    modes: Iterable[str],
+    eval_batches: List[torch.Tensor],
+    calibration_dir: Optional[str] = None,
+    batch_sizes=(1, 8),
+    warmup: int = 2,
+    runs: int = 10
+) -> Dict[str, Dict]:
+    """Compare each mode with fp32 on latency, model memory and top-1 agreement"""
+    eval_inputs = torch.cat(eval_batches)
+    with torch.no_grad():
+        reference_top1 = fp32_model(eval_inputs).argmax(dim=1)
+
+    report = {}
+    for mode in modes:
+        print(f"\n=== {mode} ===")
+        # Modes may convert the module in place, so each one starts from a fresh copy
+        candidate = copy.deepcopy(fp32_model)
+        rss_before = _rss_mb()
+        prepared, applied_mode = prepare_model_for_mode(candidate, mode, calibration_dir)
+        rss_after = _rss_mb()
+
+        with torch.no_grad():
+            top1 = prepared(eval_inputs).argmax(dim=1)
+
+        entry = {
+            "applied_mode": applied_mode,
+            "model_size_mb": round(_serialized_size_mb(prepared), 2),
+            "rss_delta_mb": round(rss_after - rss_before, 2),
+            "top1_agreement_with_fp32": round((top1 == reference_top1).float().mean().item(), 4),
+            "latency": {},
+        }
+        for batch_size in batch_sizes:
+            batch = eval_inputs[:batch_size]
+            if len(batch) < batch_size:
+                batch = batch.repeat((batch_size + len(batch) - 1) // len(batch), 1, 1, 1)[:batch_size]
+            entry["latency"][f"batch_{batch_size}"] = _time_forward(prepared, batch, warmup, runs)
+
+        fp32_latency = report.get("fp32", {}).get("latency", {}).get("batch_1", {}).get("median_ms")
+        if fp32_latency:
+            entry["speedup_vs_fp32_batch_1"] = round(fp32_latency / entry["latency"]["batch_1"]["median_ms"], 2)
+
+        report[mode] = entry
+        print(json.dumps(entry, indent=2))
+
+    return report
+
+
+def main():
+    from season_classifier import load_color_analysis_model
+
+    parser = argparse.ArgumentParser(description="Compare CPU inference modes of the season classifier")
+    parser.add_argument("--checkpoint", required=True, help="PyTorch checkpoint (.pth)")
+    parser.add_argument("--images", default=None, help="Image directory for calibration and agreement")
+    parser.add_argument("--modes", default=",".join(INFERENCE_MODES), help="Comma-separated modes to compare")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--output", default="inference_modes_report.json")
+    args = parser.parse_args()
+
+    modes = [m.strip() for m in args.modes.split(",") if m.strip()]
+    if "fp32" in modes:
+        modes.remove("fp32")
+    modes.insert(0, "fp32")
+
+    fp32_model = load_color_analysis_model(args.checkpoint, torch.device("cpu"))
+    eval_batches = load_calibration_batches(args.images, max_images=64)
+
+    report = {
+        "torch_version": torch.__version__,
+        "torch_threads": torch.get_num_threads(),
+        "bf16_supported": bf16_supported(),
+        "eval_images": sum(len(b) for b in eval_batches),
+        "modes": build_report(fp32_model, modes, eval_batches, args.images, runs=args.runs),
+    }
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nReport written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+# ingestion.py
+"""
+Garment Image Ingestion
+Background removal and dominant color extraction for catalog uploads.
+
+Kept free of FastAPI/Mongo imports so it can run inside a process pool.
+"""
+
+import io
+import threading
+from typing import Dict, Any
+
+import numpy as np
+from PIL import Image
+from rembg import new_session, remove
+from colorthief import ColorThief
+
+
+# rembg builds a new ONNX Runtime session (and re-reads the model weights)
+# on every remove() call unless one is passed in
+_REMBG_SESSION = None
+_REMBG_SESSION_LOCK = threading.Lock()
+
+
+def get_rembg_session():
+    """Shared background-removal session, created on first use (per process)"""
+    global _REMBG_SESSION
+    if _REMBG_SESSION is None:
+        with _REMBG_SESSION_LOCK:
+            if _REMBG_SESSION is None:
+                # Default model, same as remove() picks when no session is given
+                _REMBG_SESSION = new_session()
+    return _REMBG_SESSION
+
+
+def extract_colors_with_percentage(image_bytes: bytes, color_count: int = 5) -> Dict[str, Dict[str, Any]]:
+    """
+    Extracts dominant colors and estimates percentage for each one.
+    Returns:
+        {
+            "1": {"color": "#rrggbb", "percentage": int},
+            "2": {"color": "#rrggbb", "percentage": int},
+            ...
+        }
+    """
+
+    # Load image
+    img = Image.open(io.BytesIO(image_bytes)).convert("RGB")
+    img_small = img.resize((150, 150))   # shrink for faster pixel stats
+    pixels = np.array(img_small).reshape(-1, 3)
+
+    # Use ColorThief for palette
+    ct = ColorThief(io.BytesIO(image_bytes))
+    palette = ct.get_palette(color_count=color_count)
+
+    # For each palette color → percentage of closest pixels
+    percentages = []
+    for color in palette:
+        diff = np.linalg.norm(pixels - np.array(color), axis=1)
+        closest = diff <= np.min(diff) + 25   # tolerance so clusters aren't too tiny
+        pct = int((np.sum(closest) / len(pixels)) * 100)
+        percentages.append(pct)
+
+    # Normalize to sum=100 (rounding safety)
+    total = sum(percentages)
+    if total > 0:
+        percentages = [int((p / total) * 100) for p in percentages]
+
+    # Build required JSON structure
+    result = {}
+    for i, (rgb, pct) in enumerate(zip(palette, percentages), start=1):
+        hex_color = "#{:02x}{:02x}{:02x}".format(*rgb)
+        result[str(i)] = {
+            "color": hex_color,
+            "percentage": pct
+        }
+
+    return result
+
+
+def process_garment_image(image_bytes: bytes, color_count: int = 5) -> Dict[str, Dict[str, Any]]:
+    """
+    Full ingestion pipeline for one garment photo:
+    background removal followed by dominant color extraction.
+    """
+    bg_removed_bytes = remove(image_bytes, session=get_rembg_session())
+    return extract_colors_with_percentage(bg_removed_bytes, color_count=color_count)
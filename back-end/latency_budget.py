@@ -0,0 +1,164 @@
+# latency_budget.py
+"""
+Per-Request Latency Budget
+Tracks a request's deadline across the pipeline stages (decode, face
+masking, classification) and picks cheaper options when the remaining
+budget cannot cover the full pipeline.
+
+Stage costs are exponentially weighted moving averages of the observed
+stage durations, shared by all requests and seeded with conservative
+defaults. Before an expensive stage the pipeline asks its Deadline for the
+first option it can still afford; every cheaper option it falls back to is
+recorded as a named degradation that the response reports.
+
+A stage that keeps being skipped is never observed again, so each skip
+relaxes its estimate back toward the default. A single slow outlier can
+therefore not pin every later request to the degraded path.
+"""
+
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Mapping, Optional, Sequence
+
+
+# Degradations reported in responses
+DEGRADE_NEAR_DUPLICATE = "near_duplicate_result"
+DEGRADE_SKIP_PARSING = "face_parsing_skipped"
+DEGRADE_REDUCED_DETECTION = "reduced_detection_resolution"
+DEGRADE_SKIP_MASKING = "face_masking_skipped"
+
+# Starting estimates (ms) until a stage has been observed
+DEFAULT_STAGE_COSTS_MS: Dict[str, float] = {
+    "decode": 30.0,
+    "face_masking": 400.0,
+    "face_box_crop": 80.0,
+    "face_box_crop_reduced": 40.0,
+    "classify": 150.0,
+}
+
+
+class StageCostModel:
+    """
+    Thread-safe EWMA of stage durations in milliseconds.
+    """
+
+    def __init__(self, defaults: Optional[Mapping[str, float]] = None, alpha: float = 0.2):
+        """
+        Args:
+            defaults: Starting estimate per stage (unknown stages start at 0)
+            alpha: Weight of the newest observation
+        """
+        if not 0.0 < alpha <= 1.0:
+            raise ValueError("alpha must be in (0, 1]")
+
+        self.alpha = alpha
+        self.defaults = dict(DEFAULT_STAGE_COSTS_MS if defaults is None else defaults)
+        self._lock = threading.Lock()
+        self._estimates: Dict[str, float] = dict(self.defaults)
+        self._observations: Dict[str, int] = {}
+
+    def observe(self, stage: str, elapsed_ms: float):
+        with self._lock:
+            if stage not in self._observations:
+                # The first real measurement replaces the seed
+                self._estimates[stage] = elapsed_ms
+            else:
+                previous = self._estimates[stage]
+                self._estimates[stage] = previous + self.alpha * (elapsed_ms - previous)
+            self._observations[stage] = self._observations.get(stage, 0) + 1
+
+    def relax(self, stage: str):
+        """Move a skipped stage's estimate one step back toward its default"""
+        with self._lock:
+            if stage in self._estimates and stage in self.defaults:
+                current = self._estimates[stage]
+                self._estimates[stage] = current + self.alpha * (self.defaults[stage] - current)
+
+    def estimate(self, *stages: str) -> float:
+        """Expected total duration of the given stages"""
+        with self._lock:
+            return sum(self._estimates.get(stage, 0.0) for stage in stages)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                stage: {"estimate_ms": round(value, 1), "observations": self._observations.get(stage, 0)}
+                for stage, value in sorted(self._estimates.items())
+            }
+
+
+class Deadline:
+    """
+    Latency budget of one request.
+
+    Created when the request arrives and handed through the pipeline (also
+    across executor threads; it is only used by one stage at a time).
+    """
+
+    def __init__(
+        self,
+        budget_ms: Optional[float],
+        costs: StageCostModel,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        """
+        Args:
+            budget_ms: Total budget; None or <= 0 means unlimited (stages are
+                       still timed so the cost model keeps learning)
+            costs: Shared stage cost model
+            clock: Monotonic clock in seconds
+        """
+        self.budget_ms = budget_ms if budget_ms and budget_ms > 0 else None
+        self.costs = costs
+        self._clock = clock
+        self._start = clock()
+        self.degradations: List[str] = []
+        self.stage_ms: Dict[str, float] = {}
+
+    @property
+    def unlimited(self) -> bool:
+        return self.budget_ms is None
+
+    def elapsed_ms(self) -> float:
+        return (self._clock() - self._start) * 1000.0
+
+    def remaining_ms(self) -> float:
+        if self.budget_ms is None:
+            return math.inf
+        return self.budget_ms - self.elapsed_ms()
+
+    def affords(self, *stages: str) -> bool:
+        """Whether the remaining budget covers the expected cost of these stages"""
+        return self.budget_ms is None or self.remaining_ms() >= self.costs.estimate(*stages)
+
+    def choose(self, options: Sequence[str], then: Sequence[str] = ()) -> Optional[str]:
+        """
+        First option (most expensive first) that still fits together with the
+        stages that must follow it.
+
+        Returns:
+            The chosen stage, or None if not even the cheapest one fits
+        """
+        for option in options:
+            if self.affords(option, *then):
+                return option
+            self.costs.relax(option)
+        return None
+
+    def degrade(self, name: str):
+        """Record a cheaper option taken because of the budget"""
+        if name not in self.degradations:
+            self.degradations.append(name)
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """Time a pipeline stage and feed the shared cost model"""
+        start = self._clock()
+        try:
+            yield
+        finally:
+            elapsed_ms = (self._clock() - start) * 1000.0
+            self.stage_ms[name] = round(elapsed_ms, 1)
+            self.costs.observe(name, elapsed_ms)
@@ -0,0 +1,101 @@
+# mask_engine.py
+"""
+Mask Engine
+Turns a face-parsing label map into a binary region mask and crop box.
+
+The label map goes through a precomputed 256-entry lookup table in one
+pass, whatever the number of included classes. The crop box is found from
+row / column projections (`any` along each axis) rather than coordinate
+lists, and masking zeroes the excluded pixels of the uint8 image in place.
+
+Regions are named sets of facer label names, so the same set works for the
+celebm and lapa parsers even though their class indices differ.
+"""
+
+from functools import lru_cache
+from typing import Dict, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+# farl/celebm/448 output order (used when the parser does not report label names)
+CELEBM_LABELS = (
+    'background', 'neck', 'face', 'cloth', 'rr', 'lr', 'rb', 'lb', 're',
+    'le', 'nose', 'imouth', 'llip', 'ulip', 'hair',
+    'eyeg', 'hat', 'earr', 'neck_l'
+)
+
+_FACE_PARTS = ('rr', 'lr', 'rb', 'lb', 're', 'le', 'nose', 'imouth', 'llip', 'ulip')
+
+# Named region sets: label names included in the mask, everything else is black
+REGION_SETS: Dict[str, Tuple[str, ...]] = {
+    "skin": ('face',),
+    # celebm classes 2, 4-13 and 14: the original face + hair crop
+    "skin_hair": ('face',) + _FACE_PARTS + ('hair',),
+    "skin_eyes": ('face', 're', 'le'),
+}
+
+DEFAULT_REGION_SET = "skin_hair"
+
+
+@lru_cache(maxsize=32)
+def build_class_lut(region_set: str, label_names: Tuple[str, ...] = CELEBM_LABELS) -> np.ndarray:
+    """
+    Lookup table mapping class index -> 255 (included) / 0 (excluded).
+
+    Args:
+        region_set: Key of REGION_SETS
+        label_names: Parser class names, in output order
+
+    Returns:
+        Read-only (256,) uint8 array
+    """
+    if region_set not in REGION_SETS:
+        raise ValueError(f"Unknown region set '{region_set}', expected one of {sorted(REGION_SETS)}")
+
+    included = set(REGION_SETS[region_set])
+    lut = np.zeros(256, dtype=np.uint8)
+    for index, name in enumerate(label_names[:256]):
+        if name in included:
+            lut[index] = 255
+    lut.setflags(write=False)
+    return lut
+
+
+def region_mask(label_map: np.ndarray, region_set: str, label_names: Optional[Sequence[str]] = None) -> np.ndarray:
+    """
+    Binary mask (0 / 255, uint8) of the pixels whose class is in the region set.
+
+    Args:
+        label_map: (H, W) class indices - uint8 keeps the lookup cheapest
+        region_set: Key of REGION_SETS
+        label_names: Parser class names (defaults to celebm)
+    """
+    lut = build_class_lut(region_set, tuple(label_names) if label_names else CELEBM_LABELS)
+    return lut[label_map]
+
+
+def mask_bbox(mask: np.ndarray) -> Optional[Tuple[int, int, int, int]]:
+    """
+    Inclusive bounding box of the non-zero mask pixels from row / column projections.
+
+    Returns:
+        (y_min, y_max, x_min, x_max) or None for an empty mask
+    """
+    rows = np.flatnonzero(mask.any(axis=1))
+    if rows.size == 0:
+        return None
+    cols = np.flatnonzero(mask.any(axis=0))
+    return int(rows[0]), int(rows[-1]), int(cols[0]), int(cols[-1])
+
+
+def apply_mask_inplace(image: np.ndarray, mask: np.ndarray, threshold: int = 127) -> np.ndarray:
+    """
+    Black out the pixels of an (H, W, 3) uint8 image where mask <= threshold.
+
+    Writes into `image` (no 3-channel mask or background copies) and returns it.
+    """
+    keep = mask > threshold
+    # Broadcast the (H, W, 1) 0/1 mask over the channels instead of stacking it
+    np.multiply(image, keep[..., None], out=image, casting='unsafe')
+    return image
@@ -0,0 +1,270 @@
+# memory_mongo.py
+"""
+In-Memory Mongo Stand-In
+A small, thread-safe subset of the pymongo collection and GridFS API, kept
+in process memory. Used by the load-test harness and tests to run the
+catalog endpoints without a MongoDB server.
+
+Supported: insert_one / insert_many / find (with sort and limit) / find_one /
+count_documents / update_one ($set) / bulk_write (UpdateOne with $set) /
+create_index (recorded, not used), and GridFS put / get.
+Filters support equality (on scalars, or membership for array fields, as
+in Mongo), dotted paths through embedded documents and arrays, $eq, $ne,
+$in, $nin, $gt, $gte, $lt, $lte, $exists, $and and $or. Anything else raises NotImplementedError
+instead of silently matching.
+"""
+
+import threading
+from typing import Any, Dict, Iterator, List, Mapping, Optional, Sequence, Tuple
+
+from bson.objectid import ObjectId
+from gridfs.errors import NoFile
+
+
+_MISSING = object()
+
+
+class InsertOneResult:
+    def __init__(self, inserted_id: Any):
+        self.inserted_id = inserted_id
+
+
+class InsertManyResult:
+    def __init__(self, inserted_ids: List[Any]):
+        self.inserted_ids = inserted_ids
+
+
+class UpdateResult:
+    def __init__(self, matched_count: int, modified_count: int):
+        self.matched_count = matched_count
+        self.modified_count = modified_count
+
+
+class BulkWriteResult:
+    def __init__(self, matched_count: int, modified_count: int):
+        self.matched_count = matched_count
+        self.modified_count = modified_count
+
+
+def _resolve(value: Any, path: List[str]) -> List[Any]:
+    """All values at a dotted path; arrays along the way fan out like Mongo's multikey paths"""
+    if not path:
+        return [value]
+    if isinstance(value, list):
+        return [found for item in value for found in _resolve(item, path)]
+    if isinstance(value, Mapping) and path[0] in value:
+        return _resolve(value[path[0]], path[1:])
+    return [_MISSING]
+
+
+def _candidates(values: List[Any]) -> List[Any]:
+    """Values an equality test compares against: array fields match by element too"""
+    expanded = []
+    for value in values:
+        expanded.append(value)
+        if isinstance(value, list):
+            expanded.extend(value)
+    return expanded
+
+
+_COMPARISONS = {
+    "$gt": lambda a, b: a > b,
+    "$gte": lambda a, b: a >= b,
+    "$lt": lambda a, b: a < b,
+    "$lte": lambda a, b: a <= b,
+}
+
+
+def _compare(value: Any, operand: Any, op) -> bool:
+    """Range comparison; like Mongo, values of another type never match"""
+    if value is _MISSING or isinstance(value, list):
+        return False
+    try:
+        return bool(op(value, operand))
+    except TypeError:
+        return False
+
+
+def _condition_matches(values: List[Any], condition: Any) -> bool:
+    if not (isinstance(condition, Mapping) and condition and all(k.startswith("$") for k in condition)):
+        return condition in _candidates(values)
+
+    for op, operand in condition.items():
+        if op == "$eq":
+            ok = operand in _candidates(values)
+        elif op == "$ne":
+            ok = operand not in _candidates(values)
+        elif op == "$in":
+            candidates = _candidates(values)
+            ok = any(item in candidates for item in operand)
+        elif op == "$nin":
+            candidates = _candidates(values)
+            ok = not any(item in candidates for item in operand)
+        elif op in _COMPARISONS:
+            ok = any(_compare(value, operand, _COMPARISONS[op]) for value in _candidates(values))
+        elif op == "$exists":
+            ok = any(value is not _MISSING for value in values) == bool(operand)
+        else:
+            raise NotImplementedError(f"memory_mongo does not support {op}")
+        if not ok:
+            return False
+    return True
+
+
+def matches(doc: Mapping[str, Any], query: Optional[Mapping[str, Any]]) -> bool:
+    """Whether a document satisfies a Mongo-style query (supported subset only)"""
+    for key, condition in (query or {}).items():
+        if key == "$and":
+            ok = all(matches(doc, sub) for sub in condition)
+        elif key == "$or":
+            ok = any(matches(doc, sub) for sub in condition)
+        elif key.startswith("$"):
+            raise NotImplementedError(f"memory_mongo does not support {key}")
+        else:
+            ok = _condition_matches(_resolve(doc, key.split(".")), condition)
+        if not ok:
+            return False
+    return True
+
+
+def _project(doc: Dict[str, Any], projection: Optional[Mapping[str, Any]]) -> Dict[str, Any]:
+    if not projection:
+        return dict(doc)
+    included = {key for key, flag in projection.items() if flag and key != "_id"}
+    if included or all(projection.values()):
+        result = {key: doc[key] for key in included if key in doc}
+        if projection.get("_id", 1) and "_id" in doc:
+            result["_id"] = doc["_id"]
+        return result
+    return {key: value for key, value in doc.items() if key not in projection}
+
+
+def _sorted(docs: List[Dict[str, Any]], sort: Sequence[Tuple[str, int]]) -> List[Dict[str, Any]]:
+    """Documents ordered by (key, direction) pairs; missing values sort first, as null does"""
+    for key, direction in reversed(list(sort)):
+        def sort_key(doc, path=key.split(".")):
+            value = _resolve(doc, path)[0]
+            return (value is not _MISSING, value if value is not _MISSING else 0)
+        docs = sorted(docs, key=sort_key, reverse=direction < 0)
+    return docs
+
+
+class MemoryCollection:
+    """Documents of one collection, in insertion order"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.indexes: List[Any] = []
+        self._docs: Dict[Any, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def insert_one(self, document: Dict[str, Any]) -> InsertOneResult:
+        # Like pymongo, the caller's document gets the generated _id
+        document.setdefault("_id", ObjectId())
+        with self._lock:
+            if document["_id"] in self._docs:
+                raise ValueError(f"duplicate _id {document['_id']!r} in {self.name}")
+            self._docs[document["_id"]] = dict(document)
+        return InsertOneResult(document["_id"])
+
+    def insert_many(self, documents: List[Dict[str, Any]]) -> InsertManyResult:
+        return InsertManyResult([self.insert_one(document).inserted_id for document in documents])
+
+    def find(
+        self,
+        filter: Optional[Mapping[str, Any]] = None,
+        projection: Optional[Mapping[str, Any]] = None,
+        sort: Optional[Sequence[Tuple[str, int]]] = None,
+        limit: int = 0
+    ) -> Iterator[Dict[str, Any]]:
+        """Matching documents as shallow copies, over a snapshot taken at the call"""
+        with self._lock:
+            docs = list(self._docs.values())
+        if sort:
+            docs = _sorted(docs, sort)
+        returned = 0
+        for doc in docs:
+            if matches(doc, filter):
+                yield _project(doc, projection)
+                returned += 1
+                if returned == limit:
+                    return
+
+    def find_one(
+        self,
+        filter: Optional[Mapping[str, Any]] = None,
+        projection: Optional[Mapping[str, Any]] = None
+    ) -> Optional[Dict[str, Any]]:
+        if filter and set(filter) == {"_id"} and not isinstance(filter["_id"], Mapping):
+            with self._lock:
+                doc = self._docs.get(filter["_id"])
+            return _project(doc, projection) if doc is not None else None
+        return next(self.find(filter, projection), None)
+
+    def count_documents(self, filter: Optional[Mapping[str, Any]] = None) -> int:
+        return sum(1 for _ in self.find(filter, {"_id": 1}))
+
+    def update_one(self, filter: Mapping[str, Any], update: Mapping[str, Any]) -> UpdateResult:
+        if set(update) - {"$set"}:
+            raise NotImplementedError(f"memory_mongo only supports $set updates, got {sorted(update)}")
+        with self._lock:
+            for doc in self._docs.values():
+                if matches(doc, filter):
+                    doc.update(update.get("$set", {}))
+                    return UpdateResult(1, 1)
+        return UpdateResult(0, 0)
+
+    def bulk_write(self, requests: List[Any], ordered: bool = True) -> BulkWriteResult:
+        """pymongo UpdateOne requests ($set only), applied in order"""
+        matched = 0
+        for request in requests:
+            if type(request).__name__ != "UpdateOne":
+                raise NotImplementedError(f"memory_mongo bulk_write only supports UpdateOne, got {request!r}")
+            matched += self.update_one(request._filter, request._doc).matched_count
+        return BulkWriteResult(matched, matched)
+
+    def create_index(self, keys: Any, **kwargs) -> str:
+        self.indexes.append((keys, kwargs))
+        fields = [f"{keys}_1"] if isinstance(keys, str) else [f"{field}_{direction}" for field, direction in keys]
+        return kwargs.get("name") or "_".join(fields)
+
+
+class MemoryGridOut:
+    def __init__(self, file_id: Any, data: bytes):
+        self._id = file_id
+        self._data = data
+
+    def read(self) -> bytes:
+        return self._data
+
+
+class MemoryGridFS:
+    """put / get of whole files, like gridfs.GridFS"""
+
+    def __init__(self):
+        self._files: Dict[Any, bytes] = {}
+        self._lock = threading.Lock()
+
+    def put(self, data: bytes, **kwargs) -> Any:
+        file_id = kwargs.get("_id") or ObjectId()
+        with self._lock:
+            self._files[file_id] = bytes(data)
+        return file_id
+
+    def get(self, file_id: Any) -> MemoryGridOut:
+        with self._lock:
+            data = self._files.get(file_id)
+        if data is None:
+            raise NoFile(f"no file with _id {file_id!r}")
+        return MemoryGridOut(file_id, data)
+
+
+class MemoryCatalog:
+    """Drop-in for the API's MongoCatalog: photos, color_similarity and GridFS images"""
+
+    def __init__(self):
+        self.client = None
+        self.db: Dict[str, MemoryCollection] = {}
+        self.photos = self.db["photos"] = MemoryCollection("photos")
+        self.color_similarity = self.db["color_similarity"] = MemoryCollection("color_similarity")
+        self.fs = MemoryGridFS()
@@ -0,0 +1,232 @@
+# metrics.py
+"""
+Pipeline Metrics
+Low-overhead stage histograms and counters, exposed in the Prometheus text
+format on /metrics and per request as a `Server-Timing` response header.
+
+Recording a sample is a clock read, a bisect over the bucket bounds and a
+few integer increments under a per-metric lock; nothing is formatted until
+/metrics is scraped. Stage timings of the current request are collected in
+a context variable (set by ServerTimingMiddleware), which follows the work
+into the cpu pool because PipelineExecutor.run_cpu copies the context.
+Stages that run on a shared worker thread (e.g. the face batcher) only feed
+the histograms.
+
+No prometheus_client dependency: the exposition format is small and stable.
+"""
+
+import contextvars
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+
+# Upper bounds in seconds, from a cache hit to a cold full-resolution face parse
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == int(value):
+        return str(int(value))
+    return repr(value)
+
+
+class Counter:
+    """Monotonic counter with labels"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1.0):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def value(self, *labels: str) -> float:
+        with self._lock:
+            return self._values.get(labels, 0.0)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}" for labels, value in items]
+
+
+class Histogram:
+    """Cumulative-bucket histogram with labels (Prometheus semantics)"""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        # labels -> [per-bucket counts (last one is +Inf), sum]
+        self._series: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, *labels: str):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def count(self, *labels: str) -> int:
+        with self._lock:
+            series = self._series.get(labels)
+            return sum(series[0]) if series else 0
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted((labels, (list(counts), total)) for labels, (counts, total) in self._series.items())
+
+        lines = []
+        for labels, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else _format_value(bound)
+                bucket_labels = _format_labels(self.labelnames, labels, 'le="' + le + '"')
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """Prometheus text exposition format 0.0.4"""
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+# upload_read, decode, face_masking (whole face step as the request sees it, incl. batching),
+# face_detect, face_parse, face_crop, classify, palette, mongo_query, gridfs_read, catalog_index, garment_search
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "color_analysis_stage_seconds", "Duration of pipeline stages in seconds", ["stage"]
+))
+# no_face, no_segmentation, empty_mask, error, budget, unavailable
+MASKING_FALLBACKS = REGISTRY.register(Counter(
+    "color_analysis_face_masking_fallbacks_total", "Images that did not get the full face mask", ["reason"]
+))
+# cache: result | near_duplicate | color_similarity; result: hit | miss | coalesced
+CACHE_LOOKUPS = REGISTRY.register(Counter(
+    "color_analysis_cache_lookups_total", "Result cache lookups by tier and outcome", ["cache", "result"]
+))
+DEGRADATIONS = REGISTRY.register(Counter(
+    "color_analysis_degradations_total", "Cheaper pipeline options taken to meet a latency budget", ["degradation"]
+))
+
+
+# Stage timings of the request being served: list of (stage, seconds), or None outside a request
+_REQUEST_TIMINGS: contextvars.ContextVar[Optional[List[Tuple[str, float]]]] = contextvars.ContextVar(
+    "request_timings", default=None
+)
+
+
+def observe_stage(stage: str, seconds: float):
+    """Record a stage duration in the histogram and the current request's timings"""
+    STAGE_SECONDS.observe(seconds, stage)
+    timings = _REQUEST_TIMINGS.get()
+    if timings is not None:
+        timings.append((stage, seconds))
+
+
+@contextmanager
+def timed(stage: str) -> Iterator[None]:
+    """Time a block as a pipeline stage (recorded even if it raises)"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - start)
+
+
+def server_timing_header(timings: Sequence[Tuple[str, float]], total_s: Optional[float] = None) -> str:
+    """
+    `Server-Timing` value: one `stage;dur=<ms>` entry per stage, repeated
+    stages summed, in first-seen order.
+    """
+    merged: Dict[str, float] = {}
+    for stage, seconds in timings:
+        merged[stage] = merged.get(stage, 0.0) + seconds
+    entries = [f"{stage};dur={seconds * 1000.0:.1f}" for stage, seconds in merged.items()]
+    if total_s is not None:
+        entries.append(f"total;dur={total_s * 1000.0:.1f}")
+    return ", ".join(entries)
+
+
+class ServerTimingMiddleware:
+    """
+    Pure ASGI middleware: collects the stage timings of each HTTP request and
+    adds them as a `Server-Timing` header when the response starts.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timings: List[Tuple[str, float]] = []
+        token = _REQUEST_TIMINGS.set(timings)
+        start = time.perf_counter()
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                header = server_timing_header(timings, time.perf_counter() - start)
+                message = dict(message)
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"server-timing", header.encode("latin-1"))
+                ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _REQUEST_TIMINGS.reset(token)
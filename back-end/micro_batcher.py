@@ -0,0 +1,247 @@
+# micro_batcher.py
+"""
+Dynamic Micro-Batching Scheduler
+Collects work items from concurrent requests and runs them as one batch.
+
+A background worker thread waits for the first queued item, then keeps
+collecting until either `max_batch_size` items are queued or `max_wait_ms`
+has elapsed, and hands the whole batch to `batch_fn`. Each caller gets its
+own result back through a `concurrent.futures.Future`, so the batcher can be
+used from worker threads (`submit(...).result()`) as well as from asyncio
+(`await asyncio.wrap_future(submit(...))`).
+"""
+
+import queue
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional
+
+import torch
+
+
+class MicroBatcher:
+    """
+    Generic in-process micro-batcher.
+
+    `batch_fn` receives a list of items and must return a sequence of results
+    of the same length and in the same order.
+    """
+
+    def __init__(
+        self,
+        batch_fn: Callable[[List[Any]], List[Any]],
+        max_batch_size: int = 8,
+        max_wait_ms: float = 5.0,
+        name: str = "micro-batcher"
+    ):
+        """
+        Args:
+            batch_fn: Function that processes a list of items in one call
+            max_batch_size: Maximum number of items per batch
+            max_wait_ms: How long to wait for more items after the first one arrives
+            name: Name of the worker thread (shows up in logs and profiles)
+        """
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be >= 1")
+
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait_s = max(0.0, max_wait_ms) / 1000.0
+        self.name = name
+
+        self._queue: "queue.Queue[Optional[tuple]]" = queue.Queue()
+        self._stats_lock = threading.Lock()
+        self._batches_run = 0
+        self._items_processed = 0
+        self._max_batch_seen = 0
+        self._batch_size_counts: Counter = Counter()
+        self._errors = 0
+
+        self._stopped = False
+        self._worker = threading.Thread(target=self._run, name=name, daemon=True)
+        self._worker.start()
+
+    def submit(self, item: Any) -> Future:
+        """Queue an item and return a Future that resolves to its result"""
+        if self._stopped:
+            raise RuntimeError(f"{self.name} is stopped")
+
+        future: Future = Future()
+        self._queue.put((item, future))
+        return future
+
+    def process(self, item: Any, timeout: Optional[float] = None) -> Any:
+        """Blocking helper: submit an item and wait for its result"""
+        return self.submit(item).result(timeout=timeout)
+
+    def stop(self, timeout: Optional[float] = 5.0):
+        """Stop the worker thread after draining already queued items"""
+        if self._stopped:
+            return
+        self._stopped = True
+        self._queue.put(None)
+        self._worker.join(timeout=timeout)
+
+    def queue_depth(self) -> int:
+        """Number of items waiting to be batched"""
+        return self._queue.qsize()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Queue depth and batch size statistics"""
+        with self._stats_lock:
+            mean_batch = (self._items_processed / self._batches_run) if self._batches_run else 0.0
+            return {
+                "queue_depth": self.queue_depth(),
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": round(self.max_wait_s * 1000.0, 3),
+                "batches_run": self._batches_run,
+                "items_processed": self._items_processed,
+                "mean_batch_size": round(mean_batch, 3),
+                "largest_batch": self._max_batch_seen,
+                "batch_size_histogram": {str(k): v for k, v in sorted(self._batch_size_counts.items())},
+                "errors": self._errors,
+            }
+
+    def _collect_batch(self, first: tuple) -> List[tuple]:
+        """Collect more items until the batch is full or the window closes"""
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait_s
+
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining <= 0:
+                    entry = self._queue.get_nowait()
+                else:
+                    entry = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+
+            if entry is None:
+                # Stop requested - finish this batch, then exit
+                self._queue.put(None)
+                break
+            batch.append(entry)
+
+        return batch
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                break
+
+            batch = self._collect_batch(first)
+            # Skip items whose callers already gave up
+            batch = [entry for entry in batch if entry[1].set_running_or_notify_cancel()]
+            if not batch:
+                continue
+
+            items = [item for item, _ in batch]
+            try:
+                results = self.batch_fn(items)
+                if len(results) != len(items):
+                    raise RuntimeError(
+                        f"{self.name}: batch_fn returned {len(results)} results for {len(items)} items"
+                    )
+            except BaseException as e:
+                with self._stats_lock:
+                    self._errors += 1
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            with self._stats_lock:
+                self._batches_run += 1
+                self._items_processed += len(items)
+                self._max_batch_seen = max(self._max_batch_seen, len(items))
+                self._batch_size_counts[len(items)] += 1
+
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+
+
+class InferenceBatcher(MicroBatcher):
+    """
+    Micro-batcher for the season classifier.
+
+    Items are preprocessed (3, H, W) tensors; each caller receives its own
+    softmax probability row as a 1-D tensor.
+    """
+
+    def __init__(
+        self,
+        model: Callable[[torch.Tensor], torch.Tensor],
+        device: torch.device,
+        max_batch_size: int = 8,
+        max_wait_ms: float = 5.0
+    ):
+        self.model = model
+        self.device = device
+        super().__init__(
+            self._forward_batch,
+            max_batch_size=max_batch_size,
+            max_wait_ms=max_wait_ms,
+            name="inference-batcher"
+        )
+
+    def _forward_batch(self, tensors: List[torch.Tensor]) -> List[torch.Tensor]:
+        input_batch = torch.stack(tensors).to(self.device)
+        with torch.no_grad():
+            output = self.model(input_batch)
+        probabilities = torch.nn.functional.softmax(output, dim=1).cpu()
+        return list(probabilities.unbind(0))
+
+
+class FaceMaskingBatcher(MicroBatcher):
+    """
+    Micro-batcher for the face masking preprocessor.
+
+    Items are (DecodedImage, output_size) pairs, optionally with a third
+    element: a dict of process_batch options (parse, detect_max_side).
+    Concurrent images go through
+    one detector call and one parser call (`preprocessor.process_batch`), and
+    each caller receives its own (masked_face_pil, mask_array) tuple. An
+    error cropping one image is raised to that caller only.
+    """
+
+    def __init__(
+        self,
+        preprocessor: Any,
+        max_batch_size: int = 4,
+        max_wait_ms: float = 10.0
+    ):
+        self.preprocessor = preprocessor
+        super().__init__(
+            self._process_batch,
+            max_batch_size=max_batch_size,
+            max_wait_ms=max_wait_ms,
+            name="face-masking-batcher"
+        )
+
+    def process(self, item: Any, timeout: Optional[float] = None) -> Any:
+        result = super().process(item, timeout=timeout)
+        if isinstance(result, BaseException):
+            raise result
+        return result
+
+    def _process_batch(self, items: List[tuple]) -> List[Any]:
+        # One process_batch call per output size + options (normally there is only one)
+        groups: Dict[tuple, List[int]] = {}
+        for index, item in enumerate(items):
+            options = item[2] if len(item) > 2 else {}
+            groups.setdefault((tuple(item[1]), tuple(sorted(options.items()))), []).append(index)
+
+        results: List[Any] = [None] * len(items)
+        for (output_size, options), indices in groups.items():
+            group_results = self.preprocessor.process_batch(
+                [items[index][0] for index in indices],
+                output_size=output_size,
+                return_exceptions=True,
+                **dict(options)
+            )
+            for index, result in zip(indices, group_results):
+                results[index] = result
+        return results
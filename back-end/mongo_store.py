@@ -0,0 +1,210 @@
+# mongo_store.py
+"""
+Catalog Data Access
+Mongo handles for the garment catalog and an async front for them.
+
+- MongoCatalog: photos, color_similarity and GridFS on one pymongo client,
+  with a bounded connection pool and timeouts; it connects on first use.
+- CatalogStore: runs the blocking pymongo/GridFS calls of request handlers
+  on a dedicated I/O thread pool, so a slow round trip holds a pool thread
+  instead of the event loop. It wraps any catalog with the same attributes,
+  including memory_mongo.MemoryCatalog in tests and the load test.
+
+Background workers (catalog index, similarity refresh) keep using the
+synchronous collections, `store.photos` and `store.color_similarity`.
+"""
+
+import asyncio
+import contextlib
+import contextvars
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional
+
+
+class MongoCatalog:
+    """Mongo handles for the garment catalog (photos, GridFS images, color similarity)"""
+
+    def __init__(
+        self,
+        uri: str,
+        max_pool_size: int = 32,
+        min_pool_size: int = 0,
+        connect_timeout_ms: int = 5000,
+        server_selection_timeout_ms: int = 5000,
+        socket_timeout_ms: int = 30000,
+        max_idle_time_ms: int = 60000
+    ):
+        """
+        Args:
+            uri: MongoDB connection string
+            max_pool_size: Most connections the client opens to each server
+            min_pool_size: Connections kept open while idle
+            connect_timeout_ms: Timeout to open a connection
+            server_selection_timeout_ms: How long an operation waits for a usable server
+            socket_timeout_ms: Timeout for each network read or write (0 = none)
+            max_idle_time_ms: Idle connections are closed after this long (0 = never)
+        """
+        # pymongo/gridfs are only imported by workers that actually serve catalog requests
+        from pymongo import MongoClient
+        import gridfs
+
+        options: Dict[str, Any] = {
+            "maxPoolSize": max_pool_size,
+            "minPoolSize": min_pool_size,
+            "connectTimeoutMS": connect_timeout_ms,
+            "serverSelectionTimeoutMS": server_selection_timeout_ms,
+        }
+        if socket_timeout_ms > 0:
+            options["socketTimeoutMS"] = socket_timeout_ms
+        if max_idle_time_ms > 0:
+            options["maxIdleTimeMS"] = max_idle_time_ms
+
+        # connect=False: no connection (or server monitoring) until the first operation
+        self.client = MongoClient(uri, connect=False, **options)
+        self.db = self.client["color_analysis"]
+        self.photos = self.db["photos"]
+        self.color_similarity = self.db["color_similarity"]
+        self.fs = gridfs.GridFS(self.db)
+
+
+class CatalogStore:
+    """
+    Async access to a catalog through a dedicated I/O thread pool.
+
+    Handlers `await store.find_photo(...)` etc.; the calls run on the pool with
+    the caller's context variables, so stage timings recorded inside them still
+    belong to the request.
+    """
+
+    def __init__(self, catalog: Any, io_workers: int = 16):
+        """
+        Args:
+            catalog: MongoCatalog, or any object with photos / color_similarity / fs
+                     (e.g. memory_mongo.MemoryCatalog)
+            io_workers: Threads for catalog calls; keep it at most the client's
+                        pool size so they do not queue for connections
+        """
+        self.catalog = catalog
+        self.io_workers = max(1, io_workers)
+        self._pool = ThreadPoolExecutor(max_workers=self.io_workers, thread_name_prefix="mongo-io")
+
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._completed = 0
+        self._failed = 0
+
+    @property
+    def photos(self) -> Any:
+        return self.catalog.photos
+
+    @property
+    def color_similarity(self) -> Any:
+        return self.catalog.color_similarity
+
+    async def run(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """Run a blocking catalog call on the I/O pool"""
+        ctx = contextvars.copy_context()
+        call = functools.partial(ctx.run, fn, *args, **kwargs)
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            self._in_flight += 1
+        failed = False
+        try:
+            return await loop.run_in_executor(self._pool, call)
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+                self._completed += 1
+                self._failed += failed
+
+    # --- Catalog operations ---
+
+    async def find_photo(self, photo_id: Any, projection: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+        return await self.run(self.catalog.photos.find_one, {"_id": photo_id}, projection)
+
+    async def insert_photo(self, doc: Dict[str, Any]) -> Any:
+        """Insert a photo document (its `_id` is set in place); returns the _id"""
+        result = await self.run(self.catalog.photos.insert_one, doc)
+        return result.inserted_id
+
+    async def read_file(self, file_id: Any) -> bytes:
+        """Whole content of a GridFS file (gridfs.errors.NoFile if there is none)"""
+        return await self.run(lambda: self.catalog.fs.get(file_id).read())
+
+    async def iterate(self, items: Iterator[Any], batch_size: int = 256) -> AsyncIterator[Any]:
+        """
+        Yield from a blocking iterator (e.g. a pymongo cursor), fetching a batch
+        per I/O pool call. The first batch is a single item and each next one
+        twice as large, up to batch_size, so the first item does not wait for
+        a full batch. Items read before the iterator raises are yielded first.
+
+        When the caller stops early (break, aclose), the iterator's close()
+        (generator, pymongo cursor) runs on the pool.
+        """
+        size = 1
+        exhausted = False
+        try:
+            while True:
+                try:
+                    batch: List[Any] = await self.run(_take, items, size)
+                except _PartialBatch as partial:
+                    for item in partial.items:
+                        yield item
+                    raise partial.__cause__
+                for item in batch:
+                    yield item
+                if len(batch) < size:
+                    exhausted = True
+                    return
+                size = min(size * 2, batch_size)
+        finally:
+            close = getattr(items, "close", None)
+            if close is not None and not exhausted:
+                # After a cancellation the last fetch may still be running; a
+                # generator cannot be closed then and is left to the collector
+                with contextlib.suppress(ValueError):
+                    await self.run(close)
+
+    # --- Lifecycle ---
+
+    def close(self):
+        """Stop the I/O pool and close the client's connections"""
+        self._pool.shutdown(wait=False)
+        client = getattr(self.catalog, "client", None)
+        if client is not None:
+            client.close()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "backend": type(self.catalog).__name__,
+                "io_workers": self.io_workers,
+                "in_flight": self._in_flight,
+                "completed": self._completed,
+                "failed": self._failed,
+            }
+
+
+class _PartialBatch(Exception):
+    """The iterator raised after these items; the error is the __cause__"""
+
+    def __init__(self, items: List[Any]):
+        super().__init__(f"iterator failed after {len(items)} items")
+        self.items = items
+
+
+def _take(items: Iterator[Any], count: int) -> List[Any]:
+    batch: List[Any] = []
+    try:
+        for item in items:
+            batch.append(item)
+            if len(batch) == count:
+                break
+    except Exception as e:
+        raise _PartialBatch(batch) from e
+    return batch
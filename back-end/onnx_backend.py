@@ -0,0 +1,183 @@
+# onnx_backend.py
+"""
+ONNX Runtime Backend for the Season Classifier
+Export tool and CPU inference session for ColorAnalysisModel.
+
+Export (writes <output>.onnx and an offline-optimized <output>.opt.onnx):
+    python onnx_backend.py --checkpoint ../models/ResNext50/best_model_resnext50_rgbm.pth \\
+                           --output models/ResNext50/season_classifier.onnx
+
+At runtime set INFERENCE_BACKEND=onnx and ONNX_MODEL_PATH to the exported file.
+"""
+
+import argparse
+import os
+from typing import Dict, Optional
+
+import numpy as np
+import torch
+
+from season_classifier import load_color_analysis_model
+
+
+INPUT_NAME = "input"
+OUTPUT_NAME = "logits"
+DEFAULT_OPSET = 17
+
+
+def export_to_onnx(
+    model: torch.nn.Module,
+    output_path: str,
+    img_size=(224, 224),
+    opset: int = DEFAULT_OPSET
+) -> str:
+    """
+    Export the classifier to ONNX with a dynamic batch dimension
+
+    Args:
+        model: Classifier in eval mode
+        output_path: Destination .onnx file
+        img_size: Model input size (height, width)
+        opset: ONNX opset version
+
+    Returns:
+        Path of the written file
+    """
+    model = model.eval().cpu()
+    dummy = torch.randn(1, 3, img_size[0], img_size[1])
+
+    torch.onnx.export(
+        model,
+        dummy,
+        output_path,
+        input_names=[INPUT_NAME],
+        output_names=[OUTPUT_NAME],
+        dynamic_axes={INPUT_NAME: {0: "batch"}, OUTPUT_NAME: {0: "batch"}},
+        opset_version=opset,
+        do_constant_folding=True,
+    )
+    print(f"ONNX model exported to {output_path}")
+    return output_path
+
+
+def optimize_onnx_model(onnx_path: str, optimized_path: Optional[str] = None) -> str:
+    """
+    Run ONNX Runtime graph optimizations offline and save the optimized graph.
+
+    Uses the EXTENDED level (operator fusions) so the saved graph stays portable
+    across CPUs; hardware-specific layout transforms are applied at load time.
+    """
+    import onnxruntime as ort
+
+    if optimized_path is None:
+        root, ext = os.path.splitext(onnx_path)
+        optimized_path = f"{root}.opt{ext}"
+
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED
+    options.optimized_model_filepath = optimized_path
+    ort.InferenceSession(onnx_path, options, providers=["CPUExecutionProvider"])
+
+    print(f"Optimized ONNX graph written to {optimized_path}")
+    return optimized_path
+
+
+class OnnxSeasonClassifier:
+    """
+    Drop-in replacement for the PyTorch classifier backed by an ONNX Runtime CPU session.
+
+    Called with a (N, 3, H, W) float tensor, returns (N, num_classes) logits as a tensor,
+    so it works with `_classify_tensor` and the inference batcher unchanged.
+    """
+
+    def __init__(self, onnx_path: str, intra_op_threads: int = 0, inter_op_threads: int = 1):
+        """
+        Args:
+            onnx_path: Path to the exported (optionally pre-optimized) ONNX graph
+            intra_op_threads: Threads per operator (0 = match torch.get_num_threads())
+            inter_op_threads: Threads for running independent graph nodes in parallel
+        """
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        options.intra_op_num_threads = intra_op_threads if intra_op_threads > 0 else torch.get_num_threads()
+        options.inter_op_num_threads = max(1, inter_op_threads)
+        # Worker threads spin-wait by default; that steals CPU from the request pools
+        options.add_session_config_entry("session.intra_op.allow_spinning", "0")
+
+        self.onnx_path = onnx_path
+        self.session = ort.InferenceSession(onnx_path, options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+        self.output_name = self.session.get_outputs()[0].name
+
+        print(f"ONNX Runtime session ready: {onnx_path} "
+              f"(intra-op threads: {options.intra_op_num_threads})")
+
+    def __call__(self, input_batch: torch.Tensor) -> torch.Tensor:
+        array = input_batch.detach().cpu().numpy().astype(np.float32, copy=False)
+        logits = self.session.run([self.output_name], {self.input_name: array})[0]
+        return torch.from_numpy(logits)
+
+    def eval(self):
+        return self
+
+
+def check_parity(
+    torch_model: torch.nn.Module,
+    onnx_model: OnnxSeasonClassifier,
+    num_samples: int = 4,
+    atol: float = 1e-4,
+    img_size=(224, 224),
+    seed: int = 0
+) -> Dict[str, float]:
+    """
+    Compare softmax outputs of the PyTorch and ONNX classifiers on random inputs
+
+    Returns:
+        Dictionary with max_abs_diff, top1_agreement and passed (1.0/0.0)
+    """
+    generator = torch.Generator().manual_seed(seed)
+    inputs = torch.randn(num_samples, 3, img_size[0], img_size[1], generator=generator)
+
+    with torch.no_grad():
+        torch_probs = torch.nn.functional.softmax(torch_model(inputs), dim=1)
+    onnx_probs = torch.nn.functional.softmax(onnx_model(inputs), dim=1)
+
+    max_abs_diff = (torch_probs - onnx_probs).abs().max().item()
+    top1_agreement = (torch_probs.argmax(dim=1) == onnx_probs.argmax(dim=1)).float().mean().item()
+
+    return {
+        "max_abs_diff": max_abs_diff,
+        "top1_agreement": top1_agreement,
+        "passed": float(max_abs_diff <= atol and top1_agreement == 1.0),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the season classifier to ONNX")
+    parser.add_argument("--checkpoint", required=True, help="PyTorch checkpoint (.pth)")
+    parser.add_argument("--output", required=True, help="Destination .onnx file")
+    parser.add_argument("--opset", type=int, default=DEFAULT_OPSET)
+    parser.add_argument("--atol", type=float, default=1e-4, help="Max allowed softmax difference")
+    parser.add_argument("--skip-optimize", action="store_true", help="Do not write the .opt.onnx graph")
+    args = parser.parse_args()
+
+    output_dir = os.path.dirname(os.path.abspath(args.output))
+    os.makedirs(output_dir, exist_ok=True)
+
+    model = load_color_analysis_model(args.checkpoint, torch.device("cpu"))
+    export_to_onnx(model, args.output, opset=args.opset)
+
+    onnx_path = args.output if args.skip_optimize else optimize_onnx_model(args.output)
+
+    report = check_parity(model, OnnxSeasonClassifier(onnx_path), atol=args.atol)
+    print(f"Parity: max |p_torch - p_onnx| = {report['max_abs_diff']:.2e}, "
+          f"top-1 agreement = {report['top1_agreement']:.0%}")
+    if not report["passed"]:
+        raise SystemExit("Parity check FAILED - do not deploy this graph")
+
+
+if __name__ == "__main__":
+    main()
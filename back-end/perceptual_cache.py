@@ -0,0 +1,317 @@
+# perceptual_cache.py
+"""
+Perceptual-Hash Near-Duplicate Cache
+Second cache tier that recognises the same photo after re-encoding.
+
+The browser (CameraView / LazyImage) recompresses photos, so the same selfie
+arrives with different bytes and misses the exact content-hash cache. Here
+each upload gets a 64-bit difference hash (dHash) computed on a tiny,
+draft-mode decode of the image; lookups return any cached result whose hash
+is within a Hamming-distance threshold.
+
+The hash only sees grayscale gradients, while the cached result is a season
+(warm vs cool undertone), so a re-toned or white-balance-shifted copy of a
+photo hashes like the original. Each entry also keeps the mean CIE Lab color
+of the hash thumbnail, and a hit must be within a CIEDE2000 tolerance of it.
+
+Lookups use multi-index hashing: the 64 bits are split into
+`max_distance + 1` chunks, and by the pigeonhole principle any hash within
+`max_distance` bits matches at least one chunk exactly. Only the entries
+sharing a chunk are verified, which keeps lookups sub-millisecond with
+hundreds of thousands of entries.
+"""
+
+import io
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Optional, Set, Tuple
+
+import numpy as np
+from PIL import Image, ImageOps
+
+from color_space import delta_e_2000, rgb_to_lab
+from result_cache import CachedAnalysis
+
+
+HASH_BITS = 64
+
+# Mean color of the hash thumbnail, CIE L*a*b*
+ImageColor = Tuple[float, float, float]
+
+
+def _thumbnail(image_bytes: bytes, hash_size: int) -> Image.Image:
+    """
+    (hash_size + 1) x hash_size RGB thumbnail. JPEGs are decoded in draft mode
+    at a fraction of their resolution, so a 12MP photo costs far less than a
+    full decode.
+    """
+    with Image.open(io.BytesIO(image_bytes)) as img:
+        # Ask libjpeg for the smallest DCT scale that is still >= 8x the hash grid
+        img.draft("RGB", (hash_size * 8, hash_size * 8))
+        img = ImageOps.exif_transpose(img)
+        return img.convert("RGB").resize((hash_size + 1, hash_size), Image.Resampling.BILINEAR)
+
+
+def _difference_hash(small: Image.Image, hash_size: int) -> int:
+    pixels = small.convert("L").tobytes()
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+def compute_dhash(image_bytes: bytes, hash_size: int = 8) -> int:
+    """Difference hash of an image (hash_size * hash_size bits)"""
+    return _difference_hash(_thumbnail(image_bytes, hash_size), hash_size)
+
+
+def compute_image_key(image_bytes: bytes, hash_size: int = 8) -> Tuple[int, ImageColor]:
+    """
+    Difference hash and mean Lab color of an image, from one draft decode.
+
+    Returns:
+        Tuple of (hash, (L*, a*, b*))
+    """
+    small = _thumbnail(image_bytes, hash_size)
+    lab = rgb_to_lab(np.asarray(small)).reshape(-1, 3).mean(axis=0)
+    return _difference_hash(small, hash_size), (float(lab[0]), float(lab[1]), float(lab[2]))
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+class MultiIndexHashIndex:
+    """
+    Index of 64-bit hashes supporting "all entries within r bits" queries.
+    """
+
+    def __init__(self, max_distance: int, bits: int = HASH_BITS):
+        """
+        Args:
+            max_distance: Largest Hamming distance lookups must find
+            bits: Hash width
+        """
+        if not 0 <= max_distance < bits:
+            raise ValueError(f"max_distance must be in [0, {bits})")
+
+        self.bits = bits
+        self.max_distance = max_distance
+
+        # Split the hash into max_distance + 1 nearly equal chunks
+        num_chunks = max_distance + 1
+        base, extra = divmod(bits, num_chunks)
+        self._chunks: List[Tuple[int, int]] = []  # (shift, mask)
+        shift = 0
+        for i in range(num_chunks):
+            width = base + (1 if i < extra else 0)
+            self._chunks.append((shift, (1 << width) - 1))
+            shift += width
+
+        self._tables: List[Dict[int, Set[Hashable]]] = [{} for _ in self._chunks]
+        self._hashes: Dict[Hashable, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._hashes)
+
+    def add(self, entry_id: Hashable, value: int):
+        if entry_id in self._hashes:
+            self.remove(entry_id)
+        self._hashes[entry_id] = value
+        for table, (shift, mask) in zip(self._tables, self._chunks):
+            table.setdefault((value >> shift) & mask, set()).add(entry_id)
+
+    def remove(self, entry_id: Hashable):
+        value = self._hashes.pop(entry_id, None)
+        if value is None:
+            return
+        for table, (shift, mask) in zip(self._tables, self._chunks):
+            key = (value >> shift) & mask
+            bucket = table.get(key)
+            if bucket is not None:
+                bucket.discard(entry_id)
+                if not bucket:
+                    del table[key]
+
+    def nearest(
+        self,
+        value: int,
+        max_distance: Optional[int] = None,
+        accept: Optional[Callable[[Hashable], bool]] = None
+    ) -> Optional[Tuple[Hashable, int]]:
+        """
+        Closest entry within max_distance bits (defaults to the index threshold),
+        among the entries accept() returns True for.
+
+        Returns:
+            Tuple of (entry_id, distance) or None
+        """
+        limit = self.max_distance if max_distance is None else min(max_distance, self.max_distance)
+        best: Optional[Tuple[Hashable, int]] = None
+        seen: Set[Hashable] = set()
+
+        for table, (shift, mask) in zip(self._tables, self._chunks):
+            bucket = table.get((value >> shift) & mask)
+            if not bucket:
+                continue
+            for entry_id in bucket:
+                if entry_id in seen:
+                    continue
+                seen.add(entry_id)
+                distance = hamming_distance(value, self._hashes[entry_id])
+                if distance <= limit and (best is None or distance < best[1]):
+                    if accept is not None and not accept(entry_id):
+                        continue
+                    best = (entry_id, distance)
+                    if distance == 0:
+                        return best
+        return best
+
+
+class PerceptualCache:
+    """
+    Thread-safe near-duplicate cache of analysis results with LRU eviction and TTL.
+
+    Entries are partitioned by namespace (masking flag + model version) so
+    results never cross model versions or masking modes.
+    """
+
+    def __init__(
+        self,
+        max_distance: int = 4,
+        max_entries: int = 200000,
+        ttl_seconds: float = 3600.0,
+        relaxed_distance: int = 0,
+        max_color_delta_e: float = 2.0
+    ):
+        """
+        Args:
+            max_distance: Hamming distance of a normal hit
+            max_entries: LRU capacity
+            ttl_seconds: Entry lifetime
+            relaxed_distance: Larger distance callers may ask for with
+                              get(..., max_distance=...) when a looser match beats
+                              missing their deadline (0 = no relaxed lookups).
+                              The index is split into more, smaller chunks to
+                              support it, so keep it close to max_distance.
+            max_color_delta_e: Largest CIEDE2000 difference between the mean
+                               colors of a hit and the query (when both have one)
+        """
+        self.max_distance = max_distance
+        self.relaxed_distance = relaxed_distance
+        self._index_distance = max(max_distance, relaxed_distance)
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_color_delta_e = max_color_delta_e
+
+        self._lock = threading.Lock()
+        self._indexes: Dict[str, MultiIndexHashIndex] = {}
+        # entry_id -> (namespace, value, stored_at, color)
+        self._entries: "OrderedDict[int, Tuple[str, CachedAnalysis, float, Optional[ImageColor]]]" = OrderedDict()
+        self._next_id = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.color_mismatches = 0
+        self.total_lookup_s = 0.0
+
+    @staticmethod
+    def namespace(apply_face_masking: bool, model_version: str) -> str:
+        return f"{int(bool(apply_face_masking))}:{model_version}"
+
+    def get(
+        self,
+        image_hash: int,
+        namespace: str,
+        max_distance: Optional[int] = None,
+        color: Optional[ImageColor] = None
+    ) -> Optional[Tuple[CachedAnalysis, int]]:
+        """
+        Args:
+            max_distance: Overrides the hit distance, up to max(max_distance, relaxed_distance)
+            color: Mean Lab color of the query (compute_image_key); entries whose
+                   color differs by more than max_color_delta_e are not hits
+
+        Returns:
+            Tuple of (cached_value, hamming_distance) or None
+        """
+        start = time.perf_counter()
+        with self._lock:
+            try:
+                index = self._indexes.get(namespace)
+                limit = self.max_distance if max_distance is None else max_distance
+                accept = (lambda entry_id: self._same_color(entry_id, color)) if color is not None else None
+                match = index.nearest(image_hash, limit, accept) if index is not None else None
+                if match is None:
+                    self.misses += 1
+                    return None
+
+                entry_id, distance = match
+                _, value, stored_at, _ = self._entries[entry_id]
+                if time.monotonic() - stored_at > self.ttl_seconds:
+                    self._remove(entry_id)
+                    self.misses += 1
+                    return None
+
+                self._entries.move_to_end(entry_id)
+                self.hits += 1
+                return value, distance
+            finally:
+                self.total_lookup_s += time.perf_counter() - start
+
+    def _same_color(self, entry_id: int, color: ImageColor) -> bool:
+        stored = self._entries[entry_id][3]
+        if stored is None or delta_e_2000(stored, color) <= self.max_color_delta_e:
+            return True
+        self.color_mismatches += 1
+        return False
+
+    def put(
+        self,
+        image_hash: int,
+        namespace: str,
+        value: CachedAnalysis,
+        color: Optional[ImageColor] = None
+    ):
+        with self._lock:
+            index = self._indexes.get(namespace)
+            if index is None:
+                index = self._indexes[namespace] = MultiIndexHashIndex(self._index_distance)
+
+            entry_id = self._next_id
+            self._next_id += 1
+            index.add(entry_id, image_hash)
+            self._entries[entry_id] = (namespace, value, time.monotonic(), color)
+
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _remove(self, entry_id: int):
+        namespace = self._entries.pop(entry_id)[0]
+        index = self._indexes.get(namespace)
+        if index is not None:
+            index.remove(entry_id)
+            if not len(index):
+                del self._indexes[namespace]
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "max_distance": self.max_distance,
+                "relaxed_distance": self.relaxed_distance,
+                "max_color_delta_e": self.max_color_delta_e,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "color_mismatches": self.color_mismatches,
+                "mean_lookup_ms": round(1000.0 * self.total_lookup_s / lookups, 4) if lookups else 0.0,
+            }
@@ -0,0 +1,328 @@
+# profiling.py
+"""
+On-Demand Request Profiling
+Opt-in sampling profiler for live requests, with captured profiles kept in
+a bounded on-disk ring buffer.
+
+A profiled request is sampled by a background thread that reads the stack
+of every thread (sys._current_frames) at a fixed interval. The pipeline
+hops threads (event loop, cpu pool, micro-batchers), so all threads are
+sampled, not just the handler's. The result is written in the "folded" format
+(`thread;frame;frame count` per line) that speedscope, flamegraph.pl and
+inferno read directly. Idle threads parked in a queue or selector wait are
+left out. cProfile is not used: it only sees the thread that enabled it,
+and only one profiler may be active at a time per interpreter.
+
+Optionally, a torch profiler trace of the classifier forward pass is
+attached (Chrome trace JSON). torch.profiler only records ops on the
+thread that started it, so it is started around the forward pass itself
+(see profile_torch_forward).
+
+When profiling is disabled the middleware is not installed at all; the
+only remaining hook is a module constant check in the classifier path.
+"""
+
+import asyncio
+import contextvars
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional
+from urllib.parse import parse_qs
+
+
+# (file name, function) of the innermost frame of a thread that is only waiting
+IDLE_LEAVES = {
+    ("threading.py", "wait"),
+    ("queue.py", "get"),
+    ("selectors.py", "select"),
+    ("thread.py", "_worker"),  # ThreadPoolExecutor worker blocked on its work queue
+}
+
+# File name suffix per artifact kind
+PROFILE_KINDS = {
+    "meta": ".meta.json",
+    "folded": ".folded.txt",
+    "torch": ".torch.json",
+}
+
+_PROFILE_ID = re.compile(r"^[0-9]{19}-[0-9a-f]{8}$")
+
+
+class StackSampler:
+    """
+    Samples the Python stacks of all other threads at a fixed interval.
+    """
+
+    def __init__(self, interval_ms: float = 5.0, max_depth: int = 128):
+        self.interval_s = max(0.001, interval_ms / 1000.0)
+        self.max_depth = max_depth
+        self.samples = 0
+        self._stacks: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._thread_names: Dict[int, str] = {}
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _thread_name(self, ident: int) -> str:
+        name = self._thread_names.get(ident)
+        if name is None:
+            self._thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+            name = self._thread_names.get(ident, f"thread-{ident}")
+        return name.replace(";", ":").replace(" ", "_")
+
+    def _run(self):
+        own_ident = threading.get_ident()
+        while not self._stop.wait(self.interval_s):
+            self.samples += 1
+            for ident, frame in sys._current_frames().items():
+                if ident == own_ident:
+                    continue
+                code = frame.f_code
+                if (os.path.basename(code.co_filename), code.co_name) in IDLE_LEAVES:
+                    continue
+
+                stack: List[str] = []
+                while frame is not None and len(stack) < self.max_depth:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(self._thread_name(ident))
+                self._stacks[tuple(reversed(stack))] += 1
+
+    def folded(self) -> str:
+        """Folded stacks, one `root;...;leaf count` line each, most frequent first"""
+        return "".join(
+            ";".join(frame.replace(";", ":") for frame in stack) + f" {count}\n"
+            for stack, count in self._stacks.most_common()
+        )
+
+
+class ProfileStore:
+    """
+    Ring buffer of captured profiles in one directory, oldest evicted first.
+
+    Each profile is `<id>.meta.json` plus one file per artifact kind; the
+    meta file is written last, so listed profiles are always complete.
+    """
+
+    def __init__(self, directory: str, max_profiles: int = 50):
+        self.directory = directory
+        self.max_profiles = max(1, max_profiles)
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def new_id() -> str:
+        # Sorts by capture time
+        return f"{time.time_ns():019d}-{uuid.uuid4().hex[:8]}"
+
+    def path(self, profile_id: str, kind: str) -> Optional[str]:
+        """File of an artifact, or None for an unknown id / kind or a missing file"""
+        if not _PROFILE_ID.match(profile_id) or kind not in PROFILE_KINDS:
+            return None
+        path = os.path.join(self.directory, profile_id + PROFILE_KINDS[kind])
+        return path if os.path.exists(path) else None
+
+    def save(self, profile_id: str, meta: Dict[str, Any], artifacts: Dict[str, bytes]) -> Dict[str, Any]:
+        meta = dict(meta, id=profile_id, artifacts=sorted(artifacts))
+        with self._lock:
+            for kind, content in artifacts.items():
+                with open(os.path.join(self.directory, profile_id + PROFILE_KINDS[kind]), "wb") as f:
+                    f.write(content)
+            with open(os.path.join(self.directory, profile_id + PROFILE_KINDS["meta"]), "w") as f:
+                json.dump(meta, f)
+            self._evict()
+        return meta
+
+    def list(self) -> List[Dict[str, Any]]:
+        """Metadata of the stored profiles, newest first"""
+        profiles = []
+        for profile_id in reversed(self._ids()):
+            try:
+                with open(os.path.join(self.directory, profile_id + PROFILE_KINDS["meta"])) as f:
+                    profiles.append(json.load(f))
+            except (OSError, ValueError):
+                continue  # evicted meanwhile
+        return profiles
+
+    def _ids(self) -> List[str]:
+        suffix = PROFILE_KINDS["meta"]
+        return sorted(
+            name[:-len(suffix)] for name in os.listdir(self.directory)
+            if name.endswith(suffix) and _PROFILE_ID.match(name[:-len(suffix)])
+        )
+
+    def _evict(self):
+        ids = self._ids()
+        for profile_id in ids[:max(0, len(ids) - self.max_profiles)]:
+            # Meta first, so a half-evicted profile is never listed
+            for suffix in sorted(PROFILE_KINDS.values(), key=lambda s: s != PROFILE_KINDS["meta"]):
+                try:
+                    os.remove(os.path.join(self.directory, profile_id + suffix))
+                except FileNotFoundError:
+                    pass
+
+
+class ProfileCapture:
+    """Profile being captured for one request"""
+
+    def __init__(self, profile_id: str, torch_trace: bool):
+        self.id = profile_id
+        self.torch_trace = torch_trace
+        self.artifacts: Dict[str, bytes] = {}
+
+
+# Capture of the request being served (None when it is not profiled)
+_ACTIVE_CAPTURE: contextvars.ContextVar[Optional[ProfileCapture]] = contextvars.ContextVar(
+    "profile_capture", default=None
+)
+# torch.profiler is process-global; only one trace at a time
+_TORCH_LOCK = threading.Lock()
+
+
+def torch_trace_requested() -> bool:
+    capture = _ACTIVE_CAPTURE.get()
+    return capture is not None and capture.torch_trace
+
+
+@contextmanager
+def profile_torch_forward(trace_dir: str) -> Iterator[None]:
+    """
+    Record a torch profiler trace of the enclosed block (the model forward
+    pass) into the current request's profile, if it asked for one.
+    """
+    capture = _ACTIVE_CAPTURE.get()
+    if capture is None or not capture.torch_trace or not _TORCH_LOCK.acquire(blocking=False):
+        yield
+        return
+
+    try:
+        from torch.profiler import ProfilerActivity, profile
+
+        with profile(activities=[ProfilerActivity.CPU], record_shapes=True) as prof:
+            yield
+        trace_path = os.path.join(trace_dir, f".{capture.id}.torch.tmp")
+        prof.export_chrome_trace(trace_path)
+        with open(trace_path, "rb") as f:
+            capture.artifacts["torch"] = f.read()
+        os.remove(trace_path)
+    finally:
+        _TORCH_LOCK.release()
+
+
+class ProfilingMiddleware:
+    """
+    Pure ASGI middleware that profiles a request when asked to (`X-Profile`
+    header or `profile` query parameter: `1` or `torch`) or when it is
+    picked by the random sampling rate. One request is profiled at a time;
+    others run normally meanwhile. The profile id is returned in the
+    `X-Profile-Id` response header.
+    """
+
+    def __init__(
+        self,
+        app,
+        store: ProfileStore,
+        sample_rate: float = 0.0,
+        interval_ms: float = 5.0,
+        torch_traces: bool = False,
+        authorize: Optional[Callable[[Optional[str]], bool]] = None
+    ):
+        """
+        Args:
+            store: Where captured profiles go
+            sample_rate: Fraction of requests profiled without being asked
+            interval_ms: Stack sampling interval
+            torch_traces: Allow `torch` requests to attach a forward-pass trace
+            authorize: Checks the X-Admin-Token header of explicit requests
+                       (None accepts every request)
+        """
+        self.app = app
+        self.store = store
+        self.sample_rate = sample_rate
+        self.interval_ms = interval_ms
+        self.torch_traces = torch_traces
+        self.authorize = authorize
+        self._busy = threading.Lock()
+
+    def _requested_mode(self, scope) -> Optional[str]:
+        headers = dict(scope.get("headers") or ())
+        mode = headers.get(b"x-profile", b"").decode("latin-1").strip().lower()
+        if not mode and scope.get("query_string"):
+            mode = parse_qs(scope["query_string"].decode("latin-1")).get("profile", [""])[0].strip().lower()
+        if mode not in ("1", "true", "torch"):
+            return None
+        token = headers.get(b"x-admin-token")
+        if self.authorize is not None and not self.authorize(token.decode("latin-1") if token else None):
+            return None
+        return mode
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        mode = self._requested_mode(scope)
+        trigger = "request" if mode else None
+        if trigger is None and self.sample_rate > 0 and random.random() < self.sample_rate:
+            trigger = "sampled"
+        if trigger is None or not self._busy.acquire(blocking=False):
+            await self.app(scope, receive, send)
+            return
+
+        capture = ProfileCapture(self.store.new_id(), torch_trace=self.torch_traces and mode == "torch")
+        token = _ACTIVE_CAPTURE.set(capture)
+        sampler = StackSampler(self.interval_ms)
+        status: List[int] = []
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                status.append(message["status"])
+                message = dict(message)
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"x-profile-id", capture.id.encode("latin-1"))
+                ]
+            await send(message)
+
+        start = time.perf_counter()
+        sampler.start()
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            duration_ms = (time.perf_counter() - start) * 1000.0
+            _ACTIVE_CAPTURE.reset(token)
+            meta = {
+                "method": scope.get("method"),
+                "path": scope.get("path"),
+                "status": status[0] if status else None,
+                "trigger": trigger,
+                "captured_at": time.time(),
+                "duration_ms": round(duration_ms, 1),
+                "interval_ms": self.interval_ms,
+            }
+            try:
+                # Joining the sampler and writing the profile block: keep them off the event loop
+                await asyncio.get_running_loop().run_in_executor(None, self._finish, sampler, capture, meta)
+            finally:
+                self._busy.release()
+
+    def _finish(self, sampler: StackSampler, capture: ProfileCapture, meta: Dict[str, Any]):
+        sampler.stop()
+        meta["samples"] = sampler.samples
+        self.store.save(capture.id, meta, dict(capture.artifacts, folded=sampler.folded().encode("utf-8")))
@@ -0,0 +1,187 @@
+# result_cache.py
+"""
+Content-Addressed Result Cache
+LRU + TTL cache of classifier outputs keyed by the uploaded bytes.
+
+Only the season probabilities and the masking flag are stored; palettes and
+descriptions are rebuilt from the color engine on a hit, so palette changes
+never serve stale responses. Concurrent requests for the same key are
+coalesced (single-flight): one computes, the others await its result.
+"""
+
+import asyncio
+import hashlib
+import sys
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+
+@dataclass(frozen=True)
+class CachedAnalysis:
+    """What we keep per analyzed image"""
+    probabilities: Dict[str, float]
+    masking_applied: bool
+    # Cheaper pipeline options taken to meet a latency budget (see latency_budget.py)
+    degradations: Tuple[str, ...] = ()
+
+    def top_season(self) -> Tuple[str, float]:
+        """(season, confidence) - first season wins ties, like torch.argmax"""
+        season = max(self.probabilities, key=self.probabilities.get)
+        return season, self.probabilities[season]
+
+
+def _estimate_size(key: str, value: CachedAnalysis) -> int:
+    """Rough per-entry footprint in bytes (key, dict, floats, bookkeeping)"""
+    probs = value.probabilities
+    return (
+        sys.getsizeof(key)
+        + sys.getsizeof(probs)
+        + sum(sys.getsizeof(k) + sys.getsizeof(v) for k, v in probs.items())
+        + 200
+    )
+
+
+class ResultCache:
+    """
+    Thread-safe LRU cache with a TTL, an entry limit and a memory bound.
+    """
+
+    def __init__(self, max_entries: int = 10000, max_bytes: int = 32 * 1024 * 1024, ttl_seconds: float = 3600.0):
+        """
+        Args:
+            max_entries: Maximum number of cached results
+            max_bytes: Approximate memory bound for all entries
+            ttl_seconds: Entries older than this are treated as misses
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+
+        self._entries: "OrderedDict[str, Tuple[CachedAnalysis, float, int]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._in_flight: Dict[str, asyncio.Future] = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @staticmethod
+    def make_key(image_bytes: bytes, apply_face_masking: bool, model_version: str) -> str:
+        """Content hash of the upload plus everything that changes the model output"""
+        digest = hashlib.sha256(image_bytes).hexdigest()
+        return f"{digest}:{int(bool(apply_face_masking))}:{model_version}"
+
+    def get(self, key: str) -> Optional[CachedAnalysis]:
+        """Return the cached value (refreshing its LRU position) or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            value, stored_at, size = entry
+            if time.monotonic() - stored_at > self.ttl_seconds:
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: str, value: CachedAnalysis):
+        size = _estimate_size(key, value)
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, time.monotonic(), size)
+            self._bytes += size
+
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    async def get_or_compute(
+        self,
+        key: str,
+        compute: Callable[[], Awaitable[CachedAnalysis]]
+    ) -> Tuple[CachedAnalysis, bool]:
+        """
+        Single-flight lookup: on a miss only the first caller runs `compute`,
+        concurrent callers with the same key await that same computation.
+        A degraded result was shaped by the first caller's latency budget, so
+        it is not handed to the others: they compute again, with their own.
+
+        Must be called from the event loop thread.
+
+        Returns:
+            Tuple of (value, served_from_cache)
+        """
+        while True:
+            cached = self.get(key)
+            if cached is not None:
+                return cached, True
+
+            in_flight = self._in_flight.get(key)
+            if in_flight is None:
+                break
+            self.coalesced += 1
+            value = await asyncio.shield(in_flight)
+            if not value.degradations:
+                return value, True
+
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        try:
+            value = await compute()
+        except BaseException as e:
+            future.set_exception(e)
+            # Nobody else may be waiting; mark the exception as retrieved
+            future.exception()
+            raise
+        else:
+            # Degraded results are served, but the next request gets a chance at the full one
+            if not value.degradations:
+                self.put(key, value)
+            future.set_result(value)
+            return value, False
+        finally:
+            self._in_flight.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def _remove(self, key: str):
+        _, _, size = self._entries.pop(key)
+        self._bytes -= size
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "approx_bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "coalesced": self.coalesced,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "in_flight": len(self._in_flight),
+            }
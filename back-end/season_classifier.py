@@ -0,0 +1,166 @@
+# season_classifier.py
+"""
+Season Classifier
+ResNeXt50 architecture and checkpoint loading for the 4-class season model.
+
+Kept separate from the API module so offline tools (ONNX export, checkpoint
+conversion, benchmarks) can build the model without starting FastAPI/Mongo.
+
+Convert a training checkpoint to the pre-normalized serving format
+(loads without key rewriting):
+    python season_classifier.py --checkpoint ../models/ResNext50/best_model_resnext50_rgbm.pth \\
+                                --output ../models/ResNext50/season_classifier_serving.pth
+"""
+
+import argparse
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+import torch
+import torch.nn as nn
+
+
+# Output index -> season name
+SEASON_LABELS = ['Autumn', 'Summer', 'Winter', 'Spring']
+
+# Marker stored in checkpoints written by `convert_checkpoint`
+SERVING_CHECKPOINT_FORMAT = "color-analysis-serving/v1"
+
+
+# --- PYTORCH MODEL ARCHITECTURE ---
+class ColorAnalysisModel(nn.Module):
+    def __init__(self, num_classes=4, pretrained=False):
+        super().__init__()
+        # Imported here: torchvision.models drags in torch._dynamo and costs ~1.5s at import
+        from torchvision.models import resnext50_32x4d, ResNeXt50_32X4D_Weights
+
+        # Serving always overwrites every weight from our checkpoint, so the ImageNet
+        # weights are only worth downloading when training from scratch.
+        weights = ResNeXt50_32X4D_Weights.IMAGENET1K_V1 if pretrained else None
+        self.base_model = resnext50_32x4d(weights=weights)
+        num_ftrs = self.base_model.fc.in_features
+        self.base_model.fc = nn.Linear(num_ftrs, num_classes)
+
+    def forward(self, x):
+        return self.base_model(x)
+
+
+def fix_state_dict_keys(state_dict, model_has_base_model=True):
+    """Fix state_dict keys to match the model architecture"""
+    new_state_dict = OrderedDict()
+
+    for key, value in state_dict.items():
+        new_key = key
+
+        if new_key.startswith('module.'):
+            new_key = new_key.replace('module.', '')
+
+        if model_has_base_model:
+            if not new_key.startswith('base_model.'):
+                new_key = 'base_model.' + new_key
+        else:
+            if new_key.startswith('base_model.'):
+                new_key = new_key.replace('base_model.', '')
+
+        new_state_dict[new_key] = value
+
+    return new_state_dict
+
+
+def extract_state_dict(checkpoint):
+    """Pull the state_dict out of the different checkpoint layouts we have saved"""
+    if isinstance(checkpoint, dict):
+        if 'state_dict' in checkpoint:
+            return checkpoint['state_dict']
+        if 'model_state_dict' in checkpoint:
+            return checkpoint['model_state_dict']
+    return checkpoint
+
+
+def is_serving_checkpoint(checkpoint) -> bool:
+    return isinstance(checkpoint, dict) and checkpoint.get("format") == SERVING_CHECKPOINT_FORMAT
+
+
+def load_color_analysis_model(
+    model_path: str,
+    device: torch.device,
+    num_classes: int = 4,
+    timings: Optional[Dict[str, float]] = None
+) -> ColorAnalysisModel:
+    """
+    Build the classifier (no pretrained download) and load weights from a checkpoint.
+
+    Pre-normalized serving checkpoints load directly; training checkpoints
+    have their keys rewritten with `fix_state_dict_keys` first.
+
+    Args:
+        model_path: Path to the .pth checkpoint
+        device: Device to load the model onto
+        num_classes: Number of output classes
+        timings: Optional dict that receives per-phase durations in ms
+
+    Returns:
+        Model in eval mode on `device`
+    """
+    phase_start = time.perf_counter()
+
+    def mark(phase: str):
+        nonlocal phase_start
+        now = time.perf_counter()
+        if timings is not None:
+            timings[phase] = round((now - phase_start) * 1000.0, 1)
+        phase_start = now
+
+    model = ColorAnalysisModel(num_classes=num_classes, pretrained=False)
+    mark("build_architecture")
+
+    checkpoint = torch.load(model_path, map_location=device, weights_only=False)
+    mark("read_checkpoint")
+
+    if is_serving_checkpoint(checkpoint):
+        state_dict = checkpoint["state_dict"]
+    else:
+        state_dict = extract_state_dict(checkpoint)
+        state_dict = fix_state_dict_keys(state_dict, model_has_base_model=True)
+    mark("normalize_keys")
+
+    model.load_state_dict(state_dict, strict=True)
+    model.eval()
+    model = model.to(device)
+    mark("load_state_dict")
+    return model
+
+
+def convert_checkpoint(input_path: str, output_path: str, num_classes: int = 4) -> str:
+    """
+    Write a serving checkpoint: only the model weights, keys already matching
+    ColorAnalysisModel, verified by a strict load.
+    """
+    checkpoint = torch.load(input_path, map_location="cpu", weights_only=False)
+    state_dict = fix_state_dict_keys(extract_state_dict(checkpoint), model_has_base_model=True)
+
+    # Fails loudly if the keys or shapes do not match the architecture
+    ColorAnalysisModel(num_classes=num_classes, pretrained=False).load_state_dict(state_dict, strict=True)
+
+    torch.save({
+        "format": SERVING_CHECKPOINT_FORMAT,
+        "num_classes": num_classes,
+        "state_dict": state_dict,
+    }, output_path)
+    print(f"Serving checkpoint written to {output_path} ({len(state_dict)} tensors)")
+    return output_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert a training checkpoint to the serving format")
+    parser.add_argument("--checkpoint", required=True, help="Training checkpoint (.pth)")
+    parser.add_argument("--output", required=True, help="Destination serving checkpoint (.pth)")
+    parser.add_argument("--num-classes", type=int, default=4)
+    args = parser.parse_args()
+
+    convert_checkpoint(args.checkpoint, args.output, num_classes=args.num_classes)
+
+
+if __name__ == "__main__":
+    main()
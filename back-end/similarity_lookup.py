@@ -0,0 +1,256 @@
+# similarity_lookup.py
+"""
+Color Similarity Lookup
+Maps the colors of a /get-matching-clothes request to their color_similarity
+documents with at most one Mongo query per request.
+
+A requested color is looked up under up to three spellings, in priority
+order: as sent, normalized ('#rrggbb' lowercase) and lowercased. The first
+spelling that has a document wins, as with the former find_one chain.
+
+- fetch_similarity_docs: one `$in` query over every spelling of every color
+- ColorSimilarityLookup: the whole table preloaded in memory when it has at
+  most preload_max_docs documents, and reloaded when the collection changes
+  (change stream, or a polled count / newest _id fingerprint). Larger tables
+  get a bounded LRU of per-spelling results instead, including absences, in
+  front of fetch_similarity_docs.
+"""
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Set, Tuple
+
+from clothing_matcher import normalize_hex
+from metrics import CACHE_LOOKUPS
+
+logger = logging.getLogger(__name__)
+
+
+SIMILARITY_PROJECTION = {"_id": 0, "primary_color": 1, "similar_colors": 1}
+
+# Serves the $in lookup (created by catalog_migrations.py)
+SIMILARITY_INDEX = [("primary_color", 1)]
+
+
+def lookup_keys(color: str) -> List[str]:
+    """Spellings a requested color is looked up under, in priority order, without repeats"""
+    return list(dict.fromkeys([color, normalize_hex(color), color.lower()]))
+
+
+def _resolve(colors: List[str], found: Mapping[str, Optional[Dict[str, Any]]]) -> List[Optional[Dict[str, Any]]]:
+    return [
+        next((found[key] for key in lookup_keys(color) if found.get(key) is not None), None)
+        for color in colors
+    ]
+
+
+def _query(collection: Any, keys: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+    """First document per primary_color among keys, in one query"""
+    keys = sorted(set(keys))
+    found: Dict[str, Dict[str, Any]] = {}
+    if keys:
+        for doc in collection.find({"primary_color": {"$in": keys}}, SIMILARITY_PROJECTION):
+            found.setdefault(doc["primary_color"], doc)
+    return found
+
+
+def fetch_similarity_docs(collection: Any, colors: List[str]) -> List[Optional[Dict[str, Any]]]:
+    """The color_similarity document of each color (None if it has none), in one query"""
+    return _resolve(colors, _query(collection, (key for color in colors for key in lookup_keys(color))))
+
+
+class ColorSimilarityLookup:
+    """In-memory color_similarity table (or LRU) kept in sync with the collection"""
+
+    def __init__(
+        self,
+        collection: Any,
+        preload_max_docs: int = 200000,
+        cache_max_entries: int = 10000,
+        refresh_interval_s: float = 60.0,
+        reload_interval_s: float = 3600.0,
+        use_change_stream: bool = True
+    ):
+        """
+        Args:
+            collection: color_similarity collection (pymongo or memory_mongo)
+            preload_max_docs: Preload the table when it has at most this many documents (0 = never)
+            cache_max_entries: Spellings kept in the LRU when the table is not preloaded
+            refresh_interval_s: How often to check the collection for changes when polling
+            reload_interval_s: Full reload period when polling (0 = never); the
+                               polled fingerprint misses in-place edits
+            use_change_stream: Watch the collection instead of polling when the server supports it
+        """
+        self.collection = collection
+        self.preload_max_docs = preload_max_docs
+        self.cache_max_entries = cache_max_entries
+        self.refresh_interval_s = refresh_interval_s
+        self.reload_interval_s = reload_interval_s
+        self.use_change_stream = use_change_stream
+        self.mode: Optional[str] = None
+
+        self._lock = threading.Lock()
+        self._table: Optional[Dict[str, Dict[str, Any]]] = None
+        self._cache: "OrderedDict[str, Optional[Dict[str, Any]]]" = OrderedDict()
+        self._fingerprint: Optional[Tuple[int, Any]] = None
+        self._last_reload = 0.0
+        self._stream = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        self.hits = 0
+        self.misses = 0
+        self.queries = 0
+        self.reloads = 0
+        self.evictions = 0
+
+    # --- Lifecycle ---
+
+    def start(self):
+        """Open the change stream (if any), load the table, start the refresh worker"""
+        if self.use_change_stream:
+            try:
+                self._stream = self.collection.watch()
+                self.mode = "change_stream"
+            except Exception as e:
+                print(f"Color similarity: change streams unavailable ({e}), polling every {self.refresh_interval_s}s")
+        if self._stream is None:
+            self.mode = "polling"
+        self.reload()
+        self._thread = threading.Thread(target=self._run, name="similarity-refresh", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = 5.0):
+        self._stop.set()
+        if self._stream is not None:
+            try:
+                self._stream.close()
+            except Exception:
+                pass
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def reload(self):
+        """Reload the preloaded table (or drop the LRU) from the collection"""
+        fingerprint = self._current_fingerprint()
+        table = None
+        if self.preload_max_docs > 0 and fingerprint[0] <= self.preload_max_docs:
+            table = {}
+            for doc in self.collection.find({}, SIMILARITY_PROJECTION):
+                table.setdefault(doc.get("primary_color"), doc)
+        with self._lock:
+            self._table = table
+            self._cache.clear()
+            self._fingerprint = fingerprint
+            self._last_reload = time.monotonic()
+            self.reloads += 1
+
+    def _current_fingerprint(self) -> Tuple[int, Any]:
+        """(document count, newest _id): changes when documents are added or removed"""
+        newest = next(iter(self.collection.find({}, {"_id": 1}, sort=[("_id", -1)], limit=1)), None)
+        return self.collection.count_documents({}), newest and newest["_id"]
+
+    def _run(self):
+        last_check = time.monotonic()
+        while not self._stop.is_set():
+            try:
+                if self._stream is not None:
+                    # Reload once per burst of changes
+                    changed = False
+                    while self._stream.try_next() is not None:
+                        changed = True
+                    if changed:
+                        self.reload()
+                    self._stop.wait(0.5)
+                else:
+                    self._stop.wait(max(0.0, self.refresh_interval_s - (time.monotonic() - last_check)))
+                    last_check = time.monotonic()
+                    if self._stop.is_set():
+                        break
+                    reload_due = (
+                        self.reload_interval_s > 0
+                        and time.monotonic() - self._last_reload >= self.reload_interval_s
+                    )
+                    if reload_due or self._current_fingerprint() != self._fingerprint:
+                        self.reload()
+            except Exception as e:
+                logger.warning(f"color similarity refresh failed: {e}")
+                if self._stream is not None:
+                    try:
+                        self._stream.close()
+                    except Exception:
+                        pass
+                    self._stream = None
+                    self.mode = "polling"
+                self._stop.wait(self.refresh_interval_s)
+
+    # --- Lookups ---
+
+    @property
+    def preloaded(self) -> bool:
+        """True when lookups are answered from memory without querying the collection"""
+        return self._table is not None
+
+    def lookup(self, colors: List[str]) -> List[Optional[Dict[str, Any]]]:
+        """The color_similarity document of each color (None if it has none)"""
+        with self._lock:
+            table = self._table
+            if table is not None:
+                self.hits += len(colors)
+                CACHE_LOOKUPS.inc("color_similarity", "hit", amount=len(colors))
+                return _resolve(colors, table)
+
+            # A color is answered from the LRU when the spellings up to its first
+            # document (or all of them, for a color without one) are cached
+            found: Dict[str, Optional[Dict[str, Any]]] = {}
+            missing: Set[str] = set()
+            misses = 0
+            for color in colors:
+                missed = False
+                for key in lookup_keys(color):
+                    if key in self._cache:
+                        self._cache.move_to_end(key)
+                        found[key] = self._cache[key]
+                        if found[key] is not None and not missed:
+                            break
+                    else:
+                        missing.add(key)
+                        missed = True
+                misses += missed
+            self.hits += len(colors) - misses
+            self.misses += misses
+
+        if misses:
+            CACHE_LOOKUPS.inc("color_similarity", "miss", amount=misses)
+        if len(colors) > misses:
+            CACHE_LOOKUPS.inc("color_similarity", "hit", amount=len(colors) - misses)
+        if missing:
+            fetched = _query(self.collection, missing)
+            with self._lock:
+                self.queries += 1
+                for key in missing:
+                    found[key] = self._cache[key] = fetched.get(key)
+                    self._cache.move_to_end(key)
+                while len(self._cache) > self.cache_max_entries:
+                    self._cache.popitem(last=False)
+                    self.evictions += 1
+        return _resolve(colors, found)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "mode": self.mode,
+                "preloaded": self._table is not None,
+                "table_entries": len(self._table) if self._table is not None else None,
+                "cache_entries": len(self._cache),
+                "cache_max_entries": self.cache_max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "queries": self.queries,
+                "reloads": self.reloads,
+                "evictions": self.evictions,
+            }
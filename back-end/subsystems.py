@@ -0,0 +1,202 @@
+# subsystems.py
+"""
+Subsystem Registry
+Lazy / parallel initialization with per-subsystem readiness.
+
+Each subsystem (classifier, face preprocessor, ingestion, Mongo catalog, ...)
+is registered with a loader function. Loaders run at most once: either in
+parallel in the background at startup, or lazily on first use via
+`ensure()`. Callers that arrive while a load is in progress wait for it.
+"""
+
+import asyncio
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+
+PENDING = "pending"
+LOADING = "loading"
+READY = "ready"
+FAILED = "failed"
+DISABLED = "disabled"
+
+
+class SubsystemUnavailable(RuntimeError):
+    """Raised by `ensure()` when a subsystem failed to load or is disabled"""
+
+
+class Subsystem:
+    """One lazily-initialized component and its readiness state"""
+
+    def __init__(
+        self,
+        name: str,
+        loader: Callable[[], Any],
+        enabled: bool = True,
+        lazy: bool = False,
+        retry_on_failure: bool = False
+    ):
+        """
+        Args:
+            name: Name reported in /health
+            loader: Zero-argument function returning the initialized object
+            enabled: Disabled subsystems never load
+            lazy: Load on first use instead of at startup
+            retry_on_failure: Try loading again on the next use after a failure
+                              (for network-backed subsystems)
+        """
+        self.name = name
+        self.loader = loader
+        self.lazy = lazy
+        self.retry_on_failure = retry_on_failure
+        self.state = PENDING if enabled else DISABLED
+        self.value: Any = None
+        self.error: Optional[str] = None
+        self.load_ms: Optional[float] = None
+
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        if not enabled:
+            self._done.set()
+
+    @property
+    def ready(self) -> bool:
+        return self.state == READY
+
+    def ensure(self, timeout: Optional[float] = None) -> Any:
+        """
+        Return the loaded value, loading it in this thread if nobody has started yet.
+
+        Raises:
+            SubsystemUnavailable if the subsystem is disabled or failed to load
+        """
+        if self.state == READY:
+            return self.value
+
+        run_loader = False
+        with self._lock:
+            if self.state == PENDING or (self.state == FAILED and self.retry_on_failure):
+                self.state = LOADING
+                self._done.clear()
+                run_loader = True
+
+        if run_loader:
+            self._load()
+        elif not self._done.wait(timeout):
+            raise SubsystemUnavailable(f"{self.name} is still loading")
+
+        if self.state != READY:
+            raise SubsystemUnavailable(f"{self.name} unavailable: {self.error or self.state}")
+        return self.value
+
+    def get(self, wait: bool = True) -> Any:
+        """Like ensure(), but returns None instead of raising"""
+        if not wait and self.state != READY:
+            return None
+        try:
+            return self.ensure()
+        except SubsystemUnavailable:
+            return None
+
+    async def ensure_async(self) -> Any:
+        """ensure() without blocking the event loop while a load runs"""
+        if self.state == READY:
+            return self.value
+        return await asyncio.get_running_loop().run_in_executor(None, self.ensure)
+
+    def reset(self, value: Any = None):
+        """Replace the loaded value (tests, hot reloads)"""
+        with self._lock:
+            self.value = value
+            self.state = READY if value is not None else PENDING
+            self.error = None
+            if value is not None:
+                self._done.set()
+            else:
+                self._done.clear()
+
+    def _load(self):
+        start = time.perf_counter()
+        try:
+            print(f"[startup] loading {self.name}...")
+            self.value = self.loader()
+            self.state = READY
+        except Exception as e:
+            self.error = str(e)
+            self.state = FAILED
+            print(f"ERROR loading {self.name}: {e}")
+            traceback.print_exc()
+        finally:
+            self.load_ms = round((time.perf_counter() - start) * 1000.0, 1)
+            print(f"[startup] {self.name}: {self.state} in {self.load_ms:.1f}ms")
+            self._done.set()
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "lazy": self.lazy,
+            "load_ms": self.load_ms,
+            "error": self.error,
+        }
+
+
+class SubsystemRegistry:
+    """Holds all subsystems and starts the eager ones in parallel"""
+
+    def __init__(self):
+        self._subsystems: Dict[str, Subsystem] = {}
+        self._startup_pool: Optional[ThreadPoolExecutor] = None
+
+    def register(
+        self,
+        name: str,
+        loader: Callable[[], Any],
+        enabled: bool = True,
+        lazy: bool = False,
+        retry_on_failure: bool = False
+    ) -> Subsystem:
+        subsystem = Subsystem(name, loader, enabled=enabled, lazy=lazy, retry_on_failure=retry_on_failure)
+        self._subsystems[name] = subsystem
+        return subsystem
+
+    def __getitem__(self, name: str) -> Subsystem:
+        return self._subsystems[name]
+
+    def __iter__(self):
+        return iter(self._subsystems.values())
+
+    def start_eager(self, names: Optional[Iterable[str]] = None) -> List[str]:
+        """
+        Load all non-lazy subsystems in parallel background threads.
+
+        Returns:
+            Names of the subsystems that were started
+        """
+        selected = [
+            s for s in self._subsystems.values()
+            if (names is None or s.name in names) and not s.lazy and s.state == PENDING
+        ]
+        if not selected:
+            return []
+
+        self._startup_pool = ThreadPoolExecutor(max_workers=len(selected), thread_name_prefix="startup")
+        for subsystem in selected:
+            self._startup_pool.submit(subsystem.get)
+        # Threads exit once their loader finishes; nothing else is ever queued
+        self._startup_pool.shutdown(wait=False)
+        return [s.name for s in selected]
+
+    def wait(self, names: Iterable[str], timeout: Optional[float] = None) -> bool:
+        """Block until the given subsystems finished loading (successfully or not)"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for name in names:
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            if not self._subsystems[name]._done.wait(remaining):
+                return False
+        return True
+
+    def readiness(self) -> Dict[str, Dict[str, Any]]:
+        return {name: s.status() for name, s in self._subsystems.items()}
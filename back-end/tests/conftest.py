@@ -0,0 +1,73 @@
+"""Shared fixtures for the API endpoint tests."""
+
+import io
+import os
+
+import pytest
+import torch
+from PIL import Image
+
+
+BACK_END_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class StubClassifier(torch.nn.Module):
+    """Season logits from the mean input channels: deterministic, instant, counts images"""
+
+    def __init__(self):
+        super().__init__()
+        self.weights = torch.tensor([
+            [2.0, -1.0, 0.5, 0.0],
+            [-1.0, 2.0, 0.0, 0.5],
+            [0.5, 0.0, -1.0, 2.0],
+        ])
+        self.images = 0
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        self.images += x.shape[0]
+        return x.mean(dim=(2, 3)) @ self.weights
+
+
+def png_bytes(rgb, size=(64, 48)) -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", size, rgb).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def api(monkeypatch):
+    """
+    The API module with its subsystems restored after the test. Tests reset
+    the subsystems they need (`api.SUBSYSTEMS[name].reset(value)`); nothing
+    loads at startup because the TestClient is used without its lifespan.
+    """
+    import color_analysis_api as api
+
+    saved = [(subsystem, dict(vars(subsystem)), subsystem._done.is_set()) for subsystem in api.SUBSYSTEMS]
+    yield api
+    for subsystem, attributes, done in saved:
+        subsystem.__dict__.update(attributes)
+        if done:
+            subsystem._done.set()
+        else:
+            subsystem._done.clear()
+
+
+@pytest.fixture
+def classifier_api(api, monkeypatch):
+    """API with a stub classifier, the real color engine and a fresh result cache"""
+    from color_recommendation_engine import ColorRecommendationEngineV2
+    from result_cache import ResultCache
+
+    model = StubClassifier()
+    engine = ColorRecommendationEngineV2(os.path.join(BACK_END_DIR, "color_palette_v2.json"))
+    monkeypatch.setattr(api, "ML_MODEL", model)
+    monkeypatch.setattr(api, "COLOR_ENGINE", engine)
+    monkeypatch.setattr(api, "MODEL_VERSION", "stub:1")
+    monkeypatch.setattr(api, "INFERENCE_BATCHER", None)
+    monkeypatch.setattr(api, "RESULT_CACHE", ResultCache())
+    monkeypatch.setattr(api, "PERCEPTUAL_CACHE", None)
+    monkeypatch.setattr(api, "LATENCY_BUDGET_MS", 0)
+    api.SUBSYSTEMS["classifier"].reset(model)
+    api.SUBSYSTEMS["color_engine"].reset(engine)
+    return api
@@ -0,0 +1,140 @@
+"""Tests for /analyze-color/batch."""
+
+import io
+import zipfile
+
+import pytest
+import torch
+from fastapi.testclient import TestClient
+
+from conftest import png_bytes
+from micro_batcher import InferenceBatcher
+
+
+COLORS = [(200, 40, 40), (40, 200, 40), (40, 40, 200), (220, 200, 160)]
+NO_MASKING = {"apply_face_masking": "false"}
+
+
+def zip_bytes(members):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_STORED) as zf:
+        for name, data in members:
+            zf.writestr(name, data)
+    return buffer.getvalue()
+
+
+def analyze_one(client, data):
+    response = client.post("/analyze-color", params=NO_MASKING, files={"image": ("one.png", data, "image/png")})
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+@pytest.fixture
+def client(classifier_api):
+    return TestClient(classifier_api.app)
+
+
+def test_results_keep_request_order_with_per_item_errors(client, classifier_api):
+    images = [png_bytes(color) for color in COLORS]
+    expected = [analyze_one(client, data) for data in images]
+    classifier_api.RESULT_CACHE.clear()
+
+    files = [
+        ("images", ("a.png", images[0], "image/png")),
+        ("images", ("empty.png", b"", "image/png")),
+        ("images", ("b.png", images[1], "image/png")),
+        ("images", ("huge.png", b"\0" * (10 * 1024 * 1024 + 1), "image/png")),
+        ("images", ("text.png", b"not an image", "image/png")),
+        ("images", ("c.png", images[2], "image/png")),
+    ]
+    response = client.post("/analyze-color/batch", params=NO_MASKING, files=files)
+    assert response.status_code == 200, response.text
+    body = response.json()
+
+    assert body["count"] == 6 and body["succeeded"] == 3
+    assert [item["index"] for item in body["results"]] == list(range(6))
+    assert [item["filename"] for item in body["results"]] == [name for _, (name, _, _) in files]
+    for position, image_index in ((0, 0), (2, 1), (5, 2)):
+        item = body["results"][position]
+        assert item["error"] is None
+        assert item["result"]["season"] == expected[image_index]["season"]
+        assert item["result"]["all_probabilities"] == pytest.approx(expected[image_index]["all_probabilities"])
+    errors = {item["filename"]: item["error"] for item in body["results"] if item["result"] is None}
+    assert errors["empty.png"] == "Empty file or file larger than 10MB"
+    assert errors["huge.png"].startswith("File too large")
+    assert errors["text.png"].startswith("Invalid image file")
+
+
+def test_zip_members_follow_the_uploaded_images(client):
+    archive = zip_bytes([
+        ("photos/", b""),
+        ("photos/z.png", png_bytes(COLORS[1])),
+        ("photos/.hidden.png", png_bytes(COLORS[2])),
+        ("notes.txt", b"skipped"),
+        ("a.png", png_bytes(COLORS[3])),
+    ])
+    files = [
+        ("images", ("first.png", png_bytes(COLORS[0]), "image/png")),
+        ("archive", ("photos.zip", archive, "application/zip")),
+    ]
+    body = client.post("/analyze-color/batch", params=NO_MASKING, files=files).json()
+    assert [item["filename"] for item in body["results"]] == ["first.png", "photos/z.png", "a.png"]
+    assert body["succeeded"] == 3
+
+
+def post_archive(client, data):
+    return client.post("/analyze-color/batch", params=NO_MASKING, files=[("archive", ("a.zip", data, "application/zip"))])
+
+
+def test_limits_and_corrupt_archives(client, classifier_api, monkeypatch):
+    monkeypatch.setattr(classifier_api, "BATCH_MAX_IMAGES", 2)
+    image = png_bytes(COLORS[0])
+    files = [("images", (f"{i}.png", image, "image/png")) for i in range(3)]
+    assert client.post("/analyze-color/batch", params=NO_MASKING, files=files).status_code == 413
+
+    archive = zip_bytes([(f"{i}.png", image) for i in range(2)])
+    mixed = [files[0], ("archive", ("a.zip", archive, "application/zip"))]
+    assert client.post("/analyze-color/batch", params=NO_MASKING, files=mixed).status_code == 413
+
+    # CRC mismatch in a stored member
+    corrupt = zip_bytes([("a.png", image), ("b.png", b"A" * 100)]).replace(b"A" * 100, b"B" * 100)
+    response = post_archive(client, corrupt)
+    assert response.status_code == 400 and "b.png" in response.json()["detail"]
+
+    assert post_archive(client, b"not a zip").status_code == 400
+
+    monkeypatch.setattr(classifier_api, "BATCH_MAX_ARCHIVE_MB", 100 / (1024 * 1024))
+    assert post_archive(client, archive).status_code == 413
+
+    assert client.post("/analyze-color/batch", params=NO_MASKING).status_code == 400
+
+
+def test_results_are_shared_with_the_result_cache(client, classifier_api):
+    model = classifier_api.ML_MODEL
+    images = [png_bytes(color) for color in COLORS]
+    analyze_one(client, images[0])
+    assert model.images == 1
+
+    files = [("images", (f"{i}.png", data, "image/png")) for i, data in enumerate(images)]
+    first = client.post("/analyze-color/batch", params=NO_MASKING, files=files).json()
+    # Only the three images not analyzed before reach the classifier
+    assert model.images == 4
+
+    second = client.post("/analyze-color/batch", params=NO_MASKING, files=files).json()
+    assert model.images == 4
+    assert second == first
+    assert analyze_one(client, images[3])["season"] == first["results"][3]["result"]["season"]
+    assert model.images == 4
+
+
+def test_batches_go_through_the_inference_batcher(client, classifier_api, monkeypatch):
+    batcher = InferenceBatcher(classifier_api.ML_MODEL, torch.device("cpu"), max_batch_size=3, max_wait_ms=50)
+    monkeypatch.setattr(classifier_api, "INFERENCE_BATCHER", batcher)
+    try:
+        files = [("images", (f"{i}.png", png_bytes(color), "image/png")) for i, color in enumerate(COLORS)]
+        body = client.post("/analyze-color/batch", params=NO_MASKING, files=files).json()
+        assert body["succeeded"] == 4
+        stats = batcher.get_stats()
+        assert stats["items_processed"] == 4 and stats["largest_batch"] <= 3
+    finally:
+        batcher.stop()
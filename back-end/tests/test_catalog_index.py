@@ -0,0 +1,146 @@
+"""Tests for the in-memory catalog color index and its refresher."""
+
+import random
+from datetime import datetime, timezone
+
+from bson.objectid import ObjectId
+
+from catalog_index import CatalogColorIndex, CatalogIndexRefresher
+from clothing_matcher import matching_photos_query, photo_top_colors
+from memory_mongo import MemoryCollection
+
+
+GENDERS = ["female", "male", "Female", None]
+
+
+def random_photo(rng, vocabulary, oid=None):
+    top2 = rng.sample(vocabulary, 2)
+    if rng.random() < 0.3:
+        top2 = [{"hex": h.upper()} for h in top2]
+    doc = {"_id": oid or ObjectId(bytes(rng.randrange(256) for _ in range(11)) + b"\0"), "top2_colors": top2}
+    gender = rng.choice(GENDERS)
+    if gender is not None:
+        doc["gender"] = gender
+    if rng.random() < 0.05:
+        del doc["top2_colors"]
+    return doc
+
+
+def expected_ids(docs, colors, gender):
+    query = matching_photos_query(colors, gender)
+    collection = MemoryCollection("expected")
+    for doc in docs.values():
+        collection.insert_one(dict(doc, top2_colors_norm=photo_top_colors(doc)))
+    return [str(doc["_id"]) for doc in collection.find(query, {"_id": 1}, sort=[("_id", 1)])]
+
+
+def check_queries(index, docs, vocabulary, rng, count=30):
+    for _ in range(count):
+        colors = rng.sample(vocabulary, rng.randint(0, 6)) + ["#zzzzzz"]
+        gender = rng.choice(["female", "MALE", "other", None])
+        assert index.match(colors, gender) == expected_ids(docs, colors, gender)
+
+
+def test_matches_indexed_query_through_changes_and_compaction():
+    rng = random.Random(0)
+    vocabulary = ["#%06x" % rng.randrange(1 << 24) for _ in range(30)] + ["#abc", "#00ff00"]
+    docs = {}
+    for _ in range(400):
+        doc = random_photo(rng, vocabulary)
+        docs[doc["_id"]] = doc
+
+    index = CatalogColorIndex(compact_threshold=50)
+    assert index.build(docs.values()) == sum(1 for d in docs.values() if "top2_colors" in d)
+    check_queries(index, docs, vocabulary, rng)
+
+    for step in range(300):
+        roll = rng.random()
+        if roll < 0.4:
+            doc = random_photo(rng, vocabulary)
+        elif roll < 0.8:
+            doc = random_photo(rng, vocabulary, oid=rng.choice(list(docs)))
+        else:
+            removed = docs.pop(rng.choice(list(docs)))
+            index.remove(removed["_id"])
+            continue
+        docs[doc["_id"]] = doc
+        index.apply(doc)
+        if step % 25 == 0:
+            check_queries(index, docs, vocabulary, rng, count=5)
+
+    assert index.get_stats()["compactions"] > 0
+    assert len(index) == sum(1 for d in docs.values() if "top2_colors" in d)
+    check_queries(index, docs, vocabulary, rng)
+
+
+def test_pages_continue_after_the_last_id():
+    rng = random.Random(2)
+    vocabulary = ["#%06x" % rng.randrange(1 << 24) for _ in range(10)]
+    docs = [random_photo(rng, vocabulary) for _ in range(300)]
+    index = CatalogColorIndex(compact_threshold=1000)
+    index.build(docs[:200])
+    for doc in docs[200:]:
+        index.apply(doc)
+
+    colors = vocabulary[:4]
+    for gender in (None, "female"):
+        expected = index.match(colors, gender)
+        pages, after = [], None
+        while True:
+            page = index.match(colors, gender, after=after, limit=25)
+            pages.extend(page)
+            if len(page) < 25:
+                break
+            after = page[-1]
+        assert pages == expected and len(expected) > 25
+
+
+def test_polling_refresher_picks_up_inserts_and_updates():
+    photos = MemoryCollection("photos")
+    photos.insert_one({"gender": "female", "top2_colors": ["#aa0000", "#bb0000"]})
+    refresher = CatalogIndexRefresher(CatalogColorIndex(), photos, rebuild_interval_s=0, use_change_stream=True)
+    refresher.start()
+    refresher.stop()
+    assert refresher.mode == "polling"
+    assert len(refresher.index.match(["#aa0000"])) == 1
+
+    new_id = photos.insert_one({"gender": "female", "top2_colors": ["#cc0000"]}).inserted_id
+    first = photos.find_one({"top2_colors": "#aa0000"})["_id"]
+    photos.update_one({"_id": first}, {"$set": {"top2_colors": ["#dd0000"], "updated_at": datetime.now(timezone.utc)}})
+    refresher.poll_once()
+
+    assert refresher.index.match(["#cc0000"], "female") == [str(new_id)]
+    assert refresher.index.match(["#aa0000"]) == []
+    assert refresher.index.match(["#dd0000"]) == [str(first)]
+
+
+class FakeStream:
+    def __init__(self, changes):
+        self.changes = list(changes)
+
+    def try_next(self):
+        return self.changes.pop(0) if self.changes else None
+
+    def close(self):
+        pass
+
+
+def test_change_stream_events_are_applied():
+    photos = MemoryCollection("photos")
+    kept = photos.insert_one({"gender": "male", "top2_colors": ["#aa0000"]}).inserted_id
+    gone = photos.insert_one({"gender": "male", "top2_colors": ["#aa0000"]}).inserted_id
+    added = ObjectId()
+    stream = FakeStream([
+        {"operationType": "insert", "fullDocument": {"_id": added, "gender": "male", "top2_colors": ["#aa0000"]}},
+        {"operationType": "delete", "documentKey": {"_id": gone}},
+        {"operationType": "update", "documentKey": {"_id": kept}, "fullDocument": None},
+    ])
+    photos.watch = lambda **kwargs: stream
+
+    refresher = CatalogIndexRefresher(CatalogColorIndex(), photos)
+    refresher.start()
+    assert refresher.mode == "change_stream"
+    for _ in range(3):
+        refresher._consume_stream()
+    refresher.stop()
+    assert refresher.index.match(["#aa0000"], "male") == [str(added)]
@@ -0,0 +1,54 @@
+"""Tests for the match-color backfill and the indexed /get-matching-clothes query."""
+
+import random
+
+from catalog_migrations import backfill_match_colors, ensure_photo_indexes
+from clothing_matcher import MATCH_COLORS_FIELD, iter_matching_photo_ids, matching_photos_query
+from memory_mongo import MemoryCollection
+
+
+def make_photos(count=300, seed=0):
+    rng = random.Random(seed)
+    vocabulary = ["#%06x" % rng.randrange(1 << 24) for _ in range(40)]
+    photos = MemoryCollection("photos")
+    for i in range(count):
+        top2 = rng.sample(vocabulary, 2)
+        # Mixed shapes and spellings, as in the production catalog
+        if i % 3 == 0:
+            top2 = [{"hex": h.upper()} for h in top2]
+        elif i % 3 == 1:
+            top2 = [h.lstrip("#") + "ff" for h in top2]
+        doc = {"_id": i, "gender": rng.choice(["female", "male"])}
+        if i % 10:
+            doc["top2_colors"] = top2
+        photos.insert_one(doc)
+    return photos, vocabulary
+
+
+def test_backfill_is_incremental():
+    photos, _ = make_photos()
+    assert backfill_match_colors(photos, dry_run=True) == 300
+    assert photos.count_documents({MATCH_COLORS_FIELD: {"$exists": True}}) == 0
+
+    assert backfill_match_colors(photos, batch_size=64) == 300
+    assert backfill_match_colors(photos) == 0
+    assert photos.find_one({"_id": 3})[MATCH_COLORS_FIELD] == [
+        h["hex"].lower() for h in photos.find_one({"_id": 3})["top2_colors"]
+    ]
+    assert photos.find_one({"_id": 10})[MATCH_COLORS_FIELD] == []
+    assert backfill_match_colors(photos, recompute_all=True) == 300
+
+
+def test_indexed_query_matches_scan():
+    photos, vocabulary = make_photos()
+    backfill_match_colors(photos)
+    assert len(ensure_photo_indexes(photos)) == 3
+
+    rng = random.Random(1)
+    for _ in range(50):
+        similar = sorted(rng.sample(vocabulary, rng.randint(0, 8)))
+        gender = rng.choice([None, "female", "Male"])
+        scan_query = {"gender": gender.lower()} if gender else {}
+        expected = list(iter_matching_photo_ids(photos.find(scan_query), set(similar)))
+        indexed = photos.find(matching_photos_query(similar, gender), {"_id": 1}, sort=[("_id", 1)])
+        assert [doc["_id"] for doc in indexed] == expected
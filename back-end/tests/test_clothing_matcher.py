@@ -0,0 +1,51 @@
+"""Tests for the /get-matching-clothes matching helpers."""
+
+import pytest
+
+from clothing_matcher import (
+    collect_similar_colors,
+    decode_cursor,
+    encode_cursor,
+    iter_matching_photo_ids,
+    normalize_hex,
+    photo_top_colors,
+)
+
+
+def test_normalize_hex():
+    assert normalize_hex(" #ABCDEF ") == "#abcdef"
+    assert normalize_hex("abcdef12") == "#abcdef"
+    assert normalize_hex(None) == ""
+    assert normalize_hex("  ") == ""
+
+
+def test_similar_colors_are_normalized_and_deduplicated():
+    docs = [
+        {"primary_color": "#111111", "similar_colors": [{"hex": "#AA0000"}, "bb0000"]},
+        None,
+        {"primary_color": "#222222", "similar_colors": ["#aa0000"]},
+        {"primary_color": "#333333"},
+    ]
+    assert collect_similar_colors(docs) == ["#aa0000", "#bb0000"]
+
+
+def test_matching_keeps_scan_order_and_both_color_shapes():
+    photos = [
+        {"_id": 1, "top2_colors": ["#CC0000", "#aa0000"]},
+        {"_id": 2, "top2_colors": [{"hex": "cc0000"}]},
+        {"_id": 3},
+        {"_id": 4, "top2_colors": [{"hex": "BB0000"}, "#cc0000"]},
+    ]
+    assert photo_top_colors(photos[3]) == ["#bb0000", "#cc0000"]
+    assert list(iter_matching_photo_ids(photos, ["#aa0000", "#bb0000"])) == [1, 4]
+
+
+def test_cursor_round_trip_and_rejects_malformed_tokens():
+    position = {"engine": "lab", "id": "6931c6f7cd874aa7be0f026a", "score": 87.5}
+    token = encode_cursor(position)
+    assert "=" not in token and "/" not in token
+    assert decode_cursor(token) == position
+
+    for token in ("", "%%%", encode_cursor({"id": "xyz"}), encode_cursor({"engine": "id"}), encode_cursor([1])):
+        with pytest.raises(ValueError):
+            decode_cursor(token)
@@ -0,0 +1,165 @@
+"""Tests for the compiled palette arrays of the color recommendation engine."""
+
+import json
+import random
+
+import numpy as np
+import pytest
+
+from color_recommendation_engine import ColorRecommendationEngineV2
+from color_space import hex_to_rgb, rgb_to_lab
+
+
+SEASON_KEYS = {'Autumn': 'autumn', 'Summer': 'summer', 'Winter': 'winter', 'Spring': 'spring'}
+
+
+def weighted_palette_reference(engine, probabilities, primary_count=6, secondary_count=6,
+                               threshold=0.05, boost_factor=1.5):
+    """The entry-by-entry aggregation the compiled arrays replace"""
+    sorted_probs = sorted(probabilities.items(), key=lambda x: x[1], reverse=True)
+    secondary_season = sorted_probs[1][0] if len(sorted_probs) > 1 else None
+    color_map = {}
+    for season_name, probability in probabilities.items():
+        if probability < threshold:
+            continue
+        for color in engine.get_season_data(season_name).get('primary_colors', []):
+            weight = probability * color.get('confidence_multiplier', 1.0)
+            if season_name == secondary_season and probability > 0.20:
+                weight = probability * color.get('confidence_multiplier', 1.0) * boost_factor
+            if color['hex'] in color_map:
+                color_map[color['hex']]['weight'] += weight
+            else:
+                color_map[color['hex']] = {'name': color['name'], 'hex': color['hex'], 'weight': weight}
+    ordered = sorted(color_map.values(), key=lambda x: x['weight'], reverse=True)
+    ordered = [{'name': c['name'], 'hex': c['hex']} for c in ordered]
+    return {
+        'primary': ordered[:primary_count],
+        'secondary': ordered[primary_count:primary_count + secondary_count],
+    }
+
+
+def recommendations_reference(engine, predictions, use_case=None, top_n=20):
+    predictions = predictions / predictions.sum()
+    scores = {season: float(pred * 100) for season, pred in zip(engine.seasons, predictions)}
+    (primary_season, primary_score), (secondary_season, secondary_score) = sorted(
+        scores.items(), key=lambda x: x[1], reverse=True
+    )[:2]
+    all_colors = []
+    for season_name in engine.seasons:
+        for color in engine.data.get(SEASON_KEYS[season_name], {}).get('primary_colors', []):
+            if season_name == primary_season:
+                base_score = primary_score
+            elif season_name == secondary_season:
+                base_score = secondary_score * 0.7
+            else:
+                base_score = min(primary_score, secondary_score) * 0.2
+            use_for = color.get('use_for', [])
+            if use_case and use_case != 'all' and use_case not in use_for and 'all' not in use_for:
+                continue
+            all_colors.append((min(base_score * color.get('confidence_multiplier', 1.0), 100.0), season_name, color))
+    all_colors.sort(key=lambda x: x[0], reverse=True)
+    return [(color['hex'], season, fit) for fit, season, color in all_colors[:top_n]]
+
+
+@pytest.fixture
+def palette_path(tmp_path):
+    """A palette with colors shared across seasons, repeated within a season and renamed"""
+    def color(name, hex_code, multiplier=None, use_for=('tops',)):
+        entry = {'name': name, 'hex': hex_code, 'use_for': list(use_for)}
+        if multiplier is not None:
+            entry['confidence_multiplier'] = multiplier
+        return entry
+
+    data = {
+        'autumn': {'primary_colors': [
+            color('Rust', '#b7410e', 1.2), color('Olive', '#808000', 1.0, ('all',)),
+            color('Camel', '#c19a6b', 0.9, ('accessories',)), color('Rust again', '#b7410e', 0.5),
+        ], 'neutral_colors': [color('Chocolate', '#3f2a14')]},
+        'summer': {'primary_colors': [
+            color('Lavender', '#b57edc', 1.1), color('Green olive', '#808000', 1.0),
+            color('Powder', '#b0e0e6'), color('Slate', '#708090', 1.0, ('dresses',)),
+        ]},
+        'winter': {'primary_colors': [
+            color('Black', '#000000', 1.3), color('Powder blue', '#b0e0e6', 0.8),
+            color('Ruby', '#9b111e', 1.2), color('Icy', '#f0f8ff', 1.0, ('dresses', 'tops')),
+            color('White', '#ffffff', 1.2), color('Navy', '#000080', 1.0),
+            color('Emerald', '#50c878', 1.0), color('Plum', '#8e4585', 0.9),
+        ], 'neutral_colors': [color('Charcoal', '#36454f'), color('Grey', '#808080')]},
+        'spring': {'primary_colors': []},
+    }
+    path = tmp_path / 'palette.json'
+    path.write_text(json.dumps(data))
+    return str(path)
+
+
+def test_color_space_known_values():
+    assert hex_to_rgb('#FF8000').tolist() == [255, 128, 0]
+    np.testing.assert_allclose(rgb_to_lab([255, 0, 0]), [53.2408, 80.0925, 67.2032], atol=1e-3)
+    np.testing.assert_allclose(rgb_to_lab([[255, 255, 255], [0, 0, 0]]), [[100, 0, 0], [0, 0, 0]], atol=1e-3)
+    with pytest.raises(ValueError):
+        hex_to_rgb('#fff')
+
+
+def test_compiled_arrays(palette_path):
+    engine = ColorRecommendationEngineV2(palette_path)
+    assert len(engine.color_hex) == len(set(engine.color_hex)) == 13
+    assert engine.color_lab.shape == (13, 3)
+    assert len(engine.occ_season) == 16
+    # Rust is repeated within Autumn, so Autumn gets a second membership row
+    assert [len(rows) for rows in engine._season_rows] == [2, 1, 1, 0]
+    rust = engine.color_hex.index('#b7410e')
+    assert engine.membership[engine._season_rows[0], rust].tolist() == [1.2, 0.5]
+    assert engine.membership[:, rust].sum() == pytest.approx(1.7)
+
+
+def test_season_palette_unchanged(palette_path):
+    engine = ColorRecommendationEngineV2(palette_path)
+    winter = engine.get_palette_for_season('Winter')
+    assert [c['name'] for c in winter['primary']] == ['Black', 'Powder blue', 'Ruby', 'Icy', 'White', 'Navy']
+    assert [c['name'] for c in winter['secondary']] == ['Emerald', 'Plum', 'Charcoal', 'Grey']
+    winter['primary'].clear()
+    assert len(engine.get_palette_for_season('Winter')['primary']) == 6
+    with pytest.raises(ValueError):
+        engine.get_palette_for_season('Monsoon')
+
+
+@pytest.mark.parametrize('path', ['color_palette_v2.json', None])
+def test_weighted_palette_matches_reference(path, palette_path):
+    engine = ColorRecommendationEngineV2(path or palette_path)
+    rng = random.Random(7)
+    for i in range(300):
+        seasons = list(engine.seasons)
+        rng.shuffle(seasons)
+        if i % 3 == 0:
+            # Repeated probabilities produce exact weight ties
+            probabilities = {season: rng.choice([0.04, 0.1, 0.25, 0.3]) for season in seasons[:rng.randint(0, 4)]}
+        else:
+            probabilities = dict(zip(seasons, np.random.default_rng(i).dirichlet(np.ones(4)).tolist()))
+        kwargs = dict(primary_count=rng.randint(-1, 10), secondary_count=rng.randint(-1, 10),
+                      threshold=rng.choice([0.0, 0.05, 0.2]), boost_factor=rng.choice([1.0, 1.5, 3.0]))
+        expected = weighted_palette_reference(engine, probabilities, **kwargs)
+        kwargs['min_probability_threshold'] = kwargs.pop('threshold')
+        kwargs['secondary_boost_factor'] = kwargs.pop('boost_factor')
+        assert engine.get_weighted_palette_for_probabilities(probabilities, **kwargs) == expected
+
+
+def test_weighted_palette_names_colors_after_first_included_entry(palette_path):
+    engine = ColorRecommendationEngineV2(palette_path)
+    palette = engine.get_weighted_palette_for_probabilities({'Summer': 0.5, 'Autumn': 0.5}, primary_count=20)
+    names = {c['hex']: c['name'] for c in palette['primary']}
+    assert names['#808000'] == 'Green olive'
+    assert names['#b7410e'] == 'Rust'
+    assert engine.get_weighted_palette_for_probabilities({'Spring': 1.0}) == {'primary': [], 'secondary': []}
+
+
+@pytest.mark.parametrize('path', ['color_palette_v2.json', None])
+def test_recommendations_match_reference(path, palette_path):
+    engine = ColorRecommendationEngineV2(path or palette_path)
+    rng = random.Random(11)
+    use_cases = [None, 'all', 'tops', 'dresses', 'accessories', 'unknown']
+    for i in range(200):
+        predictions = np.random.default_rng(i).random(4) if i % 4 else np.full(4, 0.25)
+        use_case, top_n = rng.choice(use_cases), rng.randint(-2, 40)
+        result = engine.get_recommendations(predictions, use_case=use_case, top_n=top_n)
+        got = [(c['hex'], c['season'], c['fit_score']) for c in result['recommended_colors']]
+        assert got == recommendations_reference(engine, predictions, use_case, top_n)
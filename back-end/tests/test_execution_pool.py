@@ -0,0 +1,78 @@
+"""Tests for the cpu and ingestion pools of the execution layer."""
+
+import asyncio
+import contextvars
+import os
+import threading
+import time
+
+import pytest
+
+from execution_pool import PipelineExecutor
+
+
+REQUEST_ID = contextvars.ContextVar("request_id", default=None)
+
+
+@pytest.fixture
+def executor():
+    executor = PipelineExecutor(cpu_workers=2, ingest_workers=1)
+    yield executor
+    executor.shutdown()
+
+
+def test_run_cpu_sees_the_callers_context_variables(executor):
+    def read_and_set():
+        seen = REQUEST_ID.get()
+        REQUEST_ID.set("changed on the pool")
+        return seen, threading.current_thread().name
+
+    async def run():
+        REQUEST_ID.set("req-1")
+        seen, thread = await executor.run_cpu(read_and_set)
+        return seen, thread, REQUEST_ID.get()
+
+    seen, thread, after = asyncio.run(run())
+    assert seen == "req-1" and thread.startswith("cpu-pool")
+    # The pool ran in a copy: its changes do not leak back into the request
+    assert after == "req-1"
+
+
+def test_run_cpu_is_bounded_by_the_pool_size(executor):
+    lock = threading.Lock()
+    running, peak = 0, 0
+
+    def work(i):
+        nonlocal running, peak
+        with lock:
+            running += 1
+            peak = max(peak, running)
+        time.sleep(0.05)
+        with lock:
+            running -= 1
+        return i
+
+    async def run():
+        return await asyncio.gather(*(executor.run_cpu(work, i) for i in range(6)))
+
+    assert asyncio.run(run()) == list(range(6))
+    assert peak == 2
+    stats = executor.get_stats()
+    assert stats["in_flight"] == {"cpu": 0, "ingest": 0}
+    assert stats["completed"] == {"cpu": 6, "ingest": 0}
+
+
+@pytest.mark.parametrize("kind", ["thread", "process"])
+def test_ingest_pool_kind(kind):
+    executor = PipelineExecutor(ingest_kind=kind)
+    try:
+        pid = asyncio.run(executor.run_ingest(os.getpid))
+    finally:
+        executor.shutdown()
+    assert (pid == os.getpid()) == (kind == "thread")
+    assert executor.get_stats()["ingest_kind"] == kind
+
+
+def test_unknown_ingest_kind_is_rejected():
+    with pytest.raises(ValueError):
+        PipelineExecutor(ingest_kind="fiber")
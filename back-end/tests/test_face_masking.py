@@ -0,0 +1,200 @@
+"""Tests for the multi-resolution face masking path (facer replaced by fakes)."""
+
+import io
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+import torch
+from PIL import Image
+
+from face_masking_preprocessor import FaceMaskingPreprocessor, pad_to_batch, parser_window
+from image_pipeline import decode_image
+from micro_batcher import FaceMaskingBatcher
+
+
+class FakeDetector:
+    """One face at a fixed relative position of each image's content (black = padding / no face)"""
+
+    def __init__(self):
+        self.input_sizes = []
+        self.calls = 0
+
+    def __call__(self, images):
+        n, _, h, w = images.shape
+        self.calls += 1
+        self.input_sizes.append((w, h))
+        rects, points, image_ids = [], [], []
+        for image_id in range(n):
+            content = images[image_id].amax(dim=0) > 0
+            rows = torch.nonzero(content.any(dim=1)).flatten()
+            cols = torch.nonzero(content.any(dim=0)).flatten()
+            if rows.numel() == 0:
+                continue
+            cw, ch = cols[-1].item() + 1, rows[-1].item() + 1
+            cx, cy, size = 0.5 * cw, 0.45 * ch, 0.25 * min(cw, ch)
+            points.append([
+                [cx - 0.2 * size, cy - 0.1 * size], [cx + 0.2 * size, cy - 0.1 * size],
+                [cx, cy + 0.05 * size],
+                [cx - 0.15 * size, cy + 0.25 * size], [cx + 0.15 * size, cy + 0.25 * size],
+            ])
+            rects.append([cx - size / 2, cy - size / 2, cx + size / 2, cy + size / 2])
+            image_ids.append(image_id)
+        return {
+            "rects": torch.tensor(rects).reshape(-1, 4),
+            "points": torch.tensor(points).reshape(-1, 5, 2),
+            "scores": torch.full((len(image_ids),), 0.9),
+            "image_ids": torch.tensor(image_ids, dtype=torch.int64),
+        }
+
+
+class FakeParser:
+    """Labels a skin box around each face's landmarks, in the coordinates of its input"""
+
+    def __init__(self):
+        self.input_sizes = []
+        self.calls = 0
+
+    def __call__(self, images, data):
+        _, _, h, w = images.shape
+        self.calls += 1
+        self.input_sizes.append((w, h))
+        yy, xx = torch.meshgrid(torch.arange(h) + 0.5, torch.arange(w) + 0.5, indexing="ij")
+        logits = torch.zeros(len(data["image_ids"]), 19, h, w)
+        logits[:, 0] = 1.0
+        for k, lm in enumerate(data["points"]):
+            eye_distance = (lm[1, 0] - lm[0, 0]).item()
+            x1, x2 = lm[0, 0].item() - eye_distance, lm[1, 0].item() + eye_distance
+            y1, y2 = lm[0, 1].item() - eye_distance, lm[4, 1].item() + eye_distance / 2
+            logits[k, 2][(xx >= x1) & (xx < x2) & (yy >= y1) & (yy < y2)] = 2.0
+        data["seg"] = {"logits": logits}
+        return data
+
+
+def _preprocessor(detect_max_side: int, parse_max_side: int) -> FaceMaskingPreprocessor:
+    preprocessor = FaceMaskingPreprocessor.__new__(FaceMaskingPreprocessor)
+    preprocessor.device = torch.device("cpu")
+    preprocessor.detect_max_side = detect_max_side
+    preprocessor.parse_max_side = parse_max_side
+    preprocessor.mask_regions = "skin_hair"
+    preprocessor.face_detector = FakeDetector()
+    preprocessor.face_parser = FakeParser()
+    return preprocessor
+
+
+def _photo(width: int, height: int) -> bytes:
+    y, x = np.mgrid[0:height, 0:width]
+    pixels = np.stack([x * 255 // width, y * 255 // height, np.full_like(x, 128)], axis=-1).astype(np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def test_multires_matches_full_frame_with_smaller_working_sizes():
+    decoded = decode_image(_photo(2400, 1800))
+    full = _preprocessor(0, 0)
+    multires = _preprocessor(640, 448)
+
+    full_image, full_mask = full.process_image(decoded)
+    multires_image, multires_mask = multires.process_image(decoded)
+
+    assert full.face_parser.input_sizes == [(2400, 1800)]
+    assert max(multires.face_detector.input_sizes[0]) == 640
+    assert max(multires.face_parser.input_sizes[0]) <= 448
+
+    assert (full_mask != multires_mask).mean() < 0.02
+    diff = np.abs(np.asarray(full_image, dtype=np.int16) - np.asarray(multires_image, dtype=np.int16))
+    assert diff.mean() < 2.0
+
+
+def test_parser_window_contains_aligned_square_and_is_clipped():
+    points = torch.tensor([[90.0, 100.0], [110.0, 100.0], [100.0, 110.0], [92.0, 120.0], [108.0, 120.0]])
+    rect = torch.tensor([80.0, 80.0, 120.0, 130.0])
+    x1, y1, x2, y2 = parser_window(points, rect, 1000, 1000)
+    # half size = max(2 * 20, 1.8 * 20) = 40 around (100, 102)
+    assert x1 <= 60 and y1 <= 62 and x2 >= 140 and y2 >= 142
+
+    assert parser_window(points, rect, 150, 150)[2:] == (150, 150)
+
+
+def test_batch_matches_single_images_with_one_detector_and_parser_call():
+    images = [decode_image(_photo(1600, 1200)), decode_image(_photo(900, 1400)), decode_image(_photo(640, 480))]
+    single = _preprocessor(640, 448)
+    expected = [single.process_image(decoded) for decoded in images]
+
+    batched = _preprocessor(640, 448)
+    results = batched.process_batch(images)
+
+    assert batched.face_detector.calls == 1 and batched.face_parser.calls == 1
+    # Padded to the largest width and height of the batch
+    assert batched.face_detector.input_sizes == [(640, 640)]
+    for (image, mask), (expected_image, expected_mask) in zip(results, expected):
+        assert np.array_equal(mask, expected_mask)
+        assert np.array_equal(np.asarray(image), np.asarray(expected_image))
+
+
+def test_batch_falls_back_per_image_without_a_face():
+    buffer = io.BytesIO()
+    Image.new("RGB", (800, 600)).save(buffer, format="PNG")
+    images = [decode_image(_photo(1200, 900)), decode_image(buffer.getvalue())]
+
+    (face, face_mask), (original, no_mask) = _preprocessor(640, 448).process_batch(images)
+
+    assert face.size == (224, 224) and face_mask is not None
+    assert original is images[1].pil and no_mask is None
+
+
+def test_pad_to_batch_anchors_images_top_left():
+    small = np.full((2, 3, 3), 7, dtype=np.uint8)
+    large = np.full((4, 2, 3), 9, dtype=np.uint8)
+    batch = pad_to_batch([small, large])
+    assert batch.shape == (2, 3, 4, 3)
+    assert batch[0, :, :2, :3].eq(7).all() and batch[0, :, 2:].eq(0).all()
+    assert batch[1, :, :, :2].eq(9).all() and batch[1, :, :, 2:].eq(0).all()
+
+
+def test_face_batcher_splits_results_and_errors_per_caller():
+    preprocessor = _preprocessor(640, 448)
+    images = [decode_image(_photo(1200, 900)), decode_image(_photo(700, 700))]
+    expected = [_preprocessor(640, 448).process_image(decoded)[1] for decoded in images]
+
+    def crop_or_fail(image_rgb, merged_mask, *args):
+        if image_rgb.shape[0] == 700:
+            raise ValueError("bad crop")
+        return original_crop(image_rgb, merged_mask, *args)
+
+    original_crop = preprocessor._crop_and_resize
+    preprocessor._crop_and_resize = crop_or_fail
+
+    batcher = FaceMaskingBatcher(preprocessor, max_batch_size=4, max_wait_ms=200)
+    try:
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            futures = [pool.submit(batcher.process, (decoded, (224, 224))) for decoded in images]
+            _, mask = futures[0].result(timeout=10)
+            with pytest.raises(ValueError):
+                futures[1].result(timeout=10)
+    finally:
+        batcher.stop()
+
+    assert np.array_equal(mask, expected[0])
+    assert preprocessor.face_parser.calls == 1
+    assert batcher.get_stats()["largest_batch"] == 2
+
+
+def test_box_crop_skips_parser_and_honours_detector_override():
+    preprocessor = _preprocessor(640, 448)
+    decoded = decode_image(_photo(2000, 1500))
+
+    image, mask = preprocessor.process_image(decoded, parse=False, detect_max_side=320)
+
+    assert mask is None and image.size == (224, 224)
+    assert preprocessor.face_parser.calls == 0
+    assert max(preprocessor.face_detector.input_sizes[0]) == 320
+
+
+def test_box_crop_without_face_falls_back_to_original():
+    buffer = io.BytesIO()
+    Image.new("RGB", (300, 200)).save(buffer, format="PNG")
+    decoded = decode_image(buffer.getvalue())
+    image, mask = _preprocessor(640, 448).process_image(decoded, parse=False)
+    assert image is decoded.pil and mask is None
@@ -0,0 +1,274 @@
+"""Tests for CIEDE2000 and the perceptual garment search index."""
+
+import random
+
+import numpy as np
+import pytest
+from bson.objectid import ObjectId
+
+import garment_search
+from catalog_index import CatalogIndexRefresher
+from color_space import delta_e_2000, hexes_to_rgb, rgb_to_lab
+from garment_search import GarmentColorIndex, garment_colors
+from memory_mongo import MemoryCollection
+
+
+# Sharma, Wu & Dalal (2005) CIEDE2000 test data
+SHARMA_PAIRS = [
+    ((50.0, 2.6772, -79.7751), (50.0, 0.0, -82.7485), 2.0425),
+    ((50.0, 3.1571, -77.2803), (50.0, 0.0, -82.7485), 2.8615),
+    ((50.0, 2.5, 0.0), (50.0, 0.0, -2.5), 4.3065),
+    ((50.0, 2.49, -0.001), (50.0, -2.49, 0.0011), 7.2195),
+    ((50.0, -0.001, 2.49), (50.0, 0.0009, -2.49), 4.8045),
+    ((50.0, 2.5, 0.0), (56.0, -27.0, -3.0), 31.9030),
+    ((60.2574, -34.0099, 36.2677), (60.4626, -34.1751, 39.4387), 1.2644),
+    ((63.0109, -31.0961, -5.8663), (62.8187, -29.7946, -4.0864), 1.2630),
+    ((22.7233, 20.0904, -46.6940), (23.0331, 14.9730, -42.5619), 2.0373),
+    ((2.0776, 0.0795, -1.1350), (0.9033, -0.0636, -0.5514), 0.9082),
+]
+
+
+def test_delta_e_2000_reference_pairs():
+    lab1 = np.array([pair[0] for pair in SHARMA_PAIRS])
+    lab2 = np.array([pair[1] for pair in SHARMA_PAIRS])
+    expected = np.array([pair[2] for pair in SHARMA_PAIRS])
+    np.testing.assert_allclose(delta_e_2000(lab1, lab2), expected, atol=1e-4)
+    np.testing.assert_allclose(delta_e_2000(lab2, lab1), expected, atol=1e-4)
+
+
+def test_garment_colors_weights_by_coverage():
+    doc = {"colors_sorted": {
+        "1": {"color": "#AA0000", "percentage": 60},
+        "2": {"color": "#00aa00", "percentage": 38},
+        "3": {"color": "#0000aa", "percentage": 2},
+        "4": {"color": "not a color", "percentage": 0},
+    }}
+    assert garment_colors(doc) == {0xaa0000: 0.6, 0x00aa00: 0.38, 0x0000aa: 0.02}
+    assert garment_colors(doc, min_coverage=0.05) == {0xaa0000: 0.6, 0x00aa00: 0.38}
+    assert garment_colors({"top2_colors": [{"hex": "#aa0000"}, "aa0000"]}) == {0xaa0000: 1.0}
+    assert garment_colors({"colors_sorted": [{"color": "#aa0000"}, {"color": "#bb0000"}]}) == {
+        0xaa0000: 0.5, 0xbb0000: 0.5
+    }
+    assert garment_colors({"gender": "female"}) == {}
+
+
+GENDERS = ["female", "male", None]
+
+
+def random_photo(rng, vocabulary, oid=None):
+    colors = rng.sample(vocabulary, rng.randint(1, 5))
+    doc = {"_id": oid or ObjectId(bytes(rng.randrange(256) for _ in range(11)) + b"\0")}
+    if rng.random() < 0.2:
+        doc["top2_colors"] = colors[:2]
+    else:
+        doc["colors_sorted"] = {
+            str(i): {"color": c, "percentage": rng.randint(1, 60)} for i, c in enumerate(colors, start=1)
+        }
+    gender = rng.choice(GENDERS)
+    if gender is not None:
+        doc["gender"] = gender
+    return doc
+
+
+def brute_force(docs, colors, gender, max_delta_e, min_coverage):
+    """Every garment scored against every requested color, best first"""
+    query_labs = rgb_to_lab(hexes_to_rgb(colors))
+    scored = []
+    for doc in docs.values():
+        if gender and doc.get("gender") != gender.lower():
+            continue
+        coverage = garment_colors(doc, min_coverage)
+        if not coverage:
+            continue
+        labs = rgb_to_lab(hexes_to_rgb(["#%06x" % code for code in coverage]))
+        similarity = np.clip(1.0 - delta_e_2000(query_labs[:, None], labs[None]) / max_delta_e, 0.0, None)
+        score = 100.0 * float(np.dot(list(coverage.values()), similarity.max(axis=0)))
+        if score > 0:
+            scored.append((-score, doc["_id"].binary, round(score, 2)))
+    scored.sort()
+    return [(oid.hex(), score) for _, oid, score in scored]
+
+
+def check_searches(index, docs, vocabulary, rng, count=20):
+    for _ in range(count):
+        colors = [c for c in rng.sample(vocabulary, rng.randint(1, 4))]
+        gender = rng.choice(["female", "MALE", "other", None])
+        expected = brute_force(docs, colors, gender, index.max_delta_e, index.min_coverage)
+
+        total, results = index.search(colors + ["#zzzzzz"], gender, limit=None)
+        assert total == len(expected)
+        # Same garments and scores (up to float32 rounding), ranked by score then _id
+        expected_scores = dict(expected)
+        assert {oid for oid, _ in results} == set(expected_scores)
+        for oid, score in results:
+            assert abs(score - expected_scores[oid]) <= 0.02
+        assert results == sorted(results, key=lambda result: (-result[1], result[0]))
+
+        # Pages are slices of the full ranking
+        offset = rng.randint(0, max(0, total - 1))
+        assert index.search(colors, gender, limit=7, offset=offset)[1] == results[offset:offset + 7]
+
+
+@pytest.fixture
+def exhaustive_radius(monkeypatch):
+    # Every indexed color becomes a candidate, so results must equal the brute force exactly
+    monkeypatch.setattr(garment_search, "SEARCH_RADIUS_FACTOR", 50.0)
+
+
+def test_search_matches_brute_force_through_changes_and_compaction(exhaustive_radius):
+    rng = random.Random(0)
+    # Clusters of nearby colors, so garments have partial similarities
+    centers = [(rng.randrange(256), rng.randrange(256), rng.randrange(256)) for _ in range(8)]
+    vocabulary = sorted({
+        "#%02x%02x%02x" % tuple(min(255, max(0, v + rng.randint(-20, 20))) for v in center)
+        for center in centers for _ in range(6)
+    })
+    docs = {}
+    for _ in range(300):
+        doc = random_photo(rng, vocabulary)
+        docs[doc["_id"]] = doc
+
+    index = GarmentColorIndex(max_delta_e=12.0, min_coverage=0.05, compact_threshold=40)
+    assert index.build(docs.values()) == len(docs)
+    check_searches(index, docs, vocabulary, rng)
+
+    for step in range(200):
+        roll = rng.random()
+        if roll < 0.4:
+            doc = random_photo(rng, vocabulary)
+        elif roll < 0.8:
+            doc = random_photo(rng, vocabulary, oid=rng.choice(list(docs)))
+        else:
+            removed = docs.pop(rng.choice(list(docs)))
+            index.remove(removed["_id"])
+            continue
+        docs[doc["_id"]] = doc
+        index.apply(doc)
+        if step % 25 == 0:
+            check_searches(index, docs, vocabulary, rng, count=4)
+
+    assert index.get_stats()["compactions"] > 0
+    assert len(index) == len(docs)
+    check_searches(index, docs, vocabulary, rng)
+
+
+def test_cursor_pages_follow_the_ranking():
+    rng = random.Random(3)
+    vocabulary = ["#%02x0000" % v for v in range(0, 256, 8)]
+    docs = [random_photo(rng, vocabulary) for _ in range(300)]
+    index = GarmentColorIndex(max_delta_e=15.0)
+    index.build(docs)
+
+    total, ranked = index.search(["#800000"], limit=None)
+    pages, after = [], None
+    while True:
+        _, page = index.search(["#800000"], limit=30, after=after)
+        pages.extend(page)
+        if len(page) < 30:
+            break
+        after = (page[-1][1], page[-1][0])
+    assert pages == ranked and total > 60
+    # Ties in score are common here, so continuing after one relies on the _id
+    assert len({score for _, score in ranked}) < len(ranked)
+
+
+def test_default_radius_finds_close_colors():
+    rng = random.Random(1)
+    docs = {}
+    for _ in range(500):
+        doc = random_photo(rng, ["#%06x" % rng.randrange(1 << 24) for _ in range(5)])
+        docs[doc["_id"]] = doc
+    index = GarmentColorIndex(max_delta_e=10.0)
+    index.build(docs.values())
+
+    found = expected = 0
+    for _ in range(40):
+        colors = ["#%06x" % rng.randrange(1 << 24) for _ in range(3)]
+        reference = {oid for oid, _ in brute_force(docs, colors, None, 10.0, index.min_coverage)}
+        expected += len(reference)
+        found += len(reference & {oid for oid, _ in index.search(colors, limit=None)[1]})
+    assert expected > 0
+    assert found / expected >= 0.98
+
+
+def test_refresher_keeps_garment_index_in_sync():
+    photos = MemoryCollection("photos")
+    first = photos.insert_one({
+        "gender": "female",
+        "colors_sorted": {"1": {"color": "#aa0000", "percentage": 80}, "2": {"color": "#ffffff", "percentage": 20}},
+    }).inserted_id
+    refresher = CatalogIndexRefresher(
+        GarmentColorIndex(), photos, rebuild_interval_s=0, use_change_stream=False, name="Garment search"
+    )
+    refresher.start()
+    refresher.stop()
+
+    total, results = refresher.index.search(["#ab0101"], "female")
+    assert total == 1 and results[0][0] == str(first) and 70 < results[0][1] < 80
+
+    second = photos.insert_one({"gender": "female", "top2_colors": ["#aa0000", "#aa0000"]}).inserted_id
+    refresher.poll_once()
+    total, results = refresher.index.search(["#aa0000"])
+    assert [oid for oid, _ in results] == [str(second), str(first)]
+    assert [score for _, score in results] == [100.0, 80.0]
+    assert refresher.index.search(["#aa0000"], "male") == (0, [])
+
+
+@pytest.fixture
+def search_client(api):
+    from fastapi.testclient import TestClient
+
+    rng = random.Random(5)
+    vocabulary = ["#%06x" % rng.randrange(1 << 24) for _ in range(12)]
+    docs = [random_photo(rng, vocabulary) for _ in range(200)]
+    # An exact and a near (dE ~2.7) match for #800000
+    docs.append({"_id": ObjectId(), "gender": "female", "top2_colors": ["#800000"]})
+    docs.append({"_id": ObjectId(), "gender": "female", "top2_colors": ["#8c0a0a"]})
+    index = GarmentColorIndex()
+    index.build(docs)
+    api.SUBSYSTEMS["garment_search"].reset(index)
+    return TestClient(api.app), {str(doc["_id"]): doc for doc in docs}, vocabulary
+
+
+def test_search_clothes_endpoint_filters_and_pages(search_client, api):
+    client, docs, vocabulary = search_client
+    colors = vocabulary[:1]
+    completed = api.EXECUTOR.get_stats()["completed"]["cpu"]
+
+    full = client.post("/search-clothes", params={"limit": 100}, json=colors).json()
+    assert api.EXECUTOR.get_stats()["completed"]["cpu"] == completed + 1
+    ranked = [(item["doc_id"], item["score"]) for item in full["results"]]
+    assert full["total"] == len(ranked) > 10
+    assert full["results"][0]["image_url"].endswith(f"doc_id={ranked[0][0]}")
+
+    page = client.post("/search-clothes", params={"limit": 5, "offset": 3}, json=colors).json()
+    assert (page["total"], page["offset"], page["limit"]) == (full["total"], 3, 5)
+    assert [(item["doc_id"], item["score"]) for item in page["results"]] == ranked[3:8]
+
+    female = client.post("/search-clothes", params={"gender": "female", "limit": 100}, json=colors).json()
+    assert female["results"] and all(docs[item["doc_id"]]["gender"] == "female" for item in female["results"])
+    assert [item["doc_id"] for item in female["results"]] == [
+        doc_id for doc_id, _ in ranked if docs[doc_id].get("gender") == "female"
+    ]
+
+
+def test_search_clothes_endpoint_bounds(search_client):
+    client, _, _ = search_client
+    assert client.post("/search-clothes", params={"max_delta_e": 3}, json=["#800000"]).json()["total"] == 2
+    assert client.post("/search-clothes", params={"max_delta_e": 2}, json=["#800000"]).json()["total"] == 1
+
+    for params in ({"max_delta_e": 0}, {"max_delta_e": 101}, {"limit": 0}, {"limit": 101}, {"offset": -1}):
+        assert client.post("/search-clothes", params=params, json=["#800000"]).status_code == 422
+
+
+def test_search_clothes_is_unavailable_until_the_index_loads(api, monkeypatch):
+    from fastapi.testclient import TestClient
+
+    def unreachable():
+        raise RuntimeError("catalog unreachable")
+
+    subsystem = api.SUBSYSTEMS["garment_search"]
+    subsystem.reset(None)
+    monkeypatch.setattr(subsystem, "loader", unreachable)
+    response = TestClient(api.app).post("/search-clothes", json=["#800000"])
+    assert response.status_code == 503 and "catalog unreachable" in response.json()["detail"]
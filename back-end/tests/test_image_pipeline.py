@@ -0,0 +1,59 @@
+"""Tests for the single-decode image pipeline."""
+
+import io
+
+import numpy as np
+import pytest
+import torch
+from PIL import Image
+
+from image_pipeline import decode_image, to_model_tensor
+
+
+def _encode(image: Image.Image, fmt: str = "JPEG", **kwargs) -> bytes:
+    buffer = io.BytesIO()
+    image.save(buffer, format=fmt, **kwargs)
+    return buffer.getvalue()
+
+
+def _gradient(width: int, height: int) -> Image.Image:
+    y, x = np.mgrid[0:height, 0:width]
+    pixels = np.stack([x * 255 // width, y * 255 // height, (x + y) * 255 // (width + height)], axis=-1)
+    return Image.fromarray(pixels.astype(np.uint8))
+
+
+def test_large_jpeg_is_decoded_at_reduced_scale():
+    decoded = decode_image(_encode(_gradient(4000, 3000)), draft_min_side=1024)
+    assert decoded.source_size == (4000, 3000)
+    assert decoded.draft_scale == 2
+    assert decoded.size == (2000, 1500)
+
+    full = decode_image(_encode(_gradient(4000, 3000)), draft_min_side=0)
+    assert full.size == (4000, 3000) and full.draft_scale == 1
+
+
+def test_orientation_and_mode_are_normalized_once():
+    exif = Image.Exif()
+    exif[0x0112] = 6  # rotated 90 degrees clockwise
+    decoded = decode_image(_encode(_gradient(640, 480), exif=exif))
+    assert decoded.size == (480, 640)
+    assert decoded.pil.mode == "RGB"
+
+    rgba = decode_image(_encode(Image.new("RGBA", (32, 16), (10, 20, 30, 128)), fmt="PNG"))
+    assert rgba.pil.mode == "RGB"
+    assert rgba.array.shape == (16, 32, 3)
+    assert rgba.array is rgba.array  # one shared copy
+
+
+def test_fused_tensor_matches_torchvision():
+    transforms = pytest.importorskip("torchvision.transforms")
+    reference = transforms.Compose([
+        transforms.Resize((224, 224)),
+        transforms.ToTensor(),
+        transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225]),
+    ])
+
+    for image in (_gradient(640, 480), _gradient(224, 224)):
+        fused = to_model_tensor(image, (224, 224))
+        assert fused.shape == (3, 224, 224) and fused.is_contiguous()
+        assert torch.allclose(fused, reference(image), atol=1e-5)
@@ -0,0 +1,27 @@
+"""Tests for the reported mode of reduced-precision inference."""
+
+import torch
+from torch import nn
+
+import inference_modes
+from inference_modes import prepare_model_for_mode
+
+
+def tiny_classifier():
+    return nn.Sequential(nn.Conv2d(3, 4, 3), nn.AdaptiveAvgPool2d(1), nn.Flatten(), nn.Linear(4, 4))
+
+
+def test_applied_mode_is_reported():
+    model, mode = prepare_model_for_mode(tiny_classifier(), "fp32")
+    assert mode == "fp32"
+
+    model, mode = prepare_model_for_mode(tiny_classifier(), "channels_last")
+    assert mode == "channels_last"
+    assert model(torch.rand(2, 3, 8, 8)).shape == (2, 4)
+
+
+def test_bf16_without_cpu_support_reports_fp32(monkeypatch):
+    monkeypatch.setattr(inference_modes, "bf16_supported", lambda: False)
+    fp32 = tiny_classifier()
+    model, mode = prepare_model_for_mode(fp32, "bf16")
+    assert mode == "fp32" and model is fp32
@@ -0,0 +1,77 @@
+"""Tests for per-request latency budgets and the degraded pipeline options."""
+
+import asyncio
+
+import pytest
+
+from latency_budget import Deadline, StageCostModel
+from perceptual_cache import PerceptualCache
+from result_cache import CachedAnalysis, ResultCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_cost_model_learns_and_relaxes_toward_default():
+    costs = StageCostModel({"parse": 100.0}, alpha=0.5)
+    costs.observe("parse", 40.0)  # first observation replaces the seed
+    assert costs.estimate("parse") == 40.0
+    costs.observe("parse", 80.0)
+    assert costs.estimate("parse") == 60.0
+
+    costs.observe("parse", 1000.0)
+    costs.relax("parse")
+    assert costs.estimate("parse") == (530.0 + 100.0) / 2
+    assert costs.get_stats()["parse"]["observations"] == 3
+
+
+def test_deadline_chooses_first_affordable_option():
+    clock = FakeClock()
+    costs = StageCostModel({"full": 300.0, "box": 50.0, "classify": 100.0})
+    deadline = Deadline(500.0, costs, clock=clock)
+    assert deadline.choose(["full", "box"], then=["classify"]) == "full"
+
+    clock.now += 0.250  # 250ms spent: 250 left
+    assert deadline.choose(["full", "box"], then=["classify"]) == "box"
+    clock.now += 0.200
+    assert deadline.choose(["full", "box"], then=["classify"]) is None
+
+    with deadline.stage("classify"):
+        clock.now += 0.040
+    assert deadline.stage_ms["classify"] == 40.0
+    assert costs.estimate("classify") == pytest.approx(40.0)
+
+    deadline.degrade("face_masking_skipped")
+    deadline.degrade("face_masking_skipped")
+    assert deadline.degradations == ["face_masking_skipped"]
+
+    unlimited = Deadline(0, costs, clock=clock)
+    assert unlimited.unlimited and unlimited.choose(["full"], then=["classify"]) == "full"
+
+
+def test_degraded_results_are_not_cached():
+    cache = ResultCache()
+    degraded = CachedAnalysis(probabilities={"Autumn": 1.0}, masking_applied=True, degradations=("face_parsing_skipped",))
+
+    async def compute():
+        return degraded
+
+    value, hit = asyncio.run(cache.get_or_compute("k", compute))
+    assert value is degraded and not hit
+    assert cache.get("k") is None
+
+
+def test_perceptual_cache_relaxed_lookup_only_on_request():
+    cache = PerceptualCache(max_distance=1, relaxed_distance=3)
+    value = CachedAnalysis(probabilities={"Autumn": 1.0}, masking_applied=True)
+    ns = PerceptualCache.namespace(True, "v1")
+    cache.put(0b0000, ns, value)
+
+    assert cache.get(0b0111, ns) is None
+    assert cache.get(0b0111, ns, max_distance=3) == (value, 3)
+    assert cache.get_stats()["relaxed_distance"] == 3
@@ -0,0 +1,53 @@
+"""Tests for the LUT mask engine against the original per-class loops."""
+
+import numpy as np
+import pytest
+
+from mask_engine import CELEBM_LABELS, apply_mask_inplace, build_class_lut, mask_bbox, region_mask
+
+
+def _loop_mask(seg_pred: np.ndarray, n_classes: int = 19) -> np.ndarray:
+    """The original _create_face_hair_mask"""
+    merged_mask = np.zeros_like(seg_pred, dtype=np.uint8)
+    merged_mask[seg_pred == 2] = 255
+    for cls in range(4, 14):
+        merged_mask[seg_pred == cls] = 255
+    merged_mask[seg_pred == 14] = 255
+    merged_mask[seg_pred == 3] = 0
+    for cls in range(15, n_classes):
+        merged_mask[seg_pred == cls] = 0
+    return merged_mask
+
+
+def test_skin_hair_lut_matches_original_loops():
+    rng = np.random.default_rng(0)
+    seg_pred = rng.integers(0, 19, size=(300, 200)).astype(np.uint8)
+    assert np.array_equal(region_mask(seg_pred, "skin_hair"), _loop_mask(seg_pred))
+
+
+def test_region_sets_follow_label_names():
+    assert np.flatnonzero(build_class_lut("skin")).tolist() == [2]
+    assert np.flatnonzero(build_class_lut("skin_eyes")).tolist() == [2, 8, 9]
+
+    lapa = ('background', 'face', 'rb', 'lb', 're', 'le', 'nose', 'ulip', 'imouth', 'llip', 'hair')
+    assert np.flatnonzero(build_class_lut("skin_hair", lapa)).tolist() == list(range(1, 11))
+
+    with pytest.raises(ValueError):
+        build_class_lut("everything", CELEBM_LABELS)
+
+
+def test_bbox_and_inplace_masking_match_np_where():
+    rng = np.random.default_rng(1)
+    mask = np.zeros((120, 80), dtype=np.uint8)
+    mask[30:71, 12:55] = 255 * (rng.random((41, 43)) > 0.5)
+    mask[30, 12] = mask[70, 54] = 255
+
+    coords = np.where(mask > 0)
+    assert mask_bbox(mask) == (coords[0].min(), coords[0].max(), coords[1].min(), coords[1].max())
+    assert mask_bbox(np.zeros((4, 4), dtype=np.uint8)) is None
+
+    image = rng.integers(0, 256, size=(120, 80, 3), dtype=np.uint8)
+    expected = np.where(np.stack((mask,) * 3, axis=-1) > 127, image, np.zeros_like(image))
+    result = apply_mask_inplace(image, mask)
+    assert result is image
+    assert np.array_equal(image, expected)
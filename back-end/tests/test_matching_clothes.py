@@ -0,0 +1,205 @@
+"""Tests for the pages and NDJSON stream of /get-matching-clothes."""
+
+import asyncio
+import json
+import random
+
+import pytest
+from bson.objectid import ObjectId
+from fastapi.testclient import TestClient
+
+from clothing_matcher import encode_cursor
+from garment_search import GarmentColorIndex
+from memory_mongo import MemoryCatalog
+from mongo_store import CatalogStore
+from similarity_lookup import ColorSimilarityLookup
+
+
+REDS = ["#800000", "#8c0a0a", "#900000"]
+OTHERS = ["#0000aa", "#00aa00", "#ffffff"]
+
+
+@pytest.fixture
+def matching_api(api, monkeypatch):
+    rng = random.Random(3)
+    store = CatalogStore(MemoryCatalog(), io_workers=2)
+    store.catalog.color_similarity.insert_one({"primary_color": "#800000", "similar_colors": REDS})
+    photos = []
+    for _ in range(40):
+        colors = rng.sample(REDS + OTHERS, 2)
+        photos.append({
+            "_id": ObjectId(),
+            "gender": rng.choice(["female", "male"]),
+            "top2_colors": colors,
+            "colors_sorted": {
+                "1": {"color": colors[0], "percentage": rng.randint(40, 90)},
+                "2": {"color": colors[1], "percentage": rng.randint(1, 39)},
+            },
+        })
+    store.catalog.photos.insert_many(photos)
+    similarity = ColorSimilarityLookup(store.color_similarity, use_change_stream=False)
+    similarity.reload()
+    index = GarmentColorIndex()
+    index.build(photos)
+
+    monkeypatch.setattr(api, "CLOTHES_MATCHING_ENGINE", "lab")
+    monkeypatch.setattr(api, "INDEXED_CLOTHES_MATCHING", False)
+    api.SUBSYSTEMS["mongo_catalog"].reset(store)
+    api.SUBSYSTEMS["color_similarity"].reset(similarity)
+    api.SUBSYSTEMS["catalog_index"].reset(None)
+    api.SUBSYSTEMS["garment_search"].reset(index)
+    yield api
+    store.close()
+
+
+@pytest.fixture
+def client(matching_api):
+    return TestClient(matching_api.app)
+
+
+def use_id_engine(api):
+    api.SUBSYSTEMS["garment_search"].reset(None)
+
+
+def doc_ids(body):
+    return [url.rsplit("=", 1)[1] for url in body["images"]]
+
+
+def match(client, **params):
+    response = client.post("/get-matching-clothes", params=params, json=["#800000"])
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def stream(client, **params):
+    response = client.post("/get-matching-clothes", params={**params, "stream": "true"}, json=["#800000"])
+    assert response.status_code == 200 and response.headers["content-type"] == "application/x-ndjson"
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    return lines[:-1], lines[-1]
+
+
+def all_pages(fetch, limit):
+    ids, cursor, pages = [], None, 0
+    while True:
+        page_ids, cursor = fetch(limit=limit, **({"cursor": cursor} if cursor else {}))
+        assert len(page_ids) <= limit
+        ids += page_ids
+        pages += 1
+        if cursor is None:
+            return ids, pages
+
+
+@pytest.mark.parametrize("engine", ["id", "lab"])
+def test_pages_follow_the_full_match_list(client, matching_api, engine):
+    if engine == "id":
+        use_id_engine(matching_api)
+    full = match(client)
+    assert "next_cursor" not in full and full["matched_count"] > 10
+    if engine == "lab":
+        assert full["scores"] == sorted(full["scores"], reverse=True)
+    else:
+        assert doc_ids(full) == sorted(doc_ids(full))
+
+    def json_page(**params):
+        body = match(client, **params)
+        assert body["matched_count"] == len(body["images"])
+        return doc_ids(body), body["next_cursor"]
+
+    def ndjson_page(**params):
+        entries, trailer = stream(client, **params)
+        assert trailer["matched_count"] == len(entries)
+        return [entry["doc_id"] for entry in entries], trailer["next_cursor"]
+
+    for fetch in (json_page, ndjson_page):
+        ids, pages = all_pages(fetch, limit=4)
+        assert ids == doc_ids(full)
+        assert pages == -(-len(ids) // 4)
+
+
+def test_stream_without_limit_ends_with_the_trailer(client):
+    entries, trailer = stream(client)
+    full = match(client)
+    assert [entry["doc_id"] for entry in entries] == doc_ids(full)
+    assert [entry["score"] for entry in entries] == full["scores"]
+    assert entries[0]["image_url"].endswith(f"doc_id={entries[0]['doc_id']}")
+    assert trailer == {"matched_count": full["matched_count"], "next_cursor": None}
+
+    response = client.post(
+        "/get-matching-clothes", headers={"Accept": "application/x-ndjson"}, json=["#800000"]
+    )
+    assert response.text.splitlines()[-1] == json.dumps(trailer)
+
+
+def test_cursors_continue_with_their_own_engine(client, matching_api):
+    lab_first = match(client, limit=3)
+    lab_rest = match(client, cursor=lab_first["next_cursor"])
+    use_id_engine(matching_api)
+    id_first = match(client, limit=3)
+    id_rest = match(client, cursor=id_first["next_cursor"])
+
+    # An id cursor is paged by _id even once the garment search is loaded
+    matching_api.SUBSYSTEMS["garment_search"].reset(GarmentColorIndex())
+    assert match(client, cursor=id_first["next_cursor"]) == id_rest
+
+    # A lab cursor needs the garment search, whatever engine new queries use
+    matching_api.SUBSYSTEMS["garment_search"].reset(None)
+    matching_api.SUBSYSTEMS["garment_search"].loader = lambda: 1 / 0
+    response = client.post("/get-matching-clothes", params={"cursor": lab_first["next_cursor"]}, json=["#800000"])
+    assert response.status_code == 503
+    assert "scores" in lab_rest and "scores" not in id_rest
+
+
+def test_malformed_cursors_are_rejected(client):
+    last_id = str(ObjectId())
+    for cursor in (
+        "%%%",
+        encode_cursor({"id": last_id}),
+        encode_cursor({"engine": "lab", "id": last_id}),
+        encode_cursor({"engine": "fuzzy", "id": last_id}),
+    ):
+        for params in ({"cursor": cursor}, {"cursor": cursor, "stream": "true"}):
+            response = client.post("/get-matching-clothes", params=params, json=["#800000"])
+            assert response.status_code == 400, cursor
+
+
+def test_stream_reports_failures_in_band(client, matching_api, monkeypatch):
+    use_id_engine(matching_api)
+
+    found = [str(ObjectId()) for _ in range(3)]
+
+    def failing_matches(*args):
+        for doc_id in found:
+            yield doc_id, None
+        raise RuntimeError("cursor lost")
+
+    monkeypatch.setattr(matching_api, "_iter_photo_id_matches", failing_matches)
+    entries, trailer = stream(client)
+    assert [entry["doc_id"] for entry in entries] == found
+    assert trailer == {"error": "cursor lost", "matched_count": 3}
+
+
+def test_stream_closes_the_matches_at_the_limit(api):
+    store = CatalogStore(MemoryCatalog(), io_workers=1)
+    closed = []
+
+    def matches():
+        try:
+            for i in range(10):
+                yield str(i), None
+        finally:
+            closed.append(True)
+
+    async def run():
+        # Held here, so only an explicit close runs its finally before the trailer
+        source = matches()
+        rows = store.iterate(source)
+        lines = [json.loads(line) async for line in api._ndjson_matches(rows, "id", 3)]
+        return lines, list(closed)
+
+    try:
+        lines, closed_before_return = asyncio.run(run())
+    finally:
+        store.close()
+    assert [line.get("doc_id") for line in lines[:3]] == ["0", "1", "2"]
+    assert lines[3]["matched_count"] == 3 and lines[3]["next_cursor"] is not None
+    assert closed_before_return == [True]
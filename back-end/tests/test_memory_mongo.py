@@ -0,0 +1,66 @@
+"""Tests for the in-memory Mongo stand-in used by the load test."""
+
+import pytest
+from bson.objectid import ObjectId
+from gridfs.errors import NoFile
+
+from memory_mongo import MemoryCatalog, MemoryCollection
+
+
+@pytest.fixture
+def photos():
+    collection = MemoryCollection("photos")
+    collection.insert_many([
+        {"_id": 1, "gender": "female", "top2_colors": ["#aa0000", "#bb0000"]},
+        {"_id": 2, "gender": "male", "top2_colors": [{"hex": "#cc0000"}]},
+        {"_id": 3, "gender": "female"},
+    ])
+    return collection
+
+
+def test_equality_matches_scalars_and_array_elements(photos):
+    assert [d["_id"] for d in photos.find({"gender": "female"})] == [1, 3]
+    assert [d["_id"] for d in photos.find({"top2_colors": "#bb0000"})] == [1]
+    assert [d["_id"] for d in photos.find({"top2_colors.hex": "#cc0000"})] == [2]
+    assert photos.find_one({"_id": 2})["gender"] == "male"
+    assert photos.find_one({"_id": 4}) is None
+
+
+def test_operators(photos):
+    assert [d["_id"] for d in photos.find({"top2_colors": {"$in": ["#cc0000", "#aa0000"]}})] == [1]
+    assert [d["_id"] for d in photos.find({"top2_colors": {"$exists": False}})] == [3]
+    assert [d["_id"] for d in photos.find({"$or": [{"_id": 3}, {"gender": "male"}]})] == [2, 3]
+    assert photos.count_documents({"gender": {"$ne": "male"}}) == 2
+    with pytest.raises(NotImplementedError):
+        list(photos.find({"_id": {"$regex": "1"}}))
+
+
+def test_insert_update_and_projection(photos):
+    doc = {"gender": "male"}
+    inserted_id = photos.insert_one(doc).inserted_id
+    assert isinstance(inserted_id, ObjectId) and doc["_id"] == inserted_id
+
+    photos.update_one({"_id": inserted_id}, {"$set": {"top2_colors": ["#dd0000"]}})
+    assert photos.find_one({"_id": inserted_id}, {"top2_colors": 1, "_id": 0}) == {"top2_colors": ["#dd0000"]}
+
+    # Returned documents are copies
+    photos.find_one({"_id": 1})["gender"] = "changed"
+    assert photos.find_one({"_id": 1})["gender"] == "female"
+
+
+def test_gridfs_round_trip():
+    catalog = MemoryCatalog()
+    file_id = catalog.fs.put(b"jpeg bytes")
+    assert catalog.fs.get(file_id).read() == b"jpeg bytes"
+    with pytest.raises(NoFile):
+        catalog.fs.get(ObjectId())
+
+
+def test_sort_and_bulk_write(photos):
+    from pymongo import UpdateOne
+
+    assert list(photos.find({}, {"_id": 1}, sort=[("_id", -1)])) == [{"_id": 3}, {"_id": 2}, {"_id": 1}]
+    assert [d["_id"] for d in photos.find({}, sort=[("gender", 1), ("_id", -1)])] == [3, 1, 2]
+
+    result = photos.bulk_write([UpdateOne({"_id": 1}, {"$set": {"n": 1}}), UpdateOne({"_id": 9}, {"$set": {"n": 9}})])
+    assert (result.matched_count, photos.find_one({"_id": 1})["n"]) == (1, 1)
@@ -0,0 +1,58 @@
+"""Tests for the Prometheus exposition and Server-Timing header."""
+
+import time
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from metrics import Counter, Histogram, Registry, ServerTimingMiddleware, server_timing_header, timed
+
+
+def test_histogram_renders_cumulative_buckets():
+    registry = Registry()
+    histogram = registry.register(Histogram("stage_seconds", "Stage durations", ["stage"], buckets=(0.01, 0.1)))
+    for value in (0.005, 0.05, 0.05, 3.0):
+        histogram.observe(value, "decode")
+
+    lines = registry.render().splitlines()
+    assert lines[:2] == ["# HELP stage_seconds Stage durations", "# TYPE stage_seconds histogram"]
+    assert 'stage_seconds_bucket{stage="decode",le="0.01"} 1' in lines
+    assert 'stage_seconds_bucket{stage="decode",le="0.1"} 3' in lines
+    assert 'stage_seconds_bucket{stage="decode",le="+Inf"} 4' in lines
+    assert 'stage_seconds_sum{stage="decode"} 3.105' in lines
+    assert 'stage_seconds_count{stage="decode"} 4' in lines
+
+
+def test_counter_labels_are_escaped():
+    counter = Counter("fallbacks_total", "Fallbacks", ["reason"])
+    counter.inc("no_face")
+    counter.inc('say "hi"', amount=2)
+    assert counter.render() == ['fallbacks_total{reason="no_face"} 1', 'fallbacks_total{reason="say \\"hi\\""} 2']
+
+
+def test_server_timing_header_merges_repeated_stages():
+    header = server_timing_header([("decode", 0.010), ("classify", 0.020), ("decode", 0.005)], total_s=0.05)
+    assert header == "decode;dur=15.0, classify;dur=20.0, total;dur=50.0"
+
+
+def test_middleware_reports_stages_of_sync_and_async_handlers():
+    app = FastAPI()
+    app.add_middleware(ServerTimingMiddleware)
+
+    @app.get("/async")
+    async def async_handler():
+        with timed("palette"):
+            time.sleep(0.002)
+        return {}
+
+    @app.get("/sync")
+    def sync_handler():
+        # Runs in a worker thread with a copy of the request context
+        with timed("decode"):
+            pass
+        return {}
+
+    with TestClient(app) as client:
+        assert client.get("/async").headers["server-timing"].startswith("palette;dur=")
+        sync_header = client.get("/sync").headers["server-timing"]
+        assert sync_header.startswith("decode;dur=") and "palette" not in sync_header
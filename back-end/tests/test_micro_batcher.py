@@ -0,0 +1,66 @@
+"""Tests for the dynamic micro-batching scheduler."""
+
+import threading
+
+import pytest
+import torch
+
+from micro_batcher import InferenceBatcher, MicroBatcher
+
+
+def test_concurrent_items_share_a_batch():
+    seen_batches = []
+
+    def batch_fn(items):
+        seen_batches.append(list(items))
+        return [item * 2 for item in items]
+
+    batcher = MicroBatcher(batch_fn, max_batch_size=4, max_wait_ms=200)
+    try:
+        barrier = threading.Barrier(4)
+        results = {}
+
+        def worker(value):
+            barrier.wait()
+            results[value] = batcher.process(value, timeout=5)
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        assert results == {0: 0, 1: 2, 2: 4, 3: 6}
+        assert max(len(b) for b in seen_batches) > 1
+        stats = batcher.get_stats()
+        assert stats["items_processed"] == 4
+        assert stats["largest_batch"] <= 4
+    finally:
+        batcher.stop()
+
+
+def test_batch_errors_propagate_to_every_caller():
+    def batch_fn(items):
+        raise ValueError("boom")
+
+    batcher = MicroBatcher(batch_fn, max_batch_size=2, max_wait_ms=1)
+    try:
+        with pytest.raises(ValueError):
+            batcher.process(1, timeout=5)
+        assert batcher.get_stats()["errors"] == 1
+    finally:
+        batcher.stop()
+
+
+def test_inference_batcher_returns_per_item_softmax_rows():
+    model = torch.nn.Sequential(torch.nn.Flatten(), torch.nn.Linear(3 * 4 * 4, 4))
+    model.eval()
+    batcher = InferenceBatcher(model, torch.device("cpu"), max_batch_size=8, max_wait_ms=1)
+    try:
+        x = torch.randn(3, 4, 4)
+        probs = batcher.process(x, timeout=5)
+        expected = torch.softmax(model(x.unsqueeze(0)), dim=1)[0]
+        assert probs.shape == (4,)
+        assert torch.allclose(probs, expected, atol=1e-6)
+    finally:
+        batcher.stop()
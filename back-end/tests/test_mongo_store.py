@@ -0,0 +1,178 @@
+"""Tests for the catalog data-access layer (I/O pool and lazy Mongo client)."""
+
+import asyncio
+import threading
+import time
+
+import pytest
+from gridfs.errors import NoFile
+
+from memory_mongo import MemoryCatalog
+from metrics import ServerTimingMiddleware, timed
+from mongo_store import CatalogStore, MongoCatalog
+
+
+@pytest.fixture
+def store():
+    store = CatalogStore(MemoryCatalog(), io_workers=2)
+    yield store
+    store.close()
+
+
+def test_catalog_calls_run_on_the_io_pool(store):
+    image_id = store.catalog.fs.put(b"jpeg bytes")
+
+    async def run():
+        loop_thread = threading.current_thread().name
+        doc = {"gender": "female", "image_gridfs": image_id, "image_base64": "large"}
+        photo_id = await store.insert_photo(doc)
+        found = await store.find_photo(photo_id, {"image_gridfs": 1})
+        image = await store.read_file(found["image_gridfs"])
+        thread = await store.run(lambda: threading.current_thread().name)
+        with pytest.raises(NoFile):
+            await store.read_file(photo_id)
+        return loop_thread, photo_id, found, image, thread
+
+    loop_thread, photo_id, found, image, thread = asyncio.run(run())
+    assert found == {"_id": photo_id, "image_gridfs": image_id}
+    assert image == b"jpeg bytes"
+    assert thread.startswith("mongo-io") and thread != loop_thread
+    assert store.get_stats() == {
+        "backend": "MemoryCatalog", "io_workers": 2, "in_flight": 0, "completed": 5, "failed": 1
+    }
+
+
+def test_slow_calls_do_not_block_the_event_loop(store):
+    async def run():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        task = asyncio.ensure_future(ticker())
+        await store.run(time.sleep, 0.2)
+        task.cancel()
+        return ticks
+
+    assert asyncio.run(run()) >= 10
+
+
+def test_iterate_reads_blocking_iterators_in_batches(store):
+    store.catalog.photos.insert_many([{"_id": i} for i in range(10)])
+    threads = set()
+
+    def cursor():
+        for doc in store.photos.find({}, sort=[("_id", 1)]):
+            threads.add(threading.current_thread().name)
+            yield doc["_id"]
+
+    async def collect():
+        return [photo_id async for photo_id in store.iterate(cursor(), batch_size=4)]
+
+    assert asyncio.run(collect()) == list(range(10))
+    assert all(name.startswith("mongo-io") for name in threads)
+    # 1 + 2 + 4 + 3: the short batch ends the iteration
+    assert store.get_stats()["completed"] == 4
+
+
+def test_iterate_yields_the_first_item_without_waiting_for_a_batch(store):
+    def slow_scan():
+        yield "early"
+        time.sleep(0.5)
+        yield "late"
+
+    async def first_item():
+        start = time.perf_counter()
+        async for item in store.iterate(slow_scan()):
+            return item, time.perf_counter() - start
+
+    item, elapsed = asyncio.run(first_item())
+    assert item == "early" and elapsed < 0.25
+
+
+def test_iterate_closes_the_iterator_when_stopped_early(store):
+    closed_on = []
+
+    def cursor():
+        try:
+            yield from range(100)
+        finally:
+            closed_on.append(threading.current_thread().name)
+
+    async def first_three():
+        items, source = [], cursor()
+        rows = store.iterate(source)
+        async for item in rows:
+            items.append(item)
+            if len(items) == 3:
+                break
+        await rows.aclose()
+        return items, list(closed_on)
+
+    items, closed_before_return = asyncio.run(first_three())
+    assert items == [0, 1, 2]
+    assert len(closed_before_return) == 1 and closed_before_return[0].startswith("mongo-io")
+
+
+def test_iterate_yields_the_items_read_before_an_error(store):
+    def failing():
+        yield from range(5)
+        raise RuntimeError("cursor lost")
+
+    async def collect():
+        items = []
+        with pytest.raises(RuntimeError, match="cursor lost"):
+            async for item in store.iterate(failing(), batch_size=16):
+                items.append(item)
+        return items
+
+    assert asyncio.run(collect()) == list(range(5))
+    assert store.get_stats()["failed"] == 1
+
+
+def test_stage_timings_recorded_on_the_pool_belong_to_the_request(store):
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+
+    app = FastAPI()
+    app.add_middleware(ServerTimingMiddleware)
+
+    def query():
+        with timed("mongo_query"):
+            return store.photos.find_one({"_id": 1})
+
+    @app.get("/")
+    async def handler():
+        await store.run(query)
+        return {}
+
+    with TestClient(app) as client:
+        assert client.get("/").headers["server-timing"].startswith("mongo_query;dur=")
+
+
+def test_mongo_client_is_configured_and_connects_lazily():
+    catalog = MongoCatalog(
+        "mongodb://127.0.0.1:1",
+        max_pool_size=7,
+        min_pool_size=1,
+        connect_timeout_ms=100,
+        server_selection_timeout_ms=150,
+        socket_timeout_ms=0
+    )
+    try:
+        pool = catalog.client.options.pool_options
+        assert (pool.max_pool_size, pool.min_pool_size, pool.connect_timeout) == (7, 1, 0.1)
+        assert pool.socket_timeout is None and pool.max_idle_time_seconds == 60
+        assert catalog.client.options.server_selection_timeout == 0.15
+
+        # Nothing listens there: the first operation fails after the selection timeout
+        from pymongo.errors import ServerSelectionTimeoutError
+        start = time.perf_counter()
+        with pytest.raises(ServerSelectionTimeoutError):
+            catalog.photos.find_one({})
+        assert time.perf_counter() - start < 5
+    finally:
+        catalog.client.close()
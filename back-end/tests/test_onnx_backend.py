@@ -0,0 +1,66 @@
+"""Tests for the ONNX export and the parity check against PyTorch."""
+
+import numpy as np
+import pytest
+import torch
+from torch import nn
+
+# torch.onnx.export needs the onnx package, which serving does not install
+pytest.importorskip("onnx")
+
+from onnx_backend import OnnxSeasonClassifier, check_parity, export_to_onnx, optimize_onnx_model
+
+
+IMG_SIZE = (32, 32)
+
+
+class StubSession:
+    """Returns the PyTorch logits, transformed, in place of an ONNX Runtime session"""
+
+    def __init__(self, model, transform):
+        self.model = model
+        self.transform = transform
+
+    def run(self, output_names, feeds):
+        with torch.no_grad():
+            logits = self.model(torch.from_numpy(feeds["input"])).numpy()
+        return [self.transform(logits)]
+
+
+@pytest.fixture(scope="module")
+def exported(tmp_path_factory):
+    torch.manual_seed(0)
+    model = nn.Sequential(nn.Conv2d(3, 4, 3), nn.AdaptiveAvgPool2d(1), nn.Flatten(), nn.Linear(4, 4)).eval()
+    path = export_to_onnx(model, str(tmp_path_factory.mktemp("onnx") / "classifier.onnx"), img_size=IMG_SIZE)
+    return model, path
+
+
+def test_exported_graph_matches_pytorch_at_any_batch_size(exported):
+    model, path = exported
+    optimized = optimize_onnx_model(path)
+    assert optimized.endswith("classifier.opt.onnx")
+
+    for onnx_path in (path, optimized):
+        onnx_model = OnnxSeasonClassifier(onnx_path, intra_op_threads=1)
+        assert check_parity(model, onnx_model, num_samples=3, img_size=IMG_SIZE)["passed"] == 1.0
+        batch = torch.rand(5, 3, *IMG_SIZE)
+        with torch.no_grad():
+            torch.testing.assert_close(onnx_model(batch), model(batch), atol=1e-5, rtol=1e-4)
+
+
+def test_parity_check_fails_on_diverging_outputs(exported):
+    model, path = exported
+    onnx_model = OnnxSeasonClassifier(path, intra_op_threads=1)
+
+    # Same ranking, probabilities off by more than atol
+    onnx_model.session = StubSession(model, lambda logits: logits * 1.5)
+    result = check_parity(model, onnx_model, num_samples=4, img_size=IMG_SIZE)
+    assert result["passed"] == 0.0 and result["top1_agreement"] == 1.0 and result["max_abs_diff"] > 1e-4
+
+    # Another top-1 class for every sample
+    onnx_model.session = StubSession(model, lambda logits: -logits)
+    result = check_parity(model, onnx_model, num_samples=4, img_size=IMG_SIZE)
+    assert result["passed"] == 0.0 and result["top1_agreement"] == 0.0
+
+    onnx_model.session = StubSession(model, np.copy)
+    assert check_parity(model, onnx_model, num_samples=4, img_size=IMG_SIZE)["passed"] == 1.0
@@ -0,0 +1,111 @@
+"""Tests for the perceptual-hash near-duplicate cache."""
+
+import io
+import random
+
+import numpy as np
+from PIL import Image
+
+from perceptual_cache import (
+    MultiIndexHashIndex,
+    PerceptualCache,
+    compute_dhash,
+    compute_image_key,
+    hamming_distance,
+)
+from result_cache import CachedAnalysis
+
+
+def _jpeg(image: Image.Image, quality: int) -> bytes:
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=quality)
+    return buffer.getvalue()
+
+
+def _synthetic_photo(seed: int = 0) -> Image.Image:
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:480, 0:640]
+    base = np.stack([x / 640 * 255, y / 480 * 255, (x + y) / 1120 * 255], axis=-1)
+    blobs = rng.integers(0, 255, size=(6, 8, 3)).repeat(80, axis=0).repeat(80, axis=1)
+    return Image.fromarray(((base + blobs) / 2).astype(np.uint8))
+
+
+def test_reencoded_image_stays_within_threshold():
+    photo = _synthetic_photo()
+    original = compute_dhash(_jpeg(photo, 95))
+    reencoded = compute_dhash(_jpeg(photo.resize((320, 240)), 60))
+    other = compute_dhash(_jpeg(_synthetic_photo(seed=1), 95))
+
+    assert hamming_distance(original, reencoded) <= 4
+    assert hamming_distance(original, other) > 4
+
+
+def _tinted(image: Image.Image, red: float, blue: float) -> Image.Image:
+    pixels = np.asarray(image, dtype=np.float64) * [red, 1.0, blue]
+    return Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8))
+
+
+def test_retoned_photos_are_not_near_duplicates():
+    photo = _synthetic_photo()
+    warm_hash, warm_color = compute_image_key(_jpeg(_tinted(photo, 1.12, 0.85), 90))
+    cool_hash, cool_color = compute_image_key(_jpeg(_tinted(photo, 0.88, 1.15), 90))
+    # Same gradients: the hash alone would call them duplicates
+    assert hamming_distance(warm_hash, cool_hash) <= 4
+    assert warm_hash == compute_dhash(_jpeg(_tinted(photo, 1.12, 0.85), 90))
+
+    cache = PerceptualCache(max_distance=4)
+    ns = PerceptualCache.namespace(True, "v1")
+    warm = CachedAnalysis(probabilities={"Autumn": 1.0}, masking_applied=True)
+    cache.put(warm_hash, ns, warm, color=warm_color)
+    assert cache.get(cool_hash, ns, color=cool_color) is None
+    assert cache.get_stats()["color_mismatches"] == 1
+
+    # A re-encode of the warm photo keeps its color and still hits
+    reencoded_hash, reencoded_color = compute_image_key(_jpeg(_tinted(photo, 1.12, 0.85).resize((320, 240)), 60))
+    assert cache.get(reencoded_hash, ns, color=reencoded_color)[0] == warm
+
+    # A closer hash with the wrong color does not hide a matching entry
+    cool = CachedAnalysis(probabilities={"Summer": 1.0}, masking_applied=True)
+    cache.put(cool_hash, ns, cool, color=cool_color)
+    cache.put(cool_hash ^ 0b111, ns, warm, color=warm_color)
+    assert cache.get(cool_hash, ns, color=cool_color) == (cool, 0)
+    assert cache.get(cool_hash, ns, color=warm_color) == (warm, 3)
+
+
+def test_multi_index_matches_brute_force():
+    rng = random.Random(0)
+    index = MultiIndexHashIndex(max_distance=4)
+    hashes = {i: rng.getrandbits(64) for i in range(2000)}
+    for entry_id, value in hashes.items():
+        index.add(entry_id, value)
+
+    for _ in range(200):
+        target = rng.choice(list(hashes.values()))
+        query = target
+        for bit in rng.sample(range(64), rng.randint(0, 6)):
+            query ^= 1 << bit
+
+        expected = min(hamming_distance(query, v) for v in hashes.values())
+        match = index.nearest(query)
+        if expected <= 4:
+            assert match is not None and match[1] == expected
+        else:
+            assert match is None
+
+    index.remove(0)
+    assert len(index) == 1999
+    assert index.nearest(hashes[0]) is None or index.nearest(hashes[0])[0] != 0
+
+
+def test_cache_namespaces_and_eviction():
+    cache = PerceptualCache(max_distance=2, max_entries=1)
+    value = CachedAnalysis(probabilities={"Autumn": 1.0}, masking_applied=True)
+    ns = PerceptualCache.namespace(True, "v1")
+
+    cache.put(0b1011, ns, value)
+    assert cache.get(0b1001, ns) == (value, 1)
+    assert cache.get(0b1011, PerceptualCache.namespace(False, "v1")) is None
+
+    cache.put(0xFFFF, ns, value)
+    assert cache.get(0b1011, ns) is None
+    assert cache.get_stats()["evictions"] == 1
@@ -0,0 +1,127 @@
+"""Tests for the on-demand request profiler and its profile ring buffer."""
+
+import threading
+import time
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from profiling import ProfileStore, ProfilingMiddleware, StackSampler
+
+
+def _busy_loop(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+def _profiled_app(store, **kwargs):
+    app = FastAPI()
+    app.add_middleware(ProfilingMiddleware, store=store, interval_ms=1, **kwargs)
+
+    @app.get("/work")
+    def work():
+        _busy_loop(0.05)
+        return {"ok": True}
+
+    return app
+
+
+def test_sampler_records_busy_thread_as_folded_stacks():
+    sampler = StackSampler(interval_ms=1)
+    sampler.start()
+    _busy_loop(0.05)
+    sampler.stop()
+
+    assert sampler.samples > 0
+    lines = sampler.folded().splitlines()
+    assert any("_busy_loop (test_profiling.py:" in line for line in lines)
+    # thread;frame;...;frame count
+    assert all(line.rsplit(" ", 1)[1].isdigit() for line in lines)
+
+
+def test_store_evicts_oldest_profiles(tmp_path):
+    store = ProfileStore(str(tmp_path), max_profiles=2)
+    ids = [store.new_id() for _ in range(3)]
+    for profile_id in ids:
+        store.save(profile_id, {"path": "/work"}, {"folded": b"main;work 1\n"})
+
+    assert [profile["id"] for profile in store.list()] == [ids[2], ids[1]]
+    assert store.path(ids[0], "folded") is None
+    assert store.path(ids[2], "folded") is not None
+    # Ids are validated before touching the file system
+    assert store.path("../" + ids[2], "folded") is None
+    assert store.path(ids[2], "../../etc/passwd") is None
+
+
+def test_middleware_profiles_only_requested_requests(tmp_path):
+    store = ProfileStore(str(tmp_path))
+    with TestClient(_profiled_app(store)) as client:
+        plain = client.get("/work")
+        by_header = client.get("/work", headers={"X-Profile": "1"})
+        by_query = client.get("/work?profile=1")
+
+    assert "x-profile-id" not in plain.headers
+    profiles = store.list()
+    assert [profile["id"] for profile in profiles] == [
+        by_query.headers["x-profile-id"], by_header.headers["x-profile-id"]
+    ]
+    assert profiles[0]["status"] == 200 and profiles[0]["trigger"] == "request"
+    with open(store.path(profiles[0]["id"], "folded")) as f:
+        assert "_busy_loop" in f.read()
+
+
+def test_middleware_sampling_and_authorization(tmp_path):
+    store = ProfileStore(str(tmp_path))
+    app = _profiled_app(store, sample_rate=1.0, authorize=lambda token: token == "secret")
+    with TestClient(app) as client:
+        sampled = client.get("/work")
+    assert store.list()[0]["trigger"] == "sampled"
+    assert "x-profile-id" in sampled.headers
+
+    store = ProfileStore(str(tmp_path / "guarded"))
+    app = _profiled_app(store, authorize=lambda token: token == "secret")
+    with TestClient(app) as client:
+        client.get("/work", headers={"X-Profile": "1"})
+        client.get("/work", headers={"X-Profile": "1", "X-Admin-Token": "wrong"})
+        assert store.list() == []
+        client.get("/work", headers={"X-Profile": "1", "X-Admin-Token": "secret"})
+    assert len(store.list()) == 1
+
+
+def test_profiles_are_written_off_the_event_loop(tmp_path):
+    store = ProfileStore(str(tmp_path))
+    threads = {}
+    save = store.save
+
+    def recording_save(*args):
+        threads["save"] = threading.current_thread().name
+        save(*args)
+
+    store.save = recording_save
+    app = _profiled_app(store)
+
+    @app.get("/loop")
+    async def loop_thread():
+        threads["loop"] = threading.current_thread().name
+        return {}
+
+    with TestClient(app) as client:
+        response = client.get("/loop", headers={"X-Profile": "1"})
+    assert store.list()[0]["id"] == response.headers["x-profile-id"]
+    assert store.list()[0]["samples"] >= 0
+    assert threads["save"] != threads["loop"]
+
+
+def test_admin_endpoints_need_a_configured_token(api, monkeypatch, tmp_path):
+    monkeypatch.setattr(api, "PROFILE_STORE", ProfileStore(str(tmp_path)))
+    client = TestClient(api.app)
+
+    monkeypatch.setattr(api, "PROFILE_ADMIN_TOKEN", "")
+    assert not api._admin_token_ok(None) and not api._admin_token_ok("")
+    assert client.get("/admin/profiles").status_code == 403
+    assert client.get("/admin/profiles", headers={"X-Admin-Token": ""}).status_code == 403
+
+    monkeypatch.setattr(api, "PROFILE_ADMIN_TOKEN", "secret")
+    assert client.get("/admin/profiles", headers={"X-Admin-Token": "wrong"}).status_code == 403
+    assert client.get("/admin/profiles", headers={"X-Admin-Token": "secret"}).json()["profiles"] == []
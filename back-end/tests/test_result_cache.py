@@ -0,0 +1,95 @@
+"""Tests for the content-addressed result cache."""
+
+import asyncio
+
+import pytest
+
+from result_cache import CachedAnalysis, ResultCache
+
+
+PROBS = {"Autumn": 0.1, "Summer": 0.6, "Winter": 0.2, "Spring": 0.1}
+
+
+def test_key_depends_on_bytes_masking_and_model_version():
+    key = ResultCache.make_key(b"img", True, "v1")
+    assert key == ResultCache.make_key(b"img", True, "v1")
+    assert key != ResultCache.make_key(b"img2", True, "v1")
+    assert key != ResultCache.make_key(b"img", False, "v1")
+    assert key != ResultCache.make_key(b"img", True, "v2")
+
+
+def test_lru_eviction_and_ttl():
+    cache = ResultCache(max_entries=2, ttl_seconds=60)
+    value = CachedAnalysis(probabilities=PROBS, masking_applied=True)
+    cache.put("a", value)
+    cache.put("b", value)
+    assert cache.get("a") is value  # "a" becomes most recently used
+    cache.put("c", value)
+    assert cache.get("b") is None
+    assert cache.get("a") is value
+    assert cache.get_stats()["evictions"] == 1
+
+    expired = ResultCache(ttl_seconds=0)
+    expired.put("a", value)
+    assert expired.get("a") is None
+
+
+def test_top_season_matches_argmax():
+    assert CachedAnalysis(probabilities=PROBS, masking_applied=False).top_season() == ("Summer", 0.6)
+
+
+def test_concurrent_identical_requests_compute_once():
+    cache = ResultCache()
+    calls = 0
+
+    async def compute():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.05)
+        return CachedAnalysis(probabilities=PROBS, masking_applied=False)
+
+    async def run():
+        return await asyncio.gather(*(cache.get_or_compute("k", compute) for _ in range(5)))
+
+    results = asyncio.run(run())
+    assert calls == 1
+    assert [hit for _, hit in results].count(False) == 1
+    assert cache.get_stats()["coalesced"] == 4
+
+
+def test_failed_computation_is_not_cached():
+    cache = ResultCache()
+
+    async def compute():
+        raise RuntimeError("model failure")
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(cache.get_or_compute("k", compute))
+    assert cache.get("k") is None
+
+
+def test_degraded_results_are_not_handed_to_waiters():
+    cache = ResultCache()
+    computed = []
+
+    def computation(degradations):
+        async def compute():
+            computed.append(degradations)
+            await asyncio.sleep(0.05)
+            return CachedAnalysis(probabilities={"Autumn": 1.0}, masking_applied=True, degradations=degradations)
+        return compute
+
+    async def run():
+        # The first request is short on budget; the others have none
+        return await asyncio.gather(
+            cache.get_or_compute("k", computation(("skip_parsing",))),
+            *(cache.get_or_compute("k", computation(())) for _ in range(3))
+        )
+
+    results = asyncio.run(run())
+    assert results[0] == (CachedAnalysis({"Autumn": 1.0}, True, ("skip_parsing",)), False)
+    # One of the waiters recomputes with its own budget, the rest coalesce onto it
+    assert computed == [("skip_parsing",), ()]
+    assert all(value.degradations == () for value, _ in results[1:])
+    assert [hit for _, hit in results[1:]].count(False) == 1
+    assert cache.get("k").degradations == ()
@@ -0,0 +1,46 @@
+"""Tests for checkpoint conversion and loading of the season classifier."""
+
+import pytest
+import torch
+
+from season_classifier import (
+    SERVING_CHECKPOINT_FORMAT,
+    ColorAnalysisModel,
+    convert_checkpoint,
+    load_color_analysis_model,
+)
+
+
+@pytest.fixture(scope="module")
+def trained():
+    torch.manual_seed(0)
+    return ColorAnalysisModel(num_classes=4, pretrained=False).eval()
+
+
+def test_serving_checkpoint_round_trip(trained, tmp_path):
+    # Saved from DataParallel around the bare ResNeXt: "module." prefix, no "base_model."
+    training = {
+        "epoch": 12,
+        "model_state_dict": {f"module.{key}": value for key, value in trained.base_model.state_dict().items()},
+    }
+    torch.save(training, tmp_path / "training.pth")
+
+    serving_path = convert_checkpoint(str(tmp_path / "training.pth"), str(tmp_path / "serving.pth"))
+    serving = torch.load(serving_path, weights_only=False)
+    assert serving["format"] == SERVING_CHECKPOINT_FORMAT and serving["num_classes"] == 4
+    assert serving["state_dict"].keys() == trained.state_dict().keys()
+
+    timings = {}
+    model = load_color_analysis_model(serving_path, torch.device("cpu"), timings=timings)
+    assert not model.training
+    assert list(timings) == ["build_architecture", "read_checkpoint", "normalize_keys", "load_state_dict"]
+    batch = torch.rand(2, 3, 64, 64)
+    with torch.no_grad():
+        torch.testing.assert_close(model(batch), trained(batch))
+
+
+def test_conversion_rejects_checkpoints_for_another_architecture(trained, tmp_path):
+    torch.save({"state_dict": trained.state_dict()}, tmp_path / "four_classes.pth")
+    with pytest.raises(RuntimeError):
+        convert_checkpoint(str(tmp_path / "four_classes.pth"), str(tmp_path / "serving.pth"), num_classes=3)
+    assert not (tmp_path / "serving.pth").exists()
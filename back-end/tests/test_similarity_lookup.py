@@ -0,0 +1,126 @@
+"""Tests for the batched and cached color_similarity lookups."""
+
+import random
+
+import pytest
+
+from clothing_matcher import normalize_hex
+from memory_mongo import MemoryCollection
+from metrics import CACHE_LOOKUPS
+from similarity_lookup import ColorSimilarityLookup, fetch_similarity_docs
+
+
+class CountingCollection(MemoryCollection):
+    def __init__(self, name):
+        super().__init__(name)
+        self.finds = 0
+
+    def find(self, *args, **kwargs):
+        self.finds += 1
+        return super().find(*args, **kwargs)
+
+
+def find_one_chain(collection, color):
+    """The three sequential find_one calls the lookup replaced"""
+    return (
+        collection.find_one({"primary_color": color})
+        or collection.find_one({"primary_color": normalize_hex(color)})
+        or collection.find_one({"primary_color": color.lower()})
+    )
+
+
+@pytest.fixture
+def similarity():
+    collection = CountingCollection("color_similarity")
+    collection.insert_many([
+        {"primary_color": "#aa0000", "similar_colors": [{"hex": "#aa0101"}]},
+        # Raw spelling present as well: it must win over the normalized one
+        {"primary_color": "#AA0000", "similar_colors": ["#ab0000"]},
+        {"primary_color": "bb0000", "similar_colors": ["#bb0101"]},
+        {"primary_color": "#cc0000", "similar_colors": ["#cc0101"]},
+        {"primary_color": "#cc0000", "similar_colors": ["duplicate, never returned"]},
+        {"primary_color": "#dd0000ff", "similar_colors": ["#dd0101"]},
+    ])
+    return collection
+
+
+REQUESTS = ["#aa0000", "#AA0000", "AA0000", "bb0000", "BB0000", " #CC0000 ", "#cc0000", "#DD0000FF", "#ee0000", ""]
+
+
+def strip_ids(docs):
+    return [doc and doc["similar_colors"] for doc in docs]
+
+
+def test_batched_fetch_keeps_find_one_priority(similarity):
+    expected = strip_ids([find_one_chain(similarity, color) for color in REQUESTS])
+    similarity.finds = 0
+    assert strip_ids(fetch_similarity_docs(similarity, REQUESTS)) == expected
+    assert similarity.finds == 1
+
+
+@pytest.mark.parametrize("preload_max_docs", [0, 100])
+def test_lookup_matches_fetch(similarity, preload_max_docs):
+    expected = strip_ids(fetch_similarity_docs(similarity, REQUESTS))
+    lookup = ColorSimilarityLookup(similarity, preload_max_docs=preload_max_docs, use_change_stream=False)
+    lookup.reload()
+
+    rng = random.Random(0)
+    for _ in range(20):
+        colors = rng.sample(REQUESTS, 4)
+        assert strip_ids(lookup.lookup(colors)) == [expected[REQUESTS.index(c)] for c in colors]
+    assert lookup.get_stats()["preloaded"] == bool(preload_max_docs)
+
+
+def test_lru_counts_hits_misses_and_queries(similarity):
+    lookup = ColorSimilarityLookup(similarity, preload_max_docs=0, cache_max_entries=4, use_change_stream=False)
+    lookup.reload()
+    misses_before = CACHE_LOOKUPS.value("color_similarity", "miss")
+
+    lookup.lookup(["#aa0000", "#ee0000"])
+    lookup.lookup(["#aa0000", "#ee0000"])
+    stats = lookup.get_stats()
+    assert (stats["hits"], stats["misses"], stats["queries"]) == (2, 2, 1)
+    assert CACHE_LOOKUPS.value("color_similarity", "miss") - misses_before == 2
+
+    # Bounded: older spellings are evicted and queried again
+    lookup.lookup(["#bb0000", "#cc0000", "#dd0000"])
+    assert lookup.get_stats()["cache_entries"] <= 4
+    assert lookup.get_stats()["evictions"] > 0
+
+
+def test_polling_reloads_on_change(similarity):
+    lookup = ColorSimilarityLookup(similarity, refresh_interval_s=0.05, use_change_stream=False)
+    lookup.start()
+    try:
+        assert lookup.lookup(["#ff0000"]) == [None]
+        similarity.insert_one({"primary_color": "#ff0000", "similar_colors": ["#ff0101"]})
+        for _ in range(100):
+            if lookup.get_stats()["reloads"] > 1:
+                break
+            lookup._stop.wait(0.02)
+        assert strip_ids(lookup.lookup(["#ff0000"])) == [["#ff0101"]]
+    finally:
+        lookup.stop()
+
+
+@pytest.mark.parametrize("preload_max_docs", [0, 100])
+def test_polling_reloads_in_place_edits_on_schedule(similarity, preload_max_docs):
+    lookup = ColorSimilarityLookup(
+        similarity,
+        preload_max_docs=preload_max_docs,
+        refresh_interval_s=0.05,
+        reload_interval_s=0.2,
+        use_change_stream=False
+    )
+    lookup.start()
+    try:
+        assert strip_ids(lookup.lookup(["#cc0000"])) == [["#cc0101"]]
+        # Same count and newest _id: only the scheduled reload sees it
+        similarity.update_one({"primary_color": "#cc0000"}, {"$set": {"similar_colors": ["#cd0000"]}})
+        for _ in range(100):
+            if strip_ids(lookup.lookup(["#cc0000"])) == [["#cd0000"]]:
+                break
+            lookup._stop.wait(0.02)
+        assert strip_ids(lookup.lookup(["#cc0000"])) == [["#cd0000"]]
+    finally:
+        lookup.stop()
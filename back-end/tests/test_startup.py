@@ -0,0 +1,100 @@
+"""Tests for lazy subsystem initialization and the API import-time budget."""
+
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+from subsystems import DISABLED, FAILED, READY, SubsystemRegistry, SubsystemUnavailable
+
+
+BACK_END_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Generous default so slow CI machines pass; tighten locally with IMPORT_TIME_BUDGET_S
+IMPORT_TIME_BUDGET_S = float(os.environ.get("IMPORT_TIME_BUDGET_S", "8"))
+
+# Heavy dependencies that must only load when their subsystem is first used
+DEFERRED_MODULES = ["rembg", "onnxruntime", "colorthief", "pymongo", "gridfs", "torchvision"]
+
+
+def test_api_import_defers_heavy_dependencies():
+    script = (
+        "import json, sys, time\n"
+        "start = time.perf_counter()\n"
+        "import color_analysis_api\n"
+        "elapsed = time.perf_counter() - start\n"
+        f"loaded = [m for m in {DEFERRED_MODULES!r} if m in sys.modules]\n"
+        "print(json.dumps({'elapsed': elapsed, 'loaded': loaded}))\n"
+    )
+    # An unreachable URI: importing the API must not touch Mongo at all
+    env = dict(os.environ, MONGO_URI="mongodb://localhost:1")
+    proc = subprocess.run(
+        [sys.executable, "-c", script], cwd=BACK_END_DIR, env=env,
+        capture_output=True, text=True, timeout=120
+    )
+    assert proc.returncode == 0, proc.stderr
+    report = json.loads(proc.stdout.strip().splitlines()[-1])
+
+    assert report["loaded"] == []
+    assert report["elapsed"] < IMPORT_TIME_BUDGET_S
+
+
+def test_eager_subsystems_load_in_parallel():
+    registry = SubsystemRegistry()
+    for name in ("a", "b", "c"):
+        registry.register(name, lambda: time.sleep(0.2) or "ok")
+
+    start = time.perf_counter()
+    started = registry.start_eager()
+    assert registry.wait(started, timeout=5)
+    assert time.perf_counter() - start < 0.5
+    assert all(registry[name].state == READY for name in started)
+
+
+def test_lazy_subsystem_loads_once_on_first_use():
+    calls = []
+    registry = SubsystemRegistry()
+    lazy = registry.register("lazy", lambda: calls.append(1) or len(calls), lazy=True)
+
+    assert registry.start_eager() == []
+    threads = [threading.Thread(target=lazy.ensure) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert lazy.ensure() == 1
+    assert calls == [1]
+
+
+def test_failures_and_disabled_subsystems_are_reported():
+    attempts = []
+
+    def flaky():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise ConnectionError("no route to host")
+        return "connected"
+
+    registry = SubsystemRegistry()
+    registry.register("broken", lambda: 1 / 0)
+    registry.register("flaky", flaky, retry_on_failure=True)
+    registry.register("off", lambda: "never", enabled=False)
+
+    with pytest.raises(SubsystemUnavailable):
+        registry["broken"].ensure()
+    with pytest.raises(SubsystemUnavailable):
+        registry["broken"].ensure()
+    with pytest.raises(SubsystemUnavailable):
+        registry["flaky"].ensure()
+    assert registry["flaky"].ensure() == "connected"
+    assert registry["off"].get() is None
+
+    readiness = registry.readiness()
+    assert readiness["broken"]["state"] == FAILED
+    assert readiness["flaky"]["state"] == READY
+    assert readiness["off"]["state"] == DISABLED